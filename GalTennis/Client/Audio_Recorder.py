@@ -3,12 +3,27 @@ Gal Haham
 Real-time audio recording manager using PyAudio.
 Supports simultaneous recording with video,
 WAV file saving, and resource cleanup.
+ADDED: start_recording(sink) - buffers are passed to sink (e.g. the story
+       encoder) as they arrive instead of being kept for save_audio
+CHANGED: Streams to disk - the PyAudio callback only appends each buffer
+         to a bounded deque; a writer thread writes them to the WAV file
+         (or hands them to the sink) as they come, so memory does not
+         grow with the recording and stopping does not stall.
+         samples_recorded is the exact number of sample frames written.
 """
-import pyaudio
+import collections
+import os
+import threading
+import time
 import wave
+import pyaudio
 AUDIO_CHANNELS = 2
 STANDARD_SAMPLE_RATE = 44100
 CHUNK_SIZE = 1024
+DEFAULT_WAV_FILENAME = "audio_recording.wav"
+MAX_QUEUED_BUFFERS = 256            # About 6 s of audio at 44.1 kHz
+WRITER_POLL_SECONDS = 0.02
+WRITER_JOIN_TIMEOUT_SECONDS = 5.0
 
 
 class AudioRecorder:
@@ -17,26 +32,56 @@ class AudioRecorder:
     This class is designed to be used while recording video at the same time.
     It allows starting and stopping an audio stream, saving the audio as a WAV
     file, and cleaning up resources safely after recording is finished.
+
+    The audio callback never blocks: it appends to a deque (append and
+    popleft are atomic, no lock is taken) that a writer thread drains.
+    If the writer falls MAX_QUEUED_BUFFERS behind, a buffer is replaced
+    by silence of the same length, so the sample count - and the
+    alignment with video - stays exact.
     """
 
     def __init__(self):
         """Initialize the audio recorder and all required settings."""
         self.audio = pyaudio.PyAudio()
         self.stream = None
-        self.frames = []
+        self.sink = None
+        self.filename = None
         self.is_recording = False
+        self.samples_recorded = 0
 
         self.format = pyaudio.paInt16
         self.channels = AUDIO_CHANNELS
         self.rate = STANDARD_SAMPLE_RATE
         self.chunk = CHUNK_SIZE
 
-    def start_recording(self):
-        """Start the audio recording process."""
-        self.frames = []
+        self._queue = collections.deque()
+        self._writer = None
+        self._writer_done = threading.Event()
+
+    def start_recording(self, sink=None, filename=None):
+        """
+        Start the audio recording process.
+
+        Args:
+            sink: Optional callable given each PCM buffer (on the writer
+                  thread). Without a sink the audio is written to a WAV.
+            filename: WAV file to stream to (default DEFAULT_WAV_FILENAME;
+                      save_audio can move it afterwards)
+
+        Returns:
+            bool: True if the microphone stream is open
+        """
+        self.sink = sink
+        self.filename = None if sink is not None else (filename or DEFAULT_WAV_FILENAME)
+        self.samples_recorded = 0
+        self._queue.clear()
+        self._writer = None
+        self._writer_done.clear()
         self.is_recording = True
 
+        wav_file = None
         try:
+            wav_file = self._open_wav() if self.filename else None
             self.stream = self.audio.open(
                 format=self.format,
                 channels=self.channels,
@@ -45,41 +90,85 @@ class AudioRecorder:
                 frames_per_buffer=self.chunk,
                 stream_callback=self._audio_callback
             )
+            self._writer = threading.Thread(
+                target=self._write_loop,
+                args=(wav_file,),
+                daemon=True,
+                name="AudioRecorderWriter"
+            )
+            self._writer.start()
             self.stream.start_stream()
             print("Audio recording started")
         except Exception as e:
             print(f"Failed to start audio recording: {e}")
             self.is_recording = False
+            if wav_file is not None and self._writer is None:
+                wav_file.close()
+        return self.is_recording
 
     def _audio_callback(self, in_data, frame_count, time_info, status):
         """Internal callback function that receives audio frames"""
         if self.is_recording:
-            self.frames.append(in_data)
+            if len(self._queue) < MAX_QUEUED_BUFFERS:
+                self._queue.append(in_data)
+            else:
+                self._queue.append(len(in_data))    # Written as silence
         return in_data, pyaudio.paContinue
 
-    def stop_recording(self):
-        """Stop the current recording session."""
-        self.is_recording = False
+    def _open_wav(self):
+        wav_file = wave.open(self.filename, 'wb')
+        wav_file.setnchannels(self.channels)
+        wav_file.setsampwidth(self.audio.get_sample_size(self.format))
+        wav_file.setframerate(self.rate)
+        return wav_file
 
+    def _write_loop(self, wav_file):
+        """Writer thread: drain the queue until recording stops."""
+        bytes_per_sample_frame = self.channels * self.audio.get_sample_size(self.format)
+        try:
+            while self.is_recording or self._queue:
+                if not self._queue:
+                    time.sleep(WRITER_POLL_SECONDS)
+                    continue
+                data = self._queue.popleft()
+                if isinstance(data, int):
+                    data = bytes(data)
+                if wav_file is not None:
+                    wav_file.writeframes(data)
+                else:
+                    self.sink(data)
+                self.samples_recorded += len(data) // bytes_per_sample_frame
+        except Exception as e:
+            print(f"Audio writer error: {e}")
+        finally:
+            if wav_file is not None:
+                wav_file.close()            # Header gets the final length
+            self._writer_done.set()
+
+    def stop_recording(self):
+        """Stop the current recording session and flush what is queued."""
         if self.stream:
             self.stream.stop_stream()
             self.stream.close()
+            self.stream = None
+        self.is_recording = False
+
+        if self._writer is not None:
+            self._writer_done.wait(WRITER_JOIN_TIMEOUT_SECONDS)
+            self._writer = None
 
-        print("Audio recording stopped")
+        print(f"Audio recording stopped ({self.samples_recorded} samples)")
 
     def save_audio(self, filename):
-        """Save the recorded audio data to a WAV file."""
-        if not self.frames:
+        """Move the recorded WAV file to filename."""
+        if not self.filename or not os.path.exists(self.filename):
             print("No audio data to save")
             return False
 
         try:
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(self.audio.get_sample_size(self.format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(self.frames))
-            wf.close()
+            if os.path.abspath(filename) != os.path.abspath(self.filename):
+                os.replace(self.filename, filename)
+                self.filename = filename
             print(f"Audio saved to {filename}")
             return True
         except Exception as e:
@@ -2,10 +2,25 @@
 Gal Haham
 Background thread for continuous camera frame reading.
 Provides thread-safe access to the latest frame without blocking the GUI.
+CHANGED: Event-driven - camera.read() paces the loop (no polling sleep).
+         Every frame is stamped with its capture time and published in a
+         ring buffer guarded by a Condition, so the story recorder gets
+         each captured frame, not whatever the GUI timer finds.
+ADDED: Preview rendering - each frame is also scaled to the preview panel
+       and converted to RGB here, into reused buffers, so the UI only
+       copies it into its bitmap and blits. get_frame() no longer copies.
 """
+import collections
 import threading
 import time
-SHORT_SLEEP_SECONDS = 0.01
+import cv2
+import numpy as np
+RING_SIZE = 64
+READ_RETRY_SECONDS = 0.01
+INITIAL_SEQUENCE = 0
+IMAGE_SHAPE_SLICE_2D = 2
+RGB_CHANNELS = 3
+MIN_PREVIEW_SIDE = 1
 
 
 class CameraReaderThread(threading.Thread):
@@ -14,7 +29,11 @@ class CameraReaderThread(threading.Thread):
 
     Responsibilities:
     - Read frames without blocking the main GUI thread.
-    - Store the most recent frame in a thread-safe way.
+    - Stamp each frame with its capture time (time.monotonic()).
+    - Keep the last RING_SIZE frames in a ring buffer and wake up
+      consumers waiting for new ones.
+    - Render a panel-sized RGB preview of each frame (double-buffered:
+      one buffer is written while the UI reads the other).
     - Allow other parts of the program to fetch the latest frame at any time.
     - Run independently until stopped.
     """
@@ -25,29 +44,116 @@ class CameraReaderThread(threading.Thread):
         self.camera = camera
         self.is_running = True
         self.current_frame = None
-        self.lock = threading.Lock()
+        self.lock = threading.Condition()
+        self._ring = collections.deque(maxlen=RING_SIZE)
+        self._sequence = INITIAL_SEQUENCE
+
+        self._preview_size = None           # (width, height) of the panel
+        self._resize_buffer = None
+        self._preview_back = None           # Being rendered
+        self._preview_front = None          # Ready for the UI
+        self._preview_sequence = INITIAL_SEQUENCE
         self.start()
 
     def run(self):
-        """Thread loop: continuously reads frames from the camera."""
+        """Thread loop: reads frames as the camera delivers them."""
         while self.is_running:
             ret, frame = self.camera.read()
-            if ret:
-                with self.lock:
-                    self.current_frame = frame
-            time.sleep(SHORT_SLEEP_SECONDS)
+            captured_at = time.monotonic()
+            if not ret:
+                time.sleep(READ_RETRY_SECONDS)
+                continue
+            with self.lock:
+                self._sequence += 1
+                self._ring.append((self._sequence, captured_at, frame))
+                self.current_frame = frame
+                self.lock.notify_all()
+            self._render_preview(frame)
 
     def stop(self):
         """
         Stops the thread by setting the running flag to False.
         """
         self.is_running = False
+        with self.lock:
+            self.lock.notify_all()
 
     def get_frame(self):
-        """Returns a copy of the most recent captured frame."""
+        """
+        Returns the most recent captured frame. Frames are never changed
+        after they are published, so it is shared, not copied - copy it
+        before modifying it.
+        """
+        with self.lock:
+            return self.current_frame
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the most recent frame."""
+        with self.lock:
+            return self._sequence
+
+    def wait_frames(self, after: int, timeout: float) -> list:
+        """
+        Wait for frames newer than a sequence number.
+
+        Args:
+            after: Sequence number of the last frame already consumed
+            timeout: Maximum seconds to wait
+
+        Returns:
+            list: (sequence, captured_at, frame) tuples in capture order,
+                  empty on timeout. Frames that fell out of the ring
+                  before the caller came back are missing.
+        """
         with self.lock:
-            return (
-                self.current_frame.copy()
-                if self.current_frame is not None
-                else None
+            self.lock.wait_for(
+                lambda: self._sequence > after or not self.is_running, timeout
             )
+            return [entry for entry in self._ring if entry[0] > after]
+
+    # ── Preview ───────────────────────────────────────────────────────────────
+
+    def set_preview_size(self, width: int, height: int):
+        """Size of the panel the preview is fitted into."""
+        self._preview_size = (max(width, MIN_PREVIEW_SIDE), max(height, MIN_PREVIEW_SIDE))
+
+    def read_preview(self, consumer, after: int) -> int:
+        """
+        Hand the latest preview to consumer if it is newer than after.
+
+        Args:
+            consumer: Called with the RGB preview (height x width x 3,
+                      uint8); it must copy what it needs before returning
+            after: Preview sequence number the caller already has
+
+        Returns:
+            int: Sequence number of the preview the caller now has
+        """
+        with self.lock:
+            if self._preview_front is None or self._preview_sequence <= after:
+                return after
+            consumer(self._preview_front)
+            return self._preview_sequence
+
+    def _render_preview(self, frame):
+        """Scale and convert a frame into the back buffer, then swap."""
+        if self._preview_size is None:
+            return
+        panel_width, panel_height = self._preview_size
+        height, width = frame.shape[:IMAGE_SHAPE_SLICE_2D]
+        scale = min(panel_width / width, panel_height / height)
+        size = (max(int(width * scale), MIN_PREVIEW_SIDE),
+                max(int(height * scale), MIN_PREVIEW_SIDE))
+
+        shape = (size[1], size[0], RGB_CHANNELS)
+        if self._resize_buffer is None or self._resize_buffer.shape != shape:
+            self._resize_buffer = np.empty(shape, np.uint8)
+        if self._preview_back is None or self._preview_back.shape != shape:
+            self._preview_back = np.empty(shape, np.uint8)
+
+        cv2.resize(frame, size, dst=self._resize_buffer)
+        cv2.cvtColor(self._resize_buffer, cv2.COLOR_BGR2RGB, dst=self._preview_back)
+        with self.lock:
+            self._preview_front, self._preview_back = self._preview_back, self._preview_front
+            self._preview_sequence += 1
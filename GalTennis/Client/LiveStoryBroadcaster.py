@@ -0,0 +1,259 @@
+"""
+Gal Haham
+Live Story Broadcaster - sends a story to the server while it is being
+recorded, so viewers can watch it live (see the server's LiveStoryServer).
+
+    video   captured frames → JPEG → media_packet ┐
+    audio   PCM from mic    →        media_packet ┴→ zlib → AES → send_bin
+
+Each frame goes out once, numbered by its capture-time slot at LIVE_FPS
+(same slots as StoryRecorder); the server repeats frames over the gaps
+when it records. One sender thread owns the socket. Its queue is bounded:
+if the network cannot keep up, video frames are dropped rather than
+letting the broadcast fall behind, while audio waits for room.
+When stop() is called the server saves the broadcast as a story and
+answers with its record.
+"""
+import queue
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+import key_exchange
+import aes_cipher
+import media_packet
+from Protocol import Protocol
+
+LIVE_SERVER_PORT = 6002
+LIVE_FPS = 20
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNELS = 2
+JPEG_QUALITY = 80
+COMPRESS_LEVEL = 1
+NO_COMPRESSION = 0              # JPEG: zlib only stores it
+
+SEND_QUEUE_PACKETS = 40         # About 1 s of video + audio
+AUDIO_PUT_TIMEOUT_SECONDS = 0.5
+QUEUE_POLL_SECONDS = 0.1
+FRAME_WAIT_SECONDS = 0.1
+STOP_TIMEOUT_SECONDS = 10.0
+SAVE_TIMEOUT_SECONDS = 180.0    # Server muxes, normalizes and registers
+IMAGE_SHAPE_SLICE_2D = 2
+KEY_INDEX = 1
+
+REQUEST_BROADCAST = "BROADCAST"
+RESPONSE_READY = "LIVE_READY"
+RESPONSE_SAVED = "LIVE_SAVED"
+INFO_TYPE_END = "LIVE_END"
+
+
+class LiveStoryBroadcaster:
+    """Streams camera frames and microphone PCM to the live story server."""
+
+    def __init__(self, host: str, camera_reader, width: int, height: int,
+                 username: str, port: int = LIVE_SERVER_PORT, fps: int = LIVE_FPS):
+        """
+        Args:
+            host: Server address
+            camera_reader: CameraReaderThread publishing timestamped frames
+            width: Frame width in pixels
+            height: Frame height in pixels
+            username: Broadcasting user
+            port: Live story server port
+            fps: Frame rate of the broadcast
+        """
+        self.host = host
+        self.port = port
+        self.camera_reader = camera_reader
+        self.width = width
+        self.height = height
+        self.username = username
+        self.fps = fps
+
+        self.broadcast_id = None
+        self.first_frame = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self.socket = None
+        self.conn = None
+        self._packets = queue.Queue(maxsize=SEND_QUEUE_PACKETS)
+        self._threads = []
+        self._started_at = None
+        self._stopped_at = None
+        self._samples_sent = 0
+        self._live = threading.Event()
+        self._stopping = threading.Event()
+        self._failed = threading.Event()
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def start(self, has_audio: bool = True) -> bool:
+        """
+        Connect, announce the broadcast and start sending.
+
+        Args:
+            has_audio: Whether microphone PCM will be passed to write_audio
+
+        Returns:
+            bool: True if the broadcast is live
+        """
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.connect((self.host, self.port))
+            key = key_exchange.KeyExchange.send_recv_key((self.socket, None))
+            self.conn = (self.socket, key)
+
+            Protocol.send_json({
+                "type": REQUEST_BROADCAST,
+                "username": self.username,
+                "width": self.width,
+                "height": self.height,
+                "fps": self.fps,
+                "has_audio": has_audio,
+                "audio_sample_rate": AUDIO_SAMPLE_RATE,
+                "audio_channels": AUDIO_CHANNELS,
+            }, self.conn)
+            reply = Protocol.recv_json(self.conn)
+            if reply.get("type") != RESPONSE_READY:
+                raise ConnectionError(reply.get("message", "Broadcast refused"))
+            self.broadcast_id = reply.get("broadcast_id")
+        except Exception as e:
+            print(f"[LiveBroadcast] Cannot go live: {e}")
+            self._close_socket()
+            return False
+
+        self._started_at = time.monotonic()
+        self._live.set()
+        self._start_thread(self._send_loop, "LiveBroadcastSend")
+        self._start_thread(self._video_loop, "LiveBroadcastVideo")
+        print(f"[LiveBroadcast] Live as {self.broadcast_id} "
+              f"({self.width}x{self.height} @ {self.fps} fps)")
+        return True
+
+    @property
+    def is_live(self) -> bool:
+        """False once stopped or the connection failed."""
+        return self._live.is_set() and not self._failed.is_set()
+
+    def write_audio(self, pcm: bytes):
+        """
+        Queue a block of interleaved 16-bit PCM (called on the audio
+        recorder's writer thread). Waits briefly if the queue is full.
+        """
+        if not self.is_live:
+            return
+        audio = np.frombuffer(pcm, dtype=np.int16)
+        pts = self._samples_sent / AUDIO_SAMPLE_RATE
+        self._samples_sent += len(audio) // AUDIO_CHANNELS
+        packet = media_packet.pack_frame(
+            None, audio, self._slot(time.monotonic()), pts, audio_channels=AUDIO_CHANNELS
+        )
+        try:
+            self._packets.put((packet, COMPRESS_LEVEL), timeout=AUDIO_PUT_TIMEOUT_SECONDS)
+        except queue.Full:
+            pass
+
+    def stop(self):
+        """
+        End the broadcast and wait for the server to save it.
+
+        Returns:
+            dict: The saved story record, or None
+        """
+        if self._started_at is None:
+            return None
+        self._stopped_at = time.monotonic()
+        self._live.clear()
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(STOP_TIMEOUT_SECONDS)
+
+        story = None
+        if not self._failed.is_set():
+            try:
+                self._send(media_packet.pack_info({"type": INFO_TYPE_END}), COMPRESS_LEVEL)
+                self.socket.settimeout(SAVE_TIMEOUT_SECONDS)
+                reply = Protocol.recv_json(self.conn)
+                if reply.get("type") == RESPONSE_SAVED:
+                    story = reply.get("story")
+                else:
+                    print(f"[LiveBroadcast] Not saved: {reply.get('message')}")
+            except Exception as e:
+                print(f"[LiveBroadcast] No reply from server: {e}")
+        self._close_socket()
+
+        print(f"[LiveBroadcast] Ended ({self.frames_sent} frames sent, "
+              f"{self.frames_dropped} dropped, {'saved' if story else 'not saved'})")
+        return story
+
+    # ── Threads ───────────────────────────────────────────────────────────────
+
+    def _start_thread(self, target, name: str):
+        thread = threading.Thread(target=target, daemon=True, name=name)
+        self._threads.append(thread)
+        thread.start()
+
+    def _video_loop(self):
+        """JPEG-encode each captured frame that starts a new slot."""
+        last_sequence = self.camera_reader.sequence
+        next_slot = 0
+        while not self._stopping.is_set() and not self._failed.is_set():
+            captured = self.camera_reader.wait_frames(last_sequence, FRAME_WAIT_SECONDS)
+            for sequence, captured_at, frame in captured:
+                last_sequence = sequence
+                stopped_at = self._stopped_at
+                if stopped_at is not None and captured_at >= stopped_at:
+                    break               # Captured after stop()
+                slot = self._slot(captured_at)
+                if slot < next_slot or frame.shape[:IMAGE_SHAPE_SLICE_2D] != (self.height, self.width):
+                    continue            # Slot already sent / wrong size
+                ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                if not ok:
+                    continue
+                if self.first_frame is None:
+                    self.first_frame = frame
+                next_slot = slot + 1
+                packet = media_packet.pack_image(
+                    jpeg, self.height, self.width, slot, slot / self.fps
+                )
+                try:
+                    self._packets.put_nowait((packet, NO_COMPRESSION))
+                    self.frames_sent += 1
+                except queue.Full:
+                    self.frames_dropped += 1
+
+    def _send_loop(self):
+        """Send queued packets until stopped and drained."""
+        while True:
+            try:
+                packet, level = self._packets.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self._send(packet, level)
+            except (ConnectionError, OSError) as e:
+                print(f"[LiveBroadcast] Connection lost: {e}")
+                self._failed.set()
+                return
+
+    def _send(self, parts: list, level: int):
+        """media_packet parts → zlib.compress → AES.encrypt → Protocol.send_bin"""
+        compressed = media_packet.compress(parts, level)
+        Protocol.send_bin(aes_cipher.AESCipher.encrypt(self.conn[KEY_INDEX], compressed),
+                          self.conn)
+
+    def _slot(self, timestamp: float) -> int:
+        """Frame index of a capture time."""
+        return max(int((timestamp - self._started_at) * self.fps), 0)
+
+    def _close_socket(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
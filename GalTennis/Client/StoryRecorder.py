@@ -0,0 +1,256 @@
+"""
+Gal Haham
+Story Recorder - records a story straight into its final file.
+One ffmpeg process encodes while the user records:
+
+    video   raw BGR frames  → ffmpeg stdin          (libx264)
+    audio   PCM from mic    → local TCP connection  (aac)
+
+so when recording stops the upload-ready .mp4 only needs its last
+frames flushed - no story_raw.mp4, no WAV file and no merge pass.
+
+Every frame captured by the camera reader is placed by its capture
+timestamp into the constant-RECORD_FPS output: slot = (captured_at -
+start) * fps. A slot the camera skipped repeats the previous frame, a
+second frame in a slot that is already filled is dropped, and the last
+frame is held until stop() - so the video lasts exactly as long as the
+recording did and stays aligned with the audio.
+"""
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+RECORD_FPS = 20
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNELS = 2
+FFMPEG_PRESET = "veryfast"
+LOCALHOST = "127.0.0.1"
+ANY_FREE_PORT = 0
+AUDIO_CONNECT_TIMEOUT_SECONDS = 5.0
+AUDIO_QUEUE_POLL_SECONDS = 0.1
+FRAME_WAIT_SECONDS = 0.1
+STOP_TIMEOUT_SECONDS = 10.0
+IMAGE_SHAPE_SLICE_2D = 2
+EXIT_CODE_SUCCESS = 0
+
+
+class StoryRecorder:
+    """Pipes camera frames and microphone PCM into one ffmpeg encoder."""
+
+    def __init__(self, output_path: str, camera_reader, width: int, height: int,
+                 fps: int = RECORD_FPS):
+        """
+        Args:
+            output_path: Final .mp4 file
+            camera_reader: CameraReaderThread publishing timestamped frames
+            width: Frame width in pixels
+            height: Frame height in pixels
+            fps: Frame rate of the recorded video
+        """
+        self.output_path = output_path
+        self.camera_reader = camera_reader
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        self.first_frame = None         # For the preview thumbnail
+        self.frames_written = 0
+
+        self._process = None
+        self._has_audio = False
+        self._audio_queue = queue.Queue()
+        self._audio_listener = None
+        self._threads = []
+        self._started_at = None
+        self._stopped_at = None
+        self._recording = threading.Event()
+        self._stopping = threading.Event()
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def start(self, has_audio: bool = True) -> bool:
+        """
+        Start ffmpeg and the feeding threads.
+
+        Args:
+            has_audio: Whether microphone PCM will be passed to write_audio
+
+        Returns:
+            bool: True if recording started
+        """
+        self._has_audio = has_audio
+        try:
+            if has_audio:
+                self._audio_listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self._audio_listener.bind((LOCALHOST, ANY_FREE_PORT))
+                self._audio_listener.listen(1)
+                self._audio_listener.settimeout(AUDIO_CONNECT_TIMEOUT_SECONDS)
+
+            self._process = subprocess.Popen(
+                self._build_command(),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            print(f"[StoryRecorder] Cannot start ffmpeg: {e}")
+            self._close_listener()
+            return False
+
+        self._started_at = time.monotonic()
+        self._recording.set()
+        self._start_thread(self._video_loop, "StoryRecorderVideo")
+        if has_audio:
+            self._start_thread(self._audio_loop, "StoryRecorderAudio")
+        print(f"[StoryRecorder] Recording {self.width}x{self.height} @ {self.fps} fps "
+              f"{'with' if has_audio else 'without'} audio")
+        return True
+
+    def write_audio(self, pcm: bytes):
+        """
+        Queue a block of interleaved 16-bit PCM. Safe to call from the
+        audio callback - it never blocks.
+        """
+        if self._recording.is_set():
+            self._audio_queue.put(pcm)
+
+    def stop(self) -> bool:
+        """
+        Stop recording and let ffmpeg finish the file.
+
+        Returns:
+            bool: True if the output file was written
+        """
+        if self._process is None:
+            return False
+        self._stopped_at = time.monotonic()
+        self._recording.clear()
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(STOP_TIMEOUT_SECONDS)
+
+        try:
+            self._process.wait(STOP_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._close_listener()
+
+        ok = self._process.returncode == EXIT_CODE_SUCCESS and self.frames_written > 0
+        print(f"[StoryRecorder] Stopped ({self.frames_written} frames, "
+              f"{'ok' if ok else 'failed'})")
+        return ok
+
+    # ── ffmpeg ────────────────────────────────────────────────────────────────
+
+    def _build_command(self) -> list:
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-framerate', str(self.fps),
+            '-i', 'pipe:0',
+        ]
+        if self._has_audio:
+            port = self._audio_listener.getsockname()[1]
+            command += [
+                '-f', 's16le',
+                '-ar', str(AUDIO_SAMPLE_RATE),
+                '-ac', str(AUDIO_CHANNELS),
+                '-i', f'tcp://{LOCALHOST}:{port}',
+                '-c:a', 'aac',
+            ]
+        command += [
+            '-c:v', 'libx264', '-preset', FFMPEG_PRESET,
+            '-pix_fmt', 'yuv420p',
+            '-f', 'mp4', self.output_path,
+        ]
+        return command
+
+    # ── Feeding threads ───────────────────────────────────────────────────────
+
+    def _start_thread(self, target, name: str):
+        thread = threading.Thread(target=target, daemon=True, name=name)
+        self._threads.append(thread)
+        thread.start()
+
+    def _video_loop(self):
+        """Write every captured frame into its output slot until stopped."""
+        last_sequence = self.camera_reader.sequence
+        frame = None
+        try:
+            while not self._stopping.is_set():
+                captured = self.camera_reader.wait_frames(last_sequence, FRAME_WAIT_SECONDS)
+                for sequence, captured_at, new_frame in captured:
+                    last_sequence = sequence
+                    stopped_at = self._stopped_at
+                    if stopped_at is not None and captured_at >= stopped_at:
+                        break               # Captured after stop()
+                    if not self._fits(new_frame):
+                        continue
+                    slot = self._slot(captured_at)
+                    if slot < self.frames_written:
+                        continue            # Slot already filled
+                    self._write_until(slot, frame if frame is not None else new_frame)
+                    frame = new_frame
+                    self._write_until(slot + 1, frame)
+            # Hold the last frame until the moment recording stopped
+            if frame is not None:
+                self._write_until(self._slot(self._stopped_at), frame)
+        except (BrokenPipeError, OSError) as e:
+            print(f"[StoryRecorder] Video pipe closed: {e}")
+        finally:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+
+    def _slot(self, timestamp: float) -> int:
+        """Output frame index of a capture time."""
+        return int((timestamp - self._started_at) * self.fps)
+
+    def _write_until(self, slot: int, frame):
+        """Write frame into every output slot before slot."""
+        if self.first_frame is None:
+            self.first_frame = frame
+        while self.frames_written < slot:
+            self._process.stdin.write(frame.data)
+            self.frames_written += 1
+
+    def _audio_loop(self):
+        """Send queued PCM to ffmpeg's audio input until stopped."""
+        try:
+            connection, _ = self._audio_listener.accept()
+        except OSError as e:
+            print(f"[StoryRecorder] ffmpeg did not open the audio input: {e}")
+            return
+        try:
+            while True:
+                try:
+                    pcm = self._audio_queue.get(timeout=AUDIO_QUEUE_POLL_SECONDS)
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        break
+                    continue
+                connection.sendall(pcm)
+        except OSError as e:
+            print(f"[StoryRecorder] Audio connection closed: {e}")
+        finally:
+            try:
+                connection.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            connection.close()
+
+    def _fits(self, frame) -> bool:
+        return frame.shape[:IMAGE_SHAPE_SLICE_2D] == (self.height, self.width)
+
+    def _close_listener(self):
+        if self._audio_listener is not None:
+            try:
+                self._audio_listener.close()
+            except OSError:
+                pass
+            self._audio_listener = None
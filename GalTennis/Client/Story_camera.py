@@ -4,18 +4,38 @@ Main camera UI for capturing photos and recording videos with audio.
 Handles camera preview, recording controls, FFmpeg merging,
 and story upload workflow.
 REFACTORED: init_ui method split into focused helper methods.
+CHANGED: Videos are recorded by StoryRecorder - frames and microphone
+         PCM go straight into one ffmpeg encoder that writes the final
+         story.mp4 (no story_raw.mp4, WAV file or FFmpeg merge pass)
+CHANGED: The live preview is scaled and converted to RGB by the camera
+         reader thread; the timer copies it into one reused bitmap and
+         on_paint only blits it
+ADDED: LIVE mode - frames and microphone audio are broadcast to the
+       server as they are captured (LiveStoryBroadcaster); viewers watch
+       while it runs and the server saves it as a story when it ends
+FIXED: The standalone harness callbacks return a story record (None
+       means "Failed to post") and the subprocess one keeps its own copy
+       of the media, since UploadThread deletes a photo's temp file
+FIXED: Each recording goes to its own temp file instead of story.mp4 in
+       the working directory, so a retake cannot overwrite a video that
+       is still uploading and two camera windows do not share a file.
+       A recording is deleted when it is retaken, discarded or posted.
 """
 import wx
 import cv2
 import os
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 
 from InitCameraThread import InitCameraThread
 from CameraReaderThread import CameraReaderThread
 from UploadThread import UploadThread
 from Audio_Recorder import AudioRecorder
+from StoryRecorder import StoryRecorder
+from LiveStoryBroadcaster import LiveStoryBroadcaster
 
 SECONDS_IN_MINUTE = 60
 HALF = 2
@@ -27,6 +47,11 @@ TIMER_INTERVAL_MS = 33
 MIN_REQUIRED_ARGS_COUNT = 2
 USERNAME_ARG_INDEX = 1
 SECOND_ARG_INDEX = 2
+PREVIEW_BITMAP_DEPTH = 24
+NO_PREVIEW = 0
+MAX_LIVE_SECONDS = 5 * SECONDS_IN_MINUTE
+STORY_FILE_PREFIX = "story_"
+STORY_VIDEO_SUFFIX = ".mp4"
 
 
 class StoryCameraFrame(wx.Frame):
@@ -36,8 +61,9 @@ class StoryCameraFrame(wx.Frame):
     Responsibilities:
     - Initialize and manage the camera preview.
     - Handle photo capture and video recording with audio.
+    - Broadcast live stories (LIVE mode, when a live server is given).
     - Switch between live camera mode and preview mode.
-    - Manage FFmpeg merging, UI events, painting, and rendering.
+    - Manage recording (StoryRecorder), UI events, painting, and rendering.
     - Interact with background worker threads (CameraReaderThread,
     InitCameraThread).
     - Dispatch the upload using UploadThread and handle success/failure UI.
@@ -46,7 +72,8 @@ class StoryCameraFrame(wx.Frame):
     methods for better maintainability.
     """
 
-    def __init__(self, parent, username, on_post_callback, closed_callback):
+    def __init__(self, parent, username, on_post_callback, closed_callback,
+                 live_host=None, live_posted_callback=None):
         """
         Initialize the story camera frame.
 
@@ -55,6 +82,9 @@ class StoryCameraFrame(wx.Frame):
             username: Current user's username
             on_post_callback: Callback function when story is posted
             closed_callback: Callback function when window is closed
+            live_host: Server address for live stories (None hides LIVE)
+            live_posted_callback: Called with the story record once a
+                                  live broadcast has been saved
         """
         super().__init__(
             parent,
@@ -70,6 +100,8 @@ class StoryCameraFrame(wx.Frame):
         self.username = username
         self.on_post_callback = on_post_callback
         self.closed_callback = closed_callback
+        self.live_host = live_host
+        self.live_posted_callback = live_posted_callback
 
         # Initialize state variables
         self._initialize_camera_state()
@@ -89,6 +121,8 @@ class StoryCameraFrame(wx.Frame):
         self.camera_reader_thread = None
         self.is_capturing = False
         self._current_frame_cache = None
+        self._preview_bitmap = None          # Reused for every preview frame
+        self._preview_sequence = NO_PREVIEW
         self.mode = 'photo'
         self.captured_photo = None
         self.preview_image = None
@@ -96,10 +130,11 @@ class StoryCameraFrame(wx.Frame):
     def _initialize_recording_state(self):
         """Initialize video recording state variables."""
         self.is_recording = False
-        self.video_writer = None
-        self.temp_video_path = None
+        self.story_recorder = None
+        self.live_broadcaster = None
         self.recording_start_time = None
         self.max_video_duration = 15
+        self.max_live_duration = MAX_LIVE_SECONDS
         self.preview_mode = False
         self.preview_type = None
         self.capture_enabled = False
@@ -109,8 +144,8 @@ class StoryCameraFrame(wx.Frame):
     def _initialize_audio_state(self):
         """Initialize audio recording state variables."""
         self.audio_recorder = None
-        self.audio_path = os.path.join(os.getcwd(), "story_audio.wav")
         self.final_video_path = None
+        self._posting_path = None       # Recording an UploadThread is posting
 
     def init_ui(self):
         """
@@ -270,7 +305,7 @@ class StoryCameraFrame(wx.Frame):
         self.recording_indicator.Hide()
 
     def _add_mode_selector(self, main_panel):
-        """Add photo/video mode selector panel."""
+        """Add photo/video (/live) mode selector panel."""
         mode_panel = wx.Panel(main_panel)
         mode_panel.SetBackgroundColour(wx.Colour(15, 15, 15))
         mode_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -284,6 +319,12 @@ class StoryCameraFrame(wx.Frame):
         self.video_btn = self._create_video_button(mode_panel)
         mode_sizer.Add(self.video_btn, 0, wx.ALL, 5)
 
+        # Live button (only with a live story server)
+        self.live_btn = None
+        if self.live_host:
+            self.live_btn = self._create_live_button(mode_panel)
+            mode_sizer.Add(self.live_btn, 0, wx.ALL, 5)
+
         mode_sizer.AddStretchSpacer()
         mode_panel.SetSizer(mode_sizer)
         self.main_sizer.Add(mode_panel, 0, wx.EXPAND)
@@ -330,6 +371,27 @@ class StoryCameraFrame(wx.Frame):
         video_btn.Bind(wx.EVT_BUTTON, lambda e: self.switch_mode('video'))
         return video_btn
 
+    def _create_live_button(self, parent):
+        """Create and configure the live mode button."""
+        live_btn = wx.Button(
+            parent,
+            label="LIVE",
+            size=(100, 35),
+            style=wx.BORDER_NONE
+        )
+        live_btn.SetBackgroundColour(wx.Colour(50, 50, 50))
+        live_btn.SetForegroundColour(wx.Colour(150, 150, 150))
+        live_btn.SetFont(
+            wx.Font(
+                10,
+                wx.FONTFAMILY_DEFAULT,
+                wx.FONTSTYLE_NORMAL,
+                wx.FONTWEIGHT_BOLD
+            )
+        )
+        live_btn.Bind(wx.EVT_BUTTON, lambda e: self.switch_mode('live'))
+        return live_btn
+
     def _add_capture_button(self, main_panel):
         """Add the circular capture button panel."""
         self.controls_panel = wx.Panel(main_panel)
@@ -434,6 +496,7 @@ class StoryCameraFrame(wx.Frame):
         """Finalize UI setup with event bindings and timers."""
         main_panel.SetSizer(self.main_sizer)
         self.camera_panel.Bind(wx.EVT_PAINT, self.on_paint)
+        self.camera_panel.Bind(wx.EVT_SIZE, self.on_camera_panel_size)
 
         # Setup update timer
         self.timer = wx.Timer(self)
@@ -451,6 +514,8 @@ class StoryCameraFrame(wx.Frame):
         self.camera = camera
         self.is_capturing = True
         self.camera_reader_thread = CameraReaderThread(self.camera)
+        panel_size = self.camera_panel.GetSize()
+        self.camera_reader_thread.set_preview_size(panel_size.width, panel_size.height)
         self.title_text.SetLabel("Take Photo")
         self.loading_text.Hide()
         self.capture_enabled = True
@@ -481,8 +546,8 @@ class StoryCameraFrame(wx.Frame):
 
         Responsibilities:
         - Pull latest frame from CameraReaderThread
-        - Write frames to video_writer if recording
-        - Update recording timer
+        - Update the recording timer if recording
+        - Copy a new preview frame into the preview bitmap
         - Trigger UI refresh
 
         Args:
@@ -497,25 +562,48 @@ class StoryCameraFrame(wx.Frame):
             if frame is not None:
                 self._current_frame_cache = frame
 
-                if self.is_recording and self.video_writer:
-                    self._update_recording_frame(frame)
+                if self.is_recording:
+                    self._update_recording_timer()
+                if self.live_broadcaster and not self.live_broadcaster.is_live:
+                    self.stop_live()        # Connection lost
 
+            sequence = self.camera_reader_thread.read_preview(
+                self._copy_preview, self._preview_sequence
+            )
+            if sequence != self._preview_sequence:
+                self._preview_sequence = sequence
                 self.camera_panel.Refresh()
 
-    def _update_recording_frame(self, frame):
+    def _copy_preview(self, rgb):
         """
-        Update recording with current frame and timer.
+        Copy a rendered preview (RGB, panel-sized) into the preview bitmap.
 
         Args:
-            frame: Current video frame to write
+            rgb: Preview buffer from CameraReaderThread.read_preview
         """
-        self.video_writer.write(frame)
+        h, w = rgb.shape[:CHANNELS_INDEX]
+        if self._preview_bitmap is None or self._preview_bitmap.GetSize() != (w, h):
+            self._preview_bitmap = wx.Bitmap(w, h, PREVIEW_BITMAP_DEPTH)
+        self._preview_bitmap.CopyFromBuffer(rgb)
+
+    def on_camera_panel_size(self, event):
+        """Render the preview at the new panel size."""
+        if self.camera_reader_thread:
+            size = event.GetSize()
+            self.camera_reader_thread.set_preview_size(size.width, size.height)
+        event.Skip()
+
+    def _update_recording_timer(self):
+        """Update the recording timer and stop at the maximum duration."""
         elapsed = time.time() - self.recording_start_time
         mins = int(elapsed // SECONDS_IN_MINUTE)
         secs = int(elapsed % SECONDS_IN_MINUTE)
         self.recording_timer.SetLabel(f"{mins}: {secs: 02d}")
 
-        if elapsed >= self.max_video_duration:
+        if self.live_broadcaster:
+            if elapsed >= self.max_live_duration:
+                self.stop_live()
+        elif elapsed >= self.max_video_duration:
             self.stop_recording()
 
     def on_paint(self, event):
@@ -529,28 +617,22 @@ class StoryCameraFrame(wx.Frame):
 
         if self.preview_mode and self.preview_image:
             dc.DrawBitmap(self.preview_image, TOP_LEFT_X, TOP_LEFT_Y)
-        elif self._current_frame_cache is not None:
+        elif self._preview_bitmap is not None:
             self._draw_camera_frame(dc)
 
     def _draw_camera_frame(self, dc):
         """
-        Draw the current camera frame to the device context.
+        Draw the current camera preview to the device context.
 
         Args:
             dc: wx.DeviceContext to draw on
         """
-        frame = cv2.cvtColor(self._current_frame_cache, cv2.COLOR_BGR2RGB)
-        h, w = frame.shape[:CHANNELS_INDEX]
         panel_size = self.camera_panel.GetSize()
-        scale = min(panel_size.width / w, panel_size.height / h)
-        new_w, new_h = int(w * scale), int(h * scale)
-        frame = cv2.resize(frame, (new_w, new_h))
-        image = wx.Image(new_w, new_h, frame.tobytes())
-        bitmap = wx.Bitmap(image)
+        new_w, new_h = self._preview_bitmap.GetSize()
         x = (panel_size.width - new_w) // HALF
         y = (panel_size.height - new_h) // HALF
         dc.Clear()
-        dc.DrawBitmap(bitmap, x, y)
+        dc.DrawBitmap(self._preview_bitmap, x, y)
 
     def on_paint_button(self, event):
         """
@@ -589,6 +671,7 @@ class StoryCameraFrame(wx.Frame):
         Behavior depends on current mode:
         - Photo mode: Capture photo immediately
         - Video mode: Start/stop recording
+        - Live mode: Start/end the broadcast
 
         Args:
             event: wx.MouseEvent
@@ -600,6 +683,8 @@ class StoryCameraFrame(wx.Frame):
             self.capture_photo()
         elif self.mode == 'video':
             self._handle_video_button_click()
+        elif self.mode == 'live':
+            self._handle_live_button_click()
 
     def _handle_video_button_click(self):
         """Handle video mode button click (start/stop recording)."""
@@ -613,36 +698,61 @@ class StoryCameraFrame(wx.Frame):
             self.stop_recording()
         self.button_container.Refresh()
 
+    def _handle_live_button_click(self):
+        """Handle live mode button click (go live / end the broadcast)."""
+        if self.live_broadcaster is None:
+            if self.start_live():
+                self.button_expanded = True
+                self.button_size = 85
+        else:
+            self.stop_live()
+        self.button_container.Refresh()
+
     def switch_mode(self, mode):
         """
-        Switch between photo and video capture modes.
+        Switch between photo, video and live capture modes.
 
         Args:
-            mode: 'photo' or 'video'
+            mode: 'photo', 'video' or 'live'
         """
+        if self.is_recording:
+            return              # Finish the recording / broadcast first
         self.mode = mode
 
         if mode == 'photo':
             self._activate_photo_mode()
+        elif mode == 'live':
+            self._activate_live_mode()
         else:
             self._activate_video_mode()
 
+    def _highlight_mode_button(self, active_btn):
+        """Show active_btn as selected and the other mode buttons as not."""
+        for btn in (self.photo_btn, self.video_btn, self.live_btn):
+            if btn is None:
+                continue
+            if btn is active_btn:
+                btn.SetBackgroundColour(wx.Colour(255, 255, 255))
+                btn.SetForegroundColour(wx.Colour(0, 0, 0))
+            else:
+                btn.SetBackgroundColour(wx.Colour(50, 50, 50))
+                btn.SetForegroundColour(wx.Colour(150, 150, 150))
+
     def _activate_photo_mode(self):
         """Activate photo capture mode UI."""
-        self.photo_btn.SetBackgroundColour(wx.Colour(255, 255, 255))
-        self.photo_btn.SetForegroundColour(wx.Colour(0, 0, 0))
-        self.video_btn.SetBackgroundColour(wx.Colour(50, 50, 50))
-        self.video_btn.SetForegroundColour(wx.Colour(150, 150, 150))
+        self._highlight_mode_button(self.photo_btn)
         self.title_text.SetLabel("Take Photo")
 
     def _activate_video_mode(self):
         """Activate video capture mode UI."""
-        self.video_btn.SetBackgroundColour(wx.Colour(255, 255, 255))
-        self.video_btn.SetForegroundColour(wx.Colour(0, 0, 0))
-        self.photo_btn.SetBackgroundColour(wx.Colour(50, 50, 50))
-        self.photo_btn.SetForegroundColour(wx.Colour(150, 150, 150))
+        self._highlight_mode_button(self.video_btn)
         self.title_text.SetLabel("Record Video (Click to Start/Stop)")
 
+    def _activate_live_mode(self):
+        """Activate live broadcast mode UI."""
+        self._highlight_mode_button(self.live_btn)
+        self.title_text.SetLabel("Go Live (Click to Start/End)")
+
     def capture_photo(self):
         """
         Capture the current camera frame as a photo.
@@ -680,28 +790,41 @@ class StoryCameraFrame(wx.Frame):
         Start video and audio recording.
 
         Initializes:
-        - Video writer (OpenCV)
-        - Audio recorder (PyAudio)
+        - Story recorder (one ffmpeg encoder for frames and audio)
+        - Audio recorder (PyAudio), feeding the story recorder
         - Recording timer UI
         """
         if self._current_frame_cache is None or self.is_recording:
             return
 
-        self.temp_video_path = os.path.join(os.getcwd(), "story_raw.mp4")
-
-        # Initialize video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         h, w = self._current_frame_cache.shape[:CHANNELS_INDEX]
-        self.video_writer = cv2.VideoWriter(
-            self.temp_video_path,
-            fourcc,
-            20.0,
-            (w, h)
+        self._discard_recording()
+        fd, self.final_video_path = tempfile.mkstemp(
+            suffix=STORY_VIDEO_SUFFIX, prefix=STORY_FILE_PREFIX
+        )
+        os.close(fd)                    # ffmpeg writes it (-y)
+        self.story_recorder = StoryRecorder(
+            self.final_video_path,
+            self.camera_reader_thread,
+            w,
+            h
         )
 
-        # Initialize audio recorder
+        # Microphone first: the encoder is started with or without audio
         self.audio_recorder = AudioRecorder()
-        self.audio_recorder.start_recording()
+        has_audio = self.audio_recorder.start_recording(
+            sink=self.story_recorder.write_audio
+        )
+
+        if not self.story_recorder.start(has_audio):
+            self._release_audio_recorder()
+            self.story_recorder = None
+            wx.MessageBox(
+                "Cannot record video: FFmpeg is not available.",
+                "Error",
+                wx.OK | wx.ICON_ERROR
+            )
+            return
 
         # Start recording
         self.is_recording = True
@@ -713,9 +836,8 @@ class StoryCameraFrame(wx.Frame):
         Stop video and audio recording.
 
         Performs:
-        - Stops and releases video writer
-        - Stops and saves audio
-        - Merges video and audio with FFmpeg
+        - Stops the audio recorder
+        - Lets the encoder finish the video file (only its last frames remain)
         - Enters preview mode
         """
         if not self.is_recording:
@@ -724,121 +846,126 @@ class StoryCameraFrame(wx.Frame):
         self.is_recording = False
         self.recording_indicator.Hide()
 
-        # Stop video writer
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
+        self._release_audio_recorder()
 
-        # Stop and save audio
-        if self.audio_recorder:
-            self.audio_recorder.stop_recording()
-            self.audio_recorder.save_audio(self.audio_path)
-            self.audio_recorder.cleanup()
-            self.audio_recorder = None
-
-        # Create preview thumbnail
-        self._create_video_preview_thumbnail()
-
-        # Merge audio and video
-        self.final_video_path = os.path.join(os.getcwd(), "story_final.mp4")
-        merged_path = self.merge_audio_video(
-            self.temp_video_path,
-            self.audio_path,
-            self.final_video_path
-        )
+        recorder = self.story_recorder
+        self.story_recorder = None
+        if not recorder.stop():
+            self._discard_recording()
+            wx.MessageBox("Recording failed.", "Error", wx.OK | wx.ICON_ERROR)
+            self.button_expanded = False
+            self.button_size = 70
+            self.button_container.Refresh()
+            return
 
-        if merged_path is None:
-            self.final_video_path = self.temp_video_path
+        # Preview thumbnail from the first recorded frame
+        if recorder.first_frame is not None:
+            self.preview_image = self._create_preview_bitmap(recorder.first_frame)
 
         self.preview_type = 'video'
         self.enter_preview_mode()
 
-    def _create_video_preview_thumbnail(self):
-        """Extract first frame of recorded video for preview."""
-        frame_cap = cv2.VideoCapture(self.temp_video_path)
-        ret, frame = frame_cap.read()
-        frame_cap.release()
-
-        if ret and frame is not None:
-            self.preview_image = self._create_preview_bitmap(frame)
-
-    def merge_audio_video(self, video_path, audio_path, output_path):
+    def start_live(self):
         """
-        Merge video and audio using FFmpeg.
-
-        Args:
-            video_path: Path to video file
-            audio_path: Path to audio file
-            output_path: Path for merged output
+        Go live: frames and microphone audio are sent to the server as
+        they are captured and can be watched right away.
 
         Returns:
-            str: Path to merged file, or None on failure
+            bool: True if the broadcast started
         """
-        if not os.path.exists(video_path):
-            print("merge_audio_video: video file not found")
-            return None
-
-        # If no audio, just copy video
-        if not os.path.exists(audio_path):
-            return self._copy_video_without_audio(video_path, output_path)
+        if self._current_frame_cache is None or self.is_recording:
+            return False
 
-        # Merge with FFmpeg
-        return self._merge_with_ffmpeg(video_path, audio_path, output_path)
+        h, w = self._current_frame_cache.shape[:CHANNELS_INDEX]
+        broadcaster = LiveStoryBroadcaster(
+            self.live_host,
+            self.camera_reader_thread,
+            w,
+            h,
+            self.username
+        )
 
-    def _copy_video_without_audio(self, video_path, output_path):
-        """
-        Copy video file when no audio is available.
+        # Microphone first: the broadcast is announced with or without audio
+        self.audio_recorder = AudioRecorder()
+        has_audio = self.audio_recorder.start_recording(sink=broadcaster.write_audio)
+
+        if not broadcaster.start(has_audio):
+            self._release_audio_recorder()
+            wx.MessageBox(
+                "Cannot go live: the server is not reachable.",
+                "Error",
+                wx.OK | wx.ICON_ERROR
+            )
+            return False
 
-        Args:
-            video_path: Source video path
-            output_path: Destination path
+        self.live_broadcaster = broadcaster
+        self.is_recording = True
+        self.recording_start_time = time.time()
+        self.recording_indicator.Show()
+        self.title_text.SetLabel("LIVE (Click to End)")
+        return True
 
-        Returns:
-            str: Output path on success, None on failure
+    def stop_live(self):
         """
-        try:
-            import shutil
-            shutil.copy(video_path, output_path)
-            return output_path
-        except Exception as e:
-            print(f"Failed to copy video without audio: {e}")
-            return None
-
-    def _merge_with_ffmpeg(self, video_path, audio_path, output_path):
+        End the broadcast. The server saves it as a story; that is
+        waited for on a background thread (see _finish_live).
         """
-        Merge video and audio files using FFmpeg.
+        if self.live_broadcaster is None:
+            return
 
-        Args:
-            video_path: Path to video file
-            audio_path: Path to audio file
-            output_path: Path for output file
+        broadcaster = self.live_broadcaster
+        self.live_broadcaster = None
+        self.is_recording = False
+        self.recording_indicator.Hide()
+        self._release_audio_recorder()
 
-        Returns:
-            str: Output path on success, None on failure
+        self.button_expanded = False
+        self.button_size = 70
+        self.button_container.Refresh()
+        self.capture_enabled = False        # Until the server has answered
+        self.title_text.SetLabel("Saving live story...")
+        threading.Thread(
+            target=self._finish_live,
+            args=(broadcaster,),
+            daemon=True,
+            name="LiveStoryFinish"
+        ).start()
+
+    def _finish_live(self, broadcaster):
+        """Background thread: end the broadcast and wait until it is saved."""
+        story = broadcaster.stop()
+        if story is not None and self.live_posted_callback:
+            wx.CallAfter(self.live_posted_callback, story)
+        wx.CallAfter(self._on_live_saved, story)
+
+    def _on_live_saved(self, story):
         """
-        command = [
-            "ffmpeg", "-y",
-            "-i", video_path,
-            "-i", audio_path,
-            "-c:v", "copy",
-            "-c:a", "aac",
-            "-shortest",
-            output_path
-        ]
+        Called on the UI thread once the server saved (or failed to
+        save) the broadcast.
 
-        try:
-            result = subprocess.run(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+        Args:
+            story: The saved story record, or None
+        """
+        if not self:
+            return              # Window closed meanwhile
+        self.capture_enabled = True
+        if self.mode == 'live':
+            self._activate_live_mode()
+        if story is None:
+            wx.MessageBox("Live story was not saved.", "Error", wx.OK | wx.ICON_ERROR)
+        else:
+            wx.MessageBox(
+                "Live story saved!",
+                "Success",
+                wx.OK | wx.ICON_INFORMATION
             )
-            if result.returncode != EXIT_CODE_SUCCESS:
-                print("ffmpeg error:", result.stderr.decode(errors='ignore'))
-                return None
-            return output_path
-        except Exception as e:
-            print("merge_audio_video: exception while running ffmpeg:", e)
-            return None
+
+    def _release_audio_recorder(self):
+        """Stop the microphone and release PyAudio."""
+        if self.audio_recorder:
+            self.audio_recorder.stop_recording()
+            self.audio_recorder.cleanup()
+            self.audio_recorder = None
 
     def enter_preview_mode(self):
         """Switch UI to preview mode."""
@@ -864,8 +991,23 @@ class StoryCameraFrame(wx.Frame):
         Args:
             event: wx.Event
         """
+        self._discard_recording()
         self.exit_preview_mode()
 
+    def _discard_recording(self):
+        """Delete the current recording unless an upload is reading it."""
+        path = self.final_video_path
+        self.final_video_path = None
+        if path and path != self._posting_path:
+            self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
     def on_watch_video(self, event):
         """
         Open recorded video in default media player.
@@ -876,11 +1018,7 @@ class StoryCameraFrame(wx.Frame):
         if self.preview_type != 'video':
             return
 
-        path_to_open = (
-            self.final_video_path
-            if self.final_video_path and os.path.exists(self.final_video_path)
-            else self.temp_video_path
-        )
+        path_to_open = self.final_video_path
 
         if not path_to_open or not os.path.exists(path_to_open):
             return
@@ -928,6 +1066,9 @@ class StoryCameraFrame(wx.Frame):
 
     def _post_video(self):
         """Post recorded video using UploadThread."""
+        if self._posting_path is not None:
+            return                      # Already posting this recording
+        self._posting_path = self.final_video_path
         UploadThread(
             None,
             self.final_video_path,
@@ -944,6 +1085,9 @@ class StoryCameraFrame(wx.Frame):
         Args:
             media_type: 'photo' or 'video'
         """
+        if media_type == 'video':
+            # The server has its own copy now
+            self._finish_posting(keep=False)
         wx.MessageBox(
             f"{media_type.capitalize()} posted successfully!",
             "Success",
@@ -951,19 +1095,38 @@ class StoryCameraFrame(wx.Frame):
         )
         self.on_retake(None)
 
-    def post_failed(self, message):
+    def post_failed(self, message, media_type=None):
         """
         Called by UploadThread on upload failure.
 
         Args:
             message: Error message to display
+            media_type: 'photo' or 'video'
         """
+        if media_type == 'video':
+            # Kept for another try while it is still the one in preview
+            self._finish_posting(keep=True)
         wx.MessageBox(
             f"Failed to post: {message}",
             "Error",
             wx.OK | wx.ICON_ERROR
         )
 
+    def _finish_posting(self, keep):
+        """
+        The upload of _posting_path ended; delete the recording unless it
+        is kept and still the current one.
+        """
+        path = self._posting_path
+        self._posting_path = None
+        if path is None:
+            return
+        if path == self.final_video_path:
+            if keep:
+                return
+            self.final_video_path = None
+        self._remove_file(path)
+
     def on_close(self, event):
         """
         Clean up resources and close window.
@@ -971,6 +1134,18 @@ class StoryCameraFrame(wx.Frame):
         Args:
             event: wx.Event (can be None)
         """
+        # End a broadcast in progress (the server still saves it)
+        if self.live_broadcaster:
+            self.stop_live()
+
+        # Stop a recording in progress (ends the ffmpeg encoder)
+        if self.is_recording:
+            self.is_recording = False
+            self._release_audio_recorder()
+            self.story_recorder.stop()
+            self.story_recorder = None
+        self._discard_recording()
+
         # Stop camera threads
         if self.camera_reader_thread:
             self.camera_reader_thread.stop()
@@ -995,18 +1170,26 @@ if __name__ == '__main__':
             else None
         )
 
-        def on_post_subprocess(caption, media_type, media_data):
-            """Handle story post in subprocess mode."""
+        def on_post_subprocess(caption, media_type, media_path):
+            """
+            Handle story post in subprocess mode: copy the media next to
+            callback_file (the original may be a temp file) and pickle
+            the record there.
+            """
+            data = {
+                'posted': True,
+                'caption': caption,
+                'media_type': media_type,
+                'media_path': media_path
+            }
             if callback_file:
                 import pickle
-                data = {
-                    'posted': True,
-                    'caption': caption,
-                    'media_type': media_type,
-                    'media_data': media_data
-                }
+                import shutil
+                ext = os.path.splitext(media_path)[1]
+                data['media_path'] = shutil.copyfile(media_path, callback_file + ext)
                 with open(callback_file, 'wb') as f:
                     pickle.dump(data, f)
+            return data
 
         def on_closed_subprocess():
             """Handle window close in subprocess mode."""
@@ -1020,12 +1203,13 @@ if __name__ == '__main__':
         app.MainLoop()
     else:
         # Test mode
-        def test_callback(caption, media_type, media_data):
+        def test_callback(caption, media_type, media_path):
             """Test callback for development."""
             print(f"Callback received data.")
             print(f"Caption: {caption}")
             print(f"Media Type: {media_type}")
-            print(f"Media Data Length: {len(media_data)} characters")
+            print(f"Media File: {media_path} ({os.path.getsize(media_path)} bytes)")
+            return {'caption': caption, 'media_type': media_type}
 
         def closed_callback():
             """Test close callback."""
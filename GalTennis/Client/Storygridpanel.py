@@ -4,17 +4,18 @@ Story grid panel for displaying story thumbnails.
 Shows images and videos in a scrollable grid layout.
 REFACTORED: Separated class, all constants added, methods split.
 FIXED: on_media_double_click now reads and passes ticket from PLAY_STORY response.
+CHANGED: Double click plays the clicked story and the ones after it in the
+         grid as one playlist (prefetched, no reconnect between stories)
+CHANGED: Stories are read on a background thread and each one is added
+         to the grid as the thumbnail server sends it
 """
+import threading
 import time
 import wx
-import socket
-import json
 import base64
 import io
 from story_player_client import run_story_player_client
-import key_exchange
-import aes_cipher
-from Protocol import Protocol
+from thumbnail_client import ThumbnailClient, REQUEST_GET_MEDIA
 
 
 # Server Configuration
@@ -24,6 +25,9 @@ STORY_THUMBNAIL_PORT = 2222
 # Timing
 TWO_SECOND_PAUSE = 2
 
+# Playlist started by a double click (clicked story + the ones after it)
+MAX_PLAYLIST_STORIES = 20
+
 # Grid Display
 THUMBNAIL_SIZE = 200
 GRID_COLUMNS = 3
@@ -72,12 +76,11 @@ class StoryGridPanel(wx.Panel):
         """
         super().__init__(parent)
         self.media_data = []
+        self._load_generation = 0     # Bumped per load; older loads stop adding
         self.client_ref = client_ref
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((SERVER_IP, STORY_THUMBNAIL_PORT))
-        temp_conn = (self.sock, None)
-        key = key_exchange.KeyExchange.send_recv_key(temp_conn)
-        self.conn = (self.sock, key)
+        self.thumbs = ThumbnailClient(
+            STORY_THUMBNAIL_PORT, REQUEST_GET_MEDIA, SERVER_IP
+        )
 
         self._init_ui()
 
@@ -121,35 +124,49 @@ class StoryGridPanel(wx.Panel):
         Args:
             event: wx.Event
         """
-        try:
-            # Fetch story data from thumbnail server
-            self.media_data = self._fetch_stories_from_server()
+        # Start from an empty grid; stories are added as they arrive
+        self.grid_sizer.Clear(True)
+        self.media_data = []
+        self._load_generation += 1
 
-            # Display in grid
-            self.display_media()
+        threading.Thread(
+            target=self._fetch_stories_from_server,
+            args=(self._load_generation,),
+            daemon=True,
+            name="StoryThumbnailLoad"
+        ).start()
 
+    def _fetch_stories_from_server(self, generation):
+        """
+        Connect to story thumbnail server and hand each story to the UI
+        thread as it arrives (runs on a worker thread).
+
+        Args:
+            generation: Load this fetch belongs to
+        """
+        try:
+            self.thumbs.fetch_media(
+                on_item=lambda item: wx.CallAfter(self._add_media_item, generation, item)
+            )
         except Exception as e:
-            self._show_error(f"Error connecting to server: {e}")
+            wx.CallAfter(self._show_error, f"Error connecting to server: {e}")
 
-    def _fetch_stories_from_server(self):
+    def _add_media_item(self, generation, media_item):
         """
-        Connect to story thumbnail server and fetch data.
+        Add one received story to the grid, unless a newer load started.
 
-        Returns:
-            list: Story data with thumbnails
+        Args:
+            generation: Load the story came from
+            media_item: Story data dictionary
         """
-        # Send request
-        request_data = json.dumps({
-            "type": 'GET_MEDIA',
-            "payload": {}
-        })
-        Protocol.send(request_data, self.conn)
+        if not self or generation != self._load_generation:
+            return
 
-        # Receive response
-        response_data = Protocol.recv(self.conn)
+        self.media_data.append(media_item)
+        self.grid_sizer.Add(self._create_story_panel(media_item), 0, wx.EXPAND)
 
-        # Decode and return
-        return json.loads(response_data.get('payload'))
+        self.scroll.Layout()
+        self.scroll.FitInside()
 
     def display_media(self):
         """Display stories in grid."""
@@ -267,7 +284,7 @@ class StoryGridPanel(wx.Panel):
 
         try:
             # Request server to prepare story streaming and get a ticket
-            response = self._request_story_playback(story_name)
+            response = self._request_story_playback(self._playlist_from(media_item))
 
             if response.get('status') == 'success':
                 port   = response.get('port')
@@ -289,10 +306,19 @@ class StoryGridPanel(wx.Panel):
         except Exception as e:
             self._show_error(f"Error starting story player:\n{str(e)}")
 
-    def _request_story_playback(self, story_name):
-        """Send PLAY_STORY request to main server."""
+    def _playlist_from(self, media_item):
+        """Names of the clicked story and the stories after it in the grid."""
+        start = next(
+            (i for i, item in enumerate(self.media_data) if item is media_item), 0
+        )
+        items = self.media_data[start:start + MAX_PLAYLIST_STORIES] or [media_item]
+        return [item['name'] for item in items]
+
+    def _request_story_playback(self, story_names):
+        """Send PLAY_STORY request (playlist of story names) to main server."""
         return self.client_ref._send_request('PLAY_STORY', {
-            'filename': story_name
+            'filename': story_names[0],
+            'filenames': story_names
         })
 
     def _show_error(self, message):
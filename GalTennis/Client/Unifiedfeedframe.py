@@ -2,10 +2,16 @@
 Gal Haham
 Unified Feed Frame - Main application window with tabs
 Combines Stories and Videos in one clean interface
+CHANGED: Clicking a story plays it and the stories after it as one
+         playlist (prefetched, no reconnect between stories)
+CHANGED: A posted story shows up as soon as the server acknowledges it
+ADDED: Live stories - running broadcasts are listed above the stories
+       grid (double-click to watch), and the camera can go live
+CHANGED: The stories and videos grids fill in as the thumbnail server
+         sends each item, read on a background thread
 """
+import threading
 import wx
-import socket
-import json
 import base64
 import io
 import time
@@ -14,6 +20,8 @@ from VideoInteractionFrame import VideoInteractionFrame
 from UploadVideoFrame import UploadVideoFrame
 from Video_Player_Client import run_video_player_client
 from story_player_client import run_story_player_client
+from live_story_client import run_live_story_client
+from thumbnail_client import story_thumbnail_client, video_thumbnail_client
 
 # Window Configuration
 WINDOW_WIDTH = 900
@@ -27,6 +35,9 @@ COLOR_TAB_INACTIVE = wx.Colour(200, 200, 200)  # Inactive tab
 COLOR_BACKGROUND = wx.Colour(245, 245, 245)  # Light gray
 COLOR_WHITE = wx.WHITE
 COLOR_TEXT_DARK = wx.Colour(50, 50, 50)
+COLOR_LIVE = wx.Colour(220, 50, 50)
+COLOR_TEXT_MUTED = wx.Colour(150, 150, 150)
+COLOR_ERROR = wx.Colour(200, 0, 0)
 
 # Grid
 GRID_COLUMNS = 3
@@ -37,10 +48,15 @@ THUMBNAIL_SIZE = 200
 SERVER_IP = '127.0.0.1'
 STORY_THUMBNAIL_PORT = 2222
 VIDEO_THUMBNAIL_PORT = 2223
-RECV_BUFFER_SIZE = 4096
 
 # Timing
 SERVER_START_DELAY = 1
+MAX_PLAYLIST_STORIES = 20
+
+# Grid status line
+LABEL_LOADING = "Loading..."
+STATUS_MARGIN = 50
+GRID_MARGIN = 20
 
 
 class UnifiedFeedFrame(wx.Frame):
@@ -68,6 +84,11 @@ class UnifiedFeedFrame(wx.Frame):
         # Initialize data
         self.stories_data = []
         self.videos_data = []
+        self._grid_generation = 0     # Bumped per grid; older loads stop adding
+
+        # Persistent thumbnail connections, reused across tab switches
+        self.story_thumbs = story_thumbnail_client(SERVER_IP)
+        self.video_thumbs = video_thumbnail_client(SERVER_IP)
 
         # Build UI
         self._init_ui()
@@ -233,77 +254,81 @@ class UnifiedFeedFrame(wx.Frame):
         header_panel.SetSizer(header_sizer)
         self.content_sizer.Add(header_panel, 0, wx.EXPAND)
 
-        # Load and display stories
+        # Live broadcasts first, then the stories grid
+        self._load_and_display_live_stories()
         self._load_and_display_stories()
 
     def _load_and_display_stories(self):
-        """Load stories from server and display in grid."""
-        try:
-            # Request server to start thumbnail server
-            response = self.client._send_request(
-                'GET_IMAGES_OF_ALL_VIDEOS',
-                {}
-            )
-            time.sleep(SERVER_START_DELAY)
-
-            # Fetch stories
-            self.stories_data = self._fetch_stories_from_server()
-
-            if not self.stories_data:
-                no_stories = wx.StaticText(
-                    self.content_scroll,
-                    label="No stories yet. Post your first story!"
-                )
-                no_stories.SetForegroundColour(wx.Colour(150, 150, 150))
-                self.content_sizer.Add(
-                    no_stories,
-                    0,
-                    wx.ALL | wx.ALIGN_CENTER,
-                    50
-                )
-            else:
-                # Create grid
-                grid_panel = wx.Panel(self.content_scroll)
-                grid_panel.SetBackgroundColour(COLOR_BACKGROUND)
-                grid_sizer = wx.GridSizer(
-                    cols=GRID_COLUMNS,
-                    hgap=GRID_GAP,
-                    vgap=GRID_GAP
-                )
+        """Load stories from server and display them in a grid as they arrive."""
+        # Request server to start thumbnail server
+        self.client._send_request('GET_IMAGES_OF_ALL_VIDEOS', {})
 
-                for story in self.stories_data:
-                    story_card = self._create_story_card(grid_panel, story)
-                    grid_sizer.Add(story_card, 0, wx.EXPAND)
+        self.stories_data = []
+        self._stream_grid(
+            self.story_thumbs,
+            self.stories_data,
+            self._create_story_card,
+            "No stories yet. Post your first story!",
+            "Error loading stories"
+        )
 
-                grid_panel.SetSizer(grid_sizer)
-                self.content_sizer.Add(
-                    grid_panel,
-                    0,
-                    wx.ALL | wx.ALIGN_CENTER,
-                    20
-                )
+    def _load_and_display_live_stories(self):
+        """Show a LIVE card for each running broadcast, if any."""
+        response = self.client._send_request('GET_LIVE_STORIES', {})
+        broadcasts = response.get('broadcasts') or []
+        if response.get('status') != 'success' or not broadcasts:
+            return
+
+        live_panel = wx.Panel(self.content_scroll)
+        live_panel.SetBackgroundColour(COLOR_BACKGROUND)
+        live_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        for broadcast in broadcasts:
+            live_sizer.Add(
+                self._create_live_card(live_panel, broadcast, response.get('port')),
+                0,
+                wx.ALL,
+                5
+            )
+        live_panel.SetSizer(live_sizer)
+        self.content_sizer.Add(live_panel, 0, wx.LEFT | wx.RIGHT, 15)
+
+    def _create_live_card(self, parent, broadcast, port):
+        """Create the card of one running broadcast."""
+        card = wx.StaticText(
+            parent,
+            label=f"  LIVE  {broadcast['username']} ({broadcast['viewers']} watching)  "
+        )
+        card.SetBackgroundColour(COLOR_LIVE)
+        card.SetForegroundColour(COLOR_WHITE)
+        card.SetFont(
+            wx.Font(
+                10,
+                wx.FONTFAMILY_DEFAULT,
+                wx.FONTSTYLE_NORMAL,
+                wx.FONTWEIGHT_BOLD
+            )
+        )
+        card.SetCursor(wx.Cursor(wx.CURSOR_HAND))
+        card.Bind(
+            wx.EVT_LEFT_DCLICK,
+            lambda e: self.on_live_story_click(broadcast, port)
+        )
+        return card
 
+    def on_live_story_click(self, broadcast, port):
+        """Watch a running broadcast."""
+        print(f"Watching live story of {broadcast['username']}")
+        try:
+            run_live_story_client(broadcast['broadcast_id'], host=SERVER_IP, port=port)
         except Exception as e:
-            error_msg = wx.StaticText(
-                self.content_scroll,
-                label=f"Error loading stories: {str(e)}"
+            wx.MessageBox(
+                f"Error watching live story: {str(e)}",
+                "Error",
+                wx.OK | wx.ICON_ERROR
             )
-            error_msg.SetForegroundColour(wx.Colour(200, 0, 0))
-            self.content_sizer.Add(error_msg, 0, wx.ALL | wx.ALIGN_CENTER, 50)
-
-        self.content_scroll.Layout()
-        self.content_scroll.FitInside()
-
-    def _fetch_stories_from_server(self):
-        """Fetch stories from thumbnail server."""
-        response = self.client._send_request(
-            'GET_MEDIA',
-            {}
-        )
-        print("_fetch_stories_from_server")
-        print(response.get('payload'))
-        # return json.loads(response.get('payload'))
-        return response.get('payload')
+        # The broadcast may have ended and been saved meanwhile; rebuild
+        # after this handler returns, since it destroys the card
+        wx.CallAfter(self._on_story_posted)
 
     def _create_story_card(self, parent, story):
         """Create a story thumbnail card."""
@@ -347,8 +372,13 @@ class UnifiedFeedFrame(wx.Frame):
         print(f"Playing story: {story_name}")
 
         try:
+            start = next(
+                (i for i, item in enumerate(self.stories_data) if item is story), 0
+            )
+            playlist = self.stories_data[start:start + MAX_PLAYLIST_STORIES] or [story]
             response = self.client._send_request('PLAY_STORY', {
-                'filename': story_name
+                'filename': story_name,
+                'filenames': [item['name'] for item in playlist]
             })
 
             if response.get('status') == 'success':
@@ -381,8 +411,12 @@ class UnifiedFeedFrame(wx.Frame):
     def on_post_story(self, event):
         """Open camera to post new story."""
 
-        def on_post_callback(caption, media_type, media_data):
-            self.client.on_story_post_callback(caption, media_type, media_data)
+        def on_post_callback(caption, media_type, media_path):
+            # Runs on the upload thread; the returned record is the ack
+            story = self.client.on_story_post_callback(caption, media_type, media_path)
+            if story is not None:
+                wx.CallAfter(self._on_story_posted)
+            return story
 
         def on_closed_callback():
             print("Camera closed")
@@ -391,9 +425,16 @@ class UnifiedFeedFrame(wx.Frame):
             None,
             self.username,
             on_post_callback,
-            on_closed_callback
+            on_closed_callback,
+            live_host=SERVER_IP,
+            live_posted_callback=lambda story: self._on_story_posted()
         )
 
+    def _on_story_posted(self):
+        """Show the new story if the stories tab is open."""
+        if self.current_tab == "stories":
+            self.show_stories_tab()
+
     def show_videos_tab(self):
         """Show videos tab with grid of thumbnails."""
         self.current_tab = "videos"
@@ -434,76 +475,84 @@ class UnifiedFeedFrame(wx.Frame):
         self._load_and_display_videos()
 
     def _load_and_display_videos(self):
-        """Load videos from server and display in grid."""
-        try:
-            # Request server to start thumbnail server
-            response = self.client._send_request('GET_ALL_VIDEOS_GRID', {})
-            time.sleep(SERVER_START_DELAY)
+        """Load videos from server and display them in a grid as they arrive."""
+        # Request server to start thumbnail server
+        self.client._send_request('GET_ALL_VIDEOS_GRID', {})
 
-            # Fetch videos
-            self.videos_data = self._fetch_videos_from_server()
-
-            if not self.videos_data:
-                no_videos = wx.StaticText(
-                    self.content_scroll,
-                    label="No videos yet. Upload your first video!"
-                )
-                no_videos.SetForegroundColour(wx.Colour(150, 150, 150))
-                self.content_sizer.Add(
-                    no_videos,
-                    0,
-                    wx.ALL | wx.ALIGN_CENTER,
-                    50
-                )
-            else:
-                # Create grid
-                grid_panel = wx.Panel(self.content_scroll)
-                grid_panel.SetBackgroundColour(COLOR_BACKGROUND)
-                grid_sizer = wx.GridSizer(
-                    cols=GRID_COLUMNS,
-                    hgap=GRID_GAP,
-                    vgap=GRID_GAP
-                )
+        self.videos_data = []
+        self._stream_grid(
+            self.video_thumbs,
+            self.videos_data,
+            self._create_video_card,
+            "No videos yet. Upload your first video!",
+            "Error loading videos"
+        )
 
-                for video in self.videos_data:
-                    video_card = self._create_video_card(grid_panel, video)
-                    grid_sizer.Add(video_card, 0, wx.EXPAND)
+    def _stream_grid(self, thumbs, items, create_card, empty_label, error_prefix):
+        """
+        Add an empty grid to the content area and fill it from a
+        background thread, one card per item as the thumbnail server
+        sends it.
+
+        Args:
+            thumbs: ThumbnailClient to read from
+            items: List the received items are appended to
+            create_card: create_card(parent, item) → card panel
+            empty_label: Shown if the server has no items
+            error_prefix: Shown before the error if loading fails
+        """
+        self._grid_generation += 1
+        generation = self._grid_generation
+
+        status = wx.StaticText(self.content_scroll, label=LABEL_LOADING)
+        status.SetForegroundColour(COLOR_TEXT_MUTED)
+        self.content_sizer.Add(status, 0, wx.ALL | wx.ALIGN_CENTER, STATUS_MARGIN)
+
+        grid_panel = wx.Panel(self.content_scroll)
+        grid_panel.SetBackgroundColour(COLOR_BACKGROUND)
+        grid_sizer = wx.GridSizer(cols=GRID_COLUMNS, hgap=GRID_GAP, vgap=GRID_GAP)
+        grid_panel.SetSizer(grid_sizer)
+        self.content_sizer.Add(grid_panel, 0, wx.ALL | wx.ALIGN_CENTER, GRID_MARGIN)
+        self._refresh_content()
+
+        def is_current():
+            # The grid is destroyed when the tab is rebuilt
+            return bool(grid_panel) and generation == self._grid_generation
+
+        def add_card(item):
+            if not is_current():
+                return
+            if status.IsShown():
+                status.Hide()
+            items.append(item)
+            grid_sizer.Add(create_card(grid_panel, item), 0, wx.EXPAND)
+            self._refresh_content()
+
+        def finish(error):
+            if not is_current():
+                return
+            if error is not None:
+                status.SetLabel(f"{error_prefix}: {error}")
+                status.SetForegroundColour(COLOR_ERROR)
+                status.Show()
+            elif not items:
+                status.SetLabel(empty_label)
+            self._refresh_content()
+
+        def load():
+            time.sleep(SERVER_START_DELAY)
+            try:
+                thumbs.fetch_media(on_item=lambda item: wx.CallAfter(add_card, item))
+                wx.CallAfter(finish, None)
+            except Exception as e:
+                wx.CallAfter(finish, e)
 
-                grid_panel.SetSizer(grid_sizer)
-                self.content_sizer.Add(
-                    grid_panel,
-                    0,
-                    wx.ALL | wx.ALIGN_CENTER,
-                    20
-                )
-
-        except Exception as e:
-            error_msg = wx.StaticText(
-                self.content_scroll,
-                label=f"Error loading videos: {str(e)}"
-            )
-            error_msg.SetForegroundColour(wx.Colour(200, 0, 0))
-            self.content_sizer.Add(error_msg, 0, wx.ALL | wx.ALIGN_CENTER, 50)
+        threading.Thread(target=load, daemon=True, name="ThumbnailLoad").start()
 
+    def _refresh_content(self):
         self.content_scroll.Layout()
         self.content_scroll.FitInside()
 
-    def _fetch_videos_from_server(self):
-        """Fetch videos from thumbnail server."""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((SERVER_IP, VIDEO_THUMBNAIL_PORT))
-        sock.sendall("GET_VIDEOS_MEDIA".encode('utf-8'))
-
-        response = b""
-        while True:
-            chunk = sock.recv(RECV_BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-        sock.close()
-
-        return json.loads(response.decode('utf-8'))
-
     def _create_video_card(self, parent, video):
         """Create a video thumbnail card."""
         card = wx.Panel(parent, size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE + 100))
@@ -608,6 +657,9 @@ class UnifiedFeedFrame(wx.Frame):
         )
 
         if result == wx.YES:
+            self.story_thumbs.close()
+            self.video_thumbs.close()
+
             # Close this window
             self.Destroy()
 
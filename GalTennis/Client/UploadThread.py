@@ -1,20 +1,29 @@
 """
 Gal Haham
-Background thread for Base64 encoding and story upload processing.
+Background thread for story upload processing.
 Prevents UI blocking during media file encoding operations.
+CHANGED: The post callback runs in this thread and returns the story the
+         server acknowledged; success is reported only after that ack
+CHANGED: The callback gets a file path, not base64 data - a photo is
+         written once as JPEG, a video is posted from where it was
+         recorded, and the uploader streams the file in chunks
+FIXED: A photo is written to its own temp file (tempfile.mkstemp), not
+       story.jpg in the working directory, so concurrent posts and
+       camera windows cannot overwrite or delete each other's file
 """
+import tempfile
 import threading
-import time
 import os
-import base64
 import cv2
 import wx
-INITIAL_DELAY_SECONDS = 1
+
+PHOTO_PREFIX = "story_"
+PHOTO_SUFFIX = ".jpg"
 
 
 class UploadThread(threading.Thread):
     """
-    Handles the slow Base64 encoding and I/O operations in a separate thread
+    Handles the slow encoding and I/O operations in a separate thread
     when posting the story.
     """
 
@@ -36,35 +45,40 @@ class UploadThread(threading.Thread):
         self.start()
 
     def run(self):
-        """Performs media encoding in a background thread."""
-        time.sleep(INITIAL_DELAY_SECONDS)
-        media_data = ""
+        """Writes the media file if needed and uploads it in a background thread."""
+        media_path = None
+        temp_path = None
 
         if self.media_type == 'photo' and self.frame_ref is not None:
-            ret, buf = cv2.imencode('.jpg', self.frame_ref)
-            if ret:
-                media_data = base64.b64encode(buf).decode('utf-8')
+            fd, temp_path = tempfile.mkstemp(suffix=PHOTO_SUFFIX, prefix=PHOTO_PREFIX)
+            os.close(fd)
+            if cv2.imwrite(temp_path, self.frame_ref):
+                media_path = temp_path
+            else:
+                os.remove(temp_path)
 
         elif (self.media_type == 'video' and
               self.video_path and
               os.path.exists(self.video_path)):
-            try:
-                with open(self.video_path, 'rb') as f:
-                    media_data = base64.b64encode(f.read()).decode('utf-8')
-            except Exception as e:
-                wx.CallAfter(
-                    self.parent_frame.post_failed,
-                    f"Video Read Error: {e}"
-                )
-                return
+            media_path = self.video_path
+
+        if media_path is None:
+            wx.CallAfter(self.parent_frame.post_failed, "No media file to post",
+                         self.media_type)
+            return
+
+        story = None
+        try:
+            if self.callback:
+                story = self.callback(self.caption, self.media_type, media_path)
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
 
-        if self.callback:
-            wx.CallAfter(
-                self.callback,
-                self.caption,
-                self.media_type,
-                media_data
-            )
+        if story is None:
+            wx.CallAfter(self.parent_frame.post_failed, "Story was not posted",
+                         self.media_type)
+            return
 
         wx.CallAfter(
             self.parent_frame.post_successful,
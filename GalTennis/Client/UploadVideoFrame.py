@@ -4,10 +4,24 @@ GUI window for uploading new videos to the Tennis Social platform.
 Handles file selection, metadata input, file copying,
 and database registration.
 REFACTORED: on_upload method split into focused helper methods.
+CHANGED: Upload goes through the chunked upload server (VideoUploader)
+         on a background thread with a progress bar, instead of one
+         base64 UPLOAD_VIDEO request that blocked the UI.
+ADDED: After the upload, the window follows the server's ingest job
+       (GET_JOB_STATUS) and reports when the video is ready or if
+       processing failed.
 """
 import wx
 import os
-import base64
+import threading
+from video_uploader import VideoUploader
+
+REQUEST_START_VIDEO_UPLOAD = "START_VIDEO_UPLOAD"
+GAUGE_RANGE = 100
+BYTES_PER_MB = 1024 * 1024
+JOB_POLL_INTERVAL_MS = 1000
+JOB_DONE = "done"
+JOB_FAILED = "failed"
 
 
 class UploadVideoFrame(wx.Frame):
@@ -16,9 +30,10 @@ class UploadVideoFrame(wx.Frame):
 
     Upload Process:
     1. User selects video file from their computer
-    2. File is SENT to server over network (base64 encoded)
-    3. Server saves file to videos/ folder
+    2. File is SENT to the upload server in encrypted chunks
+    3. Server verifies the hash and moves the file to videos/
     4. Metadata (title, category, level) is saved to database
+       together with step 3
 
     FIXED: Works when client and server are on different machines.
     """
@@ -30,10 +45,17 @@ class UploadVideoFrame(wx.Frame):
         Args:
             client: Client instance for server communication
         """
-        super().__init__(parent=None, title="Upload Video", size=(550, 450))
+        super().__init__(parent=None, title="Upload Video", size=(550, 500))
 
         self.client = client
         self.selected_file_path = None
+        self.upload_thread = None
+        self.job_id = None
+        self.uploaded_data = None
+
+        self.job_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._on_job_timer, self.job_timer)
+        self.Bind(wx.EVT_CLOSE, self.on_close_window)
 
         self.SetBackgroundColour(wx.Colour(245, 245, 245))
 
@@ -54,6 +76,7 @@ class UploadVideoFrame(wx.Frame):
         self._add_instructions(panel, vbox)
         self._add_file_selection(panel, vbox)
         self._add_metadata_form(panel, vbox)
+        self._add_progress(panel, vbox)
         self._add_action_buttons(panel, vbox)
 
         panel.SetSizer(vbox)
@@ -181,6 +204,15 @@ class UploadVideoFrame(wx.Frame):
         self.level_choice.SetSelection(0)
         sizer.Add(self.level_choice, 0, wx.LEFT | wx.RIGHT | wx.BOTTOM, 15)
 
+    def _add_progress(self, panel, sizer):
+        """Add upload progress bar and status text."""
+        self.progress_gauge = wx.Gauge(panel, range=GAUGE_RANGE, size=(400, 15))
+        sizer.Add(self.progress_gauge, 0, wx.ALIGN_CENTER | wx.TOP, 5)
+
+        self.progress_label = wx.StaticText(panel, label="")
+        self.progress_label.SetForegroundColour(wx.Colour(100, 100, 100))
+        sizer.Add(self.progress_label, 0, wx.ALIGN_CENTER | wx.ALL, 5)
+
     def _add_action_buttons(self, panel, sizer):
         """Add upload and cancel buttons."""
         btn_font = wx.Font(
@@ -190,12 +222,12 @@ class UploadVideoFrame(wx.Frame):
             wx.FONTWEIGHT_BOLD,
         )
         # Upload button
-        btn_upload = wx.Button(panel, label=" Upload Video", size=(250, 45))
-        btn_upload.SetBackgroundColour(wx.Colour(76, 175, 80))
-        btn_upload.SetForegroundColour(wx.WHITE)
-        btn_upload.SetFont(btn_font)
-        btn_upload.Bind(wx.EVT_BUTTON, self.on_upload)
-        sizer.Add(btn_upload, 0, wx.ALIGN_CENTER | wx.ALL, 15)
+        self.btn_upload = wx.Button(panel, label=" Upload Video", size=(250, 45))
+        self.btn_upload.SetBackgroundColour(wx.Colour(76, 175, 80))
+        self.btn_upload.SetForegroundColour(wx.WHITE)
+        self.btn_upload.SetFont(btn_font)
+        self.btn_upload.Bind(wx.EVT_BUTTON, self.on_upload)
+        sizer.Add(self.btn_upload, 0, wx.ALIGN_CENTER | wx.ALL, 15)
 
         # Cancel button
         btn_cancel = wx.Button(panel, label="Cancel", size=(250, 35))
@@ -235,7 +267,8 @@ class UploadVideoFrame(wx.Frame):
     def on_upload(self, event):
         """
         Handle video upload - REFACTORED into smaller steps.
-        FIXED: Now sends file over network instead of local copy.
+        The transfer runs on a background thread; the result comes
+        back through wx.CallAfter.
 
         Args:
             event: wx.Event
@@ -243,33 +276,28 @@ class UploadVideoFrame(wx.Frame):
         # Step 1: Validate
         if not self._validate_upload():
             return
+        if self.upload_thread is not None and self.upload_thread.is_alive():
+            return
 
         # Step 2: Prepare upload data
         upload_data = self._prepare_upload_data()
 
-        # Step 3: Show progress
-        wx.BeginBusyCursor()
-
-        try:
-            # Step 4: Read and encode file
-            file_content = self._read_file_as_base64()
-            if file_content is None:
-                wx.EndBusyCursor()
-                return
-
-            # Step 5: Send to server
-            success = self._upload_to_server(upload_data, file_content)
-
-            # Step 6: Handle result
-            if success:
-                self._handle_upload_success(upload_data)
-            else:
-                self._handle_upload_failure()
+        # Step 3: Find the upload server
+        port = self._get_upload_port()
+        if port is None:
+            self._handle_upload_failure("Upload server is not available.")
+            return
 
-        except Exception as e:
-            self._handle_general_error(e)
-        finally:
-            wx.EndBusyCursor()
+        # Step 4: Upload in the background
+        self.btn_upload.Disable()
+        self.progress_gauge.SetValue(0)
+        self.progress_label.SetLabel("Preparing upload...")
+        self.upload_thread = threading.Thread(
+            target=self._upload_worker,
+            args=(port, upload_data),
+            daemon=True
+        )
+        self.upload_thread.start()
 
     def _validate_upload(self):
         """
@@ -309,81 +337,165 @@ class UploadVideoFrame(wx.Frame):
             'filename': os.path.basename(self.selected_file_path)
         }
 
-    def _read_file_as_base64(self):
+    def _get_upload_port(self):
         """
-        Read video file and encode as base64 string.
+        Ask the main server to start the upload server.
 
         Returns:
-            str: Base64 encoded file content, or None if error
+            int: Upload server port, or None if unavailable
         """
-        try:
-            print(f"Reading file: {self.selected_file_path}")
-            with open(self.selected_file_path, 'rb') as f:
-                file_content = f.read()
+        response = self.client._send_request(REQUEST_START_VIDEO_UPLOAD, {})
+        if not response or response.get("status") != "success":
+            return None
+        return response.get("port")
 
-            # Encode to base64
-            encoded = base64.b64encode(file_content).decode('utf-8')
-            print(f"File encoded successfully")
-            return encoded
+    def _upload_worker(self, port, upload_data):
+        """
+        Upload the selected file (background thread).
 
-        except Exception as e:
-            print(f"Error reading file: {e}")
-            wx.MessageBox(
-                f"Failed to read video file: \n{str(e)}",
-                "Read Error",
-                wx.OK | wx.ICON_ERROR
+        Args:
+            port: Upload server port
+            upload_data: Dict containing upload information
+        """
+        try:
+            uploader = VideoUploader(self.client.host, port)
+            response = uploader.upload(
+                self.selected_file_path,
+                upload_data['filename'],
+                upload_data['category'],
+                upload_data['level'],
+                self.client.username,
+                progress=lambda done, total: wx.CallAfter(
+                    self._on_upload_progress, done, total
+                )
             )
-            return None
+        except Exception as e:
+            wx.CallAfter(self._handle_general_error, e)
+            return
+
+        if response.get("status") == "success":
+            wx.CallAfter(self._handle_upload_success, upload_data, response.get("job_id"))
+        else:
+            wx.CallAfter(self._handle_upload_failure, response.get("message"))
+
+    def _on_upload_progress(self, done, total):
+        """
+        Update the progress bar (UI thread).
 
-    def _upload_to_server(self, upload_data, file_content):
+        Args:
+            done: Bytes stored on the server so far
+            total: File size in bytes
+        """
+        if not self:
+            return
+        self.progress_gauge.SetValue(int(GAUGE_RANGE * done / max(total, 1)))
+        self.progress_label.SetLabel(
+            f"{done / BYTES_PER_MB: .1f} / {total / BYTES_PER_MB: .1f} MB"
+        )
+
+    def _handle_upload_success(self, upload_data, job_id=None):
         """
-        Upload video to server over network.
+        Handle successful upload: follow the server's ingest job if it
+        queued one, otherwise report right away.
 
         Args:
             upload_data: Dict containing upload information
-            file_content: Base64 encoded file content
+            job_id: Ingest job id from the upload response, if any
+        """
+        if not self:
+            return
+        print(f"[DEBUG] Upload completed successfully!")
+        if job_id is None:
+            self._report_upload(upload_data, "")
+            return
 
-        Returns:
-            bool: True if successful, False otherwise
+        self.job_id = job_id
+        self.uploaded_data = upload_data
+        self.progress_gauge.Pulse()
+        self.progress_label.SetLabel("Uploaded - processing on the server...")
+        self.job_timer.Start(JOB_POLL_INTERVAL_MS)
+
+    def _on_job_timer(self, event):
         """
-        payload = {
-            "title": upload_data['filename'],
-            "category": upload_data['category'],
-            "level": upload_data['level'],
-            "uploader": self.client.username,
-            "file_content": file_content
-        }
+        Poll the ingest job (UI thread, like every main-server request).
 
-        response = self.client._send_request("UPLOAD_VIDEO", payload)
+        Args:
+            event: wx.TimerEvent
+        """
+        job = self.client.get_job_status([self.job_id]).get(str(self.job_id))
+        if job is None:
+            # Unknown to the server (or no answer): nothing more to show
+            self.job_timer.Stop()
+            self._report_upload(self.uploaded_data, "")
+            return
 
-        return response.get("status") == "success"
+        status = job.get("status")
+        if status == JOB_DONE:
+            self.job_timer.Stop()
+            self._report_upload(self.uploaded_data, "The video is ready to watch.")
+        elif status == JOB_FAILED:
+            self.job_timer.Stop()
+            self._report_upload(
+                self.uploaded_data,
+                f"Processing failed: {job.get('last_error') or 'unknown error'}"
+            )
+        else:
+            self.progress_gauge.Pulse()
+            self.progress_label.SetLabel(
+                f"Uploaded - processing on the server ({status}, "
+                f"attempt {job.get('attempts', 0)}/{job.get('max_attempts', 0)})..."
+            )
 
-    def _handle_upload_success(self, upload_data):
+    def _report_upload(self, upload_data, processing_note):
         """
-        Handle successful upload.
+        Show the upload result and close the window.
 
         Args:
             upload_data: Dict containing upload information
+            processing_note: Line about the server-side processing, or ""
         """
         wx.MessageBox(
             f"Video uploaded successfully!\n\n"
             f"File: {upload_data['filename']}\n"
             f"Category: {upload_data['category']}\n"
-            f"Level: {upload_data['level']}",
+            f"Level: {upload_data['level']}\n"
+            f"{processing_note}",
             "Upload Successful",
             wx.OK | wx.ICON_INFORMATION
         )
-        print(f"[DEBUG] Upload completed successfully!")
         self.Close()
 
-    def _handle_upload_failure(self):
-        """Handle upload failure."""
+    def on_close_window(self, event):
+        """
+        Stop following the ingest job when the window closes.
+
+        Args:
+            event: wx.CloseEvent
+        """
+        self.job_timer.Stop()
+        event.Skip()
+
+    def _handle_upload_failure(self, message=None):
+        """
+        Handle upload failure.
+
+        Args:
+            message: Reason reported by the server, if any
+        """
+        self._reset_upload_controls()
         wx.MessageBox(
-            "Failed to upload video to server.",
+            f"Failed to upload video to server.\n{message or ''}",
             "Upload Failed",
             wx.OK | wx.ICON_ERROR
         )
 
+    def _reset_upload_controls(self):
+        """Re-enable the upload button after a failed upload."""
+        if not self:
+            return
+        self.btn_upload.Enable()
+        self.progress_label.SetLabel("Upload stopped - press Upload to resume")
+
     def _handle_general_error(self, error):
         """
         Handle general upload error.
@@ -392,8 +504,7 @@ class UploadVideoFrame(wx.Frame):
             error: Exception that occurred
         """
         print(f"[DEBUG] Upload error: {error}")
-        import traceback
-        traceback.print_exc()
+        self._reset_upload_controls()
 
         wx.MessageBox(
             f"Upload failed: \n{str(error)}",
@@ -4,18 +4,32 @@ Video & Audio Streaming Client - RECEIVE ONLY
 REFACTORED: Single-port design. Client sends an 8-byte ticket immediately
             after TCP connect so the server knows which video to stream.
 Pipeline: send ticket → recv accept byte → key exchange → recv frames
-          recv → AES decrypt → zlib decompress → pickle.loads → display
+          recv → AES decrypt → zlib decompress → media_packet.unpack → display
+ADDED: Periodic BUFFER reports back to the server so its ABR controller
+       can pick a rendition; frames of any rendition are scaled to the
+       window opened at the source size.
+ADDED: Pause / seek / rate keys (see playback_control)
+CHANGED: Receive, audio and render are decoupled through a jitter
+         buffer: a receiver thread fills it, the PyAudio callback drains
+         the audio and is the master clock, and the renderer shows the
+         frame due at that clock (dropping or holding frames to stay in
+         sync). Dropped frames and underruns are reported to the server
+         with the BUFFER reports and printed at the end.
+CHANGED: Packets are parsed with media_packet (no pickle); frame and
+         audio arrays are zero-copy views of the received buffer.
 """
 import socket
 import cv2
-import pickle
 import zlib
 import threading
 import pyaudio
 import time
 import aes_cipher
+import media_packet
 from Protocol import Protocol
 from key_exchange import KeyExchange
+from playback_control import PlaybackControl
+from jitter_buffer import JitterBuffer
 
 DEFAULT_CLIENT_HOST = "127.0.0.1"
 DEFAULT_CLIENT_PORT = 9999
@@ -23,8 +37,9 @@ DEFAULT_CLIENT_PORT = 9999
 WINDOW_POSITION_X = 100
 WINDOW_POSITION_Y = 50
 KEYBOARD_WAIT_MS = 1
-KEY_MASK = 0xFF
-KEY_ESCAPE = 27
+PAUSED_WAIT_MS = 50
+MAX_RENDER_WAIT_MS = 20
+MS_PER_SECOND = 1000
 WINDOW_VISIBLE_THRESHOLD = 1
 
 MAX_RETRIES = 5
@@ -59,6 +74,9 @@ class VideoAudioClient:
         self.audio_stream = None
         self.pyaudio_instance = None
         self._compressed = False
+        self.playback = None
+        self.buffer = None
+        self._receiver = None
 
         self.socket = self._connect_with_retry()
         self._send_ticket_and_verify()
@@ -121,6 +139,12 @@ class VideoAudioClient:
     def connect(self) -> bool:
         try:
             self._receive_stream_info()
+            self.buffer = JitterBuffer(
+                self.stream_info['fps'],
+                bool(self.stream_info.get('has_audio')),
+                self.stream_info.get('audio_channels', 2),
+                self.stream_info.get('samples_per_frame', 0),
+            )
             self._initialize_audio()
             return True
         except Exception as e:
@@ -149,19 +173,25 @@ class VideoAudioClient:
                 channels=self.stream_info['audio_channels'],
                 rate=self.stream_info['audio_sample_rate'],
                 output=True,
-                frames_per_buffer=self.stream_info['samples_per_frame']
+                frames_per_buffer=self.stream_info['samples_per_frame'],
+                stream_callback=self._audio_callback,
             )
             print("[Client] Audio output ready")
         except Exception as e:
             print(f"[Client] Audio init failed: {e}")
             self.stream_info['has_audio'] = False
+            self.buffer.has_audio = False
+
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        """PyAudio pulls PCM from the jitter buffer; this drives the clock."""
+        return self.buffer.read_audio(frame_count), pyaudio.paContinue
 
     # ── Receive pipeline ──────────────────────────────────────────────────────
 
     def _recv_decrypt_decompress(self):
         """
-        recv_bin → AES decrypt → zlib decompress → pickle.loads
-        Exact reverse of ClientHandler._send_compressed_encrypted()
+        recv_bin → AES decrypt → zlib decompress → media_packet.unpack
+        Exact reverse of ClientHandler._encode()
         """
         try:
             raw = Protocol.recv_bin(self.conn)
@@ -178,7 +208,7 @@ class VideoAudioClient:
             except zlib.error:
                 pass  # Safety fallback
 
-            return pickle.loads(data)
+            return media_packet.unpack(data)
 
         except Exception as e:
             print(f"[Client] Receive error: {e}")
@@ -189,6 +219,22 @@ class VideoAudioClient:
 
     # ── Playback ──────────────────────────────────────────────────────────────
 
+    def _receive_loop(self):
+        """Receiver thread: socket → jitter buffer."""
+        received = 0
+        while not self.stop_flag.is_set():
+            packet = self.receive_packet()
+            if packet is None:
+                break
+            # Packets sent before the last seek are dropped
+            if not self.playback.accept(packet):
+                continue
+            if self.buffer.push(packet):
+                received += 1
+                self.playback.on_frame(packet, self.buffer.stats())
+        self.buffer.end()
+        print(f"[Client] Receiver done ({received} frames)")
+
     def play_stream(self):
         if not self.stream_info:
             print("[Client] No stream info available")
@@ -200,26 +246,31 @@ class VideoAudioClient:
         cv2.moveWindow(win, WINDOW_POSITION_X, WINDOW_POSITION_Y)
 
         self.is_playing = True
+        self.playback = PlaybackControl(
+            self.conn, self.stream_info['fps'],
+            shown_frame=lambda: self.buffer.last_shown
+        )
+        self._receiver = threading.Thread(
+            target=self._receive_loop, daemon=True, name="VideoReceiver"
+        )
+        self._receiver.start()
+        if self.audio_stream:
+            self.audio_stream.start_stream()
+
         frame_count = 0
-        print("[Client] Playback started (Q or close window to stop)")
+        print("[Client] Playback started (Q or close window to stop, "
+              "SPACE pause, A/D seek, [/] speed)")
 
         while not self.stop_flag.is_set():
-            packet = self.receive_packet()
-            if packet is None:
+            packet = self.buffer.next_frame()
+            if packet is not None:
+                cv2.imshow(win, packet['frame'])
+                frame_count += 1
+            elif self.buffer.finished:
                 print("[Client] Stream ended")
                 break
 
-            cv2.imshow(win, packet['frame'])
-            frame_count += 1
-
-            if self.audio_stream and packet.get('audio') is not None:
-                try:
-                    self.audio_stream.write(packet['audio'].tobytes())
-                except Exception:
-                    pass
-
-            key = cv2.waitKey(KEYBOARD_WAIT_MS) & KEY_MASK
-            if key == ord('q') or key == KEY_ESCAPE:
+            if not self._handle_key(cv2.waitKey(self._render_wait_ms())):
                 print("[Client] Stopped by user")
                 break
 
@@ -231,9 +282,35 @@ class VideoAudioClient:
                 break
 
         self.is_playing = False
+        self.stop_flag.set()
+        self.buffer.end()               # release a receiver blocked on a full buffer
         cv2.destroyAllWindows()
         self.cleanup()
-        print(f"[Client] Done. Received {frame_count} frames")
+        stats = self.buffer.stats()
+        print(f"[Client] Done. Shown {frame_count} frames | "
+              f"dropped {stats['dropped']} | underruns {stats['underruns']}")
+
+    def _handle_key(self, key: int) -> bool:
+        """Forward a key to PlaybackControl and mirror its state locally."""
+        seek_seq = self.playback.seek_seq
+        if not self.playback.handle_key(key):
+            return False
+        if self.playback.seek_seq != seek_seq:
+            self.buffer.flush(self.playback.seek_seq)
+        if self.playback.paused != self.buffer.paused:
+            self.buffer.set_paused(self.playback.paused)
+        if self.playback.rate != self.buffer.rate:
+            self.buffer.set_rate(self.playback.rate)
+        return True
+
+    def _render_wait_ms(self) -> int:
+        """Sleep until the next frame is due (bounded so keys stay live)."""
+        if self.playback.paused:
+            return PAUSED_WAIT_MS
+        wait = self.buffer.seconds_until_next()
+        if wait is None:
+            return KEYBOARD_WAIT_MS
+        return min(max(int(wait * MS_PER_SECOND), KEYBOARD_WAIT_MS), MAX_RENDER_WAIT_MS)
 
     # ── Cleanup ───────────────────────────────────────────────────────────────
 
@@ -3,17 +3,18 @@ Gal Haham
 Video grid panel for displaying video thumbnails.
 Shows videos in a scrollable grid layout with metadata.
 REFACTORED: Separated class, all constants added, methods split.
-FIXED: Proper socket buffer handling with size header protocol
+FIXED: Persistent framed connection to the thumbnail server
+CHANGED: Videos are read on a background thread and each one is added
+         to the grid as the thumbnail server sends it
 """
+import threading
 import time
 import wx
-import socket
-import json
 import base64
 import io
-import struct
 from Video_Player_Client import run_video_player_client
 from VideoInteractionFrame import VideoInteractionFrame
+from thumbnail_client import ThumbnailClient, REQUEST_GET_VIDEOS_MEDIA
 
 # Server Configuration
 SERVER_IP = '127.0.0.1'
@@ -37,11 +38,6 @@ SPACING_METADATA = 2
 SCROLL_RATE_X = 0
 SCROLL_RATE_Y = 20
 
-# Network
-RECV_BUFFER_SIZE = 4096
-SOCKET_TIMEOUT_SECONDS = 30
-NETWORK_HEADER_LENGTH_BYTES = 8
-
 # Colors
 COLOR_PANEL_BACKGROUND = wx.Colour(240, 240, 240)
 
@@ -61,7 +57,7 @@ class VideoGridPanel(wx.Panel):
     - Handle video selection
 
     REFACTORED: All magic numbers replaced with constants.
-    FIXED: Proper socket protocol with size headers
+    FIXED: Persistent framed connection to the thumbnail server
     """
 
     def __init__(self, parent, client_ref):
@@ -74,7 +70,11 @@ class VideoGridPanel(wx.Panel):
         """
         super().__init__(parent)
         self.media_data = []
+        self._load_generation = 0     # Bumped per load; older loads stop adding
         self.client_ref = client_ref
+        self.thumbs = ThumbnailClient(
+            VIDEO_THUMBNAIL_PORT, REQUEST_GET_VIDEOS_MEDIA, SERVER_IP
+        )
 
         self._init_ui()
 
@@ -123,14 +123,17 @@ class VideoGridPanel(wx.Panel):
             if not self._request_video_server_start():
                 return
 
-            # Wait for server to start
-            time.sleep(SERVER_START_DELAY)
-
-            # Fetch video data from thumbnail server
-            self.media_data = self._fetch_videos_from_thumbnail_server()
+            # Start from an empty grid; videos are added as they arrive
+            self.grid_sizer.Clear(True)
+            self.media_data = []
+            self._load_generation += 1
 
-            # Display in grid
-            self.display_media()
+            threading.Thread(
+                target=self._fetch_videos_from_thumbnail_server,
+                args=(self._load_generation,),
+                daemon=True,
+                name="VideoThumbnailLoad"
+            ).start()
 
         except Exception as e:
             self._show_error(f"Error connecting to server: {e}")
@@ -155,172 +158,45 @@ class VideoGridPanel(wx.Panel):
 
         return True
 
-    def _fetch_videos_from_thumbnail_server(self):
-        """
-        Connect to thumbnail server and fetch video data.
-
-        Protocol:
-        1. Send "GET_VIDEOS_MEDIA" request
-        2. Receive 8-byte size header (big-endian unsigned int)
-        3. Receive JSON data of that size
-
-        Returns:
-            list: Video data with thumbnails
-        """
-        sock = None
-        try:
-            # Connect to video thumbnail server
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(SOCKET_TIMEOUT_SECONDS)
-            sock.connect((SERVER_IP, VIDEO_THUMBNAIL_PORT))
-
-            # Send request
-            request = "GET_VIDEOS_MEDIA".encode('utf-8')
-            sock.sendall(request)
-
-            # Receive response with proper protocol
-            response = self._receive_full_response_with_size(sock)
-
-            # Decode and return
-            video_data = json.loads(response.decode('utf-8'))
-
-            return video_data
-
-        except socket.timeout:
-            raise TimeoutError(
-                f"Timeout connecting to thumbnail server at "
-                f"{SERVER_IP}: {VIDEO_THUMBNAIL_PORT}"
-            )
-        except ConnectionRefusedError:
-            raise ConnectionError(
-                f"Connection refused by thumbnail server at "
-                f"{SERVER_IP}: {VIDEO_THUMBNAIL_PORT}. "
-                f"Is the server running?"
-            )
-        except Exception as e:
-            raise
-        finally:
-            if sock:
-                try:
-                    sock.close()
-                    print("[DEBUG] Socket closed")
-                except:
-                    pass
-
-    def _receive_full_response_with_size(self, sock):
+    def _fetch_videos_from_thumbnail_server(self, generation):
         """
-        Receive complete response with size header protocol.
+        Fetch video data over the persistent thumbnail connection and hand
+        each video to the UI thread as it arrives (runs on a worker thread).
 
         Protocol:
-        1. Read 8-byte big-endian unsigned int (size header)
-        2. Read exactly that many bytes of data
-
-        This ensures we get complete messages without truncation.
+        1. Send encrypted {"type": "GET_VIDEOS_MEDIA"} request
+        2. Receive one MEDIA_ITEM frame per video
+        3. Receive a MEDIA_END frame
 
         Args:
-            sock: Socket to receive from
-
-        Returns:
-            bytes: Complete response data
-
-        Raises:
-            ConnectionError: If connection is lost before receiving all data
+            generation: Load this fetch belongs to
         """
-        size_header = self._recv_exact(sock, NETWORK_HEADER_LENGTH_BYTES)
+        # Wait for server to start
+        time.sleep(SERVER_START_DELAY)
 
-        if not size_header:
-            raise ConnectionError(
-                "Connection closed before receiving size header"
-            )
-
-        # Unpack size (big-endian unsigned int)
-        data_size = struct.unpack("!L", size_header)[0]
-
-        data = self._recv_exact(sock, data_size)
-
-        if not data or len(data) != data_size:
-            raise ConnectionError(
-                f"Failed to receive complete data. "
-                f"Expected {data_size} bytes, got {len(data) if data else 0}"
+        try:
+            self.thumbs.fetch_media(
+                on_item=lambda item: wx.CallAfter(self._add_media_item, generation, item)
             )
+        except Exception as e:
+            wx.CallAfter(self._show_error, f"Error connecting to server: {e}")
 
-        return data
-
-    def _receive_full_response(self, sock):
+    def _add_media_item(self, generation, media_item):
         """
-        Legacy method - Receive complete response from socket.
-
-        WARNING: This method is deprecated because it doesn't use
-        size headers and can receive incomplete messages.
-        Use _receive_full_response_with_size() instead.
+        Add one received video to the grid, unless a newer load started.
 
         Args:
-            sock: Socket to receive from
-
-        Returns:
-            bytes: Response data (may be incomplete!)
-        """
-        response = b""
-        sock.settimeout(SOCKET_TIMEOUT_SECONDS)
-
-        try:
-            while True:
-                chunk = sock.recv(RECV_BUFFER_SIZE)
-                if not chunk:
-                    break
-                response += chunk
-        except socket.timeout:
-            # Timeout is expected when all data received
-            pass
-
-        return response
-
-    def _recv_exact(self, sock, num_bytes):
+            generation: Load the video came from
+            media_item: Video data dictionary
         """
-        Receive an exact number of bytes from socket.
-
-        This is critical for network protocols because recv() may
-        return fewer bytes than requested, even if more data is available.
-
-        Args:
-            sock: Socket to receive from
-            num_bytes: Exact number of bytes to receive
+        if not self or generation != self._load_generation:
+            return
 
-        Returns:
-            bytes: Exactly num_bytes of data, or empty
-            bytes if connection closed
+        self.media_data.append(media_item)
+        self.grid_sizer.Add(self._create_video_panel(media_item), 0, wx.EXPAND)
 
-        Raises:
-            ConnectionError: If socket closes before receiving all bytes
-        """
-        data = b''
-
-        while len(data) < num_bytes:
-            try:
-                chunk = sock.recv(num_bytes - len(data))
-
-                if not chunk:
-                    # Connection closed
-                    if len(data) > 0:
-                        print(
-                            f"[WARNING] Connection closed after {len(data)} "
-                            f"bytes, expected {num_bytes}"
-                        )
-                    return data
-
-                data += chunk
-                print(
-                    f"[DEBUG] Received {len(chunk)} bytes "
-                    f"(total: {len(data)}/{num_bytes})"
-                )
-
-            except socket.timeout:
-                raise ConnectionError(
-                    f"Socket timeout while receiving {num_bytes} bytes. "
-                    f"Got {len(data)} so far."
-                )
-
-        return data
+        self.scroll.Layout()
+        self.scroll.FitInside()
 
     def display_media(self):
         """Display videos in grid."""
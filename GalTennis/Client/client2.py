@@ -4,14 +4,16 @@ Main client for Tennis Social application.
 Handles server connection and provides backend services for GUI.
 Primary entry point for the application.
 REFACTORED: Magic numbers replaced with constants, long methods split.
+CHANGED: Posting a story is one upload whose ack returns the story
+         record - no ADD_STORY request, sleeps or GET_STORIES polling
+CHANGED: Stories are posted from the captured file's path - no base64
+         decode and rewrite to story.mp4 / story.jpg
 """
 import socket
 import json
 import os
 import sys
-import time
 import wx
-import base64
 import key_exchange
 
 from Protocol import Protocol
@@ -23,9 +25,6 @@ from LoginSignupFrame import LoginSignupFrame
 HOST = "127.0.0.1"
 PORT = 5000
 VIDEO_FOLDER = "videos"
-TWO_SECOND_PAUSE = 2
-ATTEMPTS_LIMIT = 5
-HALF_SECOND_DELAY = 0.5
 PATH_LIST_HEAD = 0
 EXIT_CODE_ERROR = 1
 EXIT_CODE_SUCCESS = 0
@@ -34,10 +33,6 @@ EXIT_CODE_SUCCESS = 0
 USER_ROLE_REGULAR = 0
 USER_ROLE_ADMIN = 1
 
-# Story file names
-STORY_VIDEO_FILENAME = "story.mp4"
-STORY_IMAGE_FILENAME = "story.jpg"
-
 
 class Client:
     """
@@ -107,148 +102,52 @@ class Client:
             traceback.print_exc()
             return {"status": "error", "message": f"Network Error: {e}"}
 
-    """def receive_request(self):
-        response_data = Protocol.recv(self.conn)
-        return response_data"""
-
-    def on_story_post_callback(self, caption, media_type, media_data):
-        """
-        Callback for posting a story from the camera - REFACTORED.
-        Called by Story_camera.py after capturing media.
-
-        Args:
-            caption: Story caption (currently unused)
-            media_type: Type of media ('video' or 'photo')
-            media_data: Base64 encoded media data
-        """
-        # Step 1: Determine filename and save locally
-        file_name = self._get_story_filename(media_type)
-        if not self._save_story_file(file_name, media_data):
-            return
-
-        # Step 2: Register story in database
-        if not self._register_story_in_database(file_name, media_type):
-            self._cleanup_file(file_name)
-            return
-
-        # Step 3: Upload to server and verify
-        self._upload_and_verify_story(file_name)
-
-        # Step 4: Cleanup
-        self._cleanup_file(file_name)
-
-    def _get_story_filename(self, media_type):
+    def get_job_status(self, job_ids):
         """
-        Get appropriate filename based on media type.
+        Ask the server how its background jobs (e.g. the processing
+        queued by an upload) are doing.
 
         Args:
-            media_type: 'video' or 'photo'
+            job_ids: List of job ids returned by upload responses
 
         Returns:
-            str: Filename to use
-        """
-        if media_type == "video":
-            return STORY_VIDEO_FILENAME
-        else:
-            return STORY_IMAGE_FILENAME
-
-    def _save_story_file(self, file_name, media_data):
+            dict: job id (str) → status dict, or {} on error
         """
-        Save base64 encoded media to file.
+        response = self._send_request("GET_JOB_STATUS", {"job_ids": job_ids})
+        if response.get("status") != "success":
+            return {}
+        return response.get("jobs", {})
 
-        Args:
-            file_name: Name of file to create
-            media_data: Base64 encoded data
-
-        Returns:
-            bool: True if successful, False otherwise
-        """
-        try:
-            file_bytes = base64.b64decode(media_data)
-            with open(file_name, "wb") as f:
-                f.write(file_bytes)
-            return True
-        except Exception as e:
-            print(f"Failed to save media file: {e}")
-            return False
+    """def receive_request(self):
+        response_data = Protocol.recv(self.conn)
+        return response_data"""
 
-    def _register_story_in_database(self, file_name, media_type):
+    def on_story_post_callback(self, caption, media_type, media_path):
         """
-        Register story metadata in database.
+        Callback for posting a story from the camera - REFACTORED.
+        Called by UploadThread after capturing media. The upload is
+        the whole post: the server adds the story with the file and
+        acknowledges with its record.
 
         Args:
-            file_name: Name of story file
-            media_type: 'video' or 'photo'
+            caption: Story caption (currently unused)
+            media_type: Type of media ('video' or 'photo')
+            media_path: Path of the captured media file (the file is
+                        streamed from disk, never loaded whole)
 
         Returns:
-            bool: True if successful, False otherwise
-        """
-        db_content_type = "image" if media_type == "photo" else "video"
-
-        payload = {
-            "username": self.username,
-            "filename": file_name,
-            "content_type": db_content_type
-        }
-
-        response = self._send_request("ADD_STORY", payload)
-        return response.get('status') == 'success'
-
-    def _upload_and_verify_story(self, file_name):
-        """
-        Upload story to server and verify.
-
-        Args:
-            file_name: Name of file to upload
+            dict: The posted story record, or None on failure
         """
-        time.sleep(TWO_SECOND_PAUSE)
+        if not media_path or not os.path.exists(media_path):
+            print(f"Story file not found: {media_path}")
+            return None
 
         try:
             import transfer_story_to_server
-            transfer_story_to_server.run(file_name, self.username)
-
-            time.sleep(TWO_SECOND_PAUSE)
-            self.verify_story_uploaded(file_name)
-
+            return transfer_story_to_server.run(media_path, self.username)
         except Exception as e:
             print(f"Failed to upload media: {e}")
-
-    def _cleanup_file(self, file_name):
-        """
-        Remove file from filesystem.
-
-        Args:
-            file_name: Name of file to remove
-        """
-        try:
-            if os.path.exists(file_name):
-                os.remove(file_name)
-        except:
-            pass
-
-    def verify_story_uploaded(self, filename):
-        """
-        Periodically checks if the newly uploaded story
-         is available on the server.
-
-        Args:
-            filename: Name of the uploaded file
-
-        Returns:
-            bool: True if story found, False otherwise
-        """
-        for i in range(ATTEMPTS_LIMIT):
-            response = self._send_request('GET_STORIES', {})
-
-            if response.get('status') == 'success':
-                stories = response.get('stories', [])
-                for story in stories:
-                    if story['username'] == self.username:
-                        return True
-
-            time.sleep(HALF_SECOND_DELAY)
-
-        return False
+            return None
 
     def run(self):
         """
@@ -0,0 +1,267 @@
+"""
+Gal Haham
+Jitter buffer for the video player.
+The receiver thread pushes packets in; the PyAudio callback pulls PCM
+out and, by doing so, drives the playback clock. The renderer asks for
+the frame that is due at the current clock and gets the newest one,
+so a slow render drops frames instead of backing up into the socket.
+
+Clock is measured in frame numbers:
+    - with audio: position of the block just handed to the sound card
+    - without audio: wall clock scaled by fps and playback rate
+Playback starts (and restarts after an underrun) only once
+TARGET_SECONDS of media is buffered.
+ADDED: last_shown - the frame on screen, which relative seeks start from
+"""
+import collections
+import threading
+import time
+
+TARGET_SECONDS = 0.3            # Buffered media needed before playing
+MAX_SECONDS = 4.0               # Receiver blocks above this (back-pressure)
+PUSH_WAIT_SECONDS = 0.1
+BYTES_PER_SAMPLE = 2            # paInt16
+
+STATE_BUFFERING = "buffering"
+STATE_PLAYING = "playing"
+
+
+class JitterBuffer:
+    """
+    Time-indexed frame/audio buffer shared by the receive, audio and
+    render threads.
+    """
+
+    def __init__(self, fps: float, has_audio: bool, channels: int = 2,
+                 samples_per_frame: int = 0):
+        """
+        Args:
+            fps: Stream frame rate
+            has_audio: Audio callback is the master clock
+            channels: Audio channel count
+            samples_per_frame: Audio samples per video frame at 1x
+        """
+        self.fps = fps
+        self.has_audio = has_audio
+        self.channels = channels
+        self.samples_per_frame = samples_per_frame
+        self.rate = 1.0
+
+        self._lock = threading.Lock()
+        self._space = threading.Condition(self._lock)
+        self._video = collections.deque()       # (frame_number, packet)
+        self._audio = collections.deque()       # [frame_number, pcm, offset]
+        self._state = STATE_BUFFERING
+        self._paused = False
+        self._ended = False
+        self._seek_seq = 0
+        self._last_shown = None
+
+        self._audio_position = None             # frame clock (audio mode)
+        self._wall_origin = None                # (monotonic, frame) otherwise
+
+        self.frames_dropped = 0
+        self.audio_underruns = 0
+        self.video_underruns = 0
+
+    # ── Receiver side ─────────────────────────────────────────────────────────
+
+    def push(self, packet: dict) -> bool:
+        """
+        Add one received packet, blocking while the buffer is full.
+
+        Returns:
+            bool: False if the packet predates the last flush and was dropped
+        """
+        with self._lock:
+            while self._buffered_seconds() >= MAX_SECONDS and not self._ended:
+                self._space.wait(PUSH_WAIT_SECONDS)
+
+            if packet.get('seek_seq', 0) < self._seek_seq:
+                return False
+
+            frame_number = packet['frame_number']
+            self._video.append((frame_number, packet))
+
+            if self.has_audio:
+                pcm = packet.get('audio')
+                pcm = pcm.tobytes() if pcm is not None else self._silence()
+                self._audio.append([frame_number, pcm, 0])
+
+            self._maybe_start()
+            return True
+
+    def end(self):
+        """The stream is over; play out whatever is left."""
+        with self._lock:
+            self._ended = True
+            self._maybe_start()
+            self._space.notify_all()
+
+    # ── Control ───────────────────────────────────────────────────────────────
+
+    def flush(self, seek_seq: int):
+        """Drop everything buffered; later packets must carry seek_seq."""
+        with self._lock:
+            self._seek_seq = seek_seq
+            self._video.clear()
+            self._audio.clear()
+            self._state = STATE_BUFFERING
+            self._audio_position = None
+            self._wall_origin = None
+            self._last_shown = None
+            self._space.notify_all()
+
+    def set_paused(self, paused: bool):
+        with self._lock:
+            self._rebase_wall_clock()
+            self._paused = paused
+            self._space.notify_all()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._rebase_wall_clock()
+            self.rate = rate
+
+    # ── Audio side (PyAudio callback thread) ──────────────────────────────────
+
+    def read_audio(self, frame_count: int) -> bytes:
+        """
+        Return exactly frame_count samples of PCM, padded with silence.
+        Only what was actually consumed advances the clock.
+        """
+        wanted = frame_count * self.channels * BYTES_PER_SAMPLE
+        out = bytearray()
+        with self._lock:
+            if self._state == STATE_PLAYING and not self._paused:
+                while len(out) < wanted and self._audio:
+                    chunk = self._audio[0]
+                    frame_number, pcm, offset = chunk
+                    if not out:
+                        # The block starts playing now: that is the clock
+                        self._audio_position = frame_number + offset / max(len(pcm), 1)
+                    take = min(wanted - len(out), len(pcm) - offset)
+                    out += pcm[offset:offset + take]
+                    chunk[2] = offset + take
+                    if chunk[2] >= len(pcm):
+                        self._audio.popleft()
+
+                if len(out) < wanted and not self._ended:
+                    self.audio_underruns += 1
+                    self._state = STATE_BUFFERING
+                self._space.notify_all()
+
+        out += bytes(wanted - len(out))
+        return bytes(out)
+
+    # ── Render side ───────────────────────────────────────────────────────────
+
+    def next_frame(self):
+        """
+        Pop the frame due at the current clock.
+        Frames that became due before it are counted as dropped.
+
+        Returns:
+            dict: Packet to show now, or None to keep the current one
+        """
+        with self._lock:
+            clock = self._clock()
+            if clock is None:
+                return None
+
+            due = None
+            while self._video and self._video[0][0] <= clock:
+                if due is not None:
+                    self.frames_dropped += 1
+                due = self._video.popleft()[1]
+
+            if due is not None:
+                self._last_shown = due['frame_number']
+                self._space.notify_all()
+            elif (not self._video and not self._ended and not self._paused
+                  and self._last_shown is not None
+                  and clock >= self._last_shown + 1):
+                # Next frame is due and has not arrived yet
+                self.video_underruns += 1
+                self._state = STATE_BUFFERING
+                self._wall_origin = None
+            return due
+
+    def seconds_until_next(self):
+        """Time until the head frame is due, or None if unknown."""
+        with self._lock:
+            clock = self._clock()
+            if clock is None or not self._video:
+                return None
+            return max(self._video[0][0] - clock, 0) / (self.fps * self.rate)
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def last_shown(self):
+        """Frame number of the frame on screen, or None since the last flush."""
+        with self._lock:
+            return self._last_shown
+
+    @property
+    def finished(self) -> bool:
+        with self._lock:
+            return self._ended and not self._video
+
+    @property
+    def buffered_seconds(self) -> float:
+        with self._lock:
+            return self._buffered_seconds()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'dropped': self.frames_dropped,
+                'underruns': self.audio_underruns + self.video_underruns,
+                'buffered_s': round(self._buffered_seconds(), 3),
+            }
+
+    # ── Helpers (lock held) ───────────────────────────────────────────────────
+
+    def _buffered_seconds(self) -> float:
+        if not self._video:
+            return 0.0
+        span = self._video[-1][0] - self._video[0][0] + 1
+        return span / (self.fps * self.rate)
+
+    def _maybe_start(self):
+        if self._state != STATE_BUFFERING:
+            return
+        if self._buffered_seconds() < TARGET_SECONDS and not self._ended:
+            return
+        if not self._video:
+            return
+        self._state = STATE_PLAYING
+        if not self.has_audio:
+            self._wall_origin = (time.monotonic(), self._video[0][0])
+
+    def _clock(self):
+        """Current playback position in frames, or None while not playing."""
+        if self._state != STATE_PLAYING:
+            return None
+        if self.has_audio:
+            if self._audio_position is None:
+                return None                     # callback has not run yet
+            return self._audio_position
+        if self._wall_origin is None:
+            return None
+        origin_time, origin_frame = self._wall_origin
+        if self._paused:
+            return origin_frame
+        return origin_frame + (time.monotonic() - origin_time) * self.fps * self.rate
+
+    def _rebase_wall_clock(self):
+        clock = self._clock()
+        if self._wall_origin is not None and clock is not None:
+            self._wall_origin = (time.monotonic(), clock)
+
+    def _silence(self) -> bytes:
+        samples = int(self.samples_per_frame / self.rate)
+        return bytes(samples * self.channels * BYTES_PER_SAMPLE)
@@ -0,0 +1,226 @@
+"""
+Gal Haham
+Live story viewer - watches a story while it is being broadcast.
+Pipeline: key exchange → WATCH_LIVE(broadcast id) → LIVE_READY → LIVE info
+          recv_bin → AES.decrypt → zlib.decompress → media_packet.unpack
+A receiver thread reads packets as they arrive. Video frames replace the
+one waiting to be shown (only the newest is drawn), audio goes to a
+short queue played by its own thread - so the picture stays live and
+a late audio block is dropped instead of delaying everything after it.
+"""
+import collections
+import socket
+import threading
+import zlib
+import cv2
+import pyaudio
+import key_exchange
+import aes_cipher
+import media_packet
+from Protocol import Protocol
+
+LIVE_SERVER_HOST = "127.0.0.1"
+LIVE_SERVER_PORT = 6002
+
+REQUEST_WATCH = "WATCH_LIVE"
+RESPONSE_READY = "LIVE_READY"
+INFO_TYPE_END = "LIVE_END"
+
+AUDIO_QUEUE_BLOCKS = 16         # About 0.4 s at 1024 samples per block
+AUDIO_FRAMES_PER_BUFFER = 1024
+AUDIO_WAIT_SECONDS = 0.1
+FRAME_WAIT_MS = 10
+KEY_MASK = 0xFF
+KEY_ESCAPE = 27
+IS_WINDOW_VISIBLE = 1
+KEY_INDEX = 1
+
+TEXT_X = 10
+TEXT_Y = 30
+FONT_SIZE = 0.7
+LINE_THICKNESS = 2
+COLOR_RED = (0, 0, 255)
+
+
+class LiveStoryViewer:
+    """Receive-only viewer of one live broadcast."""
+
+    def __init__(self, broadcast_id: str, host: str = LIVE_SERVER_HOST,
+                 port: int = LIVE_SERVER_PORT):
+        self.broadcast_id = broadcast_id
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.conn = None
+        self.info = None
+        self.audio_stream = None
+        self.pyaudio_instance = None
+
+        self._latest_frame = None       # Newest JPEG not yet shown
+        self._audio_blocks = collections.deque(maxlen=AUDIO_QUEUE_BLOCKS)
+        self._cond = threading.Condition()
+        self._ended = threading.Event()
+
+    # ── Connection ────────────────────────────────────────────────────────────
+
+    def connect(self) -> bool:
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.connect((self.host, self.port))
+            key = key_exchange.KeyExchange.send_recv_key((self.socket, None))
+            self.conn = (self.socket, key)
+
+            Protocol.send_json({"type": REQUEST_WATCH, "broadcast_id": self.broadcast_id},
+                               self.conn)
+            reply = Protocol.recv_json(self.conn)
+            if reply.get("type") != RESPONSE_READY:
+                raise ConnectionError(reply.get("message", "Broadcast not available"))
+
+            self.info = self._recv_packet()
+            if not self.info or self.info.get('type') == INFO_TYPE_END:
+                raise ConnectionError("Broadcast ended")
+            print(f"[LiveViewer] Watching {self.info.get('username')} "
+                  f"({self.info['width']}x{self.info['height']} @ {self.info['fps']} fps)")
+
+            if self.info.get('has_audio'):
+                self._initialize_audio()
+            return True
+
+        except Exception as e:
+            print(f"[LiveViewer] Connection error: {e}")
+            self.cleanup()
+            return False
+
+    def _recv_packet(self):
+        """Protocol.recv_bin → AES.decrypt → zlib.decompress → media_packet.unpack"""
+        data = aes_cipher.AESCipher.decrypt(self.conn[KEY_INDEX], Protocol.recv_bin(self.conn))
+        return media_packet.unpack(zlib.decompress(data))
+
+    # ── Audio ─────────────────────────────────────────────────────────────────
+
+    def _initialize_audio(self):
+        try:
+            self.pyaudio_instance = pyaudio.PyAudio()
+            self.audio_stream = self.pyaudio_instance.open(
+                format=pyaudio.paInt16,
+                channels=self.info['audio_channels'],
+                rate=self.info['audio_sample_rate'],
+                output=True,
+                frames_per_buffer=AUDIO_FRAMES_PER_BUFFER
+            )
+        except Exception as e:
+            print(f"[LiveViewer] Audio init failed: {e}")
+            self.audio_stream = None
+
+    def _audio_loop(self):
+        """Play queued audio blocks until the broadcast ends."""
+        while not self._ended.is_set():
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._audio_blocks or self._ended.is_set(), AUDIO_WAIT_SECONDS
+                )
+                if not self._audio_blocks:
+                    continue
+                block = self._audio_blocks.popleft()
+            try:
+                self.audio_stream.write(block)
+            except Exception:
+                return
+
+    # ── Receiving ─────────────────────────────────────────────────────────────
+
+    def _receive_loop(self):
+        """Keep the newest frame and queue audio until the broadcast ends."""
+        try:
+            while not self._ended.is_set():
+                packet = self._recv_packet()
+                if 'frame_number' not in packet:
+                    if packet.get('type') == INFO_TYPE_END:
+                        print("[LiveViewer] Broadcast ended")
+                        break
+                    continue
+                with self._cond:
+                    if packet['frame'] is not None:
+                        self._latest_frame = packet['frame']
+                    if packet['audio'] is not None and self.audio_stream:
+                        self._audio_blocks.append(packet['audio'].tobytes())
+                    self._cond.notify_all()
+        except (ConnectionError, OSError, ValueError, zlib.error):
+            print("[LiveViewer] Connection closed")
+        finally:
+            self._ended.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    # ── Playback ──────────────────────────────────────────────────────────────
+
+    def play(self):
+        """Show the broadcast until it ends or the window is closed."""
+        threading.Thread(target=self._receive_loop, daemon=True,
+                         name="LiveViewerReceive").start()
+        if self.audio_stream:
+            threading.Thread(target=self._audio_loop, daemon=True,
+                             name="LiveViewerAudio").start()
+
+        win = f"LIVE - {self.info.get('username', '')}"
+        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(win, self.info['width'], self.info['height'])
+
+        while not self._ended.is_set():
+            with self._cond:
+                jpeg, self._latest_frame = self._latest_frame, None
+            if jpeg is not None:
+                frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+                if frame is not None:
+                    cv2.putText(frame, "LIVE", (TEXT_X, TEXT_Y),
+                                cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE, COLOR_RED, LINE_THICKNESS)
+                    cv2.imshow(win, frame)
+
+            key = cv2.waitKey(FRAME_WAIT_MS) & KEY_MASK
+            if key in (ord('q'), ord('Q'), KEY_ESCAPE) or not self._window_visible(win):
+                break
+
+        cv2.destroyAllWindows()
+        self.cleanup()
+
+    @staticmethod
+    def _window_visible(win: str) -> bool:
+        try:
+            return cv2.getWindowProperty(win, cv2.WND_PROP_VISIBLE) >= IS_WINDOW_VISIBLE
+        except Exception:
+            return False
+
+    # ── Cleanup ───────────────────────────────────────────────────────────────
+
+    def cleanup(self):
+        self._ended.set()
+        if self.socket:
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+            self.socket = None
+        if self.audio_stream:
+            try:
+                self.audio_stream.stop_stream()
+                self.audio_stream.close()
+            except Exception:
+                pass
+            self.audio_stream = None
+        if self.pyaudio_instance:
+            try:
+                self.pyaudio_instance.terminate()
+            except Exception:
+                pass
+            self.pyaudio_instance = None
+        print("[LiveViewer] Disconnected")
+
+
+def run_live_story_client(broadcast_id: str, host: str = LIVE_SERVER_HOST,
+                          port: int = LIVE_SERVER_PORT):
+    """Watch a live broadcast until it ends or the window is closed."""
+    viewer = LiveStoryViewer(broadcast_id, host, port)
+    if viewer.connect():
+        viewer.play()
+    else:
+        print("[LiveViewer] Failed to connect")
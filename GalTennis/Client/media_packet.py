@@ -0,0 +1,216 @@
+"""
+Gal Haham
+Media Packet - binary wire format for streamed frames and stream info.
+Replaces pickle on the streaming paths: pickle copies every numpy array
+into its byte stream, and unpickling data from a socket can execute code.
+
+Layout (network byte order):
+    header  HEADER_FORMAT (fixed size, see below)
+    meta    meta_len bytes   UTF-8 JSON (stream/story info, else empty)
+    video   video_len bytes  raw pixels, shape = (height, width, channels),
+                             or an encoded image (codec CODEC_JPEG)
+    audio   audio_len bytes  raw PCM (s16le, interleaved)
+
+Header fields:
+    magic, version, kind, flags, frame_number, pts, seek_seq, rendition,
+    codec, height, width, channels, audio_format, audio_channels,
+    meta_len, video_len, audio_len
+
+The same file lives in Client/ and Server/; change both together and
+bump VERSION when the layout changes.
+"""
+import json
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b'GTMP'
+VERSION = 1
+
+HEADER_FORMAT = "!4sBBHqdIHBHHBBBIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+KIND_INFO = 1
+KIND_FRAME = 2
+
+FLAG_VIDEO = 0x01
+FLAG_AUDIO = 0x02
+
+CODEC_RAW_BGR = 0
+CODEC_JPEG = 1
+BGR_CHANNELS = 3
+AUDIO_PCM_S16LE = 0
+
+_AUDIO_DTYPE = np.dtype('<i2')
+_NO_FRAME = -1
+
+
+class MediaPacketError(ValueError):
+    """Raised when bytes on the wire are not a valid media packet."""
+
+
+# ── Packing ───────────────────────────────────────────────────────────────────
+
+def pack_info(info: dict) -> list:
+    """
+    Build a stream/story info packet.
+
+    Args:
+        info: JSON-serialisable metadata dict
+
+    Returns:
+        list: Buffers that make up the packet, in order
+    """
+    meta = json.dumps(info).encode('utf-8')
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, KIND_INFO, 0,
+        _NO_FRAME, 0.0, 0, 0,
+        CODEC_RAW_BGR, 0, 0, 0,
+        AUDIO_PCM_S16LE, 0,
+        len(meta), 0, 0
+    )
+    return [header, meta]
+
+
+def pack_frame(frame, audio, frame_number: int, pts: float,
+               seek_seq: int = 0, rendition: int = 0, audio_channels: int = 0) -> list:
+    """
+    Build a frame packet without copying the pixel or sample data.
+
+    Args:
+        frame: uint8 image (H, W) or (H, W, C), or None
+        audio: int16 PCM array, or None
+        frame_number: Source frame index
+        pts: Presentation time in seconds
+        seek_seq: Seq of the last seek applied before this frame
+        rendition: Height of the rendition the frame was cut from
+        audio_channels: Interleaved channel count of audio
+
+    Returns:
+        list: Buffers that make up the packet, in order
+    """
+    flags = 0
+    height = width = channels = 0
+    video = b''
+    if frame is not None:
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        video = memoryview(frame).cast('B')
+        flags |= FLAG_VIDEO
+
+    pcm = b''
+    if audio is not None:
+        audio = np.ascontiguousarray(audio, dtype=_AUDIO_DTYPE)
+        pcm = memoryview(audio).cast('B')
+        flags |= FLAG_AUDIO
+
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, KIND_FRAME, flags,
+        frame_number, pts, seek_seq, rendition,
+        CODEC_RAW_BGR, height, width, channels,
+        AUDIO_PCM_S16LE, audio_channels,
+        0, len(video), len(pcm)
+    )
+    return [header, video, pcm]
+
+
+def pack_image(jpeg, height: int, width: int,
+               frame_number: int = 0, pts: float = 0.0) -> list:
+    """
+    Build a frame packet holding one JPEG-encoded image, for stills that
+    the client decodes and shows itself, or frames of a live broadcast.
+
+    Args:
+        jpeg: JPEG file bytes
+        height: Image height
+        width: Image width
+        frame_number: Frame index (live broadcasts)
+        pts: Presentation time in seconds (live broadcasts)
+
+    Returns:
+        list: Buffers that make up the packet, in order
+    """
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, VERSION, KIND_FRAME, FLAG_VIDEO,
+        frame_number, pts, 0, 0,
+        CODEC_JPEG, height, width, BGR_CHANNELS,
+        AUDIO_PCM_S16LE, 0,
+        0, len(jpeg), 0
+    )
+    return [header, jpeg]
+
+
+def compress(parts: list, level: int) -> bytes:
+    """zlib-compress packet buffers in one pass, without joining them first."""
+    compressor = zlib.compressobj(level)
+    chunks = [compressor.compress(part) for part in parts if len(part)]
+    chunks.append(compressor.flush())
+    return b''.join(chunks)
+
+
+# ── Unpacking ─────────────────────────────────────────────────────────────────
+
+def unpack(data: bytes) -> dict:
+    """
+    Parse a packet. Arrays are views into data (np.frombuffer), so they
+    are read-only; copy one before drawing on it.
+
+    Returns:
+        dict: The info dict for KIND_INFO, otherwise a frame packet with
+              frame, audio, frame_number, pts, seek_seq, rendition, codec.
+              For CODEC_JPEG, frame is the encoded image (1-D uint8)
+
+    Raises:
+        MediaPacketError: Bad magic, unknown version or truncated data
+    """
+    if len(data) < HEADER_SIZE:
+        raise MediaPacketError("Packet shorter than header")
+
+    (magic, version, kind, flags,
+     frame_number, pts, seek_seq, rendition,
+     codec, height, width, channels,
+     audio_format, audio_channels,
+     meta_len, video_len, audio_len) = struct.unpack_from(HEADER_FORMAT, data)
+
+    if magic != MAGIC:
+        raise MediaPacketError("Not a media packet")
+    if version != VERSION:
+        raise MediaPacketError(f"Unsupported media packet version {version}")
+    if len(data) < HEADER_SIZE + meta_len + video_len + audio_len:
+        raise MediaPacketError("Truncated media packet")
+
+    offset = HEADER_SIZE
+    if kind == KIND_INFO:
+        return json.loads(bytes(data[offset:offset + meta_len]).decode('utf-8'))
+    if kind != KIND_FRAME:
+        raise MediaPacketError(f"Unknown packet kind {kind}")
+    offset += meta_len
+
+    frame = None
+    if flags & FLAG_VIDEO:
+        if codec == CODEC_JPEG:
+            frame = np.frombuffer(data, np.uint8, video_len, offset)
+        elif codec == CODEC_RAW_BGR:
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            frame = np.frombuffer(data, np.uint8, video_len, offset).reshape(shape)
+        else:
+            raise MediaPacketError(f"Unknown video codec {codec}")
+    offset += video_len
+
+    audio = None
+    if flags & FLAG_AUDIO:
+        if audio_format != AUDIO_PCM_S16LE:
+            raise MediaPacketError(f"Unknown audio format {audio_format}")
+        audio = np.frombuffer(data, _AUDIO_DTYPE, audio_len // _AUDIO_DTYPE.itemsize, offset)
+
+    return {
+        'frame': frame,
+        'audio': audio,
+        'frame_number': frame_number,
+        'pts': pts,
+        'seek_seq': seek_seq,
+        'rendition': rendition,
+        'audio_channels': audio_channels,
+        'codec': codec,
+    }
@@ -3,6 +3,8 @@
 
 import hashlib
 
+FILE_CHUNK_SIZE = 1024 * 1024
+
 
 class Hasha256:
     @staticmethod
@@ -16,6 +18,15 @@ class Hasha256:
         result = hashlib.sha256(st.encode())
         return result.hexdigest()
 
+    @staticmethod
+    def get_file_hash(path, chunk_size=FILE_CHUNK_SIZE):
+        """ hex SHA256 of a file, read in chunks so large videos fit in memory. """
+        result = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                result.update(chunk)
+        return result.hexdigest()
+
 
 def main():
     """ hashing tests """
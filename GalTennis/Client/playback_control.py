@@ -0,0 +1,184 @@
+"""
+Gal Haham
+Playback control for the video and story players.
+Turns key presses into control messages for the server (StreamControl
+on the server side), sent as encrypted JSON on the stream socket:
+    SPACE / P   pause / resume
+    A / D       seek -5s / +5s
+    [ / ]       slower / faster
+Also keeps the playback clock used for BUFFER reports, and drops
+packets that were already in flight when a seek was sent.
+CHANGED: Sends are serialised with a lock, since the video player
+         reports from its receiver thread while keys arrive on the
+         render thread; BUFFER reports may carry extra client stats.
+FIXED: A/D seek from the frame on screen, not the last one received
+       (the video player's jitter buffer runs seconds ahead of it)
+"""
+import threading
+import time
+from Protocol import Protocol
+
+KEY_MASK = 0xFF
+KEY_ESCAPE = 27
+KEY_SPACE = 32
+
+CONTROL_BUFFER = "BUFFER"
+CONTROL_SEEK = "SEEK"
+CONTROL_PAUSE = "PAUSE"
+CONTROL_RESUME = "RESUME"
+CONTROL_RATE = "RATE"
+
+SEEK_STEP_SECONDS = 5
+PLAYBACK_RATES = (0.5, 0.75, 1.0, 1.25, 1.5, 2.0)
+NORMAL_RATE_INDEX = 2
+BUFFER_REPORT_INTERVAL_FRAMES = 10
+
+
+class PlaybackControl:
+    """
+    Client half of the stream control channel.
+    """
+
+    def __init__(self, conn: tuple, fps: float, report_buffer: bool = True,
+                 shown_frame=None):
+        """
+        Args:
+            conn: Encrypted connection tuple (socket, key)
+            fps: Stream frame rate from the stream info
+            report_buffer: Send periodic BUFFER reports (used for ABR)
+            shown_frame: shown_frame() → number of the frame on screen, or
+                         None if nothing is shown yet. Defaults to the last
+                         received frame, for players that show on receipt.
+        """
+        self.conn = conn
+        self.fps = fps
+        self.report_buffer = report_buffer
+        self.paused = False
+        self.rate_index = NORMAL_RATE_INDEX
+        self.seek_seq = 0
+        self.last_frame = -1
+        self._shown_frame = shown_frame or self._last_received_frame
+        self._seek_frame = 0                # Target of the last seek
+        self._frames_since_report = 0
+        self._clock_origin = None           # (wall time, frame number)
+        self._send_lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return PLAYBACK_RATES[self.rate_index]
+
+    # ── Keys ──────────────────────────────────────────────────────────────────
+
+    def handle_key(self, key: int) -> bool:
+        """
+        Act on one cv2.waitKey result.
+
+        Returns:
+            bool: False if the user asked to quit
+        """
+        key &= KEY_MASK
+        if key in (ord('q'), ord('Q'), KEY_ESCAPE):
+            return False
+
+        if key in (KEY_SPACE, ord('p'), ord('P')):
+            self.toggle_pause()
+        elif key in (ord('a'), ord('A')):
+            self.seek_by(-SEEK_STEP_SECONDS)
+        elif key in (ord('d'), ord('D')):
+            self.seek_by(SEEK_STEP_SECONDS)
+        elif key == ord('['):
+            self.set_rate_index(self.rate_index - 1)
+        elif key == ord(']'):
+            self.set_rate_index(self.rate_index + 1)
+        return True
+
+    # ── Commands ──────────────────────────────────────────────────────────────
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self._send({'type': CONTROL_PAUSE if self.paused else CONTROL_RESUME})
+        self._clock_origin = None
+        print(f"[Playback] {'Paused' if self.paused else 'Resumed'}")
+
+    def seek_by(self, seconds: float):
+        self.seek_to_frame(self.position_frame() + int(seconds * self.fps))
+
+    def position_frame(self) -> int:
+        """
+        Frame relative seeks start from: the one on screen, or the target
+        of the last seek until a frame from it is shown.
+        """
+        shown = self._shown_frame()
+        return self._seek_frame if shown is None else shown
+
+    def seek_to_frame(self, frame: int):
+        self.seek_seq += 1
+        frame = max(frame, 0)
+        self._seek_frame = frame
+        self.last_frame = -1
+        self._send({'type': CONTROL_SEEK, 'frame': frame, 'seq': self.seek_seq})
+        self._clock_origin = None
+        print(f"[Playback] Seek → {frame / self.fps:.1f}s")
+
+    def set_rate_index(self, index: int):
+        index = min(max(index, 0), len(PLAYBACK_RATES) - 1)
+        if index == self.rate_index:
+            return
+        self.rate_index = index
+        self._send({'type': CONTROL_RATE, 'rate': self.rate})
+        self._clock_origin = None
+        print(f"[Playback] Rate {self.rate}x")
+
+    # ── Packets ───────────────────────────────────────────────────────────────
+
+    def accept(self, packet: dict) -> bool:
+        """
+        Returns:
+            bool: False if the packet predates the last seek and
+                  should be dropped
+        """
+        return packet.get('seek_seq', 0) >= self.seek_seq
+
+    def on_frame(self, packet: dict, extra: dict = None):
+        """
+        Update the playback clock and send a BUFFER report when due.
+
+        Args:
+            packet: Accepted frame packet
+            extra: Extra fields for the report (e.g. dropped / underruns)
+        """
+        frame_number = packet['frame_number']
+        now = time.monotonic()
+        origin = self._clock_origin
+        if origin is None:
+            origin = self._clock_origin = (now, frame_number)
+        self.last_frame = frame_number
+
+        if not self.report_buffer:
+            return
+        self._frames_since_report += 1
+        if self._frames_since_report >= BUFFER_REPORT_INTERVAL_FRAMES:
+            self._frames_since_report = 0
+            report = {
+                'type': CONTROL_BUFFER,
+                'buffer_s': round(self.buffer_seconds(frame_number, now, origin), 3),
+                'frame': frame_number,
+            }
+            report.update(extra or {})
+            self._send(report)
+
+    def _last_received_frame(self):
+        return self.last_frame if self.last_frame >= 0 else None
+
+    def buffer_seconds(self, frame_number: int, now: float, origin: tuple) -> float:
+        """
+        How far ahead of real-time playback the received stream is.
+        Negative means frames are arriving late.
+        """
+        origin_time, origin_frame = origin
+        media_time = (frame_number + 1 - origin_frame) / (self.fps * self.rate)
+        return media_time - (now - origin_time)
+
+    def _send(self, message: dict):
+        with self._send_lock:
+            Protocol.send_json(message, self.conn)
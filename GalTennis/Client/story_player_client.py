@@ -1,20 +1,33 @@
 """
 Gal Haham
 Story player client - ENCRYPTED + COMPRESSED
-REFACTORED: Single-port design. Client sends an 8-byte ticket immediately
-            after TCP connect so the server knows which story to stream.
-Pipeline: send ticket → recv accept byte → key exchange → recv frames
-          recv_bin → AES.decrypt → zlib.decompress → pickle.loads → display
+REFACTORED: Single-port design. The client sends its ticket so the server
+            knows which story to stream.
+Pipeline: key exchange → SELECT_STORY(ticket) → STORY_READY → recv frames
+          recv_bin → AES.decrypt → zlib.decompress → media_packet.unpack → display
+ADDED: Pause / seek / rate keys (see playback_control)
+CHANGED: Packets are parsed with media_packet (no pickle)
+CHANGED: Image stories arrive once as JPEG with a display duration and
+         are shown (and paused) locally
+CHANGED: The ticket is sent encrypted after key exchange and the server
+         answers STORY_READY; no accept byte before encryption
+ADDED: Playlist mode - several stories on one session. A receiver thread
+       keeps a bounded prefetch buffer, so the next story's info and first
+       seconds are already here when the current one ends.
 """
 import socket
+import queue
+import threading
+import time
 import cv2
-import pickle
 import zlib
 import pyaudio
 import numpy as np
 import key_exchange
 import aes_cipher
+import media_packet
 from Protocol import Protocol
+from playback_control import PlaybackControl
 
 STORY_SERVER_HOST = "127.0.0.1"
 STORY_SERVER_PORT = 6001
@@ -23,7 +36,20 @@ FRAME_INCREMENT = 1
 MODULO_SUCCESS = 0
 FPS_RATE = 20
 FRAME_DELAY_MS = 1
+PAUSED_WAIT_MS = 50
+STILL_WAIT_MS = 50
+KEY_MASK = 0xFF
 KEY_ESCAPE = 27
+KEY_SPACE = 32
+
+PREFETCH_PACKETS = 60           # About 3 s of video at 20 fps
+QUEUE_POLL_SECONDS = 0.5
+CONTROL_SKIP = "SKIP"
+
+# How a story in playlist mode ended
+OUTCOME_DONE = 'done'
+OUTCOME_NEXT = 'next'
+OUTCOME_QUIT = 'quit'
 IS_WINDOW_VISIBLE = 1
 SOCK_INDEX = 0
 KEY_INDEX = 1
@@ -45,16 +71,15 @@ COLOR_GREEN = (0, 255, 0)
 COLOR_RED = (0, 0, 255)
 COLOR_YELLOW = (255, 255, 0)
 
-TICKET_ACCEPT  = b'\x01'
-TICKET_REJECT  = b'\x00'
-TICKET_LENGTH  = 8
+REQUEST_SELECT_STORY = "SELECT_STORY"
+RESPONSE_STORY_READY = "STORY_READY"
 
 
 class StoryPlayer:
     """
     Receive-only story player.
-    Sends ticket on connect, then:
-    Pipeline: Protocol.recv_bin → AES.decrypt → zlib.decompress → pickle.loads
+    Selects its story with the ticket after key exchange, then:
+    Pipeline: Protocol.recv_bin → AES.decrypt → zlib.decompress → media_packet.unpack
     """
 
     def __init__(
@@ -69,8 +94,11 @@ class StoryPlayer:
         self.socket = None
         self.conn = None            # (socket, encryption_key)
         self.story_info = None
+        self.stories = []           # Story names of the ticket (playlist)
         self.audio_stream = None
         self.pyaudio_instance = None
+        self._clock_origin = None   # Playlist mode: local playback clock
+        self._paused_at = None
 
     # ── Connection ─────────────────────────────────────────────────────────────
 
@@ -81,15 +109,15 @@ class StoryPlayer:
             self.socket.connect((self.host, self.port))
             print("[StoryClient] Connected")
 
-            # Send ticket and verify acceptance
-            self._send_ticket_and_verify()
-
             # Key exchange - client role (send then receive)
             temp_conn = (self.socket, None)
             key = key_exchange.KeyExchange.send_recv_key(temp_conn)
             self.conn = (self.socket, key)
             print(f"[StoryClient] Encryption ready ({len(key)} bytes)")
 
+            # Pick the story and wait until the server is ready to stream it
+            self._select_story()
+
             # Receive story metadata
             self.story_info = self._recv_decrypt_decompress()
             if not self.story_info:
@@ -109,43 +137,39 @@ class StoryPlayer:
                 self.socket.close()
             return False
 
-    def _send_ticket_and_verify(self):
-        """Send the 8-byte ticket and check the server's accept/reject byte."""
+    def _select_story(self):
+        """Send the ticket (encrypted) and wait for STORY_READY."""
         if not self.ticket:
             raise ValueError("[StoryClient] No ticket provided")
 
-        # Pad / truncate to exactly TICKET_LENGTH bytes
-        ticket_bytes = self.ticket.encode("utf-8")[:TICKET_LENGTH].ljust(TICKET_LENGTH, b'\x00')
-        self.socket.sendall(ticket_bytes)
-
-        # Wait for server ack
-        ack = self._recv_exact(self.socket, 1)
-        if ack != TICKET_ACCEPT:
-            self.socket.close()
-            raise ConnectionError(f"[StoryClient] Server rejected ticket '{self.ticket}'")
-        print(f"[StoryClient] Ticket '{self.ticket}' accepted")
-
-    @staticmethod
-    def _recv_exact(sock: socket.socket, n: int) -> bytes:
-        data = b""
-        while len(data) < n:
-            chunk = sock.recv(n - len(data))
-            if not chunk:
-                return b""
-            data += chunk
-        return data
+        Protocol.send_json({'type': REQUEST_SELECT_STORY, 'ticket': self.ticket}, self.conn)
+        reply = Protocol.recv_json(self.conn)
+        if reply.get('type') != RESPONSE_STORY_READY:
+            raise ConnectionError(
+                f"[StoryClient] Server rejected ticket '{self.ticket}': {reply.get('message')}"
+            )
+        self.stories = reply.get('stories') or [reply.get('story')]
+        print(f"[StoryClient] Ticket '{self.ticket}' accepted ({len(self.stories)} stories)")
 
     # ── Core receive pipeline ─────────────────────────────────────────────────
 
     def _recv_decrypt_decompress(self):
         """
-        Protocol.recv_bin → AES.decrypt → zlib.decompress → pickle.loads
+        Protocol.recv_bin → AES.decrypt → zlib.decompress → media_packet.unpack
         """
         try:
             raw = Protocol.recv_bin(self.conn)
             if not raw:
                 return None
+            return self._decode(raw)
 
+        except Exception as e:
+            print(f"[StoryClient] Receive error: {e}")
+            return None
+
+    def _decode(self, raw):
+        """AES.decrypt → zlib.decompress → media_packet.unpack of one packet."""
+        try:
             key = self.conn[KEY_INDEX]
             data = raw if isinstance(raw, bytes) else raw.encode()
             if key:
@@ -156,10 +180,10 @@ class StoryPlayer:
             except zlib.error:
                 pass    # Fallback: not compressed
 
-            return pickle.loads(data)
+            return media_packet.unpack(data)
 
         except Exception as e:
-            print(f"[StoryClient] Receive error: {e}")
+            print(f"[StoryClient] Decode error: {e}")
             return None
 
     # ── Audio ──────────────────────────────────────────────────────────────────
@@ -179,6 +203,21 @@ class StoryPlayer:
             print(f"[StoryClient] Audio init failed: {e}")
             self.story_info['has_audio'] = False
 
+    def _close_audio(self):
+        if self.audio_stream:
+            try:
+                self.audio_stream.stop_stream()
+                self.audio_stream.close()
+            except Exception:
+                pass
+            self.audio_stream = None
+        if self.pyaudio_instance:
+            try:
+                self.pyaudio_instance.terminate()
+            except Exception:
+                pass
+            self.pyaudio_instance = None
+
     # ── Playback ───────────────────────────────────────────────────────────────
 
     def play_story(self):
@@ -190,32 +229,45 @@ class StoryPlayer:
         cv2.namedWindow(win, cv2.WINDOW_NORMAL)
         cv2.resizeWindow(win, self.story_info['width'], self.story_info['height'])
 
+        if 'display_seconds' in self.story_info:
+            self._show_still(win, self._recv_decrypt_decompress())
+            cv2.destroyAllWindows()
+            self.cleanup()
+            return
+
+        playback = PlaybackControl(self.conn, self.story_info['fps'], report_buffer=False)
         frame_count = 0
         print(f"[StoryClient] Playing {self.story_info['type']} story...")
 
         while True:
-            packet = self._recv_decrypt_decompress()
-            if packet is None:
-                print("[StoryClient] Story ended")
-                break
+            # While paused the server sends nothing; only keep the window live
+            if not playback.paused:
+                packet = self._recv_decrypt_decompress()
+                if packet is None:
+                    print("[StoryClient] Story ended")
+                    break
 
-            frame = packet['frame']
-            self._add_overlay(frame, frame_count)
-            cv2.imshow(win, frame)
+                # Packets sent before the last seek are dropped
+                if playback.accept(packet):
+                    playback.on_frame(packet)
+                    # Received frames are read-only views; the overlay draws on a copy
+                    frame = packet['frame'].copy()
+                    self._add_overlay(frame, packet['frame_number'])
+                    cv2.imshow(win, frame)
 
-            if self.audio_stream and packet.get('audio') is not None:
-                try:
-                    self.audio_stream.write(packet['audio'].tobytes())
-                except Exception:
-                    pass
+                    if self.audio_stream and packet.get('audio') is not None:
+                        try:
+                            self.audio_stream.write(packet['audio'].tobytes())
+                        except Exception:
+                            pass
 
-            frame_count += FRAME_INCREMENT
+                    frame_count += FRAME_INCREMENT
 
-            if frame_count % FPS_RATE == MODULO_SUCCESS:
-                print(f"[StoryClient] Frame {frame_count}/{self.story_info['total_frames']}")
+                    if frame_count % FPS_RATE == MODULO_SUCCESS:
+                        print(f"[StoryClient] Frame {packet['frame_number']}/{self.story_info['total_frames']}")
 
-            key = cv2.waitKey(FRAME_DELAY_MS) & 0xFF
-            if key == KEY_ESCAPE or key == ord('q') or key == ord('Q'):
+            wait_ms = PAUSED_WAIT_MS if playback.paused else FRAME_DELAY_MS
+            if not playback.handle_key(cv2.waitKey(wait_ms)):
                 print("[StoryClient] Skipped by user")
                 break
 
@@ -230,6 +282,229 @@ class StoryPlayer:
         self.cleanup()
         print(f"[StoryClient] Done ({frame_count} frames)")
 
+    def _show_still(self, win: str, packet) -> str:
+        """
+        Image story: one JPEG, shown for display_seconds. The countdown
+        and pause (SPACE / P) are local - the server has already sent
+        everything.
+
+        Returns:
+            str: OUTCOME_DONE, OUTCOME_NEXT (N key) or OUTCOME_QUIT
+        """
+        if packet is None or packet.get('codec') != media_packet.CODEC_JPEG:
+            print("[StoryClient] No image received")
+            return OUTCOME_DONE
+        image = cv2.imdecode(packet['frame'], cv2.IMREAD_COLOR)
+        if image is None:
+            print("[StoryClient] Cannot decode image")
+            return OUTCOME_DONE
+
+        remaining = self.story_info['display_seconds']
+        paused = False
+        shown_second = None
+        last = time.monotonic()
+        print(f"[StoryClient] Showing image story for {remaining:.1f}s")
+
+        while remaining > 0:
+            now = time.monotonic()
+            if not paused:
+                remaining -= now - last
+            last = now
+
+            # Redraw only when the countdown text changes
+            seconds_left = int(remaining) + 1
+            if (seconds_left, paused) != shown_second:
+                shown_second = (seconds_left, paused)
+                frame = image.copy()
+                self._add_still_overlay(frame, seconds_left, paused)
+                cv2.imshow(win, frame)
+
+            key = cv2.waitKey(STILL_WAIT_MS) & KEY_MASK
+            if key in (ord('q'), ord('Q'), KEY_ESCAPE):
+                print("[StoryClient] Skipped by user")
+                return OUTCOME_QUIT
+            if key in (ord('n'), ord('N')):
+                return OUTCOME_NEXT
+            if key in (KEY_SPACE, ord('p'), ord('P')):
+                paused = not paused
+
+            if not self._window_visible(win):
+                return OUTCOME_QUIT
+
+        print("[StoryClient] Story ended")
+        return OUTCOME_DONE
+
+    def _add_still_overlay(self, frame, seconds_left: int, paused: bool):
+        cv2.putText(
+            frame,
+            f"IMAGE | {'Paused' if paused else f'{seconds_left}s'}",
+            (TEXT_INFO_X, TEXT_INFO_Y),
+            cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE_INFO, COLOR_WHITE, LINE_THICKNESS
+        )
+        cv2.putText(
+            frame,
+            "Q/ESC quit | SPACE pause | N next" if len(self.stories) > 1 else "Q/ESC skip | SPACE pause",
+            (TEXT_INSTRUCTIONS_X, self.story_info['height'] - TEXT_INSTRUCTIONS_Y_OFFSET),
+            cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE_INSTRUCTIONS, COLOR_YELLOW, LINE_THICKNESS
+        )
+
+    # ── Playlist mode ──────────────────────────────────────────────────────────
+
+    def play_playlist(self):
+        """
+        Play every story of a playlist ticket on this session.
+        The server sends the stories back to back; a receiver thread
+        keeps up to PREFETCH_PACKETS of them buffered (a full buffer
+        holds back the server through TCP), and frames are shown at
+        their pts. Keys: SPACE pause, N next story, Q/ESC quit.
+        """
+        packets = queue.Queue(maxsize=PREFETCH_PACKETS)
+        stop = threading.Event()
+        threading.Thread(
+            target=self._prefetch_loop, args=(packets, stop),
+            daemon=True, name="StoryPrefetch"
+        ).start()
+
+        win = "Story"
+        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+        info = self.story_info
+        try:
+            while info is not None:
+                self.story_info = info
+                index = info.get('index', 0)
+                print(f"[StoryClient] Story {index + 1}/{info.get('count', 1)} ({info['type']})")
+                cv2.resizeWindow(win, info['width'], info['height'])
+
+                if 'display_seconds' in info:
+                    outcome = self._show_still(win, self._next_packet(packets))
+                    next_info = None
+                else:
+                    outcome, next_info = self._play_buffered_video(win, packets)
+
+                if outcome == OUTCOME_QUIT:
+                    break
+                if outcome == OUTCOME_NEXT:
+                    Protocol.send_json({'type': CONTROL_SKIP, 'index': index}, self.conn)
+                info = next_info or self._next_info(packets, index)
+        finally:
+            stop.set()
+            cv2.destroyAllWindows()
+            self.cleanup()
+        print("[StoryClient] Playlist done")
+
+    def _prefetch_loop(self, packets: queue.Queue, stop: threading.Event):
+        """Receive raw packets into the bounded buffer; None marks the end."""
+        while not stop.is_set():
+            try:
+                raw = Protocol.recv_bin(self.conn)
+            except Exception:
+                raw = None
+            item = raw or None
+            while not stop.is_set():
+                try:
+                    packets.put(item, timeout=QUEUE_POLL_SECONDS)
+                    break
+                except queue.Full:
+                    continue
+            if item is None:
+                return
+
+    def _next_packet(self, packets: queue.Queue):
+        """Next decoded packet from the buffer, or None at the end."""
+        raw = packets.get()
+        if raw is None:
+            packets.put(None)       # Keep the end marker for later calls
+            return None
+        return self._decode(raw)
+
+    def _next_info(self, packets: queue.Queue, index: int):
+        """Drop what is left of story <index> and return the next story's info."""
+        while True:
+            packet = self._next_packet(packets)
+            if packet is None:
+                return None
+            if 'frame_number' not in packet and packet.get('index', 0) > index:
+                return packet
+
+    def _play_buffered_video(self, win: str, packets: queue.Queue):
+        """
+        Show one video story from the buffer, paced by frame pts.
+
+        Returns:
+            tuple: (outcome, info of the next story if it was reached)
+        """
+        self._close_audio()
+        if self.story_info.get('has_audio'):
+            self._initialize_audio()
+
+        self._clock_origin = None       # monotonic time of pts 0
+        self._paused_at = None
+        while True:
+            packet = self._next_packet(packets)
+            if packet is None:
+                return OUTCOME_DONE, None
+            if 'frame_number' not in packet:
+                return OUTCOME_DONE, packet     # Next story's info
+
+            if self._clock_origin is None:
+                self._clock_origin = time.monotonic() - packet['pts']
+            due = self._clock_origin + packet['pts']
+            frame = packet['frame'].copy()
+            self._add_overlay(frame, packet['frame_number'])
+
+            # Hold the frame until its pts; keys stay live while waiting
+            while self._paused_at is not None or time.monotonic() < due:
+                wait_ms = PAUSED_WAIT_MS
+                if self._paused_at is None:
+                    wait_ms = min(max(int((due - time.monotonic()) * 1000), FRAME_DELAY_MS),
+                                  PAUSED_WAIT_MS)
+                outcome = self._handle_playlist_key(cv2.waitKey(wait_ms), win)
+                if outcome:
+                    return outcome, None
+                due = self._clock_origin + packet['pts']
+
+            cv2.imshow(win, frame)
+            if self.audio_stream and packet.get('audio') is not None:
+                try:
+                    self.audio_stream.write(packet['audio'].tobytes())
+                except Exception:
+                    pass
+            outcome = self._handle_playlist_key(cv2.waitKey(FRAME_DELAY_MS), win)
+            if outcome:
+                return outcome, None
+
+    def _handle_playlist_key(self, key: int, win: str):
+        """
+        Returns:
+            str: OUTCOME_QUIT / OUTCOME_NEXT, or None to keep playing
+        """
+        key &= KEY_MASK
+        if key in (ord('q'), ord('Q'), KEY_ESCAPE):
+            return OUTCOME_QUIT
+        if key in (ord('n'), ord('N')):
+            return OUTCOME_NEXT
+        if key in (KEY_SPACE, ord('p'), ord('P')):
+            now = time.monotonic()
+            if self._paused_at is None:
+                self._paused_at = now
+            else:
+                # Shift the clock by the pause so playback resumes in place
+                self._clock_origin += now - self._paused_at
+                self._paused_at = None
+        if not self._window_visible(win):
+            return OUTCOME_QUIT
+        return None
+
+    @staticmethod
+    def _window_visible(win: str) -> bool:
+        try:
+            if cv2.getWindowProperty(win, cv2.WND_PROP_VISIBLE) < IS_WINDOW_VISIBLE:
+                print("[StoryClient] Window closed")
+                return False
+            return True
+        except Exception:
+            return False
+
     # ── Overlay text ───────────────────────────────────────────────────────────
 
     def _add_overlay(self, frame, frame_count: int):
@@ -247,9 +522,13 @@ class StoryPlayer:
             cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE_AUDIO,
             COLOR_GREEN if has_audio else COLOR_RED, LINE_THICKNESS
         )
+        instructions = (
+            "Q/ESC quit | SPACE pause | N next" if len(self.stories) > 1
+            else "Q/ESC skip | SPACE pause | A/D seek | [/] speed"
+        )
         cv2.putText(
             frame,
-            "Press Q or ESC to skip",
+            instructions,
             (TEXT_INSTRUCTIONS_X, self.story_info['height'] - TEXT_INSTRUCTIONS_Y_OFFSET),
             cv2.FONT_HERSHEY_SIMPLEX, FONT_SIZE_INSTRUCTIONS, COLOR_YELLOW, LINE_THICKNESS
         )
@@ -263,17 +542,7 @@ class StoryPlayer:
     # ── Cleanup ────────────────────────────────────────────────────────────────
 
     def cleanup(self):
-        if self.audio_stream:
-            try:
-                self.audio_stream.stop_stream()
-                self.audio_stream.close()
-            except Exception:
-                pass
-        if self.pyaudio_instance:
-            try:
-                self.pyaudio_instance.terminate()
-            except Exception:
-                pass
+        self._close_audio()
         if self.socket:
             try:
                 self.socket.close()
@@ -287,10 +556,16 @@ def run_story_player_client(
     port: int = STORY_SERVER_PORT,
     ticket: str = "",
 ):
-    """Connect to the story server with the given ticket and play the story."""
+    """
+    Connect to the story server with the given ticket and play the story,
+    or every story of a playlist ticket in order.
+    """
     player = StoryPlayer(host, port, ticket=ticket)
     if player.connect():
-        player.play_story()
+        if len(player.stories) > 1:
+            player.play_playlist()
+        else:
+            player.play_story()
     else:
         print("[StoryClient] Failed to connect")
 
@@ -0,0 +1,153 @@
+"""
+Gal Haham
+Persistent client for the story (2222) and video (2223) thumbnail servers.
+Key exchange runs once per connection and the session key is reused for
+every request. Items arrive as separate MEDIA_ITEM frames followed by a
+MEDIA_END frame, so callers can render while the list is still streaming.
+CHANGED: fetch_media() hands each item to an on_item callback as it
+         arrives, so the grids fill in instead of waiting for MEDIA_END
+"""
+import socket
+import threading
+import key_exchange
+from Protocol import Protocol
+
+SERVER_IP = '127.0.0.1'
+STORY_THUMBNAIL_PORT = 2222
+VIDEO_THUMBNAIL_PORT = 2223
+SOCKET_TIMEOUT_SECONDS = 30
+MAX_ATTEMPTS = 2
+
+REQUEST_GET_MEDIA = "GET_MEDIA"
+REQUEST_GET_VIDEOS_MEDIA = "GET_VIDEOS_MEDIA"
+RESPONSE_MEDIA_ITEM = "MEDIA_ITEM"
+RESPONSE_MEDIA_END = "MEDIA_END"
+RESPONSE_ERROR = "error"
+
+KEY_TYPE = 'type'
+KEY_PAYLOAD = 'payload'
+KEY_MESSAGE = 'message'
+
+
+class ThumbnailClient:
+    """
+    Persistent encrypted connection to a thumbnail server.
+
+    The connection is opened lazily on the first request and kept
+    open for later requests. If the server dropped the connection in
+    the meantime, the request is retried once on a fresh connection.
+    """
+
+    def __init__(
+            self,
+            port: int,
+            request_type: str,
+            host: str = SERVER_IP
+    ):
+        """
+        Initialize the thumbnail client.
+
+        Args:
+            port: Thumbnail server port
+            request_type: Request sent to list media
+            host: Thumbnail server address
+        """
+        self.host = host
+        self.port = port
+        self.request_type = request_type
+        self.sock = None
+        self.conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the socket and run the key exchange (client role)."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(SOCKET_TIMEOUT_SECONDS)
+        self.sock.connect((self.host, self.port))
+        temp_conn = (self.sock, None)
+        key = key_exchange.KeyExchange.send_recv_key(temp_conn)
+        self.conn = (self.sock, key)
+
+    def iter_media(self):
+        """
+        Request the media list and yield items as they arrive.
+
+        Yields:
+            dict: Media item with name, thumbnail and metadata
+
+        Raises:
+            ConnectionError: If the connection is lost
+            RuntimeError: If the server answers with an error frame
+        """
+        with self._lock:
+            if self.conn is None:
+                self._connect()
+
+            Protocol.send_json(
+                {KEY_TYPE: self.request_type, KEY_PAYLOAD: {}},
+                self.conn
+            )
+            while True:
+                response = Protocol.recv_json(self.conn)
+                response_type = response.get(KEY_TYPE)
+
+                if response_type == RESPONSE_MEDIA_ITEM:
+                    yield response.get(KEY_PAYLOAD)
+                elif response_type == RESPONSE_MEDIA_END:
+                    return
+                elif response_type == RESPONSE_ERROR:
+                    raise RuntimeError(response.get(KEY_MESSAGE))
+
+    def fetch_media(self, on_item=None) -> list:
+        """
+        Request the media list and read all of it.
+        A stale connection (server restarted, idle socket closed) is
+        replaced and the request retried once - unless items were
+        already handed to on_item, which would then see them twice.
+
+        Args:
+            on_item: Called with each item as it arrives (on the
+                     calling thread)
+
+        Returns:
+            list: Media items
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            items = []
+            try:
+                for item in self.iter_media():
+                    items.append(item)
+                    if on_item is not None:
+                        on_item(item)
+                return items
+            except (ConnectionError, OSError):
+                # A half-read response leaves the stream out of sync
+                self.close()
+                if items or attempt == MAX_ATTEMPTS - 1:
+                    raise ConnectionError(
+                        f"Thumbnail server unreachable at "
+                        f"{self.host}:{self.port}"
+                    )
+        return []
+
+    def close(self):
+        """Close the connection; the next request reconnects."""
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.conn = None
+
+
+def story_thumbnail_client(host: str = SERVER_IP) -> ThumbnailClient:
+    """Create a client for the story thumbnail server."""
+    return ThumbnailClient(STORY_THUMBNAIL_PORT, REQUEST_GET_MEDIA, host)
+
+
+def video_thumbnail_client(host: str = SERVER_IP) -> ThumbnailClient:
+    """Create a client for the video thumbnail server."""
+    return ThumbnailClient(
+        VIDEO_THUMBNAIL_PORT, REQUEST_GET_VIDEOS_MEDIA, host
+    )
@@ -3,14 +3,21 @@ Gal Haham
 Media file uploader client - ENCRYPTED VERSION
 FIXED: {payload_bytes} set bug → now sends base64 string in JSON correctly
 FIXED: Payload built and sent properly via Protocol.send
+ADDED: The SHA-256 of the file is sent first; the bytes only follow if
+       the server does not already store that content
+CHANGED: run() returns the server's ack, which holds the posted story
+         record - there is nothing to poll for afterwards
+CHANGED: The file is streamed from disk in encrypted binary chunks after
+         its size and hash - no base64 and never the whole file in memory
 """
 import socket
-import base64
 import json
 import os
 from pathlib import Path
 import key_exchange
+import aes_cipher
 from Protocol import Protocol
+from my_sha256 import Hasha256
 
 HOST = "127.0.0.1"
 PORT = 3333
@@ -21,6 +28,9 @@ MEDIA_TYPE_IMAGE = "image"
 FILE_MODE_READ_BINARY = "rb"
 DEFAULT_USERNAME = "user"
 ERROR_FILE_NOT_FOUND = "File not found"
+RESPONSE_TYPE_NEED_DATA = "need"
+RESPONSE_TYPE_GOOD = "good"
+CHUNK_SIZE = 256 * 1024
 
 SOCK_INDEX = 0
 KEY_INDEX = 1
@@ -29,7 +39,8 @@ KEY_INDEX = 1
 class MediaClient:
     """
     Sends image/video files to the story upload server with encryption.
-    Pipeline: load file → base64 → JSON → Protocol.send (encrypted)
+    Pipeline: size + SHA-256 → (server asks for data) → file chunks →
+              AES.encrypt → Protocol.send_bin
     """
 
     def __init__(self, host: str = HOST, port: int = PORT):
@@ -45,26 +56,26 @@ class MediaClient:
         print(f"[MediaClient] Encryption ready ({len(key)} bytes)")
 
     def send_media(self, file_path: str, username: str = DEFAULT_USERNAME):
-        """Load a media file, encode it, and send to server."""
+        """Offer a media file by hash and stream it to the server if asked."""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"{ERROR_FILE_NOT_FOUND}: {file_path}")
 
-        # Read and encode
-        with open(file_path, FILE_MODE_READ_BINARY) as f:
-            file_bytes = f.read()
-
-        b64_data = base64.b64encode(file_bytes).decode()
         media_type = MEDIA_TYPE_VIDEO if Path(file_path).suffix.lower() == VIDEO_EXTENSION else MEDIA_TYPE_IMAGE
-
-        # Build JSON payload
-        payload = json.dumps({
+        metadata = {
             "username": username,
             "media_type": media_type,
-            "data": b64_data          # ← FIXED: was {payload_bytes} (set bug)
-        })
+            "sha256": Hasha256.get_file_hash(file_path),
+            "size": os.path.getsize(file_path),
+        }
 
-        # Send via encrypted Protocol
-        Protocol.send(payload, self.conn)
+        # Offer the hash first - the server may already have this content
+        Protocol.send(json.dumps(metadata), self.conn)
+        response = Protocol.recv(self.conn)
+        if self._response_type(response) != RESPONSE_TYPE_NEED_DATA:
+            print(f"[MediaClient] Server already had {file_path}: {response}")
+            return response
+
+        self._send_file(file_path)
         print(f"[MediaClient] Sent {media_type}: {file_path}")
 
         # Receive response
@@ -72,6 +83,26 @@ class MediaClient:
         print(f"[MediaClient] Server response: {response}")
         return response
 
+    def _send_file(self, file_path: str):
+        """Stream the file as encrypted chunks of up to CHUNK_SIZE bytes."""
+        key = self.conn[KEY_INDEX]
+        with open(file_path, FILE_MODE_READ_BINARY) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                Protocol.send_bin(aes_cipher.AESCipher.encrypt(key, chunk), self.conn)
+
+    @staticmethod
+    def _response_type(response: str):
+        return MediaClient.parse_response(response).get("type")
+
+    @staticmethod
+    def parse_response(response: str) -> dict:
+        """The server's JSON reply as a dict ({} if it is not one)."""
+        try:
+            parsed = json.loads(response)
+        except (TypeError, ValueError):
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
+
     def close(self):
         try:
             self.socket.close()
@@ -79,10 +110,20 @@ class MediaClient:
             pass
 
 
-def run(file_path: str, username: str = DEFAULT_USERNAME):
-    """Send a file in one call."""
+def run(file_path: str, username: str = DEFAULT_USERNAME) -> dict:
+    """
+    Send a file in one call.
+
+    Returns:
+        dict: The story record from the server's ack, or None if the
+              story was not posted
+    """
     client = MediaClient()
     try:
-        client.send_media(file_path, username)
+        response = MediaClient.parse_response(client.send_media(file_path, username))
     finally:
-        client.close()
\ No newline at end of file
+        client.close()
+    if response.get("type") != RESPONSE_TYPE_GOOD:
+        print(f"[MediaClient] Story not posted: {response.get('payload')}")
+        return None
+    return response.get("story")
\ No newline at end of file
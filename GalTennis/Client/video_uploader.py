@@ -0,0 +1,218 @@
+"""
+Gal Haham
+Video uploader client - chunked, parallel, resumable, encrypted.
+Talks to the server's VideoUploadServer (port from START_VIDEO_UPLOAD):
+    1. INIT on one connection: metadata, size and SHA-256 of the file;
+       the server answers with the chunks it still needs
+    2. PARALLEL_STREAMS connections send those chunks, each one
+       encrypted on its own and acknowledged by the server
+    3. COMPLETE: the server checks the hash and registers the video
+
+If the server already stores a file with the same SHA-256 (another
+player uploaded the same clip), step 2 is skipped entirely.
+
+Calling upload() again for the same file after a failure sends only the
+chunks the server does not have yet.
+"""
+import os
+import queue
+import socket
+import struct
+import threading
+import aes_cipher
+import key_exchange
+from Protocol import Protocol
+from my_sha256 import Hasha256
+
+HOST = "127.0.0.1"
+PORT = 3334
+
+PARALLEL_STREAMS = 4
+CHUNK_HEADER_FORMAT = "!I"      # chunk index
+SOCKET_TIMEOUT_SECONDS = 30
+COMPLETE_TIMEOUT_SECONDS = 600  # Server hashes the whole file before replying
+
+MSG_INIT = 'INIT'
+MSG_CHUNKS = 'CHUNKS'
+MSG_COMPLETE = 'COMPLETE'
+
+KEY_STATUS = 'status'
+KEY_MESSAGE = 'message'
+KEY_UPLOAD_ID = 'upload_id'
+
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+
+KEY_INDEX_IN_CONN = 1
+
+
+class VideoUploader:
+    """Uploads one video file to the upload server."""
+
+    def __init__(self, host: str = HOST, port: int = PORT,
+                 streams: int = PARALLEL_STREAMS):
+        """
+        Args:
+            host: Server address
+            port: Upload server port
+            streams: Number of parallel chunk connections
+        """
+        self.host = host
+        self.port = port
+        self.streams = streams
+
+    def upload(self, file_path: str, title: str, category: str, level: str,
+               uploader: str, progress=None) -> dict:
+        """
+        Upload file_path and register it as a video (blocking).
+
+        Args:
+            file_path: Local video file
+            title: Video title (server filename)
+            category: Video category
+            level: Difficulty level
+            uploader: Username of the uploader
+            progress: Optional callback(bytes_done, bytes_total), called from
+                      the upload threads after every acknowledged chunk
+
+        Returns:
+            dict: Server response with status and message
+        """
+        size = os.path.getsize(file_path)
+        print(f"[VideoUploader] Hashing {file_path}...")
+        sha256 = Hasha256.get_file_hash(file_path)
+
+        init = self._request({
+            'type': MSG_INIT,
+            'title': title,
+            'category': category,
+            'level': level,
+            'uploader': uploader,
+            'size': size,
+            'sha256': sha256,
+        })
+        if init.get(KEY_STATUS) != STATUS_SUCCESS:
+            return init
+
+        upload_id = init[KEY_UPLOAD_ID]
+        chunk_size = init['chunk_size']
+        missing = init['missing']
+        done = size - sum(self._chunk_length(i, chunk_size, size) for i in missing)
+        if init.get('deduplicated'):
+            print(f"[VideoUploader] Upload {upload_id}: server already has this file")
+        else:
+            print(f"[VideoUploader] Upload {upload_id}: {len(missing)} chunks to send")
+        if progress and not missing:
+            progress(size, size)
+
+        error = self._send_chunks(file_path, upload_id, chunk_size, size,
+                                  missing, done, progress)
+        if error:
+            return {KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: f"Upload interrupted: {error}"}
+
+        return self._request({'type': MSG_COMPLETE, KEY_UPLOAD_ID: upload_id},
+                             COMPLETE_TIMEOUT_SECONDS)
+
+    # ── Chunk streams ─────────────────────────────────────────────────────────
+
+    def _send_chunks(self, file_path, upload_id, chunk_size, size,
+                     missing, done, progress):
+        """
+        Send the missing chunks over parallel connections.
+
+        Returns:
+            str: First error that stopped a stream, or None
+        """
+        pending = queue.Queue()
+        for index in missing:
+            pending.put(index)
+
+        state = {'done': done, 'error': None}
+        lock = threading.Lock()
+
+        def _on_chunk(length):
+            with lock:
+                state['done'] += length
+                current = state['done']
+            if progress:
+                progress(current, size)
+
+        def _worker():
+            try:
+                self._stream_worker(file_path, upload_id, chunk_size, size,
+                                    pending, _on_chunk)
+            except Exception as e:
+                with lock:
+                    state['error'] = state['error'] or str(e)
+
+        workers = [
+            threading.Thread(target=_worker, daemon=True, name=f"VideoUpload-{n}")
+            for n in range(min(self.streams, len(missing)))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return state['error']
+
+    def _stream_worker(self, file_path, upload_id, chunk_size, size,
+                       pending, on_chunk):
+        """One connection: take chunks off the queue until it is empty."""
+        sock, conn = self._connect()
+        try:
+            Protocol.send_json({'type': MSG_CHUNKS, KEY_UPLOAD_ID: upload_id}, conn)
+            reply = Protocol.recv_json(conn)
+            if reply.get(KEY_STATUS) != STATUS_SUCCESS:
+                raise ConnectionError(reply.get(KEY_MESSAGE, "Chunk stream refused"))
+
+            with open(file_path, 'rb') as f:
+                while True:
+                    try:
+                        index = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    f.seek(index * chunk_size)
+                    data = f.read(self._chunk_length(index, chunk_size, size))
+                    packet = struct.pack(CHUNK_HEADER_FORMAT, index) + data
+                    Protocol.send_bin(
+                        aes_cipher.AESCipher.encrypt(conn[KEY_INDEX_IN_CONN], packet),
+                        conn
+                    )
+                    ack = Protocol.recv_json(conn)
+                    if ack.get(KEY_STATUS) != STATUS_SUCCESS:
+                        raise ConnectionError(ack.get(KEY_MESSAGE, f"Chunk {index} rejected"))
+                    on_chunk(len(data))
+        finally:
+            self._close(sock)
+
+    # ── Connection helpers ────────────────────────────────────────────────────
+
+    def _connect(self, timeout: float = SOCKET_TIMEOUT_SECONDS):
+        sock = socket.create_connection((self.host, self.port), timeout)
+        key = key_exchange.KeyExchange.send_recv_key((sock, None))
+        return sock, (sock, key)
+
+    def _request(self, message: dict, timeout: float = SOCKET_TIMEOUT_SECONDS) -> dict:
+        """Send one JSON request on a fresh connection and return the reply."""
+        sock = None
+        try:
+            sock, conn = self._connect(timeout)
+            Protocol.send_json(message, conn)
+            return Protocol.recv_json(conn)
+        except (OSError, ConnectionError, ValueError) as e:
+            return {KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: f"Upload server unreachable: {e}"}
+        finally:
+            self._close(sock)
+
+    @staticmethod
+    def _close(sock):
+        if sock is None:
+            return
+        try:
+            sock.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _chunk_length(index: int, chunk_size: int, size: int) -> int:
+        return min(chunk_size, size - index * chunk_size)
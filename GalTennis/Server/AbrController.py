@@ -0,0 +1,155 @@
+"""
+Gal Haham
+ABR Controller - picks the rendition a stream should be sending.
+Frames go over the wire as compressed raw pixels, so the cost of a
+rung is estimated from the bytes-per-pixel actually measured on the
+current rung, scaled by each rung's pixel count.
+
+Inputs:
+    - send throughput, measured over windows of WINDOW_PACKETS sends
+    - client-reported buffer level (seconds ahead of playback)
+FIXED: Throughput is no longer bytes / time inside one sendall - that
+       returns once the bytes are in the kernel buffer, so it measured
+       memory-copy speed. A window's rate is its bytes over the time the
+       sender was blocked, but never over less than MIN_BUSY_FRACTION of
+       the window's wall-clock span: a paced sender that never blocks
+       may claim at most 1 / MIN_BUSY_FRACTION times what it delivered.
+"""
+import time
+
+# ── Tuning ────────────────────────────────────────────────────────────────────
+ABR_START_HEIGHT = 720           # Start no higher than this
+EWMA_ALPHA = 0.2                 # Weight of the newest sample
+WINDOW_PACKETS = 20              # Sends per throughput sample (~1 s)
+MIN_BUSY_FRACTION = 0.15         # Idle sender → tput ≤ 6.7× delivered rate
+SAFETY_FACTOR = 0.8              # Stay on a rung while need ≤ 80% of tput
+UPSWITCH_FACTOR = 0.6            # Step up only if next rung needs ≤ 60%
+BUFFER_LOW_SECONDS = -0.5        # Client this far behind → step down
+BUFFER_STABLE_SECONDS = 0.0      # Client at least on time → may step up
+MIN_SWITCH_INTERVAL = 3.0        # Seconds between two switches
+MIN_SAMPLES = WINDOW_PACKETS     # Frames to measure before first decision
+
+
+class AbrController:
+    """
+    Throughput + buffer based rendition selection with hysteresis.
+    """
+
+    def __init__(self, ladder: list, fps: float, start_height: int = ABR_START_HEIGHT):
+        """
+        Args:
+            ladder: Rendition dicts sorted lowest → highest resolution
+            fps: Stream frame rate
+            start_height: Highest rung the stream may start on
+        """
+        self.ladder = ladder
+        self.fps = fps
+        self.index = 0
+        for i, rendition in enumerate(ladder):
+            if rendition['height'] <= start_height:
+                self.index = i
+
+        self.throughput = None           # bytes / second
+        self.bytes_per_pixel = None
+        self.samples = 0
+        self.switches = 0
+        self._last_switch = time.monotonic()
+        self.restart_window()
+
+    @property
+    def current(self) -> dict:
+        return self.ladder[self.index]
+
+    # ── Measurements ──────────────────────────────────────────────────────────
+
+    def record_send(self, nbytes: int, seconds: float, rendition: dict = None):
+        """
+        Feed one sent packet's size and the time sendall took (called
+        right after it returned).
+
+        Args:
+            nbytes: Payload size
+            seconds: Time spent in sendall
+            rendition: Rung the packet was cut from (defaults to current)
+        """
+        now = time.monotonic()
+        if self._window_start is None:
+            self._window_start = now - seconds
+        self._window_bytes += nbytes
+        self._window_busy += seconds
+        self._window_packets += 1
+        if self._window_packets >= WINDOW_PACKETS:
+            wall = now - self._window_start
+            rate = self._window_bytes / max(self._window_busy, wall * MIN_BUSY_FRACTION)
+            self.throughput = self._ewma(self.throughput, rate)
+            self.restart_window()
+
+        bpp = nbytes / self._pixels(rendition or self.current)
+        self.bytes_per_pixel = self._ewma(self.bytes_per_pixel, bpp)
+        self.samples += 1
+
+    def restart_window(self):
+        """Drop the partial window (after a pause or seek, whose idle
+        time must not count as slow sending)."""
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_busy = 0.0
+        self._window_packets = 0
+
+    # ── Decision ──────────────────────────────────────────────────────────────
+
+    def decide(self, buffer_seconds=None):
+        """
+        Decide whether to switch rung.
+
+        Args:
+            buffer_seconds: Latest client buffer report (None if unknown)
+
+        Returns:
+            dict: The new rendition, or None to stay on the current one
+        """
+        if len(self.ladder) < 2 or self.samples < MIN_SAMPLES or self.throughput is None:
+            return None
+        if time.monotonic() - self._last_switch < MIN_SWITCH_INTERVAL:
+            return None
+
+        budget = self.throughput * SAFETY_FACTOR
+        lagging = buffer_seconds is not None and buffer_seconds < BUFFER_LOW_SECONDS
+
+        if lagging or self._need(self.current) > budget:
+            target = 0
+            for i in range(self.index - 1, -1, -1):
+                if self._need(self.ladder[i]) <= budget:
+                    target = i
+                    break
+            return self._switch_to(target) if target < self.index else None
+
+        stable = buffer_seconds is None or buffer_seconds >= BUFFER_STABLE_SECONDS
+        if stable and self.index + 1 < len(self.ladder):
+            upper = self.ladder[self.index + 1]
+            if self._need(upper) <= self.throughput * UPSWITCH_FACTOR:
+                return self._switch_to(self.index + 1)
+
+        return None
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _switch_to(self, index: int) -> dict:
+        self.index = index
+        self.switches += 1
+        self._last_switch = time.monotonic()
+        return self.current
+
+    def _need(self, rendition: dict) -> float:
+        """Estimated bytes/second to send this rung in real time."""
+        return self.bytes_per_pixel * self._pixels(rendition) * self.fps
+
+    @staticmethod
+    def _pixels(rendition: dict) -> int:
+        return max(rendition['width'] * rendition['height'], 1)
+
+    @staticmethod
+    def _ewma(previous, sample):
+        if previous is None:
+            return sample
+        return previous + EWMA_ALPHA * (sample - previous)
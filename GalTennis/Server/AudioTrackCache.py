@@ -0,0 +1,292 @@
+"""
+Gal Haham
+Audio Track Cache - each media file's audio decoded once to raw PCM.
+The track is extracted with one ffmpeg run (at ingest, or on first play)
+into audio_cache/<name>.pcm with a JSON sidecar holding the format.
+Streams then read per-frame chunks by slicing a numpy.memmap of the
+file, so a viewer costs no ffprobe, no ffmpeg and no pipe buffer.
+
+Only playback at a rate other than 1x still runs ffmpeg (atempo), and
+that reads the cached PCM rather than demuxing the source again.
+"""
+import json
+import os
+import subprocess
+import threading
+import numpy as np
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_CACHE_FOLDER = os.path.join(_SERVER_DIR, "audio_cache")
+PCM_EXTENSION = ".pcm"
+META_EXTENSION = ".json"
+TEMP_SUFFIX = ".part"
+CACHE_VERSION = 1
+
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+BYTES_PER_SAMPLE = 2            # s16le
+NORMAL_RATE = 1.0
+PIPE_BUFFER_BYTES = 1 << 20
+
+KEY_VERSION = 'version'
+KEY_MTIME = 'mtime'
+KEY_HAS_AUDIO = 'has_audio'
+KEY_SAMPLE_RATE = 'sample_rate'
+KEY_CHANNELS = 'channels'
+
+_cache = {}                     # abspath → (mtime, AudioTrack or None)
+_cache_lock = threading.Lock()
+_path_locks = {}                # one extraction per file at a time
+
+
+class AudioTrack:
+    """Decoded 16-bit PCM audio of one media file."""
+
+    def __init__(self, pcm_path: str, sample_rate: int, channels: int):
+        self.pcm_path = pcm_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples = np.memmap(pcm_path, dtype=np.int16, mode='r')
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / (self.channels * self.sample_rate)
+
+    def samples_per_frame(self, fps: float) -> int:
+        return int(self.sample_rate / fps)
+
+    def chunk(self, frame_number: int, fps: float):
+        """
+        Audio that plays under one video frame at 1x.
+
+        Returns:
+            np.ndarray: Interleaved int16 view into the cache file, or
+                        None past the end of the track
+        """
+        per_frame = self.samples_per_frame(fps) * self.channels
+        start = frame_number * per_frame
+        if start + per_frame > len(self.samples):
+            return None
+        return self.samples[start:start + per_frame]
+
+    def open_reader(self, fps: float, start_frame: int = 0, rate: float = NORMAL_RATE):
+        """
+        Per-stream chunk source starting at start_frame.
+        At 1x this slices the memmap; otherwise an atempo pipe over the
+        cached PCM supplies time-stretched chunks.
+        """
+        return AudioReader(self, fps, start_frame, rate)
+
+
+class AudioReader:
+    """Sequential per-frame audio for one stream at one playback rate."""
+
+    def __init__(self, track: AudioTrack, fps: float, start_frame: int, rate: float):
+        self.track = track
+        self.fps = fps
+        self.rate = rate
+        self._frame = start_frame
+        self._proc = None
+        self._chunk_bytes = (int(track.samples_per_frame(fps) / rate) *
+                             track.channels * BYTES_PER_SAMPLE)
+        if rate != NORMAL_RATE:
+            self._proc = self._start_tempo_pipe(start_frame / fps)
+
+    def read(self):
+        """Next frame's chunk, or None when the audio has run out."""
+        if self._proc is None:
+            chunk = self.track.chunk(self._frame, self.fps)
+            self._frame += 1
+            return chunk
+        try:
+            data = self._proc.stdout.read(self._chunk_bytes)
+        except (OSError, ValueError):
+            return None
+        if data and len(data) == self._chunk_bytes:
+            return np.frombuffer(data, dtype=np.int16)
+        return None
+
+    def close(self):
+        if self._proc is not None:
+            try:
+                self._proc.terminate()
+                self._proc.wait()
+            except Exception:
+                pass
+            self._proc = None
+
+    def _start_tempo_pipe(self, start_seconds: float):
+        track = self.track
+        raw_format = ['-f', 's16le', '-ar', str(track.sample_rate), '-ac', str(track.channels)]
+        cmd = ['ffmpeg', '-v', 'error']
+        cmd += raw_format
+        if start_seconds > 0:
+            cmd += ['-ss', f'{start_seconds:.3f}']
+        cmd += ['-i', track.pcm_path, '-af', f'atempo={self.rate}']
+        cmd += raw_format + ['pipe:1']
+        try:
+            return subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=PIPE_BUFFER_BYTES
+            )
+        except OSError:
+            return None
+
+
+# ── Extraction ────────────────────────────────────────────────────────────────
+
+def _cache_name(media_path: str) -> str:
+    name = os.path.abspath(media_path).replace(os.sep, '_').replace(':', '')
+    return os.path.join(AUDIO_CACHE_FOLDER, name)
+
+
+def _probe(media_path: str):
+    """(sample_rate, channels) of the first audio stream, or None."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=sample_rate,channels',
+             '-of', 'json', media_path],
+            capture_output=True, text=True, check=True
+        )
+        streams = json.loads(result.stdout).get('streams', [])
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return None
+    if not streams:
+        return None
+    stream = streams[0]
+    return (int(stream.get('sample_rate', DEFAULT_SAMPLE_RATE)),
+            int(stream.get('channels', DEFAULT_CHANNELS)))
+
+
+def _extract(media_path: str, mtime: float) -> dict:
+    """Decode the audio to the cache and write its sidecar."""
+    os.makedirs(AUDIO_CACHE_FOLDER, exist_ok=True)
+    base = _cache_name(media_path)
+    meta = {KEY_VERSION: CACHE_VERSION, KEY_MTIME: mtime, KEY_HAS_AUDIO: False}
+
+    probed = _probe(media_path)
+    if probed is not None:
+        sample_rate, channels = probed
+        tmp_path = base + PCM_EXTENSION + TEMP_SUFFIX
+        try:
+            subprocess.run(
+                ['ffmpeg', '-y', '-v', 'error', '-i', media_path, '-vn',
+                 '-acodec', 'pcm_s16le', '-ar', str(sample_rate),
+                 '-ac', str(channels), '-f', 's16le', tmp_path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            if os.path.getsize(tmp_path) > 0:
+                os.replace(tmp_path, base + PCM_EXTENSION)
+                meta.update({
+                    KEY_HAS_AUDIO: True,
+                    KEY_SAMPLE_RATE: sample_rate,
+                    KEY_CHANNELS: channels,
+                })
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"[AudioCache] Extraction failed for {media_path}: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # The sidecar is also written for silent files so they are not re-probed
+    try:
+        with open(base + META_EXTENSION + TEMP_SUFFIX, 'w') as f:
+            json.dump(meta, f)
+        os.replace(base + META_EXTENSION + TEMP_SUFFIX, base + META_EXTENSION)
+    except OSError as e:
+        print(f"[AudioCache] Cannot save sidecar for {media_path}: {e}")
+    return meta
+
+
+def _load_meta(media_path: str, mtime: float):
+    base = _cache_name(media_path)
+    try:
+        with open(base + META_EXTENSION, 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get(KEY_VERSION) != CACHE_VERSION or meta.get(KEY_MTIME) != mtime:
+        return None
+    if meta.get(KEY_HAS_AUDIO) and not os.path.exists(base + PCM_EXTENSION):
+        return None
+    return meta
+
+
+def _path_lock(key: str) -> threading.Lock:
+    with _cache_lock:
+        return _path_locks.setdefault(key, threading.Lock())
+
+
+# ── Public API ────────────────────────────────────────────────────────────────
+
+def get_audio_track(media_path: str):
+    """
+    Return the cached audio track of media_path, extracting it first if
+    the cache is missing or older than the file.
+
+    Returns:
+        AudioTrack: Memory-mapped PCM, or None if the file has no audio
+    """
+    key = os.path.abspath(media_path)
+    try:
+        mtime = os.path.getmtime(media_path)
+    except OSError:
+        return None
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _path_lock(key):
+        with _cache_lock:
+            cached = _cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        meta = _load_meta(media_path, mtime)
+        if meta is None:
+            meta = _extract(media_path, mtime)
+            if meta[KEY_HAS_AUDIO]:
+                print(f"[AudioCache] {os.path.basename(media_path)}: audio cached")
+
+        track = None
+        if meta[KEY_HAS_AUDIO]:
+            try:
+                track = AudioTrack(
+                    _cache_name(media_path) + PCM_EXTENSION,
+                    meta[KEY_SAMPLE_RATE],
+                    meta[KEY_CHANNELS],
+                )
+            except (OSError, ValueError) as e:
+                print(f"[AudioCache] Cannot map {media_path}: {e}")
+
+        with _cache_lock:
+            _cache[key] = (mtime, track)
+        return track
+
+
+def extract_audio_track_async(media_path: str):
+    """Warm the cache for media_path on a background thread."""
+    threading.Thread(
+        target=get_audio_track,
+        args=(media_path,),
+        daemon=True,
+        name=f"AudioCache-{os.path.basename(media_path)}"
+    ).start()
+
+
+def discard_audio_track(media_path: str):
+    """Forget and delete the cached track of a removed media file."""
+    key = os.path.abspath(media_path)
+    with _cache_lock:
+        _cache.pop(key, None)
+    base = _cache_name(media_path)
+    for path in (base + PCM_EXTENSION, base + META_EXTENSION):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
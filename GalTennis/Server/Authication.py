@@ -4,12 +4,14 @@ User authentication system with SQLite backend.
 Manages signup/login for regular users.
 NOW USES DBManager for all database operations.
 REFACTORED: Added constants, comprehensive documentation.
+ADDED: A successful login reports whether the user is an admin
 """
 from Db_manager import get_db_manager
 
 USER_ID_INDEX = 0
 USERNAME_INDEX = 1
 PASSWORD_INDEX = 2
+IS_ADMIN_INDEX = 3
 
 STATUS_SUCCESS = "success"
 STATUS_ERROR = "error"
@@ -71,11 +73,12 @@ class Authentication:
             dict: Response with status and message
                 - status: "success" or "error"
                 - message: Description of the result
+                - is_admin: On success, whether the user is an admin
         """
         user_data = self.db.get_user(username, password)
 
         if user_data:
-            return self._create_login_success_response()
+            return self._create_login_success_response(bool(user_data[IS_ADMIN_INDEX]))
 
         return self._create_error_response(MESSAGE_LOGIN_FAILED)
 
@@ -122,14 +125,18 @@ class Authentication:
             "message": message
         }
 
-    def _create_login_success_response(self):
+    def _create_login_success_response(self, is_admin):
         """
         Create a successful login response.
 
+        Args:
+            is_admin: Whether the logged-in user is an admin
+
         Returns:
             dict: Success response
         """
         return {
             "status": STATUS_SUCCESS,
-            "message": MESSAGE_LOGIN_SUCCESS
+            "message": MESSAGE_LOGIN_SUCCESS,
+            "is_admin": is_admin
         }
\ No newline at end of file
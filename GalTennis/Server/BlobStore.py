@@ -0,0 +1,210 @@
+"""
+Gal Haham
+Blob Store - content-addressed storage for uploaded videos and stories.
+Each distinct file content is stored once, as blobs/<hash[:2]>/<hash>,
+and every video or story that uses it gets a hard link to it under
+its own name (videos/<title>, stories/<name>). The rest of the server
+keeps working with those paths unchanged.
+
+The blobs table counts the blob_refs rows that point at each blob;
+the blob file is deleted together with its last reference. Where hard
+links are not available the content is copied instead (still counted,
+just not shared on disk).
+FIXED: Deduplication is per kind - has() only finds blobs used by the
+       same kind, so a story never satisfies a video upload or the other
+       way round. relink() / replace() move a file onto another blob
+       (a normalized story) without the file ever being missing.
+"""
+import os
+import shutil
+import threading
+import time
+from Db_manager import get_db_manager
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BLOBS_FOLDER = os.path.join(_SERVER_DIR, "blobs")
+FANOUT_CHARS = 2
+SWAP_SUFFIX = ".swap"
+
+
+class BlobStore:
+    """Stores blobs by SHA-256 and tracks which media files use them."""
+
+    def __init__(self, blobs_folder: str = BLOBS_FOLDER):
+        self.blobs_folder = blobs_folder
+        self.db = get_db_manager()
+        self._lock = threading.Lock()
+        os.makedirs(self.blobs_folder, exist_ok=True)
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def has(self, content_hash: str, kind: str) -> bool:
+        """True if a blob with this content, used by this kind, is on disk."""
+        blob = self.db.get_blob(content_hash)
+        return (blob is not None and os.path.exists(blob['path'])
+                and self.db.has_blob_ref(content_hash, kind))
+
+    def store(self, temp_path: str, content_hash: str) -> str:
+        """
+        Move a verified file into the store (or drop it if the content
+        is already there).
+
+        Args:
+            temp_path: File whose SHA-256 is content_hash
+            content_hash: Hex SHA-256
+
+        Returns:
+            str: Path of the blob
+        """
+        blob_path = self._blob_path(content_hash)
+        with self._lock:
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                shutil.move(temp_path, blob_path)
+        return blob_path
+
+    def attach(self, content_hash: str, dest_path: str, kind: str) -> bool:
+        """
+        Make dest_path a name for the blob and count the reference.
+
+        Args:
+            content_hash: Hex SHA-256 of a stored blob
+            dest_path: Media path to create (must not exist)
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+
+        Returns:
+            bool: True if dest_path now holds the content
+        """
+        blob_path = self._blob_path(content_hash)
+        with self._lock:
+            if not os.path.exists(blob_path) or os.path.exists(dest_path):
+                return False
+            try:
+                os.link(blob_path, dest_path)
+            except OSError:
+                shutil.copyfile(blob_path, dest_path)
+
+            added = self.db.add_blob_ref(
+                kind,
+                os.path.basename(dest_path),
+                content_hash,
+                blob_path,
+                os.path.getsize(blob_path),
+                time.time()
+            )
+            if not added:
+                os.remove(dest_path)
+                self._remove_if_unreferenced(content_hash, blob_path)
+                return False
+        return True
+
+    def replace(self, dest_path: str, kind: str, temp_path: str, content_hash: str) -> bool:
+        """
+        Store temp_path as a blob and switch dest_path to it (see relink).
+
+        Args:
+            dest_path: Attached media path
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            temp_path: File whose SHA-256 is content_hash (consumed)
+            content_hash: Hex SHA-256 of the new content
+
+        Returns:
+            bool: True if dest_path now holds the new content
+        """
+        blob_path = self.store(temp_path, content_hash)
+        if self.relink(dest_path, kind, content_hash):
+            return True
+        with self._lock:
+            self._remove_if_unreferenced(content_hash, blob_path)
+        return False
+
+    def relink(self, dest_path: str, kind: str, content_hash: str) -> bool:
+        """
+        Give an attached media file the content of another stored blob.
+        dest_path is switched in one rename, so readers see either the
+        old or the new file. The old blob goes with its last reference.
+
+        Args:
+            dest_path: Attached media path
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            content_hash: Hex SHA-256 of a stored blob
+
+        Returns:
+            bool: True if dest_path now holds the content, False if the
+                  blob is gone or dest_path was detached in the meantime
+        """
+        blob_path = self._blob_path(content_hash)
+        swap_path = dest_path + SWAP_SUFFIX
+        with self._lock:
+            if not os.path.exists(blob_path) or not os.path.exists(dest_path):
+                return False
+            try:
+                os.link(blob_path, swap_path)
+            except OSError:
+                shutil.copyfile(blob_path, swap_path)
+
+            released = self.db.replace_blob_ref(
+                kind,
+                os.path.basename(dest_path),
+                content_hash,
+                blob_path,
+                os.path.getsize(blob_path),
+                time.time()
+            )
+            if released is None:
+                self._remove_file(swap_path)
+                return False
+            os.replace(swap_path, dest_path)
+            if released['ref_count'] == 0 and released['content_hash'] != content_hash:
+                self._remove_file(released['path'])
+        return True
+
+    def detach(self, dest_path: str, kind: str):
+        """
+        Delete a media file and release its reference; the blob goes
+        with its last reference. Files stored before the blob store
+        existed are simply deleted.
+        """
+        with self._lock:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            released = self.db.release_blob_ref(kind, os.path.basename(dest_path))
+            if released is not None and released['ref_count'] == 0:
+                self._remove_file(released['path'])
+                print(f"[Blobs] Deleted blob {released['content_hash'][:12]}")
+
+    def discard(self, content_hash: str):
+        """Delete a stored blob that ended up with no references."""
+        with self._lock:
+            self._remove_if_unreferenced(content_hash, self._blob_path(content_hash))
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blobs_folder, content_hash[:FANOUT_CHARS], content_hash)
+
+    def _remove_if_unreferenced(self, content_hash: str, blob_path: str):
+        if self.db.get_blob(content_hash) is None:
+            self._remove_file(blob_path)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_store_instance = None
+
+
+def get_blob_store() -> BlobStore:
+    """Return the shared BlobStore instance."""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = BlobStore()
+    return _store_instance
@@ -4,15 +4,36 @@ Client Handler - handles a single streaming client session
 ADDED: zlib compression before encryption → smaller packets → faster transfer
 CHANGED: DEFAULT_FPS capped at 20 for better cross-network performance
 Compression pipeline: raw data → zlib.compress → AES.encrypt → send
+ADDED: Adaptive bitrate - switches between pre-transcoded renditions
+       mid-stream from send throughput and client buffer reports
+ADDED: Client control channel - SEEK / PAUSE / RESUME / RATE. Seeks use a
+       cached keyframe index and restart the audio reader at the new time.
+CHANGED: Staged pipeline so decode, encode and network time overlap:
+         decode thread → queue → encode/encrypt thread → queue → sender
+CHANGED: Packets use the binary media_packet format instead of pickle
+CHANGED: Sender paced by FramePacer (monotonic deadlines + fast-start burst)
+CHANGED: Audio comes from the AudioTrackCache memmap, not a per-viewer
+         ffprobe + ffmpeg pipe
+CHANGED: Stream info is answered from the media catalog (probed at ingest)
+ADDED: Stream metrics (Metrics) - bytes and frames sent, time blocked in
+       send, achieved fps per LOG_INTERVAL_FRAMES window, active streams
 """
-import pickle
+import queue
+import threading
 import time
 import cv2
-import subprocess
-import numpy as np
-import zlib
 import aes_cipher
+import media_packet
 from Protocol import Protocol
+from RenditionManager import get_rendition_manager
+from AbrController import AbrController
+from StreamControl import StreamControl, DEFAULT_RATE
+from FrameIndex import get_frame_index
+from FramePacer import FramePacer
+from AudioTrackCache import get_audio_track, DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS
+from MediaCatalog import get_media_catalog
+from Db_manager import MEDIA_KIND_VIDEO
+from Metrics import get_metrics
 
 # ── Compression ───────────────────────────────────────────────────────────────
 COMPRESS_LEVEL = 1          # zlib level 1 = fastest
@@ -21,20 +42,49 @@ COMPRESS_LEVEL = 1          # zlib level 1 = fastest
 DEFAULT_FPS = 20.0          # Capped at 20 for reliable cross-network streaming
 MAXIMUM_FPS = 20.0          # Hard cap — prevents overwhelming slow connections
 MINIMUM_FPS = 5.0
-MINIMUM_DELAY = 0.0
 JPEG_QUALITY = 75           # Slightly lower quality = smaller packets
 LOG_INTERVAL_FRAMES = 30
-LARGE_BUFFER = 100_000_000
-BYTES_PER_SAMPLE = 2        # 16-bit PCM
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+DECODE_QUEUE_SIZE = 8       # Decoded frames waiting for encode
+SEND_QUEUE_SIZE = 8         # Encrypted payloads waiting for send
+QUEUE_POLL_SECONDS = 0.2    # How often blocked stages re-check for shutdown
+STATS_ALPHA = 0.1           # EWMA weight for stage timings
+MS_PER_SECOND = 1000.0
+MIN_WINDOW_SECONDS = 1e-6   # fps of a window sent in no measurable time
 
 KEY_INDEX = 1
 
+_END_OF_STREAM = None
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+_streams_active = get_metrics().gauge(
+    "video_streams_active", "Video streams being sent"
+)
+_bytes_sent = get_metrics().counter(
+    "video_stream_bytes_sent_total", "Encrypted video stream bytes sent"
+)
+_frames_sent = get_metrics().counter(
+    "video_stream_frames_sent_total", "Video frames sent"
+)
+_send_stall_seconds = get_metrics().histogram(
+    "video_stream_send_stall_seconds", "Time one packet blocked in send_bin"
+)
+_achieved_fps = get_metrics().histogram(
+    "video_stream_fps", "Frames per second achieved over each LOG_INTERVAL_FRAMES frames"
+)
+
 
 class ClientHandler:
     """
     Handles one streaming client:
       1. Sends stream_info (compressed + encrypted)
-      2. Loops: read frame → compress → encrypt → send
+      2. Runs three stages concurrently:
+           decode thread  : seek / read frame / read audio   → decode queue
+           encode thread  : pack → zlib → AES                → send queue
+           sender (caller): FramePacer deadline → send → ABR decision
+      3. A seek (or rate change) bumps the generation counter; items of
+         an older generation are discarded wherever they are queued
     """
 
     def __init__(self, video_path: str, conn: tuple, address: tuple, client_id: int):
@@ -43,6 +93,24 @@ class ClientHandler:
         self.address = address
         self.client_id = client_id
         self._encryption_key = conn[KEY_INDEX]
+        self.control = StreamControl(conn, client_id)
+        self.abr = None
+
+        self._decode_queue = queue.Queue(maxsize=DECODE_QUEUE_SIZE)
+        self._send_queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._generation = 0
+        self._pending_rendition = None      # set by sender, applied by decoder
+        self._last_sent_frame = -1
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'frames_sent': 0,
+            'frames_flushed': 0,
+            'decode_ms': 0.0,
+            'encode_ms': 0.0,
+            'send_ms': 0.0,
+            'late_ms': 0.0,
+        }
 
     # ── Public entry point ────────────────────────────────────────────────────
 
@@ -52,17 +120,61 @@ class ClientHandler:
             return
 
         props = self._get_video_props(cap)
-        audio_info = self._get_audio_info()
-        audio_proc, samples_per_frame, chunk_bytes = self._start_audio(audio_info, props['fps'])
-
-        stream_info = self._build_stream_info(props, audio_info, samples_per_frame, audio_proc)
-        if not self._send_compressed_encrypted(stream_info):
-            self._cleanup(cap, audio_proc)
+        ladder = get_rendition_manager().get_ladder(
+            self.video_path, props['width'], props['height']
+        )
+        self.abr = AbrController(ladder, props['fps'])
+        active = ladder[-1]                 # the source
+        if self.abr.current is not active:
+            cap, active = self._switch_capture(cap, active, self.abr.current, 0)
+
+        track = get_audio_track(self.video_path)
+        audio = track.open_reader(props['fps']) if track else None
+
+        stream_info = self._build_stream_info(props, track)
+        if not self._send_payload(self._encode(media_packet.pack_info(stream_info))):
+            self._cleanup(cap, audio)
             return
+        self.control.start()
 
         print(f"[ClientHandler #{self.client_id}] Streaming {self.video_path} → {self.address} @ {props['fps']:.0f} fps")
-        self._stream_loop(cap, props, audio_proc, chunk_bytes)
-        self._cleanup(cap, audio_proc)
+
+        stages = [
+            threading.Thread(
+                target=self._decode_stage,
+                args=(cap, active, props, track, audio),
+                daemon=True,
+                name=f"Decode-{self.client_id}"
+            ),
+            threading.Thread(
+                target=self._encode_stage,
+                daemon=True,
+                name=f"Encode-{self.client_id}"
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+
+        _streams_active.inc()
+        try:
+            self._send_stage(props)
+        finally:
+            _streams_active.dec()
+            self._stop.set()
+            for stage in stages:
+                stage.join()
+
+    def get_stats(self) -> dict:
+        """Snapshot of queue depths and per-stage timings (ms, EWMA)."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['decode_queue'] = self._decode_queue.qsize()
+        stats['send_queue'] = self._send_queue.qsize()
+        stats['generation'] = self._generation
+        stats['rendition'] = self.abr.current['height'] if self.abr else None
+        for key, value in list(self.control.client_stats.items()):
+            stats[f'client_{key}'] = value
+        return stats
 
     # ── Setup helpers ─────────────────────────────────────────────────────────
 
@@ -74,7 +186,18 @@ class ClientHandler:
         return cap
 
     def _get_video_props(self, cap) -> dict:
-        fps = cap.get(cv2.CAP_PROP_FPS)
+        """Source properties from the media catalog; cap only as a fallback."""
+        entry = get_media_catalog().lookup(self.video_path, MEDIA_KIND_VIDEO)
+        if entry is not None:
+            fps, width, height = entry['fps'], entry['width'], entry['height']
+            total_frames, duration = entry['frame_count'], entry['duration']
+        else:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            duration = total_frames / fps if fps else 0.0
+
         # Clamp to [MINIMUM_FPS, MAXIMUM_FPS]
         if not (MINIMUM_FPS <= fps <= MAXIMUM_FPS):
             fps = DEFAULT_FPS
@@ -82,113 +205,270 @@ class ClientHandler:
             fps = min(fps, MAXIMUM_FPS)   # also cap if video is e.g. 30/60 fps
         return {
             'fps': fps,
-            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': width,
+            'height': height,
+            'total_frames': total_frames,
+            'duration': duration,
             'frame_delay': 1.0 / fps,
         }
 
-    def _get_audio_info(self) -> dict:
-        try:
-            result = subprocess.run(
-                ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
-                 '-show_entries', 'stream=sample_rate,channels',
-                 '-of', 'default=noprint_wrappers=1', self.video_path],
-                capture_output=True, text=True, check=True
-            )
-            info = {}
-            for line in result.stdout.splitlines():
-                if '=' in line:
-                    k, v = line.split('=', 1)
-                    info[k.strip()] = v.strip()
-            return {
-                'sample_rate': int(info.get('sample_rate', 44100)),
-                'channels': int(info.get('channels', 2)),
-            }
-        except Exception:
-            return {'sample_rate': 44100, 'channels': 2}
-
-    def _start_audio(self, audio_info: dict, fps: float):
-        samples_per_frame = int(audio_info['sample_rate'] / fps)
-        chunk_bytes = samples_per_frame * audio_info['channels'] * BYTES_PER_SAMPLE
-        try:
-            proc = subprocess.Popen(
-                ['ffmpeg', '-i', self.video_path, '-vn',
-                 '-acodec', 'pcm_s16le',
-                 '-ar', str(audio_info['sample_rate']),
-                 '-ac', str(audio_info['channels']),
-                 '-f', 's16le', 'pipe:1'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-                bufsize=LARGE_BUFFER
-            )
-            return proc, samples_per_frame, chunk_bytes
-        except Exception:
-            return None, samples_per_frame, chunk_bytes
-
-    def _build_stream_info(self, props, audio_info, samples_per_frame, audio_proc) -> dict:
+    def _build_stream_info(self, props, track) -> dict:
+        sample_rate = track.sample_rate if track else DEFAULT_SAMPLE_RATE
         return {
             'width': props['width'],
             'height': props['height'],
             'fps': props['fps'],
             'total_frames': props['total_frames'],
-            'has_audio': audio_proc is not None,
-            'audio_sample_rate': audio_info['sample_rate'],
-            'audio_channels': audio_info['channels'],
-            'samples_per_frame': samples_per_frame,
+            'duration': props['duration'],
+            'has_audio': track is not None,
+            'audio_sample_rate': sample_rate,
+            'audio_channels': track.channels if track else DEFAULT_CHANNELS,
+            'samples_per_frame': int(sample_rate / props['fps']),
             'compressed': True,
+            'renditions': [r['height'] for r in self.abr.ladder],
+            'rendition': self.abr.current['height'],
         }
 
-    # ── Streaming loop ────────────────────────────────────────────────────────
+    # ── Stage 1: decode ───────────────────────────────────────────────────────
 
-    def _stream_loop(self, cap, props, audio_proc, chunk_bytes):
-        frame_count = 0
-        start_time = time.time()
-
-        while True:
-            t0 = time.time()
+    def _decode_stage(self, cap, active, props, track, audio):
+        """
+        Owns cap and the audio reader; releases both when it exits.
+        active is the rendition cap is actually reading, which can lag
+        behind the ABR choice until the switch is applied here.
+        """
+        frame_number = 0
+        rate = DEFAULT_RATE
+        try:
+            while not self._stop.is_set():
+                seek_to = self.control.take_seek(props['fps'], props['total_frames'])
+                if self.control.rate != rate:
+                    rate = self.control.rate
+                    print(f"[ClientHandler #{self.client_id}] Rate → {rate}x")
+                    if seek_to is None:
+                        # Re-cut from the last frame the client actually got
+                        seek_to = self._last_sent_frame + 1
+
+                if seek_to is not None:
+                    self._generation += 1
+                    cap = self._seek_capture(cap, active['path'], seek_to)
+                    frame_number = seek_to
+                    if track is not None:
+                        audio.close()
+                        audio = track.open_reader(props['fps'], frame_number, rate)
+
+                rendition = self._pending_rendition
+                if rendition is not None:
+                    self._pending_rendition = None
+                    cap, active = self._switch_capture(cap, active, rendition, frame_number)
+
+                t0 = time.monotonic()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                audio_chunk = audio.read() if audio else None
+                self._record_timing('decode_ms', t0)
+
+                packet = {
+                    'frame': frame,
+                    'audio': audio_chunk,
+                    'frame_number': frame_number,
+                    'pts': frame_number / props['fps'],
+                    'rendition': active['height'],
+                    'seek_seq': self.control.seek_seq,
+                    'audio_channels': track.channels if track else 0,
+                }
+                item = (self._generation, frame_number, rate, active, packet)
+                if not self._put(self._decode_queue, item):
+                    break
+                frame_number += 1
+        finally:
+            self._put(self._decode_queue, _END_OF_STREAM)
+            self._cleanup(cap, audio)
+
+    # ── Stage 2: encode / encrypt ─────────────────────────────────────────────
+
+    def _encode_stage(self):
+        while not self._stop.is_set():
+            item = self._get(self._decode_queue)
+            if item is _END_OF_STREAM:
+                break
+            generation, frame_number, rate, rendition, packet = item
+            if generation != self._generation:
+                self._count_flushed()
+                continue
 
-            ret, frame = cap.read()
-            if not ret:
+            t0 = time.monotonic()
+            try:
+                payload = self._encode(media_packet.pack_frame(**packet))
+            except Exception as e:
+                print(f"[ClientHandler #{self.client_id}] Encode error: {e}")
                 break
+            self._record_timing('encode_ms', t0)
 
-            audio_chunk = self._read_audio(audio_proc, chunk_bytes)
+            item = (generation, frame_number, rate, rendition, payload)
+            if not self._put(self._send_queue, item):
+                return
+        self._put(self._send_queue, _END_OF_STREAM)
 
-            packet = {
-                'frame': frame,
-                'audio': audio_chunk,
-                'frame_number': frame_count,
-            }
+    # ── Stage 3: send (runs on the handler's own thread) ──────────────────────
 
-            if not self._send_compressed_encrypted(packet):
+    def _send_stage(self, props):
+        frames_sent = 0
+        generation = self._generation
+        seek_seq = self.control.seek_seq
+        pacer = FramePacer(props['fps'])
+        window_start = time.monotonic()     # fps window; restarts on pause / seek
+        window_frames = 0
+
+        while True:
+            if self.control.paused:
+                if not self.control.wait_while_paused():
+                    break
+                pacer.restart(burst=False)  # client kept its buffer
+                self.abr.restart_window()
+                window_start, window_frames = time.monotonic(), 0
+
+            item = self._get(self._send_queue)
+            if item is _END_OF_STREAM or self._stop.is_set():
                 break
+            item_generation, frame_number, rate, rendition, payload = item
+            if item_generation != self._generation:
+                self._count_flushed()
+                continue
+            if item_generation != generation:
+                generation = item_generation
+                # A seek empties the client's buffer → refill it in a burst;
+                # a rate change only needs a new timeline
+                pacer.restart(burst=self.control.seek_seq != seek_seq)
+                seek_seq = self.control.seek_seq
+                self.abr.restart_window()
+                window_start, window_frames = time.monotonic(), 0
+
+            late = pacer.wait(rate, self._stop)
+            self._record_value('late_ms', late * MS_PER_SECOND)
+
+            t0 = time.monotonic()
+            if not self._send_payload(payload, rendition):
+                break
+            self._record_timing('send_ms', t0)
+
+            self._last_sent_frame = frame_number
+            frames_sent += 1
+            with self._stats_lock:
+                self._stats['frames_sent'] = frames_sent
+            _frames_sent.inc()
+
+            window_frames += 1
+            if window_frames == LOG_INTERVAL_FRAMES:
+                now = time.monotonic()
+                _achieved_fps.observe(window_frames / max(now - window_start, MIN_WINDOW_SECONDS))
+                window_start, window_frames = now, 0
+
+            choice = self.abr.decide(self.control.buffer_level())
+            if choice is not None:
+                self._pending_rendition = choice
+
+            if frames_sent % LOG_INTERVAL_FRAMES == 0:
+                self._log_stats(frame_number, props)
+
+        print(
+            f"[ClientHandler #{self.client_id}] Stream finished after "
+            f"{frames_sent} frames ({self.abr.switches} rendition switches)"
+        )
+
+    # ── Pipeline helpers ──────────────────────────────────────────────────────
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up when the session is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """Blocking get that returns end-of-stream when the session stops."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def _record_timing(self, name: str, started: float):
+        self._record_value(name, (time.monotonic() - started) * MS_PER_SECOND)
+
+    def _record_value(self, name: str, value: float):
+        with self._stats_lock:
+            previous = self._stats[name]
+            self._stats[name] = value if not previous else previous + STATS_ALPHA * (value - previous)
+
+    def _count_flushed(self):
+        with self._stats_lock:
+            self._stats['frames_flushed'] += 1
+
+    def _log_stats(self, frame_number, props):
+        stats = self.get_stats()
+        print(
+            f"[ClientHandler #{self.client_id}] "
+            f"Frame {frame_number + 1}/{props['total_frames']} {stats['rendition']}p | "
+            f"queues decode={stats['decode_queue']} send={stats['send_queue']} | "
+            f"decode={stats['decode_ms']:.1f}ms encode={stats['encode_ms']:.1f}ms "
+            f"send={stats['send_ms']:.1f}ms late={stats['late_ms']:.1f}ms | "
+            f"flushed={stats['frames_flushed']}"
+        )
+
+    # ── Seeking ───────────────────────────────────────────────────────────────
+
+    def _seek_capture(self, cap, path: str, frame_index: int):
+        """Move cap (reading path) so the next read() returns frame_index."""
+        if not get_frame_index(path).seek(cap, frame_index):
+            print(f"[ClientHandler #{self.client_id}] Seek past end: frame {frame_index}")
+        else:
+            print(f"[ClientHandler #{self.client_id}] Seek → frame {frame_index}")
+        return cap
 
-            frame_count += 1
+    # ── Rendition switching ───────────────────────────────────────────────────
 
-            if frame_count % LOG_INTERVAL_FRAMES == 0:
-                elapsed = time.time() - start_time
-                print(
-                    f"[ClientHandler #{self.client_id}] "
-                    f"Frame {frame_count}/{props['total_frames']} "
-                    f"({elapsed:.1f}s)"
-                )
+    def _switch_capture(self, cap, active: dict, rendition: dict, frame_index: int):
+        """
+        Reopen the stream on another rendition, positioned at frame_index.
+        Keeps the old capture if the rendition cannot be opened.
 
-            self._pace(t0, props['frame_delay'])
+        Returns:
+            (capture, rendition it reads)
+        """
+        new_cap = cv2.VideoCapture(rendition['path'])
+        if not new_cap.isOpened():
+            print(f"[ClientHandler #{self.client_id}] Cannot open rendition: {rendition['path']}")
+            return cap, active
 
-        print(f"[ClientHandler #{self.client_id}] Stream finished after {frame_count} frames")
+        if frame_index:
+            get_frame_index(rendition['path']).seek(new_cap, frame_index)
+        cap.release()
+        print(f"[ClientHandler #{self.client_id}] Rendition → {rendition['height']}p at frame {frame_index}")
+        return new_cap, rendition
 
     # ── Core: compress → encrypt → send ──────────────────────────────────────
 
-    def _send_compressed_encrypted(self, obj) -> bool:
-        try:
-            raw = pickle.dumps(obj)
-            compressed = zlib.compress(raw, level=COMPRESS_LEVEL)
-            if self._encryption_key:
-                payload = aes_cipher.AESCipher.encrypt(self._encryption_key, compressed)
-            else:
-                payload = compressed
+    def _encode(self, parts: list) -> bytes:
+        compressed = media_packet.compress(parts, COMPRESS_LEVEL)
+        if self._encryption_key:
+            return aes_cipher.AESCipher.encrypt(self._encryption_key, compressed)
+        return compressed
 
+    def _send_payload(self, payload, rendition: dict = None) -> bool:
+        try:
+            send_start = time.monotonic()
             Protocol.send_bin(payload, self.conn)
+            send_seconds = time.monotonic() - send_start
+            _send_stall_seconds.observe(send_seconds)
+            _bytes_sent.inc(len(payload))
+            if rendition is not None:
+                self.abr.record_send(len(payload), send_seconds, rendition)
             return True
         except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, OSError):
             return False
@@ -196,36 +476,12 @@ class ClientHandler:
             print(f"[ClientHandler #{self.client_id}] Send error: {e}")
             return False
 
-    # ── Audio helper ──────────────────────────────────────────────────────────
-
-    def _read_audio(self, audio_proc, chunk_bytes):
-        if audio_proc and audio_proc.stdout:
-            try:
-                data = audio_proc.stdout.read(chunk_bytes)
-                if data and len(data) == chunk_bytes:
-                    return np.frombuffer(data, dtype=np.int16)
-            except Exception:
-                pass
-        return None
-
-    # ── Frame-rate pacing ─────────────────────────────────────────────────────
-
-    @staticmethod
-    def _pace(frame_start: float, frame_delay: float):
-        sleep_time = frame_delay - (time.time() - frame_start)
-        if sleep_time > MINIMUM_DELAY:
-            time.sleep(sleep_time)
-
     # ── Cleanup ───────────────────────────────────────────────────────────────
 
-    def _cleanup(self, cap, audio_proc):
+    def _cleanup(self, cap, audio):
         try:
             cap.release()
         except Exception:
             pass
-        if audio_proc:
-            try:
-                audio_proc.terminate()
-                audio_proc.wait()
-            except Exception:
-                pass
\ No newline at end of file
+        if audio is not None:
+            audio.close()
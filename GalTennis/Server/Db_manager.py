@@ -3,11 +3,14 @@ Gal Haham
 Database Manager - Centralized database operations for Tennis Social.
 Handles all SQLite database interactions with proper connection management,
 error handling, and query execution.
+ADDED: execute_query is timed per statement kind (Metrics)
 """
 import sqlite3
 import os
 from typing import Optional, List, Dict, Any, Tuple
 from contextlib import contextmanager
+import time
+from Metrics import get_metrics
 
 # FIX: Calculate the absolute path to the database
 # This ensures Server and Client always use the SAME database file
@@ -18,6 +21,9 @@ print(f"[DB_MANAGER] Database will be at: {DB_NAME}")
 
 DB_TIMEOUT_SECONDS = 10
 
+QUERY_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+QUERY_OPERATION_OTHER = 'OTHER'
+
 DEFAULT_IS_ADMIN = 0
 DEFAULT_CONTENT_TYPE = 'text'
 DEFAULT_LIKES_COUNT = 0
@@ -28,6 +34,12 @@ TABLE_VIDEOS = 'videos'
 TABLE_COMMENTS = 'comments'
 TABLE_LIKES = 'likes'
 TABLE_STORIES = 'stories'
+TABLE_RENDITIONS = 'renditions'
+TABLE_MEDIA_CATALOG = 'media_catalog'
+TABLE_BLOBS = 'blobs'
+TABLE_BLOB_REFS = 'blob_refs'
+TABLE_STORY_SOURCES = 'story_sources'
+TABLE_JOBS = 'jobs'
 
 CATEGORY_FOREHAND = 'forehand'
 CATEGORY_BACKHAND = 'backhand'
@@ -95,6 +107,42 @@ STORY_ROW_CONTENT_TYPE = 1
 STORY_ROW_CONTENT = 2
 STORY_ROW_FILENAME = 3
 STORY_ROW_TIMESTAMP = 4
+STORY_ROW_ID = 5
+STORY_ROW_EXPIRES_AT = 6
+
+RENDITION_ROW_HEIGHT = 0
+RENDITION_ROW_WIDTH = 1
+RENDITION_ROW_BITRATE = 2
+RENDITION_ROW_PATH = 3
+
+BLOB_ROW_HASH = 0
+BLOB_ROW_PATH = 1
+BLOB_ROW_SIZE = 2
+BLOB_ROW_REF_COUNT = 3
+
+MEDIA_KIND_VIDEO = 'video'
+MEDIA_KIND_STORY = 'story'
+
+# Column order of media_catalog (also the keys of a catalog entry dict)
+MEDIA_CATALOG_FIELDS = (
+    'kind', 'filename', 'path', 'file_size', 'mtime', 'content_hash',
+    'duration', 'fps', 'width', 'height', 'frame_count',
+    'video_codec', 'bitrate_kbps', 'audio_codec',
+    'audio_sample_rate', 'audio_channels', 'keyframe_count',
+)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+# Column order of jobs (also the keys of a job dict)
+JOB_FIELDS = (
+    'id', 'job_key', 'kind', 'payload', 'priority', 'status',
+    'attempts', 'max_attempts', 'run_after', 'last_error',
+    'created', 'updated',
+)
 
 LIKE_EXISTS_QUERY = "SELECT 1 FROM likes WHERE username=? AND video_filename=?"
 COUNT_LIKES_QUERY = "SELECT COUNT(*) FROM likes WHERE video_filename=?"
@@ -164,6 +212,11 @@ class DBManager:
             self._create_comments_table(cursor)
             self._create_likes_table(cursor)
             self._create_stories_table(cursor)
+            self._migrate_stories_table(cursor)
+            self._create_renditions_table(cursor)
+            self._create_media_catalog_table(cursor)
+            self._create_blobs_tables(cursor)
+            self._create_jobs_table(cursor)
 
             conn.commit()
 
@@ -231,6 +284,106 @@ class DBManager:
                 timestamp TEXT NOT NULL, 
                 FOREIGN KEY (username) REFERENCES {TABLE_USERS}(username))''')
 
+    def _migrate_stories_table(self, cursor):
+        """
+        Add expires_at (seconds since epoch) to stories tables created
+        before it, plus the index GET_STORIES and the expiry scheduler
+        read through. Rows without it are filled in by the scheduler.
+        """
+        cursor.execute(f"PRAGMA table_info({TABLE_STORIES})")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'expires_at' not in columns:
+            cursor.execute(f"ALTER TABLE {TABLE_STORIES} ADD COLUMN expires_at REAL")
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_stories_expires_at
+            ON {TABLE_STORIES} (expires_at)''')
+
+    def _create_renditions_table(self, cursor):
+        """Create renditions table schema (one row per transcoded copy)."""
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_RENDITIONS} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_filename TEXT NOT NULL,
+                height INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                bitrate_kbps INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                FOREIGN KEY (video_filename) REFERENCES {TABLE_VIDEOS}(filename),
+                UNIQUE (video_filename, height))''')
+
+    def _create_media_catalog_table(self, cursor):
+        """Create media_catalog table schema (probed once per media file)."""
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_MEDIA_CATALOG} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL
+                    CHECK(kind IN ('{MEDIA_KIND_VIDEO}', '{MEDIA_KIND_STORY}')),
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                content_hash TEXT,
+                duration REAL,
+                fps REAL,
+                width INTEGER,
+                height INTEGER,
+                frame_count INTEGER,
+                video_codec TEXT,
+                bitrate_kbps INTEGER,
+                audio_codec TEXT,
+                audio_sample_rate INTEGER,
+                audio_channels INTEGER,
+                keyframe_count INTEGER,
+                UNIQUE (kind, filename))''')
+
+    def _create_blobs_tables(self, cursor):
+        """
+        Create the content-addressed storage tables: one blobs row per
+        distinct file content, one blob_refs row per video/story using it,
+        and one story_sources row per uploaded story content, naming the
+        blob of its normalized version.
+        """
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_BLOBS} (
+                content_hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL)''')
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_BLOB_REFS} (
+                kind TEXT NOT NULL
+                    CHECK(kind IN ('{MEDIA_KIND_VIDEO}', '{MEDIA_KIND_STORY}')),
+                filename TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                FOREIGN KEY (content_hash) REFERENCES {TABLE_BLOBS}(content_hash),
+                UNIQUE (kind, filename))''')
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_STORY_SOURCES} (
+                source_hash TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL)''')
+
+    def _create_jobs_table(self, cursor):
+        """Create the background job queue table (see JobQueue)."""
+        statuses = ','.join([f"'{s}'" for s in JOB_STATUSES])
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {TABLE_JOBS} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_key TEXT UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL CHECK(status IN ({statuses})),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL)''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready
+            ON {TABLE_JOBS} (status, priority, run_after)''')
+
     def execute_query(
             self,
             query: str,
@@ -238,6 +391,8 @@ class DBManager:
             fetch_one: bool = False,
             fetch_all: bool = True
     ):
+        operation = _query_operation(query)
+        started = time.monotonic()
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
@@ -253,10 +408,14 @@ class DBManager:
                 return True
 
         except sqlite3.IntegrityError:
+            _query_errors.inc(op=operation)
             raise
         except Exception as e:
+            _query_errors.inc(op=operation)
             print(f"Database error: {e}")
             return None
+        finally:
+            _query_seconds.observe(time.monotonic() - started, op=operation)
 
     def execute_many(self, query: str, params_list: List[tuple]) -> bool:
         """
@@ -613,8 +772,9 @@ class DBManager:
         content_type: str,
         content: str,
         filename: Optional[str],
-        timestamp: str
-    ) -> Dict[str, str]:
+        timestamp: str,
+        expires_at: Optional[float] = None
+    ) -> Dict[str, Any]:
         """
         Add a new story.
 
@@ -624,24 +784,26 @@ class DBManager:
             content: Story content
             filename: Optional filename for media stories
             timestamp: Story timestamp
+            expires_at: When the story expires (seconds since epoch)
 
         Returns:
-            Dict with status and message
+            Dict with status, message and the new story_id
         """
         try:
-            query = f'''
-                INSERT INTO {TABLE_STORIES}
-                (username, content_type, content, filename, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            '''
-            self.execute_query(
-                query,
-                (username, content_type, content, filename, timestamp),
-                fetch_all=False
-            )
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'''INSERT INTO {TABLE_STORIES}
+                        (username, content_type, content, filename, timestamp, expires_at)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                    (username, content_type, content, filename, timestamp, expires_at)
+                )
+                conn.commit()
+                story_id = cursor.lastrowid
             return {
                 "status": STATUS_SUCCESS,
-                "message": MESSAGE_STORY_ADDED
+                "message": MESSAGE_STORY_ADDED,
+                "story_id": story_id
             }
         except Exception as e:
             return {"status": STATUS_ERROR, "message": str(e)}
@@ -667,16 +829,71 @@ class DBManager:
         if not rows:
             return []
 
-        return [
-            {
-                "username": row[STORY_ROW_USERNAME],
-                "content_type": row[STORY_ROW_CONTENT_TYPE],
-                "content": row[STORY_ROW_CONTENT],
-                "filename": row[STORY_ROW_FILENAME],
-                "timestamp": row[STORY_ROW_TIMESTAMP]
-            }
-            for row in rows
-        ]
+        return [self._story_row_to_dict(row) for row in rows]
+
+    def get_active_stories(self, now: float) -> List[Dict[str, Any]]:
+        """
+        Get the stories that have not expired yet, newest first
+        (an index range scan on expires_at).
+
+        Args:
+            now: Current time (seconds since epoch)
+
+        Returns:
+            List of story dictionaries (with id and expires_at)
+        """
+        query = f'''
+            SELECT username, content_type, content, filename, timestamp,
+                   id, expires_at
+            FROM {TABLE_STORIES}
+            WHERE expires_at > ?
+            ORDER BY expires_at DESC
+        '''
+        rows = self.execute_query(query, (now,))
+        return [self._story_row_to_dict(row) for row in rows] if rows else []
+
+    def get_all_stories(self) -> List[Dict[str, Any]]:
+        """
+        Get every story with its id and expires_at (None for rows added
+        before the column existed). Used to load the expiry scheduler.
+        """
+        query = f'''
+            SELECT username, content_type, content, filename, timestamp,
+                   id, expires_at
+            FROM {TABLE_STORIES}
+        '''
+        rows = self.execute_query(query)
+        return [self._story_row_to_dict(row) for row in rows] if rows else []
+
+    def set_story_expiry(self, story_id: int, expires_at: float) -> bool:
+        """Set the expiry time of a story."""
+        return bool(self.execute_query(
+            f"UPDATE {TABLE_STORIES} SET expires_at = ? WHERE id = ?",
+            (expires_at, story_id),
+            fetch_all=False
+        ))
+
+    def delete_story(self, story_id: int) -> bool:
+        """Delete one story row."""
+        return bool(self.execute_query(
+            f"DELETE FROM {TABLE_STORIES} WHERE id = ?",
+            (story_id,),
+            fetch_all=False
+        ))
+
+    @staticmethod
+    def _story_row_to_dict(row) -> Dict[str, Any]:
+        story = {
+            "username": row[STORY_ROW_USERNAME],
+            "content_type": row[STORY_ROW_CONTENT_TYPE],
+            "content": row[STORY_ROW_CONTENT],
+            "filename": row[STORY_ROW_FILENAME],
+            "timestamp": row[STORY_ROW_TIMESTAMP]
+        }
+        if len(row) > STORY_ROW_EXPIRES_AT:
+            story["id"] = row[STORY_ROW_ID]
+            story["expires_at"] = row[STORY_ROW_EXPIRES_AT]
+        return story
 
     def delete_old_stories(self, cutoff_time: str) -> int:
         """
@@ -701,6 +918,535 @@ class DBManager:
             print(f"Error deleting old stories: {e}")
             return NO_ROWS_DELETED
 
+    def add_rendition(
+        self,
+        video_filename: str,
+        height: int,
+        width: int,
+        bitrate_kbps: int,
+        path: str
+    ) -> bool:
+        """
+        Record a transcoded rendition of a video.
+        Re-running ingest for the same height replaces the old row.
+
+        Args:
+            video_filename: Source video filename
+            height: Rendition height in pixels
+            width: Rendition width in pixels
+            bitrate_kbps: Target video bitrate
+            path: Path of the rendition file
+
+        Returns:
+            bool: True if stored
+        """
+        query = f'''
+            INSERT OR REPLACE INTO {TABLE_RENDITIONS}
+            (video_filename, height, width, bitrate_kbps, path)
+            VALUES (?, ?, ?, ?, ?)
+        '''
+        return bool(self.execute_query(
+            query,
+            (video_filename, height, width, bitrate_kbps, path),
+            fetch_all=False
+        ))
+
+    def get_renditions(self, video_filename: str) -> List[Dict[str, Any]]:
+        """
+        Get all renditions of a video, highest resolution first.
+
+        Args:
+            video_filename: Source video filename
+
+        Returns:
+            List of rendition dictionaries
+        """
+        query = f'''
+            SELECT height, width, bitrate_kbps, path
+            FROM {TABLE_RENDITIONS}
+            WHERE video_filename=?
+            ORDER BY height DESC
+        '''
+        rows = self.execute_query(query, (video_filename,))
+
+        if not rows:
+            return []
+
+        return [
+            {
+                "height": row[RENDITION_ROW_HEIGHT],
+                "width": row[RENDITION_ROW_WIDTH],
+                "bitrate_kbps": row[RENDITION_ROW_BITRATE],
+                "path": row[RENDITION_ROW_PATH]
+            }
+            for row in rows
+        ]
+
+    def upsert_media_catalog(self, entry: Dict[str, Any]) -> bool:
+        """
+        Store (or replace) the probed metadata of one media file.
+
+        Args:
+            entry: Dict with the MEDIA_CATALOG_FIELDS keys
+
+        Returns:
+            bool: True if stored
+        """
+        columns = ', '.join(MEDIA_CATALOG_FIELDS)
+        placeholders = ', '.join('?' for _ in MEDIA_CATALOG_FIELDS)
+        query = f'''
+            INSERT OR REPLACE INTO {TABLE_MEDIA_CATALOG} ({columns})
+            VALUES ({placeholders})
+        '''
+        params = tuple(entry.get(field) for field in MEDIA_CATALOG_FIELDS)
+        return bool(self.execute_query(query, params, fetch_all=False))
+
+    def get_media_catalog(self, kind: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the catalog entry of a media file.
+
+        Args:
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            filename: Media filename (no folder)
+
+        Returns:
+            Entry dict, or None if the file was never cataloged
+        """
+        query = f'''
+            SELECT {', '.join(MEDIA_CATALOG_FIELDS)}
+            FROM {TABLE_MEDIA_CATALOG}
+            WHERE kind=? AND filename=?
+        '''
+        row = self.execute_query(query, (kind, filename), fetch_one=True)
+        if not row:
+            return None
+        return dict(zip(MEDIA_CATALOG_FIELDS, row))
+
+    def delete_media_catalog(self, kind: str, filename: str) -> bool:
+        """Remove a media file's catalog entry."""
+        query = f"DELETE FROM {TABLE_MEDIA_CATALOG} WHERE kind=? AND filename=?"
+        return bool(self.execute_query(query, (kind, filename), fetch_all=False))
+
+    def find_media_by_hash(self, kind: str, content_hash: str) -> List[str]:
+        """Filenames of cataloged media of this kind with the given content."""
+        query = f'''
+            SELECT filename FROM {TABLE_MEDIA_CATALOG}
+            WHERE kind=? AND content_hash=?
+        '''
+        rows = self.execute_query(query, (kind, content_hash))
+        return [row[0] for row in rows] if rows else []
+
+    def get_blob(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a stored blob.
+
+        Args:
+            content_hash: Hex SHA-256 of the content
+
+        Returns:
+            Dict with content_hash, path, size, ref_count, or None
+        """
+        query = f'''
+            SELECT content_hash, path, size, ref_count
+            FROM {TABLE_BLOBS}
+            WHERE content_hash=?
+        '''
+        row = self.execute_query(query, (content_hash,), fetch_one=True)
+        if not row:
+            return None
+        return {
+            "content_hash": row[BLOB_ROW_HASH],
+            "path": row[BLOB_ROW_PATH],
+            "size": row[BLOB_ROW_SIZE],
+            "ref_count": row[BLOB_ROW_REF_COUNT],
+        }
+
+    def add_blob_ref(
+        self,
+        kind: str,
+        filename: str,
+        content_hash: str,
+        path: str,
+        size: int,
+        created: float
+    ) -> bool:
+        """
+        Record that a video/story uses a blob (creating the blob row on
+        first use) and bump its reference count, in one transaction.
+
+        Args:
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            filename: Video/story filename
+            content_hash: Hex SHA-256 of the content
+            path: Blob file path
+            size: Blob size in bytes
+            created: Time the blob was stored
+
+        Returns:
+            bool: True if recorded, False if filename already has a blob
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'''INSERT OR IGNORE INTO {TABLE_BLOBS}
+                        (content_hash, path, size, ref_count, created)
+                        VALUES (?, ?, ?, 0, ?)''',
+                    (content_hash, path, size, created)
+                )
+                cursor.execute(
+                    f'''INSERT INTO {TABLE_BLOB_REFS} (kind, filename, content_hash)
+                        VALUES (?, ?, ?)''',
+                    (kind, filename, content_hash)
+                )
+                cursor.execute(
+                    f'''UPDATE {TABLE_BLOBS} SET ref_count = ref_count + 1
+                        WHERE content_hash=?''',
+                    (content_hash,)
+                )
+                conn.commit()
+                return True
+        except sqlite3.IntegrityError:
+            return False
+        except Exception as e:
+            print(f"Database error: {e}")
+            return False
+
+    def release_blob_ref(self, kind: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Drop a video/story's reference to its blob, in one transaction.
+        The blob row is deleted with its last reference.
+
+        Args:
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            filename: Video/story filename
+
+        Returns:
+            Dict with content_hash, path and the remaining ref_count,
+            or None if filename had no blob
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'''SELECT b.content_hash, b.path, b.ref_count
+                        FROM {TABLE_BLOB_REFS} r
+                        JOIN {TABLE_BLOBS} b ON b.content_hash = r.content_hash
+                        WHERE r.kind=? AND r.filename=?''',
+                    (kind, filename)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                content_hash, path, ref_count = row
+                remaining = max(ref_count - 1, 0)
+
+                cursor.execute(
+                    f"DELETE FROM {TABLE_BLOB_REFS} WHERE kind=? AND filename=?",
+                    (kind, filename)
+                )
+                if remaining:
+                    cursor.execute(
+                        f"UPDATE {TABLE_BLOBS} SET ref_count=? WHERE content_hash=?",
+                        (remaining, content_hash)
+                    )
+                else:
+                    self._delete_blob_row(cursor, content_hash)
+                conn.commit()
+                return {"content_hash": content_hash, "path": path, "ref_count": remaining}
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+
+    def replace_blob_ref(
+        self,
+        kind: str,
+        filename: str,
+        content_hash: str,
+        path: str,
+        size: int,
+        created: float
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Point a video/story at another blob, in one transaction: the old
+        blob loses the reference (and its row with its last one), the new
+        blob gains it (its row is created on first use).
+
+        Args:
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+            filename: Video/story filename
+            content_hash: Hex SHA-256 of the new content
+            path: New blob file path
+            size: New blob size in bytes
+            created: Time the new blob was stored
+
+        Returns:
+            Dict with the old blob's content_hash, path and remaining
+            ref_count, or None if filename had no blob (nothing changed)
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f'''SELECT b.content_hash, b.path, b.ref_count
+                        FROM {TABLE_BLOB_REFS} r
+                        JOIN {TABLE_BLOBS} b ON b.content_hash = r.content_hash
+                        WHERE r.kind=? AND r.filename=?''',
+                    (kind, filename)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                old_hash, old_path, ref_count = row
+                if old_hash == content_hash:
+                    return {"content_hash": old_hash, "path": old_path, "ref_count": ref_count}
+                remaining = max(ref_count - 1, 0)
+
+                if remaining:
+                    cursor.execute(
+                        f"UPDATE {TABLE_BLOBS} SET ref_count=? WHERE content_hash=?",
+                        (remaining, old_hash)
+                    )
+                else:
+                    self._delete_blob_row(cursor, old_hash)
+                cursor.execute(
+                    f'''INSERT OR IGNORE INTO {TABLE_BLOBS}
+                        (content_hash, path, size, ref_count, created)
+                        VALUES (?, ?, ?, 0, ?)''',
+                    (content_hash, path, size, created)
+                )
+                cursor.execute(
+                    f'''UPDATE {TABLE_BLOB_REFS} SET content_hash=?
+                        WHERE kind=? AND filename=?''',
+                    (content_hash, kind, filename)
+                )
+                cursor.execute(
+                    f'''UPDATE {TABLE_BLOBS} SET ref_count = ref_count + 1
+                        WHERE content_hash=?''',
+                    (content_hash,)
+                )
+                conn.commit()
+                return {"content_hash": old_hash, "path": old_path, "ref_count": remaining}
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+
+    @staticmethod
+    def _delete_blob_row(cursor, content_hash: str):
+        """Delete an unreferenced blob row and the story sources naming it."""
+        cursor.execute(f"DELETE FROM {TABLE_BLOBS} WHERE content_hash=?", (content_hash,))
+        cursor.execute(
+            f"DELETE FROM {TABLE_STORY_SOURCES} WHERE content_hash=?", (content_hash,)
+        )
+
+    def has_blob_ref(self, content_hash: str, kind: str) -> bool:
+        """
+        Whether a video/story of this kind uses the blob.
+
+        Args:
+            content_hash: Hex SHA-256 of the content
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+
+        Returns:
+            bool: True if at least one reference of that kind exists
+        """
+        query = f"SELECT 1 FROM {TABLE_BLOB_REFS} WHERE content_hash=? AND kind=? LIMIT 1"
+        return self.execute_query(query, (content_hash, kind), fetch_one=True) is not None
+
+    def get_story_source(self, source_hash: str) -> Optional[str]:
+        """
+        Hash of the normalized version of an uploaded story content.
+
+        Args:
+            source_hash: Hex SHA-256 of the file as uploaded
+
+        Returns:
+            str: Hex SHA-256 of the normalized blob, or None if unknown
+        """
+        query = f"SELECT content_hash FROM {TABLE_STORY_SOURCES} WHERE source_hash=?"
+        row = self.execute_query(query, (source_hash,), fetch_one=True)
+        return row[0] if row else None
+
+    def set_story_source(self, source_hash: str, content_hash: str) -> bool:
+        """
+        Record the normalized blob made from an uploaded story content.
+
+        Args:
+            source_hash: Hex SHA-256 of the file as uploaded
+            content_hash: Hex SHA-256 of its normalized version
+
+        Returns:
+            bool: True if recorded
+        """
+        query = f'''INSERT OR REPLACE INTO {TABLE_STORY_SOURCES}
+                    (source_hash, content_hash) VALUES (?, ?)'''
+        return bool(self.execute_query(query, (source_hash, content_hash), fetch_all=False))
+
+    def enqueue_job(
+        self,
+        job_key: Optional[str],
+        kind: str,
+        payload: str,
+        priority: int,
+        max_attempts: int,
+        now: float
+    ) -> Optional[int]:
+        """
+        Add a job, or reuse the job that already has job_key: a queued or
+        running one is returned as is, a finished one is queued again.
+
+        Args:
+            job_key: Idempotency key (None → always a new job)
+            kind: Handler name
+            payload: JSON payload
+            priority: Lower runs first
+            max_attempts: Attempts before the job is marked failed
+            now: Current time
+
+        Returns:
+            int: Job id, or None on database error
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                row = None
+                if job_key is not None:
+                    cursor.execute(
+                        f"SELECT id, status FROM {TABLE_JOBS} WHERE job_key=?",
+                        (job_key,)
+                    )
+                    row = cursor.fetchone()
+
+                if row is not None and row[1] in (JOB_QUEUED, JOB_RUNNING):
+                    job_id = row[0]
+                elif row is not None:
+                    job_id = row[0]
+                    cursor.execute(
+                        f'''UPDATE {TABLE_JOBS}
+                            SET kind=?, payload=?, priority=?, status=?,
+                                attempts=0, max_attempts=?, run_after=?,
+                                last_error=NULL, updated=?
+                            WHERE id=?''',
+                        (kind, payload, priority, JOB_QUEUED,
+                         max_attempts, now, now, job_id)
+                    )
+                else:
+                    cursor.execute(
+                        f'''INSERT INTO {TABLE_JOBS}
+                            (job_key, kind, payload, priority, status,
+                             max_attempts, run_after, created, updated)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                        (job_key, kind, payload, priority, JOB_QUEUED,
+                         max_attempts, now, now, now)
+                    )
+                    job_id = cursor.lastrowid
+                conn.commit()
+                return job_id
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+
+    def claim_job(self, now: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the most urgent runnable job and mark it running.
+
+        Returns:
+            Job dict (attempts already counted), or None if nothing is due
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    f'''SELECT {', '.join(JOB_FIELDS)} FROM {TABLE_JOBS}
+                        WHERE status=? AND run_after<=?
+                        ORDER BY priority, id
+                        LIMIT 1''',
+                    (JOB_QUEUED, now)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                job = dict(zip(JOB_FIELDS, row))
+                cursor.execute(
+                    f'''UPDATE {TABLE_JOBS}
+                        SET status=?, attempts=attempts + 1, updated=?
+                        WHERE id=?''',
+                    (JOB_RUNNING, now, job['id'])
+                )
+                conn.commit()
+                job['status'] = JOB_RUNNING
+                job['attempts'] += 1
+                return job
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+
+    def finish_job(
+        self,
+        job_id: int,
+        status: str,
+        now: float,
+        error: Optional[str] = None,
+        run_after: Optional[float] = None
+    ) -> bool:
+        """
+        Record the outcome of a run: done, failed, or queued again for a
+        retry at run_after.
+        """
+        query = f'''
+            UPDATE {TABLE_JOBS}
+            SET status=?, last_error=?, run_after=COALESCE(?, run_after), updated=?
+            WHERE id=?
+        '''
+        return bool(self.execute_query(
+            query, (status, error, run_after, now, job_id), fetch_all=False
+        ))
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Get one job by id."""
+        query = f"SELECT {', '.join(JOB_FIELDS)} FROM {TABLE_JOBS} WHERE id=?"
+        row = self.execute_query(query, (job_id,), fetch_one=True)
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def next_job_time(self) -> Optional[float]:
+        """run_after of the earliest queued job, or None if none is queued."""
+        query = f"SELECT MIN(run_after) FROM {TABLE_JOBS} WHERE status=?"
+        row = self.execute_query(query, (JOB_QUEUED,), fetch_one=True)
+        return row[0] if row else None
+
+    def requeue_running_jobs(self, now: float) -> int:
+        """Put jobs left running by a crashed server back in the queue."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"UPDATE {TABLE_JOBS} SET status=?, updated=? WHERE status=?",
+                    (JOB_QUEUED, now, JOB_RUNNING)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Database error: {e}")
+            return NO_ROWS_DELETED
+
+    def delete_finished_jobs(self, before: float) -> int:
+        """Delete done/failed jobs last updated before the given time."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"DELETE FROM {TABLE_JOBS} WHERE status IN (?, ?) AND updated<?",
+                    (JOB_DONE, JOB_FAILED, before)
+                )
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Database error: {e}")
+            return NO_ROWS_DELETED
+
     def table_exists(self, table_name: str) -> bool:
         """
         Check if a table exists in the database.
@@ -731,6 +1477,23 @@ class DBManager:
         query = f"PRAGMA table_info({table_name})"
         return self.execute_query(query) or []
 
+
+# Query metrics
+_query_seconds = get_metrics().histogram(
+    "db_query_seconds", "Time spent in DBManager.execute_query", ("op",)
+)
+_query_errors = get_metrics().counter(
+    "db_query_errors_total", "DBManager.execute_query calls that failed", ("op",)
+)
+
+
+def _query_operation(query: str) -> str:
+    """First SQL keyword of the query (SELECT / INSERT / UPDATE / DELETE / OTHER)."""
+    words = query.split(None, 1)
+    operation = words[0].upper() if words else QUERY_OPERATION_OTHER
+    return operation if operation in QUERY_OPERATIONS else QUERY_OPERATION_OTHER
+
+
 # Global singleton instance
 _db_manager_instance = None
 
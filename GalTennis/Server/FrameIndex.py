@@ -0,0 +1,163 @@
+"""
+Gal Haham
+Frame Index - keyframe positions of a video file, for fast seeking.
+Built once with ffprobe (keyframes only, no full decode) and cached as
+JSON next to the server. A seek jumps the capture to the nearest
+keyframe at or before the target and then grabs forward, which avoids
+OpenCV decoding from an unknown position.
+"""
+import bisect
+import json
+import os
+import subprocess
+import threading
+import cv2
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_FOLDER = os.path.join(_SERVER_DIR, "frame_index")
+INDEX_EXTENSION = ".json"
+INDEX_VERSION = 1
+
+KEY_VERSION = 'version'
+KEY_MTIME = 'mtime'
+KEY_KEYFRAMES = 'keyframes'
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class FrameIndex:
+    """Sorted keyframe indices of one video file."""
+
+    def __init__(self, video_path: str, keyframes: list):
+        self.video_path = video_path
+        self.keyframes = keyframes          # [] → index unavailable
+
+    # ── Seeking ───────────────────────────────────────────────────────────────
+
+    def keyframe_before(self, frame: int) -> int:
+        position = bisect.bisect_right(self.keyframes, frame) - 1
+        return self.keyframes[position] if position >= 0 else 0
+
+    def seek(self, cap, frame: int) -> bool:
+        """
+        Position cap so that the next read() returns frame.
+
+        Args:
+            cap: cv2.VideoCapture opened on this index's file
+            frame: Target frame index
+
+        Returns:
+            bool: False if the file ended before the target
+        """
+        if not self.keyframes:
+            # No index: let OpenCV do the (slower) seek itself
+            return cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+
+        keyframe = self.keyframe_before(frame)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        for _ in range(frame - keyframe):
+            if not cap.grab():
+                return False
+        return True
+
+    # ── Building ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def build(video_path: str) -> list:
+        """
+        Probe keyframe timestamps and turn them into frame indices.
+
+        Returns:
+            list: Keyframe indices, or [] if probing failed
+        """
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        if not fps or fps <= 0:
+            return []
+
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                 '-skip_frame', 'nokey',
+                 '-show_entries', 'frame=pts_time',
+                 '-of', 'csv=p=0', video_path],
+                capture_output=True, text=True, check=True
+            )
+        except (subprocess.CalledProcessError, OSError):
+            return []
+
+        times = []
+        for line in result.stdout.splitlines():
+            try:
+                times.append(float(line.strip().rstrip(',')))
+            except ValueError:
+                continue
+        if not times:
+            return []
+
+        start = min(times)
+        return sorted({int(round((t - start) * fps)) for t in times})
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+def _index_path(video_path: str) -> str:
+    name = os.path.abspath(video_path).replace(os.sep, '_').replace(':', '')
+    return os.path.join(INDEX_FOLDER, name + INDEX_EXTENSION)
+
+
+def _load(video_path: str, mtime: float):
+    try:
+        with open(_index_path(video_path), 'r') as f:
+            data = json.load(f)
+        if data.get(KEY_VERSION) == INDEX_VERSION and data.get(KEY_MTIME) == mtime:
+            return data.get(KEY_KEYFRAMES, [])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _save(video_path: str, mtime: float, keyframes: list):
+    os.makedirs(INDEX_FOLDER, exist_ok=True)
+    tmp_path = _index_path(video_path) + ".tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                KEY_VERSION: INDEX_VERSION,
+                KEY_MTIME: mtime,
+                KEY_KEYFRAMES: keyframes,
+            }, f)
+        os.replace(tmp_path, _index_path(video_path))
+    except OSError as e:
+        print(f"[FrameIndex] Cannot save index for {video_path}: {e}")
+
+
+def get_frame_index(video_path: str) -> FrameIndex:
+    """
+    Return the keyframe index of video_path, building it if the cached
+    one is missing or older than the file.
+    """
+    key = os.path.abspath(video_path)
+    try:
+        mtime = os.path.getmtime(video_path)
+    except OSError:
+        return FrameIndex(video_path, [])
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    keyframes = _load(video_path, mtime)
+    if keyframes is None:
+        keyframes = FrameIndex.build(video_path)
+        if keyframes:
+            _save(video_path, mtime, keyframes)
+            print(f"[FrameIndex] {os.path.basename(video_path)}: {len(keyframes)} keyframes")
+
+    index = FrameIndex(video_path, keyframes)
+    with _cache_lock:
+        _cache[key] = (mtime, index)
+    return index
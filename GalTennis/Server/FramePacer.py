@@ -0,0 +1,82 @@
+"""
+Gal Haham
+Frame Pacer - shared send-rate scheduler for the streaming servers.
+Each frame gets an absolute deadline on time.monotonic():
+    deadline(n) = origin + media_sent(n) - burst
+so per-frame jitter never accumulates into drift and wall-clock changes
+do not affect pacing. The first `burst` seconds of media after a
+(re)start are due immediately, which fills the client's buffer as fast
+as the link allows before falling back to real time.
+"""
+import threading
+import time
+
+FAST_START_SECONDS = 2.0        # Media sent unpaced after start / seek
+MAX_LATE_SECONDS = 0.5          # Further behind than this → rebase the clock
+DEFAULT_RATE = 1.0
+
+
+class FramePacer:
+    """
+    Deadline clock for one stream.
+      1. restart() at start, after a seek (with burst) or after a
+         pause / rate change (without burst)
+      2. wait() before sending each frame
+    """
+
+    def __init__(self, fps: float, burst_seconds: float = FAST_START_SECONDS,
+                 max_late_seconds: float = MAX_LATE_SECONDS):
+        """
+        Args:
+            fps: Stream frame rate at 1x
+            burst_seconds: Media sent unpaced after a bursting restart
+            max_late_seconds: Lateness that makes the clock rebase
+        """
+        self.frame_delay = 1.0 / fps
+        self.burst_seconds = burst_seconds
+        self.max_late_seconds = max_late_seconds
+        self._origin = None
+        self._media = 0.0
+        self._burst = burst_seconds
+
+    def restart(self, burst: bool = True):
+        """Start a new timeline at the next frame."""
+        self._origin = None
+        self._burst = self.burst_seconds if burst else 0.0
+
+    def wait(self, rate: float = DEFAULT_RATE, stop: threading.Event = None) -> float:
+        """
+        Block until the next frame is due, then count it as sent.
+
+        Args:
+            rate: Current playback rate (2.0 → frames due twice as often)
+            stop: Optional event that cuts the wait short
+
+        Returns:
+            float: Seconds the frame is late (0 while bursting or on time)
+        """
+        now = time.monotonic()
+        if self._origin is None:
+            self._origin = now
+            self._media = 0.0
+
+        late = 0.0
+        if self._media >= self._burst:
+            deadline = self._origin + self._media - self._burst
+            if deadline > now:
+                if stop is not None:
+                    stop.wait(deadline - now)
+                else:
+                    time.sleep(deadline - now)
+            else:
+                late = now - deadline
+                if late > self.max_late_seconds:
+                    # Link could not keep up: accept the loss instead of racing
+                    self._origin = now - self._media + self._burst
+
+        self._media += self.frame_delay / rate
+        return late
+
+    @property
+    def bursting(self) -> bool:
+        return self._origin is None or self._media < self._burst
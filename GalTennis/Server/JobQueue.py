@@ -0,0 +1,180 @@
+"""
+Gal Haham
+Job Queue - persistent background work for the server.
+Jobs live in the jobs table (SQLite), so media processing queued by an
+upload survives a server restart; a pool of worker threads, one per
+CPU core, runs them in priority order.
+
+    enqueue(kind, payload, key)   → job id (same key → same job)
+    register(kind, handler)       handler(payload) does the work and
+                                  raises to report a failure
+    get_status(job_id)            → status dict for the client
+
+A failed run is retried with exponential backoff up to max_attempts.
+Jobs found 'running' at startup (server crashed mid-job) are queued
+again, so handlers must be safe to run twice.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from Db_manager import (
+    get_db_manager, JOB_QUEUED, JOB_DONE, JOB_FAILED
+)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 5.0
+IDLE_POLL_SECONDS = 5.0
+FINISHED_JOB_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+# Fields of a job returned to clients
+STATUS_FIELDS = ('id', 'kind', 'status', 'attempts', 'max_attempts', 'last_error', 'updated')
+
+
+class JobQueue:
+    """SQLite-backed priority queue with a worker pool."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        """
+        Args:
+            workers: Number of worker threads
+        """
+        self.db = get_db_manager()
+        self.workers = workers
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    # ── Setup ─────────────────────────────────────────────────────────────────
+
+    def register(self, kind: str, handler):
+        """Set the function that runs jobs of this kind."""
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Recover interrupted jobs and start the worker threads."""
+        if self._running:
+            return
+        self._running = True
+
+        now = time.time()
+        recovered = self.db.requeue_running_jobs(now)
+        if recovered:
+            print(f"[Jobs] Re-queued {recovered} interrupted jobs")
+        self.db.delete_finished_jobs(now - FINISHED_JOB_TTL_SECONDS)
+
+        for n in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop, daemon=True, name=f"JobWorker-{n}"
+            )
+            thread.start()
+            self._threads.append(thread)
+        print(f"[Jobs] {self.workers} workers started")
+
+    def stop(self):
+        self._running = False
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def enqueue(self, kind: str, payload: dict, key: str = None,
+                priority: int = PRIORITY_NORMAL,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Queue a job. While a job with the same key is queued or running,
+        enqueuing it again returns that job instead of adding another.
+
+        Args:
+            kind: Registered handler name
+            payload: JSON-serialisable handler argument
+            key: Idempotency key, e.g. "ingest_video:clip.mp4"
+            priority: PRIORITY_HIGH / NORMAL / LOW (lower runs first)
+            max_attempts: Runs before the job is marked failed
+
+        Returns:
+            int: Job id, or None if it could not be stored
+        """
+        job_id = self.db.enqueue_job(
+            key, kind, json.dumps(payload), priority, max_attempts, time.time()
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get_status(self, job_id) -> dict:
+        """
+        Returns:
+            dict: Public fields of the job, or None if there is no such job
+        """
+        job = self.db.get_job(job_id)
+        if job is None:
+            return None
+        return {field: job[field] for field in STATUS_FIELDS}
+
+    # ── Workers ───────────────────────────────────────────────────────────────
+
+    def _worker_loop(self):
+        while self._running:
+            job = self.db.claim_job(time.time())
+            if job is None:
+                self._wait_for_work()
+                continue
+            self._run(job)
+
+    def _wait_for_work(self):
+        timeout = IDLE_POLL_SECONDS
+        next_time = self.db.next_job_time()
+        if next_time is not None:
+            timeout = min(timeout, max(next_time - time.time(), 0))
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def _run(self, job: dict):
+        handler = self._handlers.get(job['kind'])
+        started = time.time()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{job['kind']}'")
+            handler(json.loads(job['payload']))
+        except Exception as e:
+            self._handle_failure(job, e)
+            return
+
+        self.db.finish_job(job['id'], JOB_DONE, time.time())
+        print(f"[Jobs] #{job['id']} {job['kind']} done in {time.time() - started:.1f}s")
+
+    def _handle_failure(self, job: dict, error: Exception):
+        now = time.time()
+        message = f"{type(error).__name__}: {error}"
+        if job['attempts'] < job['max_attempts']:
+            delay = RETRY_BASE_SECONDS * (2 ** (job['attempts'] - 1))
+            self.db.finish_job(job['id'], JOB_QUEUED, now, message, now + delay)
+            print(f"[Jobs] #{job['id']} {job['kind']} failed ({message}), "
+                  f"retry in {delay:.0f}s")
+        else:
+            self.db.finish_job(job['id'], JOB_FAILED, now, message)
+            print(f"[Jobs] #{job['id']} {job['kind']} failed for good: {message}")
+            traceback.print_exc()
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_queue_instance = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the shared JobQueue instance."""
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            _queue_instance = JobQueue()
+        return _queue_instance
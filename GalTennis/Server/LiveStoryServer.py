@@ -0,0 +1,573 @@
+"""
+Gal Haham
+Live Story Server - stories watched while they are being recorded.
+One port (6002) for broadcasters and viewers:
+
+    broadcaster  key exchange → BROADCAST(stream info) → LIVE_READY(id)
+                 → media packets (JPEG frames, PCM audio) → LIVE_END info
+                 → LIVE_SAVED(story)
+    viewer       key exchange → WATCH_LIVE(id) → LIVE_READY
+                 → LIVE info packet → media packets → LIVE_END info
+
+Packets from the broadcaster are decrypted once and handed, still
+compressed, to every viewer. Each viewer has its own sender thread and a
+bounded queue (VIEWER_QUEUE_PACKETS): when a viewer falls behind its
+oldest packets are dropped, so a slow viewer never delays the
+broadcaster or the other viewers and never lags more than about a
+second behind.
+
+While it runs the broadcast is written to disk as it arrives (MJPEG +
+WAV, see LiveRecording). When it ends the two are muxed without
+re-encoding and added as a normal story through the story upload
+server (normalized, thumbnailed, registered, expiring like any other).
+"""
+import collections
+import os
+import socket
+import subprocess
+import threading
+import time
+import uuid
+import wave
+import zlib
+
+import aes_cipher
+import key_exchange
+import media_packet
+from Protocol import Protocol
+from story_saver_server import ensure_story_upload_server_running
+
+HOST = '0.0.0.0'
+PORT = 6002
+SOCKET_OPTION_ENABLED = 1
+MAX_PENDING_CONNECTIONS = 20
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+LIVE_FOLDER = os.path.join(_SERVER_DIR, "live_recordings")
+
+REQUEST_BROADCAST = "BROADCAST"
+REQUEST_WATCH = "WATCH_LIVE"
+RESPONSE_READY = "LIVE_READY"
+RESPONSE_SAVED = "LIVE_SAVED"
+RESPONSE_ERROR = "error"
+INFO_TYPE_LIVE = "LIVE"
+INFO_TYPE_END = "LIVE_END"
+
+MESSAGE_BAD_REQUEST = "Expected BROADCAST or WATCH_LIVE"
+MESSAGE_BAD_STREAM = "Invalid stream info"
+MESSAGE_NOT_LIVE = "Broadcast not found or ended"
+MESSAGE_NOT_SAVED = "Broadcast could not be saved"
+
+VIEWER_QUEUE_PACKETS = 40           # About 1 s of video + audio at 20 fps
+MAX_LIVE_FPS = 30
+MAX_FRAME_SIDE = 4096
+MAX_AUDIO_CHANNELS = 2
+MAX_AUDIO_SAMPLE_RATE = 48000
+MAX_LIVE_SECONDS = 10 * 60          # Longer broadcasts stop being recorded
+AUDIO_SAMPLE_WIDTH = 2              # s16le
+COMPRESS_LEVEL = 1
+BROADCAST_ID_LENGTH = 8
+FINISH_TIMEOUT_SECONDS = 120
+EXIT_CODE_SUCCESS = 0
+KEY_INDEX = 1
+MEDIA_TYPE_VIDEO = 'video'
+
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+
+class LiveRecording:
+    """
+    Writes a broadcast to disk as it arrives: JPEG frames to an MJPEG
+    stream at a constant frame rate, PCM to a WAV file. A frame the
+    broadcaster skipped repeats the previous one, so the video keeps the
+    broadcast's timing and stays aligned with the audio.
+    """
+
+    def __init__(self, base_path: str, fps: int, has_audio: bool,
+                 audio_sample_rate: int, audio_channels: int):
+        """
+        Args:
+            base_path: Path of the recording files, without extension
+            fps: Frame rate of the broadcast
+            has_audio: Whether audio packets will arrive
+            audio_sample_rate: Sample rate of the PCM
+            audio_channels: Interleaved channel count of the PCM
+        """
+        self.fps = fps
+        self.max_frames = fps * MAX_LIVE_SECONDS
+        self.video_path = base_path + ".mjpeg"
+        self.audio_path = base_path + ".wav" if has_audio else None
+        self.output_path = base_path + ".mkv"
+        self.frames_written = 0
+        self._last_jpeg = None
+
+        self._video = open(self.video_path, 'wb')
+        self._audio = None
+        if self.audio_path:
+            self._audio = wave.open(self.audio_path, 'wb')
+            self._audio.setnchannels(audio_channels)
+            self._audio.setsampwidth(AUDIO_SAMPLE_WIDTH)
+            self._audio.setframerate(audio_sample_rate)
+
+    def add_frame(self, jpeg, frame_number: int):
+        """Write a frame into its slot, repeating the last one over gaps."""
+        if not self.frames_written <= frame_number < self.max_frames:
+            return                  # Late, duplicate or past the limit
+        fill = self._last_jpeg if self._last_jpeg is not None else jpeg
+        while self.frames_written < frame_number:
+            self._video.write(fill)
+            self.frames_written += 1
+        self._video.write(jpeg)
+        self.frames_written += 1
+        self._last_jpeg = jpeg
+
+    def add_audio(self, pcm):
+        if self._audio is not None and self.frames_written < self.max_frames:
+            self._audio.writeframes(pcm)
+
+    def finish(self) -> bool:
+        """
+        Close the recording and mux it into output_path (stream copy).
+
+        Returns:
+            bool: True if output_path was written
+        """
+        self._close()
+        if self.frames_written == 0:
+            return False
+
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'mjpeg', '-framerate', str(self.fps), '-i', self.video_path,
+        ]
+        if self.audio_path:
+            command += ['-i', self.audio_path]
+        command += ['-c', 'copy', '-f', 'matroska', self.output_path]
+        try:
+            result = subprocess.run(
+                command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=FINISH_TIMEOUT_SECONDS
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"[LiveStory] Cannot mux recording: {e}")
+            return False
+        return result.returncode == EXIT_CODE_SUCCESS and os.path.exists(self.output_path)
+
+    def discard(self):
+        """Delete whatever is left of the recording files."""
+        self._close()
+        for path in (self.video_path, self.audio_path, self.output_path):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _close(self):
+        if not self._video.closed:
+            self._video.close()
+        if self._audio is not None:
+            self._audio.close()     # Header gets the final length
+            self._audio = None
+
+
+# ── Fan-out ───────────────────────────────────────────────────────────────────
+
+class LiveViewer:
+    """
+    One viewer of a broadcast. publish() never blocks: packets go into a
+    bounded deque that drops the oldest one when full, and run() sends
+    them on the viewer's own thread, encrypted with its own key.
+    """
+
+    def __init__(self, conn, viewer_id: int):
+        self.conn = conn
+        self.viewer_id = viewer_id
+        self.dropped = 0
+        self._packets = collections.deque(maxlen=VIEWER_QUEUE_PACKETS)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def offer(self, packet: bytes):
+        """Queue a compressed packet, dropping the oldest if the queue is full."""
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._packets) == self._packets.maxlen:
+                self.dropped += 1
+            self._packets.append(packet)
+            self._cond.notify()
+
+    def close(self):
+        """Send what is queued, then stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def run(self):
+        """Send queued packets until closed and drained, or the viewer leaves."""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._packets or self._closed)
+                if not self._packets:
+                    return
+                packet = self._packets.popleft()
+            try:
+                encrypted = aes_cipher.AESCipher.encrypt(self.conn[KEY_INDEX], packet)
+                Protocol.send_bin(encrypted, self.conn)
+            except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, OSError):
+                with self._cond:
+                    self._closed = True
+                    self._packets.clear()
+                return
+
+
+class LiveBroadcast:
+    """One running broadcast: its stream info, viewers and recording."""
+
+    def __init__(self, broadcast_id: str, username: str, stream: dict,
+                 recording: LiveRecording):
+        self.broadcast_id = broadcast_id
+        self.username = username
+        self.stream = stream
+        self.recording = recording
+        self.started_at = time.time()
+        self.ended = False
+        self._viewers = set()
+        self._lock = threading.Lock()
+
+    def info(self) -> dict:
+        """Info packet contents sent to each viewer first."""
+        info = {
+            'type': INFO_TYPE_LIVE,
+            'broadcast_id': self.broadcast_id,
+            'username': self.username,
+            'compressed': True,
+        }
+        info.update(self.stream)
+        return info
+
+    def describe(self) -> dict:
+        """Entry for the list of live stories."""
+        with self._lock:
+            viewers = len(self._viewers)
+        return {
+            'broadcast_id': self.broadcast_id,
+            'username': self.username,
+            'started_at': self.started_at,
+            'viewers': viewers,
+        }
+
+    def add_viewer(self, viewer: LiveViewer) -> bool:
+        with self._lock:
+            if self.ended:
+                return False
+            self._viewers.add(viewer)
+            return True
+
+    def remove_viewer(self, viewer: LiveViewer):
+        with self._lock:
+            self._viewers.discard(viewer)
+
+    def publish(self, packet: bytes):
+        """Give a compressed packet to every viewer."""
+        with self._lock:
+            viewers = list(self._viewers)
+        for viewer in viewers:
+            viewer.offer(packet)
+
+    def end(self):
+        """Tell every viewer the broadcast is over and let them go."""
+        end_packet = media_packet.compress(
+            media_packet.pack_info({'type': INFO_TYPE_END, 'broadcast_id': self.broadcast_id}),
+            COMPRESS_LEVEL
+        )
+        with self._lock:
+            self.ended = True
+            viewers = list(self._viewers)
+            self._viewers.clear()
+        for viewer in viewers:
+            viewer.offer(end_packet)
+            viewer.close()
+
+
+# ── Server ────────────────────────────────────────────────────────────────────
+
+class LiveStoryServer:
+    """
+    Accepts broadcasters and viewers on one port, each connection in
+    its own thread.
+    """
+
+    def __init__(self, host: str = HOST, port: int = PORT):
+        self.host = host
+        self.port = port
+        self.is_running = False
+        os.makedirs(LIVE_FOLDER, exist_ok=True)
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, SOCKET_OPTION_ENABLED
+        )
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(MAX_PENDING_CONNECTIONS)
+
+        self._client_counter = 0
+        self._counter_lock = threading.Lock()
+        self._broadcasts = {}       # broadcast_id → LiveBroadcast
+        self._broadcasts_lock = threading.Lock()
+
+    def start(self):
+        self.is_running = True
+        print(f"[LiveStory] Listening on {self.host}:{self.port}")
+
+        while self.is_running:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except OSError:
+                break
+
+            with self._counter_lock:
+                self._client_counter += 1
+                client_id = self._client_counter
+
+            threading.Thread(
+                target=self._handle_client,
+                args=(client_socket, addr, client_id),
+                daemon=True,
+                name=f"LiveStory-{client_id}"
+            ).start()
+
+        self.server_socket.close()
+        print("[LiveStory] Server stopped")
+
+    def stop(self):
+        self.is_running = False
+        try:
+            self.server_socket.close()
+        except Exception:
+            pass
+
+    def list_broadcasts(self) -> list:
+        """Running broadcasts, oldest first."""
+        with self._broadcasts_lock:
+            broadcasts = list(self._broadcasts.values())
+        return sorted(
+            (broadcast.describe() for broadcast in broadcasts),
+            key=lambda entry: entry['started_at']
+        )
+
+    # ── Connections ───────────────────────────────────────────────────────────
+
+    def _handle_client(self, client_socket: socket.socket, addr: tuple, client_id: int):
+        """Key exchange, then serve the connection as broadcaster or viewer."""
+        print(f"[LiveStory] Client #{client_id} connected from {addr}")
+        try:
+            key = key_exchange.KeyExchange.recv_send_key((client_socket, None))
+            conn = (client_socket, key)
+
+            request = Protocol.recv_json(conn)
+            request_type = request.get("type")
+            if request_type == REQUEST_BROADCAST:
+                self._serve_broadcaster(conn, request, client_id)
+            elif request_type == REQUEST_WATCH:
+                self._serve_viewer(conn, request, client_id)
+            else:
+                self._send_error(conn, MESSAGE_BAD_REQUEST)
+
+        except (ConnectionError, OSError, ValueError):
+            pass    # Normal disconnect / bad request
+        except Exception as e:
+            print(f"[LiveStory] Client #{client_id} error: {e}")
+        finally:
+            try:
+                client_socket.close()
+            except Exception:
+                pass
+            print(f"[LiveStory] Client #{client_id} disconnected")
+
+    def _serve_broadcaster(self, conn, request: dict, client_id: int):
+        """Relay and record a broadcast until it ends, then save it."""
+        stream = self._stream_info(request)
+        if stream is None:
+            self._send_error(conn, MESSAGE_BAD_STREAM)
+            return
+
+        broadcast_id = str(uuid.uuid4())[:BROADCAST_ID_LENGTH]
+        username = str(request.get("username") or "user")
+        recording = LiveRecording(
+            os.path.join(LIVE_FOLDER, f"live_{broadcast_id}"),
+            stream['fps'], stream['has_audio'],
+            stream['audio_sample_rate'], stream['audio_channels']
+        )
+        broadcast = LiveBroadcast(broadcast_id, username, stream, recording)
+        with self._broadcasts_lock:
+            self._broadcasts[broadcast_id] = broadcast
+
+        print(f"[LiveStory] #{client_id} {username} is live ({broadcast_id}, "
+              f"{stream['width']}x{stream['height']} @ {stream['fps']} fps)")
+        try:
+            Protocol.send_json({"type": RESPONSE_READY, "broadcast_id": broadcast_id}, conn)
+            ended = self._relay(conn, broadcast)
+        finally:
+            with self._broadcasts_lock:
+                self._broadcasts.pop(broadcast_id, None)
+            broadcast.end()
+            story = self._save(broadcast)
+
+        if not ended:
+            return                  # Broadcaster is gone; the story is saved anyway
+        if story is None:
+            self._send_error(conn, MESSAGE_NOT_SAVED)
+        else:
+            Protocol.send_json({"type": RESPONSE_SAVED, "story": story}, conn)
+
+    def _relay(self, conn, broadcast: LiveBroadcast) -> bool:
+        """
+        Receive the broadcaster's packets: publish each to the viewers
+        and write it to the recording.
+
+        Returns:
+            bool: True if the broadcaster ended the broadcast (LIVE_END),
+                  False if the connection dropped
+        """
+        key = conn[KEY_INDEX]
+        recording = broadcast.recording
+        while True:
+            try:
+                compressed = aes_cipher.AESCipher.decrypt(key, Protocol.recv_bin(conn))
+                packet = media_packet.unpack(zlib.decompress(compressed))
+            except (ConnectionError, OSError):
+                return False
+            except (ValueError, zlib.error) as e:
+                print(f"[LiveStory] {broadcast.broadcast_id}: bad packet ({e})")
+                return False
+
+            if 'frame_number' not in packet:
+                if packet.get('type') == INFO_TYPE_END:
+                    return True
+                continue
+
+            broadcast.publish(compressed)
+            if packet['frame'] is not None and packet['codec'] == media_packet.CODEC_JPEG:
+                recording.add_frame(packet['frame'], packet['frame_number'])
+            if packet['audio'] is not None:
+                recording.add_audio(packet['audio'])
+
+    def _save(self, broadcast: LiveBroadcast):
+        """
+        Turn the recording into a story.
+
+        Returns:
+            dict: The story record, or None if nothing was saved
+        """
+        recording = broadcast.recording
+        try:
+            if not recording.finish():
+                print(f"[LiveStory] {broadcast.broadcast_id}: nothing recorded")
+                return None
+            upload_server = ensure_story_upload_server_running()["server"]
+            story = upload_server.add_story_file(
+                recording.output_path, broadcast.username, MEDIA_TYPE_VIDEO
+            )
+            print(f"[LiveStory] {broadcast.broadcast_id} ended "
+                  f"({recording.frames_written} frames, "
+                  f"{'saved' if story else 'not saved'})")
+            return story
+        finally:
+            recording.discard()
+
+    def _serve_viewer(self, conn, request: dict, client_id: int):
+        """Stream a running broadcast to one viewer until it ends."""
+        with self._broadcasts_lock:
+            broadcast = self._broadcasts.get(str(request.get("broadcast_id", "")))
+        if broadcast is None or broadcast.ended:
+            self._send_error(conn, MESSAGE_NOT_LIVE)
+            return
+
+        Protocol.send_json({"type": RESPONSE_READY, "broadcast_id": broadcast.broadcast_id}, conn)
+        viewer = LiveViewer(conn, client_id)
+        viewer.offer(media_packet.compress(media_packet.pack_info(broadcast.info()),
+                                           COMPRESS_LEVEL))
+        if not broadcast.add_viewer(viewer):
+            return
+        print(f"[LiveStory] #{client_id} watching {broadcast.broadcast_id}")
+        try:
+            viewer.run()
+        finally:
+            broadcast.remove_viewer(viewer)
+            if viewer.dropped:
+                print(f"[LiveStory] #{client_id} dropped {viewer.dropped} packets (slow viewer)")
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _stream_info(request: dict):
+        """
+        Validated stream info of a BROADCAST request.
+
+        Returns:
+            dict: width, height, fps, has_audio, audio_sample_rate,
+                  audio_channels - or None if the request is invalid
+        """
+        try:
+            stream = {
+                'width': int(request["width"]),
+                'height': int(request["height"]),
+                'fps': int(request["fps"]),
+                'has_audio': bool(request.get("has_audio")),
+                'audio_sample_rate': int(request.get("audio_sample_rate", 0)),
+                'audio_channels': int(request.get("audio_channels", 0)),
+            }
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if not (0 < stream['width'] <= MAX_FRAME_SIDE and 0 < stream['height'] <= MAX_FRAME_SIDE
+                and 0 < stream['fps'] <= MAX_LIVE_FPS):
+            return None
+        if stream['has_audio'] and not (
+                0 < stream['audio_sample_rate'] <= MAX_AUDIO_SAMPLE_RATE
+                and 0 < stream['audio_channels'] <= MAX_AUDIO_CHANNELS):
+            return None
+        return stream
+
+    @staticmethod
+    def _send_error(conn, message: str):
+        try:
+            Protocol.send_json({"type": RESPONSE_ERROR, "message": message}, conn)
+        except Exception:
+            pass
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_server_instance = None
+_server_lock = threading.Lock()
+
+
+def ensure_live_story_server_running() -> dict:
+    """
+    Start the live story server on first use. The socket is bound
+    before this returns, so clients can connect right away.
+
+    Returns:
+        dict: {"server": <LiveStoryServer>, "port": PORT}
+    """
+    global _server_instance
+    with _server_lock:
+        if _server_instance is None:
+            _server_instance = LiveStoryServer()
+            threading.Thread(
+                target=_server_instance.start,
+                daemon=True,
+                name="LiveStoryServer"
+            ).start()
+    return {"server": _server_instance, "port": _server_instance.port}
+
+
+def get_live_stories() -> list:
+    """Running broadcasts (empty if the server is not started)."""
+    server = _server_instance
+    return server.list_broadcasts() if server is not None else []
@@ -0,0 +1,220 @@
+"""
+Gal Haham
+Media Catalog - technical metadata of every video and story, probed once.
+One ffprobe run (plus the keyframe index and a SHA-256 of the file) when
+the media is added fills a media_catalog row; stream setup then reads
+fps, size, frame count and audio format from the table instead of
+probing the file on every play. A row is re-probed when the file's size
+or mtime no longer match.
+"""
+import json
+import os
+import subprocess
+import threading
+import cv2
+from Db_manager import get_db_manager
+from FrameIndex import get_frame_index
+from my_sha256 import Hasha256
+
+BITS_PER_KILOBIT = 1000
+FRACTION_SEPARATOR = '/'
+
+
+class MediaCatalog:
+    """
+    Probes media files and keeps their metadata in the media_catalog table.
+    """
+
+    def __init__(self):
+        self.db = get_db_manager()
+        self._lock = threading.Lock()
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def ingest(self, path: str, kind: str) -> dict:
+        """
+        Probe path and store its catalog entry (skipped if up to date).
+
+        Args:
+            path: Media file path
+            kind: MEDIA_KIND_VIDEO or MEDIA_KIND_STORY
+
+        Returns:
+            dict: The catalog entry, or None if the file is unreadable
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        filename = os.path.basename(path)
+        with self._lock:
+            entry = self.db.get_media_catalog(kind, filename)
+            if self._is_fresh(entry, stat):
+                return entry
+
+            entry = self._probe(path, stat)
+            if entry is None:
+                print(f"[Catalog] Cannot probe: {path}")
+                return None
+            entry.update({'kind': kind, 'filename': filename})
+            self.db.upsert_media_catalog(entry)
+
+        print(f"[Catalog] {kind} {filename}: {entry['width']}x{entry['height']} "
+              f"@ {entry['fps']:.2f} fps, {entry['duration']:.1f}s")
+        return entry
+
+    def ingest_async(self, path: str, kind: str):
+        """Run ingest() on a background thread."""
+        threading.Thread(
+            target=self.ingest,
+            args=(path, kind),
+            daemon=True,
+            name=f"Catalog-{os.path.basename(path)}"
+        ).start()
+
+    def lookup(self, path: str, kind: str) -> dict:
+        """
+        Catalog entry for path, probing it now if it is missing or stale.
+
+        Returns:
+            dict: The catalog entry, or None if the file is unreadable
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.db.get_media_catalog(kind, os.path.basename(path))
+        if self._is_fresh(entry, stat):
+            return entry
+        return self.ingest(path, kind)
+
+    def forget(self, path: str, kind: str):
+        """Drop the entry of a deleted media file."""
+        self.db.delete_media_catalog(kind, os.path.basename(path))
+
+    # ── Probing ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _is_fresh(entry, stat) -> bool:
+        return (entry is not None
+                and entry['file_size'] == stat.st_size
+                and entry['mtime'] == stat.st_mtime)
+
+    def _probe(self, path: str, stat) -> dict:
+        entry = {
+            'path': os.path.abspath(path),
+            'file_size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'content_hash': Hasha256.get_file_hash(path),
+            'duration': 0.0,
+            'fps': 0.0,
+            'width': 0,
+            'height': 0,
+            'frame_count': 0,
+            'video_codec': None,
+            'bitrate_kbps': None,
+            'audio_codec': None,
+            'audio_sample_rate': None,
+            'audio_channels': None,
+            'keyframe_count': None,
+        }
+
+        probe = self._run_ffprobe(path)
+        video = self._first_stream(probe, 'video')
+        audio = self._first_stream(probe, 'audio')
+        media_format = probe.get('format', {})
+
+        if video is not None:
+            entry['video_codec'] = video.get('codec_name')
+            entry['width'] = int(video.get('width', 0))
+            entry['height'] = int(video.get('height', 0))
+            entry['fps'] = self._parse_rate(video.get('avg_frame_rate'))
+            entry['frame_count'] = int(video.get('nb_frames', 0) or 0)
+        if audio is not None:
+            entry['audio_codec'] = audio.get('codec_name')
+            entry['audio_sample_rate'] = int(audio.get('sample_rate', 0)) or None
+            entry['audio_channels'] = int(audio.get('channels', 0)) or None
+        entry['duration'] = float(media_format.get('duration', 0) or 0)
+        bit_rate = media_format.get('bit_rate')
+        if bit_rate:
+            entry['bitrate_kbps'] = int(bit_rate) // BITS_PER_KILOBIT
+
+        # Images and files ffprobe could not read: fall back to OpenCV
+        if not entry['width'] or not entry['fps'] or not entry['frame_count']:
+            if not self._fill_from_opencv(path, entry):
+                return None
+
+        if entry['fps'] and not entry['duration']:
+            entry['duration'] = entry['frame_count'] / entry['fps']
+        if entry['frame_count'] > 1:
+            keyframes = get_frame_index(path).keyframes
+            entry['keyframe_count'] = len(keyframes) if keyframes else None
+        return entry
+
+    @staticmethod
+    def _run_ffprobe(path: str) -> dict:
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error',
+                 '-show_entries',
+                 'format=duration,bit_rate:'
+                 'stream=codec_type,codec_name,width,height,avg_frame_rate,'
+                 'nb_frames,sample_rate,channels',
+                 '-of', 'json', path],
+                capture_output=True, text=True, check=True
+            )
+            return json.loads(result.stdout)
+        except (subprocess.CalledProcessError, OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _first_stream(probe: dict, codec_type: str):
+        for stream in probe.get('streams', []):
+            if stream.get('codec_type') == codec_type:
+                return stream
+        return None
+
+    @staticmethod
+    def _parse_rate(rate) -> float:
+        """'30000/1001' → 29.97"""
+        try:
+            if rate and FRACTION_SEPARATOR in rate:
+                numerator, denominator = rate.split(FRACTION_SEPARATOR)
+                return float(numerator) / float(denominator) if float(denominator) else 0.0
+            return float(rate or 0)
+        except ValueError:
+            return 0.0
+
+    @staticmethod
+    def _fill_from_opencv(path: str, entry: dict) -> bool:
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                image = cv2.imread(path)
+                if image is None:
+                    return False
+                entry['height'], entry['width'] = image.shape[:2]
+                entry['frame_count'] = 1
+                return True
+            entry['width'] = entry['width'] or int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            entry['height'] = entry['height'] or int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            entry['fps'] = entry['fps'] or float(cap.get(cv2.CAP_PROP_FPS) or 0)
+            entry['frame_count'] = (entry['frame_count'] or
+                                    int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            return entry['width'] > 0 and entry['height'] > 0
+        finally:
+            cap.release()
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_catalog_instance = None
+
+
+def get_media_catalog() -> MediaCatalog:
+    """Return the shared MediaCatalog instance."""
+    global _catalog_instance
+    if _catalog_instance is None:
+        _catalog_instance = MediaCatalog()
+    return _catalog_instance
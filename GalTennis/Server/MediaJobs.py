@@ -0,0 +1,116 @@
+"""
+Gal Haham
+Media Jobs - the background jobs of the media pipeline.
+Uploads enqueue these instead of starting threads, so the work is
+prioritised, retried on failure and resumed after a restart.
+
+    ingest_video    catalog, seek index, audio cache and ABR renditions
+                    (raises on a failed probe / rung, so it is retried)
+    ingest_story    playback-size copy (StoryNormalizer) and thumbnail,
+                    then catalog entry (+ audio cache for video stories)
+
+Job keys are per file, so an upload retried by the client or a
+backfill of an already queued file does not queue the work twice.
+"""
+import os
+from JobQueue import get_job_queue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from RenditionManager import get_rendition_manager, VIDEO_EXTENSIONS
+from MediaCatalog import get_media_catalog
+from Db_manager import get_db_manager, MEDIA_KIND_STORY
+from AudioTrackCache import get_audio_track
+from BlobStore import get_blob_store
+from StoryNormalizer import normalized_copy, make_thumbnail
+from my_sha256 import Hasha256
+
+JOB_INGEST_VIDEO = 'ingest_video'
+JOB_INGEST_STORY = 'ingest_story'
+
+MEDIA_TYPE_VIDEO = 'video'
+
+
+# ── Handlers ──────────────────────────────────────────────────────────────────
+
+def _ingest_video(payload: dict):
+    path = payload['path']
+    if not os.path.exists(path):
+        print(f"[Jobs] Video gone before ingest: {path}")
+        return
+    get_rendition_manager().ingest(path)
+
+
+def _ingest_story(payload: dict):
+    path = payload['path']
+    if not os.path.exists(path):
+        return                  # Expired or deleted in the meantime
+    _normalize_story(path, payload.get('media_type'))
+    make_thumbnail(path)
+    if get_media_catalog().ingest(path, MEDIA_KIND_STORY) is None:
+        raise RuntimeError(f"Cannot probe story {path}")
+    if payload.get('media_type') == MEDIA_TYPE_VIDEO:
+        get_audio_track(path)
+
+
+def _normalize_story(path: str, media_type: str):
+    """
+    Move a story onto the blob of its playback-format version. Uploads
+    of the same content share that blob: story_sources maps the hash of
+    the content as uploaded to the hash of its normalized version (and
+    a normalized version to itself, so it is never normalized twice).
+    """
+    db = get_db_manager()
+    store = get_blob_store()
+    source_hash = Hasha256.get_file_hash(path)
+    normalized_hash = db.get_story_source(source_hash)
+    if normalized_hash == source_hash:
+        return                  # Already in playback format
+    if normalized_hash and store.relink(path, MEDIA_KIND_STORY, normalized_hash):
+        return
+
+    work_path = normalized_copy(path, media_type)
+    if work_path is None:
+        raise RuntimeError(f"Cannot normalize story {path}")
+    normalized_hash = Hasha256.get_file_hash(work_path)
+    if store.replace(path, MEDIA_KIND_STORY, work_path, normalized_hash):
+        db.set_story_source(source_hash, normalized_hash)
+        db.set_story_source(normalized_hash, normalized_hash)
+
+
+def register_media_jobs():
+    """Register the media handlers on the shared queue."""
+    queue = get_job_queue()
+    queue.register(JOB_INGEST_VIDEO, _ingest_video)
+    queue.register(JOB_INGEST_STORY, _ingest_story)
+
+
+# ── Enqueue helpers ───────────────────────────────────────────────────────────
+
+def enqueue_video_ingest(video_path: str, priority: int = PRIORITY_NORMAL):
+    """Queue ingest of an uploaded video. Returns the job id."""
+    return get_job_queue().enqueue(
+        JOB_INGEST_VIDEO,
+        {'path': os.path.abspath(video_path)},
+        key=f"{JOB_INGEST_VIDEO}:{os.path.basename(video_path)}",
+        priority=priority
+    )
+
+
+def enqueue_video_backfill(videos_folder: str) -> list:
+    """Queue ingest (at low priority) of every video already on disk."""
+    if not os.path.isdir(videos_folder):
+        return []
+    return [
+        enqueue_video_ingest(os.path.join(videos_folder, name), PRIORITY_LOW)
+        for name in sorted(os.listdir(videos_folder))
+        if name.lower().endswith(VIDEO_EXTENSIONS)
+    ]
+
+
+def enqueue_story_ingest(story_path: str, media_type: str):
+    """Queue ingest of a new story (high priority: stories are short-lived)."""
+    return get_job_queue().enqueue(
+        JOB_INGEST_STORY,
+        {'path': os.path.abspath(story_path), 'media_type': media_type},
+        key=f"{JOB_INGEST_STORY}:{os.path.basename(story_path)}",
+        priority=PRIORITY_HIGH
+    )
+
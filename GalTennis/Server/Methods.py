@@ -6,12 +6,23 @@ REFACTORED: Both videos and stories use single-port + ticket system.
             No more per-request port allocation.
             Videos  → port 9999  (ensure_video_server_running)
             Stories → port 6001  (ensure_story_server_running)
+ADDED: START_VIDEO_UPLOAD - starts the chunked video upload server
+       (port 3334) and returns its port
+ADDED: GET_JOB_STATUS - status of background jobs by id
+CHANGED: GET_MEDIA serves the stories' precomputed thumbnails
+CHANGED: The story playback service (port 6001) starts with the handler
+ADDED: PLAY_STORY accepts 'filenames' for a playlist ticket
+CHANGED: The story upload server (port 3333) starts with the handler;
+         ADD_STORY no longer starts it and sleeps
+ADDED: Live stories - the live story server (port 6002) starts with the
+       handler; GET_LIVE_STORIES lists the running broadcasts
+ADDED: Request count and routing time per type (Metrics);
+       GET_SERVER_STATS returns every server metric (admins only -
+       Server.py checks the session)
 """
-import threading
-import time
 import os
 import base64
-import cv2
+import time
 
 from Authication import Authentication
 from Videos_Handler import VideosHandler
@@ -21,10 +32,19 @@ from Stories_Handler import StoriesHandler
 from Manger_commands import ManagerCommands
 from VideoAudioServer import ensure_video_server_running
 from story_player_server import ensure_story_server_running
+from story_saver_server import ensure_story_upload_server_running
+from VideoUploadServer import ensure_video_upload_server_running
+from LiveStoryServer import ensure_live_story_server_running, get_live_stories
+from JobQueue import get_job_queue
+from StoryNormalizer import get_thumbnail
+from Metrics import get_metrics
 
 REQUEST_LOGIN = 'LOGIN'
 REQUEST_SIGNUP = 'SIGNUP'
 REQUEST_ADD_VIDEO = 'ADD_VIDEO'
+REQUEST_UPLOAD_VIDEO = 'UPLOAD_VIDEO'
+REQUEST_START_VIDEO_UPLOAD = 'START_VIDEO_UPLOAD'
+REQUEST_GET_JOB_STATUS = 'GET_JOB_STATUS'
 REQUEST_GET_VIDEOS = 'GET_VIDEOS'
 REQUEST_LIKE_VIDEO = 'LIKE_VIDEO'
 REQUEST_GET_LIKES_COUNT = 'GET_LIKES_COUNT'
@@ -36,14 +56,29 @@ REQUEST_GET_ALL_USERS = 'GET_ALL_USERS'
 REQUEST_PLAY_VIDEO = 'PLAY_VIDEO'
 REQUEST_PLAY_STORY = 'PLAY_STORY'
 REQUEST_PLAY_STORY_MEDIA = 'PLAY_STORY_MEDIA'
+REQUEST_GET_LIVE_STORIES = 'GET_LIVE_STORIES'
 REQUEST_GET_IMAGES_OF_ALL_VIDEOS = 'GET_IMAGES_OF_ALL_VIDEOS'
 REQUEST_GET_ALL_VIDEOS_GRID = 'GET_ALL_VIDEOS_GRID'
 REQUEST_GET_MEDIA = 'GET_MEDIA'
+REQUEST_GET_SERVER_STATS = 'GET_SERVER_STATS'
+
+KNOWN_REQUESTS = frozenset((
+    REQUEST_LOGIN, REQUEST_SIGNUP, REQUEST_ADD_VIDEO, REQUEST_UPLOAD_VIDEO,
+    REQUEST_START_VIDEO_UPLOAD, REQUEST_GET_JOB_STATUS, REQUEST_GET_VIDEOS,
+    REQUEST_LIKE_VIDEO, REQUEST_GET_LIKES_COUNT, REQUEST_ADD_COMMENT,
+    REQUEST_GET_COMMENTS, REQUEST_ADD_STORY, REQUEST_GET_STORIES,
+    REQUEST_GET_ALL_USERS, REQUEST_PLAY_VIDEO, REQUEST_PLAY_STORY,
+    REQUEST_PLAY_STORY_MEDIA, REQUEST_GET_LIVE_STORIES,
+    REQUEST_GET_IMAGES_OF_ALL_VIDEOS, REQUEST_GET_ALL_VIDEOS_GRID,
+    REQUEST_GET_MEDIA, REQUEST_GET_SERVER_STATS,
+))
+REQUEST_LABEL_OTHER = 'OTHER'   # Metric label for unknown types
 
 KEY_TYPE = 'type'
 KEY_PAYLOAD = 'payload'
 KEY_VIDEO_TITLE = 'video_title'
 KEY_FILENAME = 'filename'
+KEY_FILENAMES = 'filenames'
 KEY_STATUS = 'status'
 KEY_MESSAGE = 'message'
 
@@ -63,12 +98,15 @@ MESSAGE_STORIES_DISPLAYED = "All stories displayed"
 MESSAGE_VIDEOS_DISPLAYED = "Video grid display server started"
 MESSAGE_STORY_STREAMING_STARTED = "Story streaming started"
 MESSAGE_FILE_NOT_FOUND = "Story file not found"
+MESSAGE_VIDEO_UPLOAD_READY = "Video upload server ready"
+MESSAGE_VIDEO_UPLOAD_FAILED = "Failed to start video upload server"
+MESSAGE_JOB_IDS_NOT_PROVIDED = "Job ids not provided"
+MESSAGE_LIVE_STORIES_FAILED = "Failed to list live stories"
+MESSAGE_SERVER_STATS_FAILED = "Failed to collect server stats"
 
 VIDEO_FOLDER = "videos"
 STORY_FOLDER = "stories"
 
-STARTUP_DELAY_SECONDS = 1
-
 DEFAULT_HOST = '0.0.0.0'
 VIDEO_STREAM_PORT = 9999
 STORY_STREAM_PORT = 6001
@@ -76,15 +114,18 @@ STORY_STREAM_PORT = 6001
 VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
 
-THUMBNAIL_MAX_SIZE = 200
-IMAGE_SHAPE_SLICE_2D = 2
-
 ENCODING_FORMAT = 'utf-8'
-JPEG_EXTENSION = '.jpg'
 
 MEDIA_TYPE_IMAGE = 'image'
 MEDIA_TYPE_VIDEO = 'video'
 
+_requests_total = get_metrics().counter(
+    "requests_total", "Requests routed, by type and response status", ("type", "status")
+)
+_route_seconds = get_metrics().histogram(
+    "request_route_seconds", "Time to handle a request, by type", ("type",)
+)
+
 
 class RequestMethodsHandler:
 
@@ -96,12 +137,26 @@ class RequestMethodsHandler:
         self.stories_handler = StoriesHandler()
         self.manager_commands = ManagerCommands()
 
-        self.story_upload_server_running = False
-        self.story_upload_server_thread = None
+        # Story upload, playback and live services run for the life of the server
+        ensure_story_upload_server_running()
+        ensure_story_server_running()
+        ensure_live_story_server_running()
 
     # ── Router ────────────────────────────────────────────────────────────────
 
     def route_request(self, request_data: dict) -> dict:
+        """Route one request, counting it and timing it by type."""
+        request_type = request_data.get(KEY_TYPE) if isinstance(request_data, dict) else None
+        label = request_type if request_type in KNOWN_REQUESTS else REQUEST_LABEL_OTHER
+        started = time.monotonic()
+
+        response = self._route(request_data)
+
+        _route_seconds.observe(time.monotonic() - started, type=label)
+        _requests_total.inc(type=label, status=response.get(KEY_STATUS, STATUS_SUCCESS))
+        return response
+
+    def _route(self, request_data: dict) -> dict:
         try:
             request_type = request_data.get(KEY_TYPE)
             payload = request_data.get(KEY_PAYLOAD, {})
@@ -111,9 +166,15 @@ class RequestMethodsHandler:
             if request_type in [REQUEST_LOGIN, REQUEST_SIGNUP]:
                 return self.auth_handler.handle_request(request_type, payload)
 
-            if request_type in [REQUEST_ADD_VIDEO, REQUEST_GET_VIDEOS]:
+            if request_type in [REQUEST_ADD_VIDEO, REQUEST_UPLOAD_VIDEO, REQUEST_GET_VIDEOS]:
                 return self.videos_handler.handle_request(request_type, payload)
 
+            if request_type == REQUEST_START_VIDEO_UPLOAD:
+                return self.handle_start_video_upload()
+
+            if request_type == REQUEST_GET_JOB_STATUS:
+                return self.handle_get_job_status(payload)
+
             if request_type in [REQUEST_LIKE_VIDEO, REQUEST_GET_LIKES_COUNT]:
                 return self.likes_handler.handle_request(request_type, payload)
 
@@ -138,6 +199,9 @@ class RequestMethodsHandler:
             if request_type == REQUEST_PLAY_STORY_MEDIA:
                 return self.handle_play_story_media(payload)
 
+            if request_type == REQUEST_GET_LIVE_STORIES:
+                return self.handle_get_live_stories()
+
             if request_type == REQUEST_GET_IMAGES_OF_ALL_VIDEOS:
                 return self.get_stories_display_data()
 
@@ -147,58 +211,20 @@ class RequestMethodsHandler:
             if request_type == REQUEST_GET_MEDIA:
                 return {"type": 'RES_GET_MEDIA', "payload": self.get_media_data()}
 
+            if request_type == REQUEST_GET_SERVER_STATS:
+                return self.handle_get_server_stats()
+
             return self._create_error_response(MESSAGE_UNKNOWN_REQUEST)
         except Exception:
             return self._create_error_response("Error routing request")
 
     # ── Thumbnail helpers ─────────────────────────────────────────────────────
 
-    def _resize_to_thumbnail(self, img):
-        try:
-            height, width = img.shape[:IMAGE_SHAPE_SLICE_2D]
-            if height > width:
-                new_height = THUMBNAIL_MAX_SIZE
-                new_width = int(width * (THUMBNAIL_MAX_SIZE / height))
-            else:
-                new_width = THUMBNAIL_MAX_SIZE
-                new_height = int(height * (THUMBNAIL_MAX_SIZE / width))
-            return cv2.resize(img, (new_width, new_height))
-        except Exception:
-            return None
-
-    def _encode_image_to_base64(self, img) -> str:
-        try:
-            _, buffer = cv2.imencode(JPEG_EXTENSION, img)
-            return base64.b64encode(buffer).decode(ENCODING_FORMAT)
-        except Exception:
-            return None
-
-    def _extract_image_thumbnail(self, file_path: str):
-        try:
-            img = cv2.imread(file_path)
-            if img is None:
-                return None
-            resized = self._resize_to_thumbnail(img)
-            return self._encode_image_to_base64(resized) if resized is not None else None
-        except Exception:
-            return None
-
-    def _extract_video_thumbnail(self, file_path: str):
-        try:
-            cap = cv2.VideoCapture(file_path)
-            ret, frame = cap.read()
-            cap.release()
-            return self._encode_image_to_base64(frame) if ret else None
-        except Exception:
-            return None
-
     def extract_thumbnail(self, file_path: str, file_type: str):
+        """Base64 of the story's precomputed thumbnail (see StoryNormalizer)."""
         try:
-            if file_type == MEDIA_TYPE_IMAGE:
-                return self._extract_image_thumbnail(file_path)
-            elif file_type == MEDIA_TYPE_VIDEO:
-                return self._extract_video_thumbnail(file_path)
-            return None
+            data = get_thumbnail(file_path)
+            return base64.b64encode(data).decode(ENCODING_FORMAT) if data else None
         except Exception:
             return None
 
@@ -311,31 +337,39 @@ class RequestMethodsHandler:
         """
         Returns a one-time ticket the client uses to identify which story
         to stream. All stories share a single server on port 6001.
+        With 'filenames' (a list) the ticket is for a playlist: the
+        stories are streamed in that order on one connection.
         """
         try:
-            story_filename = payload.get(KEY_FILENAME)
-            if not story_filename:
+            story_filenames = payload.get(KEY_FILENAMES) or [payload.get(KEY_FILENAME)]
+            story_filenames = [name for name in story_filenames if name]
+            if not story_filenames:
                 return self._create_error_response(MESSAGE_STORY_NOT_PROVIDED)
 
-            story_path = os.path.join(STORY_FOLDER, story_filename)
-            if not os.path.exists(story_path):
+            story_paths = [
+                os.path.join(STORY_FOLDER, os.path.basename(name))
+                for name in story_filenames
+            ]
+            story_paths = [path for path in story_paths if os.path.exists(path)]
+            if not story_paths:
                 return self._create_error_response(MESSAGE_STORY_NOT_FOUND)
 
-            print(f"[Methods] Creating streaming ticket for story → {story_path}")
+            print(f"[Methods] Creating streaming ticket for {len(story_paths)} story(ies)")
 
-            result = ensure_story_server_running(story_path)
+            result = ensure_story_server_running(story_paths)
             port   = result.get("port")
             ticket = result.get("ticket")
 
             if not port or not ticket:
                 return self._create_error_response(MESSAGE_STORY_STREAM_FAILED)
 
-            print(f"[Methods] Story '{story_filename}' ticket={ticket} port={port}")
+            print(f"[Methods] Story '{story_filenames[0]}' ticket={ticket} port={port}")
             return {
                 KEY_STATUS: STATUS_SUCCESS,
                 KEY_MESSAGE: MESSAGE_STORY_STREAM_STARTED,
                 "port": port,
                 "ticket": ticket,
+                "count": len(story_paths),
             }
 
         except Exception as e:
@@ -366,6 +400,39 @@ class RequestMethodsHandler:
         except Exception:
             return self._create_error_response(MESSAGE_STORY_STREAM_FAILED)
 
+    def handle_get_live_stories(self) -> dict:
+        """
+        Broadcasts that can be watched right now.
+
+        Returns:
+            dict: {"status": "success", "port": <live story port>,
+                   "broadcasts": [{broadcast_id, username, started_at, viewers}]}
+        """
+        try:
+            info = ensure_live_story_server_running()
+            return {
+                KEY_STATUS: STATUS_SUCCESS,
+                "port": info["port"],
+                "broadcasts": get_live_stories(),
+            }
+        except Exception as e:
+            print(f"[Methods] handle_get_live_stories error: {e}")
+            return self._create_error_response(MESSAGE_LIVE_STORIES_FAILED)
+
+    def handle_get_server_stats(self) -> dict:
+        """
+        Every server metric (see Metrics.MetricsRegistry.snapshot).
+
+        Returns:
+            dict: {"status": "success", "uptime_seconds": float,
+                   "metrics": {name: {type, help, series}}}
+        """
+        try:
+            return {KEY_STATUS: STATUS_SUCCESS, **get_metrics().snapshot()}
+        except Exception as e:
+            print(f"[Methods] handle_get_server_stats error: {e}")
+            return self._create_error_response(MESSAGE_SERVER_STATS_FAILED)
+
     def get_stories_display_data(self) -> dict:
         try:
             return self._create_success_response(MESSAGE_STORIES_DISPLAYED)
@@ -378,37 +445,53 @@ class RequestMethodsHandler:
         except Exception:
             return self._create_error_response("Error getting videos")
 
-    # ── Story upload server ───────────────────────────────────────────────────
+    # ── Video upload server ───────────────────────────────────────────────────
 
-    def handle_add_story(self, payload: dict) -> dict:
+    def handle_start_video_upload(self) -> dict:
+        """Start the chunked upload server if needed and return its port."""
         try:
-            if not self.story_upload_server_running:
-                self.start_story_upload_server()
-                time.sleep(STARTUP_DELAY_SECONDS)
-            return self.stories_handler.handle_request(REQUEST_ADD_STORY, payload)
+            info = ensure_video_upload_server_running()
+            return {
+                KEY_STATUS: STATUS_SUCCESS,
+                KEY_MESSAGE: MESSAGE_VIDEO_UPLOAD_READY,
+                "port": info["port"],
+            }
         except Exception:
-            return self._create_error_response("Error adding story")
+            return self._create_error_response(MESSAGE_VIDEO_UPLOAD_FAILED)
 
-    def _run_story_upload_server(self):
-        try:
-            import story_saver_server
-            print("Starting Story Upload Server (port 3333)...")
-            story_saver_server.run()
-        except Exception:
-            pass
+    # ── Background jobs ───────────────────────────────────────────────────────
 
-    def start_story_upload_server(self):
+    def handle_get_job_status(self, payload: dict) -> dict:
+        """
+        Status of background jobs (e.g. the ingest queued by an upload).
+
+        Args:
+            payload: {"job_ids": [int, ...]}
+
+        Returns:
+            dict: {"status": "success", "jobs": {id: job status or None}}
+        """
+        job_ids = payload.get("job_ids")
+        if not isinstance(job_ids, list) or not job_ids:
+            return self._create_error_response(MESSAGE_JOB_IDS_NOT_PROVIDED)
+        queue = get_job_queue()
+        return {
+            KEY_STATUS: STATUS_SUCCESS,
+            "jobs": {str(job_id): queue.get_status(job_id) for job_id in job_ids},
+        }
+
+    # ── Stories ───────────────────────────────────────────────────────────────
+
+    def handle_add_story(self, payload: dict) -> dict:
+        """
+        Metadata-only ADD_STORY of older clients. Posting a story is a
+        single upload to the story upload server, whose ack already
+        holds the story record.
+        """
         try:
-            if not self.story_upload_server_running:
-                self.story_upload_server_thread = threading.Thread(
-                    target=self._run_story_upload_server,
-                    daemon=True
-                )
-                self.story_upload_server_thread.start()
-                self.story_upload_server_running = True
-                time.sleep(0.5)
+            return self.stories_handler.handle_request(REQUEST_ADD_STORY, payload)
         except Exception:
-            pass
+            return self._create_error_response("Error adding story")
 
     # ── Response builders ─────────────────────────────────────────────────────
 
@@ -0,0 +1,362 @@
+"""
+Gal Haham
+Metrics - in-process counters, gauges and histograms for the server.
+Modules register their metrics once on the shared registry and update
+them from any thread:
+
+    requests = get_metrics().counter("requests_total", "Requests routed", ("type",))
+    requests.inc(type="LOGIN")
+
+    counter     only goes up (inc)
+    gauge       set / inc / dec, or set_function(fn) read at collection
+    histogram   observe(value); HDR-style log-linear buckets - every
+                power of two is split into SUB_BUCKETS buckets, so any
+                quantile is within 1 / SUB_BUCKETS of the true value
+                whatever the range, in a few hundred counters at most
+
+Two ways out:
+    snapshot()              dict for the admin GET_SERVER_STATS request
+    render_prometheus()     Prometheus text format, served on
+                            http://127.0.0.1:METRICS_HTTP_PORT/metrics
+                            (histograms as summaries with quantiles)
+"""
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HTTP_HOST = '127.0.0.1'
+METRICS_HTTP_PORT = 9100
+METRICS_PATH = '/metrics'
+PROMETHEUS_PREFIX = 'tennis_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+HTTP_OK = 200
+HTTP_NOT_FOUND = 404
+
+TYPE_COUNTER = 'counter'
+TYPE_GAUGE = 'gauge'
+TYPE_HISTOGRAM = 'histogram'
+
+SUB_BUCKETS = 32                    # ≈3% relative error per quantile
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+NO_LABELS = ()
+LABEL_MISSING = ""
+
+
+# ── Histogram buckets ─────────────────────────────────────────────────────────
+
+class _HdrBuckets:
+    """
+    Log-linear value counts. A positive value v = m * 2**e (0.5 <= m < 1)
+    falls into bucket e * SUB_BUCKETS + int((2m - 1) * SUB_BUCKETS);
+    zero and negative values are counted apart.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float):
+        if value > 0:
+            mantissa, exponent = math.frexp(value)
+            index = exponent * SUB_BUCKETS + int((mantissa * 2 - 1) * SUB_BUCKETS)
+            self.counts[index] = self.counts.get(index, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def value_at(self, quantile: float) -> float:
+        """Upper bound of the bucket holding the quantile (clamped to min/max)."""
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(quantile * self.count))
+        seen = self.zero_count
+        if seen >= target:
+            return min(0.0, self.max)
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return max(min(self._upper_bound(index), self.max), self.min)
+        return self.max
+
+    @staticmethod
+    def _upper_bound(index: int) -> float:
+        exponent, sub_bucket = divmod(index, SUB_BUCKETS)
+        return math.ldexp(1 + (sub_bucket + 1) / SUB_BUCKETS, exponent - 1)
+
+    def summary(self) -> dict:
+        summary = {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else 0.0,
+            'max': self.max if self.count else 0.0,
+        }
+        for quantile in QUANTILES:
+            summary[_quantile_key(quantile)] = self.value_at(quantile)
+        return summary
+
+
+def _quantile_key(quantile: float) -> str:
+    """0.5 → 'p50', 0.999 → 'p999'"""
+    return 'p' + f"{quantile * 100:g}".replace('.', '')
+
+
+# ── Metric types ──────────────────────────────────────────────────────────────
+
+class _Metric:
+    """A named metric with one series per combination of label values."""
+
+    metric_type = None
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._series = {}           # label values tuple → value
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, LABEL_MISSING)) for name in self.label_names)
+
+    def collect(self) -> list:
+        """[(label values, value)] of every series."""
+        with self._lock:
+            return list(self._series.items())
+
+
+class Counter(_Metric):
+    metric_type = TYPE_COUNTER
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = TYPE_GAUGE
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        super().__init__(name, help_text, label_names)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Read the (unlabelled) value from function() at collection time."""
+        self._function = function
+
+    def collect(self) -> list:
+        if self._function is not None:
+            try:
+                return [(NO_LABELS, self._function())]
+            except Exception:
+                return []
+        return super().collect()
+
+
+class Histogram(_Metric):
+    metric_type = TYPE_HISTOGRAM
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            buckets = self._series.get(key)
+            if buckets is None:
+                buckets = self._series[key] = _HdrBuckets()
+            buckets.record(value)
+
+    def time(self, **labels):
+        """Context manager that observes the seconds its block took."""
+        return _Timer(self, labels)
+
+    def collect(self) -> list:
+        with self._lock:
+            return [(key, buckets.summary()) for key, buckets in self._series.items()]
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.monotonic() - self._started, **self._labels)
+        return False
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+
+class MetricsRegistry:
+    """All metrics of the process, by name."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def counter(self, name: str, help_text: str, label_names: tuple = NO_LABELS) -> Counter:
+        return self._register(Counter, name, help_text, label_names)
+
+    def gauge(self, name: str, help_text: str, label_names: tuple = NO_LABELS) -> Gauge:
+        return self._register(Gauge, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: tuple = NO_LABELS) -> Histogram:
+        return self._register(Histogram, name, help_text, label_names)
+
+    def _register(self, metric_class, name: str, help_text: str, label_names: tuple):
+        """Create the metric, or return it if a module registered it already."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, help_text, label_names)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already a {metric.metric_type}")
+            return metric
+
+    def _all(self) -> list:
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def snapshot(self) -> dict:
+        """
+        JSON-serialisable view of every metric.
+
+        Returns:
+            dict: {"uptime_seconds": float, "metrics": {name: {"type",
+                  "help", "series": [{"labels": {...}, "value": ...}]}}}.
+                  A histogram's value is its summary: count, sum, min,
+                  max and p50 / p90 / p99 / p999.
+        """
+        metrics = {}
+        for metric in self._all():
+            metrics[metric.name] = {
+                'type': metric.metric_type,
+                'help': metric.help,
+                'series': [
+                    {'labels': dict(zip(metric.label_names, key)), 'value': value}
+                    for key, value in metric.collect()
+                ],
+            }
+        return {'uptime_seconds': time.time() - self.started_at, 'metrics': metrics}
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._all():
+            name = PROMETHEUS_PREFIX + metric.name
+            is_histogram = metric.metric_type == TYPE_HISTOGRAM
+            lines.append(f"# HELP {name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {name} {'summary' if is_histogram else metric.metric_type}")
+            for key, value in metric.collect():
+                labels = list(zip(metric.label_names, key))
+                if not is_histogram:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for quantile in QUANTILES:
+                    quantile_labels = labels + [('quantile', f"{quantile:g}")]
+                    lines.append(f"{name}{_format_labels(quantile_labels)} "
+                                 f"{_format_value(value[_quantile_key(quantile)])}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels: list) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value) -> str:
+    return repr(float(value))
+
+
+# ── HTTP endpoint ─────────────────────────────────────────────────────────────
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics → Prometheus text; anything else → 404."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != METRICS_PATH:
+            self.send_error(HTTP_NOT_FOUND)
+            return
+        body = get_metrics().render_prometheus().encode('utf-8')
+        self.send_response(HTTP_OK)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass    # One line per scrape is noise
+
+
+# ── Module-level singletons ───────────────────────────────────────────────────
+
+_registry_instance = None
+_registry_lock = threading.Lock()
+_http_server_instance = None
+_http_server_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the shared MetricsRegistry instance."""
+    global _registry_instance
+    with _registry_lock:
+        if _registry_instance is None:
+            _registry_instance = MetricsRegistry()
+        return _registry_instance
+
+
+def ensure_metrics_http_server_running() -> dict:
+    """
+    Serve the metrics on localhost (Prometheus text) from a daemon thread.
+
+    Returns:
+        dict: {"server": <ThreadingHTTPServer>, "port": METRICS_HTTP_PORT}
+    """
+    global _http_server_instance
+    with _http_server_lock:
+        if _http_server_instance is None:
+            _http_server_instance = ThreadingHTTPServer(
+                (METRICS_HTTP_HOST, METRICS_HTTP_PORT), _MetricsRequestHandler
+            )
+            _http_server_instance.daemon_threads = True
+            threading.Thread(
+                target=_http_server_instance.serve_forever,
+                daemon=True,
+                name="MetricsHttpServer"
+            ).start()
+            print(f"[Metrics] Serving http://{METRICS_HTTP_HOST}:{METRICS_HTTP_PORT}{METRICS_PATH}")
+    return {"server": _http_server_instance, "port": METRICS_HTTP_PORT}
@@ -3,11 +3,12 @@ Gal Haham
 Network Manager - ENCRYPTED VERSION
 Handles all network communication for the streaming server with encryption.
 ENHANCED: Added encrypted send/receive methods using AES + pickle
+CHANGED: Info and packets are serialized with media_packet, not pickle
 """
 import socket
-import pickle
 import struct
 import aes_cipher
+import media_packet
 
 NETWORK_LEN_BYTES = 4
 REUSE_ADDRESS_ENABLED = 1
@@ -85,7 +86,7 @@ class NetworkManager:
             client_socket: Client socket
             stream_info: Stream metadata dictionary
         """
-        info_data = pickle.dumps(stream_info)
+        info_data = b''.join(media_packet.pack_info(stream_info))
         info_size = struct.pack(STRUCT_FORMAT_LONG, len(info_data))
         client_socket.sendall(info_size + info_data)
 
@@ -102,7 +103,7 @@ class NetworkManager:
         encryption_key = encrypted_conn[KEY_INDEX]
 
         # Serialize data
-        info_data = pickle.dumps(stream_info)
+        info_data = b''.join(media_packet.pack_info(stream_info))
 
         # Encrypt with AES
         if encryption_key:
@@ -127,7 +128,7 @@ class NetworkManager:
             client_socket: Client socket
             packet: Packet data dictionary
         """
-        packet_data = pickle.dumps(packet)
+        packet_data = NetworkManager._pack_packet(packet)
         packet_size = struct.pack(STRUCT_FORMAT_LONG, len(packet_data))
         client_socket.sendall(packet_size + packet_data)
 
@@ -144,7 +145,7 @@ class NetworkManager:
         encryption_key = encrypted_conn[KEY_INDEX]
 
         # Serialize packet
-        packet_data = pickle.dumps(packet)
+        packet_data = NetworkManager._pack_packet(packet)
 
         # Encrypt with AES
         if encryption_key:
@@ -159,6 +160,20 @@ class NetworkManager:
         packet_size = struct.pack(STRUCT_FORMAT_LONG, len(encrypted_data))
         client_socket.sendall(packet_size + encrypted_data)
 
+    @staticmethod
+    def _pack_packet(packet: dict) -> bytes:
+        """Packet dict (frame, audio, frame_number, ...) → media_packet bytes."""
+        parts = media_packet.pack_frame(
+            packet.get('frame'),
+            packet.get('audio'),
+            packet.get('frame_number', 0),
+            packet.get('pts', 0.0),
+            seek_seq=packet.get('seek_seq', 0),
+            rendition=packet.get('rendition', 0),
+            audio_channels=packet.get('audio_channels', 0),
+        )
+        return b''.join(parts)
+
     @staticmethod
     def close_client_socket(client_socket: socket.socket):
         """
@@ -0,0 +1,221 @@
+"""
+Gal Haham
+Rendition Manager - pre-transcodes uploaded videos into an ABR ladder.
+Each rung is a video-only H.264 copy at a lower resolution, made by an
+ffmpeg subprocess and recorded in the renditions table. Audio is still
+read from the source file, so every rung keeps the source frame count
+and a stream can switch rung at any frame index.
+The source's catalog entry (MediaCatalog) and audio track
+(AudioTrackCache) are produced here too, once per upload.
+A video whose content hash matches an already transcoded one reuses
+that video's rendition files instead of transcoding again.
+FIXED: ingest() raises when the probe or a rung fails, or when the video
+       is already being ingested, so the job queue retries it
+"""
+import os
+import subprocess
+import threading
+from Db_manager import get_db_manager, MEDIA_KIND_VIDEO
+from MediaCatalog import get_media_catalog
+from FrameIndex import get_frame_index
+from AudioTrackCache import get_audio_track
+
+# ── Ladder (height, target video bitrate in kbps) ────────────────────────────
+RENDITION_LADDER = (
+    (1080, 5000),
+    (720, 2800),
+    (480, 1200),
+    (240, 400),
+)
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+RENDITIONS_FOLDER = os.path.join(_SERVER_DIR, "renditions")
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
+RENDITION_EXTENSION = ".mp4"
+TEMP_SUFFIX = ".part"
+EVEN_DIMENSION = 2
+BUFSIZE_FACTOR = 2
+FFMPEG_PRESET = "veryfast"
+
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+class IngestInProgressError(RuntimeError):
+    """The video is being ingested by another thread - try again later."""
+
+
+class RenditionManager:
+    """
+    Produces and looks up the renditions of a video.
+      1. Catalog the source (resolution comes from the catalog entry)
+      2. ffmpeg one rung at a time (skipping rungs >= source height)
+      3. Write to a .part file, rename into place, record in the DB
+    """
+
+    def __init__(self, renditions_folder: str = RENDITIONS_FOLDER):
+        self.renditions_folder = renditions_folder
+        self.db = get_db_manager()
+        os.makedirs(self.renditions_folder, exist_ok=True)
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def ingest(self, video_path: str) -> list:
+        """
+        Build every missing rendition of video_path (blocking).
+
+        Args:
+            video_path: Path to the source video
+
+        Returns:
+            list: Renditions now available for the video
+
+        Raises:
+            IngestInProgressError: Another thread is ingesting the video
+            RuntimeError: The video cannot be probed or a rung failed to
+                transcode (the rungs that worked are kept)
+        """
+        filename = os.path.basename(video_path)
+        with _in_progress_lock:
+            if filename in _in_progress:
+                raise IngestInProgressError(f"Already ingesting {filename}")
+            _in_progress.add(filename)
+
+        try:
+            # Catalog entry first: it is the probe the ladder is sized from
+            source = get_media_catalog().ingest(video_path, MEDIA_KIND_VIDEO)
+            if source is None or not source['height']:
+                raise RuntimeError(f"Cannot probe {video_path}")
+
+            # Seek index and audio cache for the source; rungs are video-only
+            get_frame_index(video_path)
+            get_audio_track(video_path)
+
+            self._share_renditions(filename, source)
+            existing = {r['height'] for r in self.db.get_renditions(filename)}
+            failed = []
+            for height, bitrate_kbps in RENDITION_LADDER:
+                if height >= source['height'] or height in existing:
+                    continue
+                if not self._transcode(video_path, filename, source, height, bitrate_kbps):
+                    failed.append(height)
+            if failed:
+                raise RuntimeError(f"{filename}: rungs {failed} failed to transcode")
+
+            return self.db.get_renditions(filename)
+        finally:
+            with _in_progress_lock:
+                _in_progress.discard(filename)
+
+    def ingest_async(self, video_path: str):
+        """Run ingest() on a background thread."""
+        threading.Thread(
+            target=self.ingest,
+            args=(video_path,),
+            daemon=True,
+            name=f"Renditions-{os.path.basename(video_path)}"
+        ).start()
+
+    def get_ladder(self, video_path: str, width: int, height: int) -> list:
+        """
+        All playable versions of a video, lowest resolution first.
+        The source itself is always the top rung.
+
+        Args:
+            video_path: Path to the source video
+            width: Source width
+            height: Source height
+
+        Returns:
+            list: Rendition dicts with height, width, bitrate_kbps, path
+        """
+        filename = os.path.basename(video_path)
+        ladder = [
+            r for r in self.db.get_renditions(filename)
+            if r['height'] < height and os.path.exists(r['path'])
+        ]
+        ladder.append({
+            'height': height,
+            'width': width,
+            'bitrate_kbps': None,
+            'path': video_path,
+        })
+        ladder.sort(key=lambda r: r['height'])
+        return ladder
+
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    def _share_renditions(self, filename, source):
+        """Record the renditions of identical videos as this video's own."""
+        if not source.get('content_hash'):
+            return
+        have = {r['height'] for r in self.db.get_renditions(filename)}
+        for other in self.db.find_media_by_hash(MEDIA_KIND_VIDEO, source['content_hash']):
+            if other == filename:
+                continue
+            for r in self.db.get_renditions(other):
+                if r['height'] in have or not os.path.exists(r['path']):
+                    continue
+                self.db.add_rendition(filename, r['height'], r['width'],
+                                      r['bitrate_kbps'], r['path'])
+                have.add(r['height'])
+                print(f"[Renditions] {filename} {r['height']}p shared with {other}")
+
+    def _transcode(self, video_path, filename, source, height, bitrate_kbps) -> bool:
+        """Make one rung. Returns False if ffmpeg failed."""
+        stem = os.path.splitext(filename)[0]
+        out_dir = os.path.join(self.renditions_folder, stem)
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, f"{height}p{RENDITION_EXTENSION}")
+        tmp_path = out_path + TEMP_SUFFIX
+
+        # Keep aspect ratio with an even width (required by libx264)
+        width = int(source['width'] * height / source['height'])
+        width -= width % EVEN_DIMENSION
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', video_path,
+            '-an',
+            '-vf', f'scale={width}:{height}',
+            '-c:v', 'libx264', '-preset', FFMPEG_PRESET,
+            '-b:v', f'{bitrate_kbps}k',
+            '-maxrate', f'{bitrate_kbps}k',
+            '-bufsize', f'{bitrate_kbps * BUFSIZE_FACTOR}k',
+            # One output frame per input frame → indices match the source
+            '-vsync', 'passthrough',
+            '-f', 'mp4', tmp_path,
+        ]
+
+        print(f"[Renditions] {filename} → {height}p @ {bitrate_kbps}k")
+        try:
+            subprocess.run(
+                cmd,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            os.replace(tmp_path, out_path)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"[Renditions] {filename} {height}p failed: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        self.db.add_rendition(filename, height, width, bitrate_kbps, out_path)
+        get_frame_index(out_path)
+        return True
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_manager_instance = None
+
+
+def get_rendition_manager() -> RenditionManager:
+    """Return the shared RenditionManager instance."""
+    global _manager_instance
+    if _manager_instance is None:
+        _manager_instance = RenditionManager()
+    return _manager_instance
@@ -4,6 +4,11 @@ Main Tennis Social server application.
 Routes client requests, manages handlers, and coordinates video/story streaming servers.
 FIXED: Video streaming server starts automatically when RequestMethodsHandler is created.
        No extra code needed in Server.__init__ for video.
+ADDED: Starts the persistent job queue workers (JobQueue / MediaJobs).
+ADDED: Loads and starts the story expiry scheduler (StoryExpiryScheduler).
+ADDED: Connection and request metrics (Metrics), served as Prometheus text
+       on localhost; GET_SERVER_STATS is answered only after an admin LOGIN
+       on the same connection.
 """
 import socket
 import json
@@ -13,7 +18,12 @@ import os
 import key_exchange
 from Protocol import Protocol
 from Methods import RequestMethodsHandler
+from JobQueue import get_job_queue
+from MediaJobs import register_media_jobs, enqueue_video_backfill
+from Stories_Handler import StoriesHandler
+from StoryExpiryScheduler import get_story_expiry_scheduler
 from handle_show_all_stories import run as run_stories_display_server
+from Metrics import get_metrics, ensure_metrics_http_server_running
 
 try:
     from handle_show_all_videos import run as run_videos_display_server
@@ -37,6 +47,29 @@ KEY_TYPE = 'type'
 KEY_PAYLOAD = 'payload'
 KEY_STATUS = 'status'
 KEY_MESSAGE = 'message'
+KEY_IS_ADMIN = 'is_admin'
+
+STATUS_SUCCESS = 'success'
+STATUS_ERROR = 'error'
+REQUEST_LOGIN = 'LOGIN'
+ADMIN_REQUESTS = frozenset(('GET_SERVER_STATS',))
+MESSAGE_ADMIN_REQUIRED = "Admin login required"
+
+_connections_active = get_metrics().gauge(
+    "connections_active", "Clients connected to the main server"
+)
+_connections_total = get_metrics().counter(
+    "connections_total", "Clients accepted by the main server"
+)
+_request_seconds = get_metrics().histogram(
+    "request_seconds", "Request handled to response sent on the main server"
+)
+_admin_rejections = get_metrics().counter(
+    "admin_rejections_total", "Admin requests refused for a non-admin session"
+)
+_threads_active = get_metrics().gauge(
+    "threads_active", "Threads alive in the server process"
+)
 
 
 class Server:
@@ -66,6 +99,23 @@ class Server:
         self.start_video_thumbnail_server()
         self.start_story_thumbnail_server()
 
+        # Background media jobs (ingest), then backfill videos uploaded
+        # before ingest existed
+        register_media_jobs()
+        get_job_queue().start()
+        enqueue_video_backfill(VIDEO_FOLDER)
+
+        # Each story is deleted when it expires
+        StoriesHandler().load_expiry_schedule()
+        get_story_expiry_scheduler().start()
+
+        # Metrics for scraping, on localhost only
+        _threads_active.set_function(threading.active_count)
+        try:
+            ensure_metrics_http_server_running()
+        except OSError as e:
+            print(f"[WARN] Metrics endpoint not available: {e}")
+
         try:
             self._run_server_loop()
         except KeyboardInterrupt:
@@ -162,6 +212,9 @@ class Server:
 
     def handle_client(self, client_socket: socket.socket, addr: tuple):
         conn = (client_socket, None)
+        is_admin = False
+        _connections_total.inc()
+        _connections_active.inc()
         try:
             # Key exchange (server role)
             print(f"[{addr}] Key exchange...")
@@ -175,10 +228,24 @@ class Server:
                     print(f"[{addr}] Client disconnected")
                     break
 
-                print(f"[{addr}] Request: {request_data.get('type')}")
-                response = self.methods_handler.route_request(request_data)
+                request_type = request_data.get(KEY_TYPE)
+                print(f"[{addr}] Request: {request_type}")
+                started = time.monotonic()
+
+                if request_type in ADMIN_REQUESTS and not is_admin:
+                    _admin_rejections.inc()
+                    response = {KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: MESSAGE_ADMIN_REQUIRED}
+                else:
+                    response = self.methods_handler.route_request(request_data)
+
+                # The session is the last user who logged in on it
+                if request_type == REQUEST_LOGIN:
+                    is_admin = (response.get(KEY_STATUS) == STATUS_SUCCESS
+                                and bool(response.get(KEY_IS_ADMIN)))
 
-                if not self._send_response(conn, response, addr):
+                sent = self._send_response(conn, response, addr)
+                _request_seconds.observe(time.monotonic() - started)
+                if not sent:
                     print(f"[{addr}] Send failed - client disconnected")
                     break
 
@@ -194,6 +261,7 @@ class Server:
             import traceback
             traceback.print_exc()
         finally:
+            _connections_active.dec()
             self._close_client_socket(client_socket, addr)
 
     def _receive_request(self, conn, addr) -> dict:
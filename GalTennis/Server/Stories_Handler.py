@@ -3,12 +3,21 @@ Gal Haham
 Story management system with 24-hour expiration.
 Handles story creation, retrieval, and automatic cleanup of expired content.
 NOW USES DBManager for all database operations.
+ADDED: Expired stories also drop their cached audio track and catalog entry
+CHANGED: Expired story files are detached from the BlobStore (the shared
+         blob is deleted with its last story)
+CHANGED: Stories carry expires_at and are deleted (row and files together)
+         by the StoryExpiryScheduler at that moment; GET_STORIES is a read
+         of the expires_at index with no folder scan. Files saved by the
+         upload server get their own story row (register_story_file)
+ADDED: A successful add returns the story record ('story'), so the
+       upload server can acknowledge a post with it
 """
 import time
 import os
-from datetime import datetime, timedelta
 from pathlib import Path
 from Db_manager import get_db_manager
+from StoryExpiryScheduler import get_story_expiry_scheduler
 
 # Folder paths
 STORIES_FOLDER = "stories"
@@ -16,6 +25,8 @@ STORY_FOLDER = "stories"
 
 # Time constants
 HOURS_IN_A_DAY = 24
+SECONDS_IN_AN_HOUR = 60 * 60
+STORY_LIFETIME_SECONDS = HOURS_IN_A_DAY * SECONDS_IN_AN_HOUR
 
 # Array indices
 FILE_EXTENSION_INDEX = 1
@@ -23,8 +34,6 @@ FIRST_PART_INDEX = 0
 
 # Minimum counts
 MIN_PARTS_WITH_SEPARATOR = 1
-ZERO_DELETED_FILES = 0
-ZERO_DELETED_STORIES = 0
 
 # Content types
 CONTENT_TYPE_IMAGE = 'image'
@@ -39,19 +48,12 @@ STATUS_ERROR = "error"
 MSG_MISSING_DATA = "Missing username or filename"
 MSG_ERROR_PREFIX = "Error: "
 MSG_DELETED_TEMPLATE = "Deleted {} expired stories."
-MSG_CLEANUP_INFO = "[INFO] Cleanup: Deleted {} DB records and {} files"
-MSG_CLEANUP_STARTING = "[INFO] Running auto-cleanup of expired stories..."
-MSG_CLEANUP_COMPLETED = "[INFO] Cleaned up {} expired stories"
-MSG_DELETED_FILE = "[INFO] Deleted expired story file: {}"
-MSG_DELETE_WARNING = "[WARN] Could not delete {}: {}"
+MSG_CLEANUP_INFO = "[INFO] Cleanup: Deleted {} expired stories"
 MSG_ERROR_DELETE = "[ERROR] delete_expired_stories: {}"
 MSG_ERROR_GET_STORIES = "[ERROR] get_stories_from_folder: {}"
 MSG_FOUND_STORIES = "[INFO] Found {} active stories (within 24 hours)"
 MSG_UNKNOWN_REQUEST = "Unknown request type."
 
-# Database query dates
-EARLIEST_DATE = "1900-01-01 00:00:00"
-
 # Date format
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
@@ -80,8 +82,14 @@ KEY_FILE_PATH = 'file_path'
 KEY_TIMESTAMP = 'timestamp'
 KEY_UNIQUE_FILENAME = 'unique_filename'
 KEY_DELETED_DB = 'deleted_db'
-KEY_DELETED_FILES = 'deleted_files'
 KEY_STORIES = 'stories'
+KEY_ID = 'id'
+KEY_STORY_ID = 'story_id'
+KEY_EXPIRES_AT = 'expires_at'
+KEY_STORY = 'story'
+
+# Prefix of files saved by the story upload server
+STORY_FILE_PREFIX = 'story_'
 
 # Request types
 REQUEST_ADD_STORY = "ADD_STORY"
@@ -91,11 +99,9 @@ REQUEST_DELETE_EXPIRED = "DELETE_EXPIRED_STORIES"
 # Default values
 DEFAULT_CONTENT_TYPE = 'photo'
 DEFAULT_USERNAME = "Unknown"
-DEFAULT_DELETED_COUNT = 0
 
 # Comparison values
 NO_DELETIONS = 0
-SORT_REVERSE = True
 
 
 class StoriesHandler:
@@ -138,35 +144,100 @@ class StoriesHandler:
         ext = os.path.splitext(filename)[FILE_EXTENSION_INDEX]
         unique_filename = f"{username}_{timestamp}{ext}"
 
-        # Get current time as string
-        current_time = time.strftime(DATE_FORMAT)
+        result = self._add_and_schedule(
+            username, content_type, filename, unique_filename, time.time()
+        )
+
+        if result.get(KEY_STATUS) == STATUS_SUCCESS:
+            result[KEY_UNIQUE_FILENAME] = unique_filename
+
+        return result
 
-        # Use DBManager to add story
+    def register_story_file(self, file_path, username, content_type):
+        """
+        Adds the story row of a media file saved by the upload server,
+        so it is listed by GET_STORIES and expires with its file.
+
+        Args:
+            file_path: Saved story file (in the stories folder)
+            username: Story creator
+            content_type: 'image' or 'video'
+
+        Returns:
+            dict: DBManager result (with story_id and the story record
+                  on success)
+        """
+        name = os.path.basename(file_path)
+        return self._add_and_schedule(username, content_type, name, name, time.time())
+
+    def _add_and_schedule(self, username, content_type, content, filename, created):
+        expires_at = created + STORY_LIFETIME_SECONDS
+        timestamp = time.strftime(DATE_FORMAT, time.localtime(created))
         result = self.db.add_story(
             username=username,
             content_type=content_type,
-            content=filename,
-            filename=unique_filename,
-            timestamp=current_time
+            content=content,
+            filename=filename,
+            timestamp=timestamp,
+            expires_at=expires_at
         )
-
         if result.get(KEY_STATUS) == STATUS_SUCCESS:
-            result[KEY_UNIQUE_FILENAME] = unique_filename
-
+            get_story_expiry_scheduler().schedule(
+                result[KEY_STORY_ID], expires_at, self._story_paths(content, filename)
+            )
+            # Same fields as a GET_STORIES entry
+            result[KEY_STORY] = {
+                KEY_ID: result[KEY_STORY_ID],
+                KEY_FILENAME: filename,
+                KEY_USERNAME: username,
+                KEY_TIMESTAMP: timestamp,
+                KEY_CONTENT_TYPE: content_type,
+                KEY_EXPIRES_AT: expires_at,
+            }
         return result
 
+    def load_expiry_schedule(self):
+        """
+        Rebuild the expiry schedule at startup: every story row is
+        scheduled (rows from before expires_at existed get it from their
+        timestamp), and media files with no row - saved by older server
+        versions - are registered with their mtime as creation time.
+        Anything already expired is deleted right away.
+        """
+        scheduler = get_story_expiry_scheduler()
+        known_files = set()
+        for story in self.db.get_all_stories():
+            expires_at = story[KEY_EXPIRES_AT]
+            if expires_at is None:
+                expires_at = self._timestamp_to_epoch(story[KEY_TIMESTAMP]) + STORY_LIFETIME_SECONDS
+                self.db.set_story_expiry(story[KEY_ID], expires_at)
+            scheduler.schedule(
+                story[KEY_ID], expires_at,
+                self._story_paths(story[KEY_CONTENT], story[KEY_FILENAME])
+            )
+            known_files.update((story[KEY_CONTENT], story[KEY_FILENAME]))
+
+        self._ensure_stories_folder()
+        for filename in sorted(os.listdir(STORY_FOLDER)):
+            if filename in known_files or not self._is_media_file(filename):
+                continue
+            file_path = os.path.join(STORY_FOLDER, filename)
+            self._add_and_schedule(
+                self._username_from_filename(filename),
+                self._content_type_from_filename(filename),
+                filename, filename, os.path.getmtime(file_path)
+            )
+
+        expired = scheduler.expire_due()
+        if expired > NO_DELETIONS:
+            print(MSG_CLEANUP_INFO.format(expired))
+
     def get_stories(self, payload):
         """
         Retrieves all stories from the last 24 hours using DBManager.
         Returns file paths for image/video stories.
         """
-        # Calculate 24 hours ago
-        twenty_four_hours_ago = (
-            datetime.now() - timedelta(hours=HOURS_IN_A_DAY)
-        ).strftime(DATE_FORMAT)
-
-        # Use DBManager to get stories
-        stories_data = self.db.get_stories(twenty_four_hours_ago)
+        stories_data = self.db.get_active_stories(time.time())
 
         # Add file paths for media stories
         stories = []
@@ -188,64 +259,20 @@ class StoriesHandler:
 
     def delete_expired_stories(self):
         """
-        Deletes stories older than 24 hours from both database and disk.
-        Uses DBManager for database operations.
+        Deletes the stories that are due now (database rows and files).
+        The scheduler does this on its own at each expiry time; this
+        request only forces it.
         """
-        cutoff = (
-                datetime.now() - timedelta(hours=HOURS_IN_A_DAY)
-        ).strftime(DATE_FORMAT)
-
         try:
-            # Get expired stories before deleting (to delete files)
-            expired_stories = self.db.get_stories(EARLIEST_DATE)
-
-            # Filter to only expired ones and delete their files
-            deleted_files = ZERO_DELETED_FILES
-            for story in expired_stories:
-                if (
-                        story[KEY_TIMESTAMP] <= cutoff and
-                        story[KEY_CONTENT_TYPE] in [
-                            CONTENT_TYPE_IMAGE,
-                            CONTENT_TYPE_VIDEO,
-                        ]
-                ):
-                    # Try with 'content' field
-                    file_path = os.path.join(
-                        STORIES_FOLDER,
-                        story.get(KEY_CONTENT, "")
-                    )
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            deleted_files += 1
-                            print(MSG_DELETED_FILE.format(file_path))
-                        except Exception as e:
-                            print(MSG_DELETE_WARNING.format(file_path, e))
-
-                    # Also try with 'filename' field
-                    file_path = os.path.join(
-                        STORIES_FOLDER,
-                        story.get(KEY_FILENAME, "")
-                    )
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            deleted_files += 1
-                            print(MSG_DELETED_FILE.format(file_path))
-                        except Exception as e:
-                            print(MSG_DELETE_WARNING.format(file_path, e))
-
-            # Use DBManager to delete expired stories from DB
-            deleted_count = self.db.delete_old_stories(cutoff)
-
-            if deleted_count > NO_DELETIONS or deleted_files > NO_DELETIONS:
-                print(MSG_CLEANUP_INFO.format(deleted_count, deleted_files))
+            deleted_count = get_story_expiry_scheduler().expire_due()
+
+            if deleted_count > NO_DELETIONS:
+                print(MSG_CLEANUP_INFO.format(deleted_count))
 
             return {
                 KEY_STATUS: STATUS_SUCCESS,
                 KEY_MESSAGE: MSG_DELETED_TEMPLATE.format(deleted_count),
-                KEY_DELETED_DB: deleted_count,
-                KEY_DELETED_FILES: deleted_files
+                KEY_DELETED_DB: deleted_count
             }
 
         except Exception as e:
@@ -257,89 +284,22 @@ class StoriesHandler:
 
     def get_stories_from_folder(self):
         """
-        Returns a combined list of story metadata from filesystem and database.
-        This is a helper method for compatibility with existing code.
+        Returns the active stories whose media file is on disk, newest
+        first. A read of the expires_at index - expired stories are
+        deleted by the StoryExpiryScheduler, not here.
         """
         try:
-            print(MSG_CLEANUP_STARTING)
-            cleanup_result = self.delete_expired_stories()
-            if cleanup_result.get(KEY_STATUS) == STATUS_SUCCESS:
-                deleted = cleanup_result.get(
-                    KEY_DELETED_DB,
-                    DEFAULT_DELETED_COUNT,
-                )
-                if deleted > NO_DELETIONS:
-                    print(MSG_CLEANUP_COMPLETED.format(deleted))
-
-            if not os.path.exists(STORY_FOLDER):
-                os.makedirs(STORY_FOLDER)
-
-            # Get files from folder
-            files_in_folder = set(os.listdir(STORY_FOLDER))
-            valid_extensions = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
-            media_files = {
-                f
-                for f in files_in_folder
-                if (
-                        os.path.splitext(f)[FILE_EXTENSION_INDEX].lower()
-                        in valid_extensions
-                )
-            }
-            stories = []
-
-            # Get recent stories from DB (last 24 hours)
-            cutoff = (
-                datetime.now() - timedelta(hours=HOURS_IN_A_DAY)
-            ).strftime(DATE_FORMAT)
-
-            db_stories = self.db.get_stories(cutoff)
-
-            # Add DB stories that exist in folder
-            for story in db_stories:
-                if story[KEY_FILENAME] in media_files:
-                    stories.append({
-                        KEY_FILENAME: story[KEY_FILENAME],
-                        KEY_USERNAME: story[KEY_USERNAME],
-                        KEY_TIMESTAMP: story[KEY_TIMESTAMP],
-                        KEY_CONTENT_TYPE: story[KEY_CONTENT_TYPE]
-                    })
-
-            # Add files that exist in folder but not in DB
-            for filename in media_files:
-                if not any(s[KEY_FILENAME] == filename for s in stories):
-                    file_path = os.path.join(STORY_FOLDER, filename)
-                    file_stat = os.stat(file_path)
-                    file_timestamp = datetime.fromtimestamp(file_stat.st_mtime)
-                    timestamp = file_timestamp.strftime(DATE_FORMAT)
-
-                    # Check if file is within 24 hours
-                    if file_timestamp > (
-                            datetime.now() - timedelta(hours=HOURS_IN_A_DAY)
-                    ):
-                        # Extract username from filename
-                        username_parts = filename.split('_')
-                        username = (
-                            username_parts[FIRST_PART_INDEX]
-                            if len(username_parts) > MIN_PARTS_WITH_SEPARATOR
-                            else DEFAULT_USERNAME
-                        )
-
-                        # Determine content type
-                        ext = Path(filename).suffix.lower()
-                        content_type = (
-                            CONTENT_TYPE_VIDEO
-                            if ext in VIDEO_EXTENSIONS
-                            else CONTENT_TYPE_PHOTO
-                        )
-                        stories.append({
-                            KEY_FILENAME: filename,
-                            KEY_USERNAME: username,
-                            KEY_TIMESTAMP: timestamp,
-                            KEY_CONTENT_TYPE: content_type
-                        })
-
-            # Sort by timestamp (newest first)
-            stories.sort(key=lambda x: x[KEY_TIMESTAMP], reverse=SORT_REVERSE)
+            stories = [
+                {
+                    KEY_FILENAME: story[KEY_FILENAME],
+                    KEY_USERNAME: story[KEY_USERNAME],
+                    KEY_TIMESTAMP: story[KEY_TIMESTAMP],
+                    KEY_CONTENT_TYPE: story[KEY_CONTENT_TYPE]
+                }
+                for story in self.db.get_active_stories(time.time())
+                if story[KEY_FILENAME]
+                and os.path.exists(os.path.join(STORY_FOLDER, story[KEY_FILENAME]))
+            ]
 
             print(MSG_FOUND_STORIES.format(len(stories)))
             return {KEY_STATUS: STATUS_SUCCESS, KEY_STORIES: stories}
@@ -354,6 +314,40 @@ class StoriesHandler:
                 KEY_STORIES: [],
             }
 
+    # ── Helpers ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _story_paths(content, filename):
+        names = {name for name in (content, filename) if name}
+        return [os.path.join(STORIES_FOLDER, name) for name in sorted(names)]
+
+    @staticmethod
+    def _timestamp_to_epoch(timestamp):
+        return time.mktime(time.strptime(timestamp, DATE_FORMAT))
+
+    @staticmethod
+    def _is_media_file(filename):
+        ext = os.path.splitext(filename)[FILE_EXTENSION_INDEX].lower()
+        return ext in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+
+    @staticmethod
+    def _content_type_from_filename(filename):
+        ext = Path(filename).suffix.lower()
+        return CONTENT_TYPE_VIDEO if ext in VIDEO_EXTENSIONS else CONTENT_TYPE_IMAGE
+
+    @staticmethod
+    def _username_from_filename(filename):
+        """'story_<user>_<ts>.jpg' or '<user>_<ts>.jpg' -> user."""
+        stem = Path(filename).stem
+        if stem.startswith(STORY_FILE_PREFIX):
+            stem = stem[len(STORY_FILE_PREFIX):]
+        username_parts = stem.rsplit('_', 1)
+        return (
+            username_parts[FIRST_PART_INDEX]
+            if len(username_parts) > MIN_PARTS_WITH_SEPARATOR
+            else DEFAULT_USERNAME
+        )
+
     def handle_request(self, request_type, payload):
         """Dispatches request to the matching handler."""
         if request_type == REQUEST_ADD_STORY:
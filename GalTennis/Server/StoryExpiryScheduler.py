@@ -0,0 +1,138 @@
+"""
+Gal Haham
+Story Expiry Scheduler - deletes each story exactly when it expires.
+Every story is pushed on a min-heap keyed by its expires_at; one thread
+sleeps until the head of the heap is due, then removes the story's
+files (BlobStore detach, cached audio track, catalog entry, thumbnail)
+and its database row together. Nothing scans the stories table or
+the stories folder per request any more.
+
+    schedule(story_id, expires_at, paths)   called when a story is added
+    expire_due()                            run the expiries that are due
+
+Schedules are not persisted: the heap is rebuilt from the stories table
+at startup (StoriesHandler.load_expiry_schedule), which also expires
+anything that came due while the server was down.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from Db_manager import get_db_manager, MEDIA_KIND_STORY
+from BlobStore import get_blob_store
+from AudioTrackCache import discard_audio_track
+from MediaCatalog import get_media_catalog
+from StoryNormalizer import discard_thumbnail
+
+IDLE_WAIT_SECONDS = 3600.0     # Nothing scheduled: re-check once an hour
+
+
+class StoryExpiryScheduler:
+    """Min-heap of (expires_at, story) served by one timer thread."""
+
+    def __init__(self):
+        self.db = get_db_manager()
+        self._heap = []
+        self._seq = itertools.count()     # Tie-break for equal expiry times
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def schedule(self, story_id: int, expires_at: float, paths=()):
+        """
+        Expire a story at expires_at.
+
+        Args:
+            story_id: Row id in the stories table
+            expires_at: Expiry time (seconds since epoch)
+            paths: Media files of the story to delete with it
+        """
+        with self._wakeup:
+            is_new_head = not self._heap or expires_at < self._heap[0][0]
+            heapq.heappush(
+                self._heap, (expires_at, next(self._seq), story_id, tuple(paths))
+            )
+            if is_new_head:
+                self._wakeup.notify()
+
+    def start(self):
+        """Start the timer thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="StoryExpiry"
+        )
+        self._thread.start()
+        print(f"[StoryExpiry] Scheduler started ({len(self._heap)} stories)")
+
+    def stop(self):
+        self._running = False
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def expire_due(self, now: float = None) -> int:
+        """
+        Expire every story whose time has come.
+
+        Returns:
+            int: Number of stories expired
+        """
+        now = time.time() if now is None else now
+        expired = 0
+        while True:
+            with self._wakeup:
+                if not self._heap or self._heap[0][0] > now:
+                    return expired
+                _, _, story_id, paths = heapq.heappop(self._heap)
+            self._expire(story_id, paths)
+            expired += 1
+
+    def pending(self) -> int:
+        """Number of stories waiting to expire."""
+        with self._wakeup:
+            return len(self._heap)
+
+    # ── Timer thread ──────────────────────────────────────────────────────────
+
+    def _run(self):
+        while self._running:
+            self.expire_due()
+            with self._wakeup:
+                timeout = IDLE_WAIT_SECONDS
+                if self._heap:
+                    timeout = min(timeout, max(self._heap[0][0] - time.time(), 0))
+                if timeout > 0:
+                    self._wakeup.wait(timeout)
+
+    def _expire(self, story_id: int, paths: tuple):
+        for path in paths:
+            try:
+                if os.path.exists(path):
+                    get_blob_store().detach(path, MEDIA_KIND_STORY)
+                    print(f"[StoryExpiry] Deleted expired story file: {path}")
+                discard_audio_track(path)
+                discard_thumbnail(path)
+                get_media_catalog().forget(path, MEDIA_KIND_STORY)
+            except Exception as e:
+                print(f"[StoryExpiry] Could not delete {path}: {e}")
+        if story_id is not None:
+            self.db.delete_story(story_id)
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_story_expiry_scheduler() -> StoryExpiryScheduler:
+    """Return the shared StoryExpiryScheduler instance."""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            _scheduler_instance = StoryExpiryScheduler()
+        return _scheduler_instance
@@ -0,0 +1,188 @@
+"""
+Gal Haham
+Story Normalizer - puts uploaded stories in their playback format once.
+The story player shows every story at PLAYBACK_WIDTH x PLAYBACK_HEIGHT;
+instead of resizing each frame on every view, the ingest_story job
+(MediaJobs) makes a normalized copy of each new story and moves the
+story onto it:
+
+    image   resized with cv2 and re-encoded as JPEG
+    video   scaled by one ffmpeg pass (H.264 + AAC, audio kept)
+
+Each story also gets its grid thumbnail (first frame, longest side
+THUMBNAIL_MAX_SIZE) written to story_thumbs/ by the same job, so the
+thumbnail server only reads a small JPEG. The thumbnail is deleted with
+the story.
+CHANGED: Runs in the ingest_story job after the upload is acknowledged,
+         on a copy (the story file is a link to its blob)
+"""
+import os
+import shutil
+import subprocess
+import cv2
+
+PLAYBACK_WIDTH = 640
+PLAYBACK_HEIGHT = 480
+THUMBNAIL_MAX_SIZE = 200
+JPEG_QUALITY = 90
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+THUMBNAILS_FOLDER = os.path.join(_SERVER_DIR, "story_thumbs")
+
+MEDIA_TYPE_VIDEO = 'video'
+JPEG_EXTENSION = '.jpg'
+NORMALIZED_SUFFIX = ".norm"
+WORK_SUFFIX = ".work"
+FFMPEG_PRESET = "veryfast"
+IMAGE_SHAPE_SLICE_2D = 2
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+
+def normalized_copy(path: str, media_type: str):
+    """
+    Make a playback-format copy of a story, leaving the story untouched.
+
+    Args:
+        path: Story file
+        media_type: 'video' or 'image'
+
+    Returns:
+        str: Path of the copy (the caller takes it over), or None if the
+             story cannot be normalized
+    """
+    work_path = path + WORK_SUFFIX
+    try:
+        shutil.copyfile(path, work_path)
+    except OSError as e:
+        print(f"[StoryNormalizer] Cannot copy {path}: {e}")
+        return None
+    if normalize(work_path, media_type):
+        return work_path
+    os.remove(work_path)
+    return None
+
+
+def normalize(path: str, media_type: str) -> bool:
+    """
+    Rewrite a file in place at the playback resolution.
+
+    Args:
+        path: Story file not linked to a blob (see normalized_copy)
+        media_type: 'video' or 'image'
+
+    Returns:
+        bool: True if the file is now in playback format
+    """
+    if media_type == MEDIA_TYPE_VIDEO:
+        return _normalize_video(path)
+    return _normalize_image(path)
+
+
+def _normalize_image(path: str) -> bool:
+    img = cv2.imread(path)
+    if img is None:
+        print(f"[StoryNormalizer] Cannot read image {path}")
+        return False
+    if img.shape[:IMAGE_SHAPE_SLICE_2D] != (PLAYBACK_HEIGHT, PLAYBACK_WIDTH):
+        img = cv2.resize(img, (PLAYBACK_WIDTH, PLAYBACK_HEIGHT),
+                         interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(JPEG_EXTENSION, img,
+                              [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        return False
+    with open(path, 'wb') as f:
+        f.write(buffer.tobytes())
+    return True
+
+
+def _normalize_video(path: str) -> bool:
+    tmp_path = path + NORMALIZED_SUFFIX
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', path,
+        '-vf', f'scale={PLAYBACK_WIDTH}:{PLAYBACK_HEIGHT}',
+        '-c:v', 'libx264', '-preset', FFMPEG_PRESET,
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        # One output frame per input frame → story length is unchanged
+        '-vsync', 'passthrough',
+        '-movflags', '+faststart',
+        '-f', 'mp4', tmp_path,
+    ]
+    try:
+        subprocess.run(
+            cmd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        os.replace(tmp_path, path)
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"[StoryNormalizer] Video normalization failed for {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+# ── Thumbnails ────────────────────────────────────────────────────────────────
+
+def thumbnail_path(story_path: str) -> str:
+    """Where the thumbnail of a story is kept."""
+    return os.path.join(THUMBNAILS_FOLDER, os.path.basename(story_path) + JPEG_EXTENSION)
+
+
+def make_thumbnail(story_path: str):
+    """
+    Write the first-frame thumbnail of a story.
+
+    Returns:
+        bytes: The JPEG, or None if the story cannot be read
+    """
+    cap = cv2.VideoCapture(story_path)      # Reads still images too
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        frame = cv2.imread(story_path)
+        if frame is None:
+            return None
+
+    height, width = frame.shape[:IMAGE_SHAPE_SLICE_2D]
+    scale = THUMBNAIL_MAX_SIZE / max(height, width)
+    frame = cv2.resize(frame, (int(width * scale), int(height * scale)),
+                       interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(JPEG_EXTENSION, frame)
+    if not ok:
+        return None
+
+    data = buffer.tobytes()
+    os.makedirs(THUMBNAILS_FOLDER, exist_ok=True)
+    path = thumbnail_path(story_path)
+    with open(path + NORMALIZED_SUFFIX, 'wb') as f:
+        f.write(data)
+    os.replace(path + NORMALIZED_SUFFIX, path)
+    return data
+
+
+def get_thumbnail(story_path: str):
+    """
+    The stored thumbnail of a story, made now for stories saved before
+    thumbnails were precomputed.
+
+    Returns:
+        bytes: JPEG data, or None
+    """
+    try:
+        with open(thumbnail_path(story_path), 'rb') as f:
+            return f.read()
+    except OSError:
+        return make_thumbnail(story_path)
+
+
+def discard_thumbnail(story_path: str):
+    """Delete the thumbnail of a removed story."""
+    try:
+        os.remove(thumbnail_path(story_path))
+    except OSError:
+        pass
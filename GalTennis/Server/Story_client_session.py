@@ -2,38 +2,55 @@
 Gal Haham
 Story Client Session
 Handles a single connected client - runs in its own thread.
-Pipeline: pickle → zlib.compress → AES.encrypt → Protocol.send_bin
+Pipeline: media_packet → zlib.compress → AES.encrypt → Protocol.send_bin
+ADDED: Client control channel (see StreamControl) - video stories can be
+       paused, sought and played at another rate.
+CHANGED: Binary media_packet format instead of pickle
+CHANGED: Frames paced by FramePacer (monotonic deadlines + fast-start burst)
+CHANGED: Audio read from the AudioTrackCache memmap instead of ffprobe +
+         an ffmpeg pipe per viewer
+CHANGED: Video story info comes from the media catalog
+CHANGED: No per-frame resize - stories are stored at the playback size
+         (StoryNormalizer) and frames are sent as decoded
+CHANGED: Image stories are sent once, as JPEG, with a display duration
+         instead of as 150 raw frames
+ADDED: Playlists - several stories back to back on one session. Each
+       starts with its info packet (index / count) and a fast-start
+       burst, so the client can prefetch it while the previous one plays.
+FIXED: Stories not yet normalized (ingest job pending or failed) are
+       resized to the playback size here, per frame / per image
 """
 import os
 import cv2
-import time
-import pickle
-import zlib
-import subprocess
-import numpy as np
 import key_exchange
 import aes_cipher
+import media_packet
 from Protocol import Protocol
+from StreamControl import StreamControl, DEFAULT_RATE
+from FrameIndex import get_frame_index
+from FramePacer import FramePacer
+from AudioTrackCache import get_audio_track
+from MediaCatalog import get_media_catalog
+from StoryNormalizer import PLAYBACK_WIDTH, PLAYBACK_HEIGHT
+from Db_manager import MEDIA_KIND_STORY
 
-MAX_SPLIT_COUNT = 1
 DEFAULT_AUDIO_SAMPLE_RATE = 44100
 DEFAULT_AUDIO_CHANNELS = 2
 DEFAULT_FPS = 20.0
 MAXIMUM_FPS_LIMIT = 20.0
 MINIMUM_FPS_LIMIT = 0
-SECONDS_IN_ONE_UNIT = 1.0
-BYTES_PER_SAMPLE_16_BIT = 2
 INITIAL_COUNT = 0
-TARGET_FRAME_HEIGHT = 480
-TARGET_FRAME_WIDTH = 640
 STORY_TOTAL_FRAME_COUNT = 150
-LARGE_IO_BUFFER_SIZE_BYTES = 100_000_000
 INCREMENT_STEP = 1
 TARGET_FPS = 20
-MINIMUM_DELAY_SECONDS = 0
 FILE_EXTENSION_INDEX = 1
+IMAGE_SHAPE_SLICE_2D = 2
 KEY_INDEX = 1
 COMPRESS_LEVEL = 1
+NO_COMPRESSION = 0
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+IMAGE_DISPLAY_SECONDS = STORY_TOTAL_FRAME_COUNT / DEFAULT_FPS
+IMAGE_TOTAL_FRAMES = 1
 
 
 class StoryClientSession:
@@ -44,14 +61,15 @@ class StoryClientSession:
         self.addr = addr
         self.session_id = session_id
         self.encrypted_conn = None
+        self.control = None
+        self._playlist_info = {}    # index / count added to each story info
 
     # ── Core send pipeline ────────────────────────────────────────────────────
 
-    def _send_compressed_encrypted(self, obj) -> bool:
-        """pickle → zlib.compress → AES.encrypt → Protocol.send_bin"""
+    def _send_compressed_encrypted(self, parts: list, level: int = COMPRESS_LEVEL) -> bool:
+        """media_packet parts → zlib.compress → AES.encrypt → Protocol.send_bin"""
         try:
-            raw = pickle.dumps(obj)
-            compressed = zlib.compress(raw, level=COMPRESS_LEVEL)
+            compressed = media_packet.compress(parts, level)
             encryption_key = self.encrypted_conn[KEY_INDEX]
             if encryption_key:
                 payload = aes_cipher.AESCipher.encrypt(encryption_key, compressed)
@@ -72,6 +90,7 @@ class StoryClientSession:
             temp_conn = (self.client_socket, None)
             key = key_exchange.KeyExchange.recv_send_key(temp_conn)
             self.encrypted_conn = (self.client_socket, key)
+            self.control = StreamControl(self.encrypted_conn, self.session_id)
             print(f"[StorySession #{self.session_id}] Encryption ready ({len(key)} bytes)")
             return True
         except Exception as e:
@@ -80,6 +99,23 @@ class StoryClientSession:
 
     # ── Story dispatching ─────────────────────────────────────────────────────
 
+    def stream_playlist(self, story_paths: list):
+        """
+        Stream several stories in order on this connection. The next story
+        is sent as soon as the previous one is; the client's bounded
+        buffer (TCP backpressure) limits how far ahead that gets.
+        """
+        self.control.start()
+        count = len(story_paths)
+        for index, story_path in enumerate(story_paths):
+            if self.control.closed.is_set():
+                break
+            self._playlist_info = {'index': index, 'count': count}
+            if self.control.skipped(index):
+                continue
+            self.stream_story(story_path)
+        print(f"[StorySession #{self.session_id}] Playlist done ({count} stories)")
+
     def stream_story(self, story_path: str):
         ext = os.path.splitext(story_path)[FILE_EXTENSION_INDEX].lower()
         is_image = ext in ['.jpg', '.jpeg', '.png', '.bmp']
@@ -95,36 +131,58 @@ class StoryClientSession:
     # ── Image story ───────────────────────────────────────────────────────────
 
     def _send_image_story(self, image_path: str):
-        img = cv2.imread(image_path)
-        if img is None:
+        """
+        Send the image once, as JPEG, with how long to show it. The
+        client shows it (and handles pause) on its own.
+        """
+        image = self._load_jpeg(image_path)
+        if image is None:
             print(f"[StorySession #{self.session_id}] Cannot read image")
             return
-
-        img = cv2.resize(img, (TARGET_FRAME_WIDTH, TARGET_FRAME_HEIGHT))
+        jpeg, height, width = image
 
         story_info = {
             'type': 'IMAGE',
-            'width': TARGET_FRAME_WIDTH,
-            'height': TARGET_FRAME_HEIGHT,
+            'width': width,
+            'height': height,
             'fps': DEFAULT_FPS,
-            'total_frames': STORY_TOTAL_FRAME_COUNT,
+            'total_frames': IMAGE_TOTAL_FRAMES,
+            'display_seconds': IMAGE_DISPLAY_SECONDS,
             'has_audio': False,
             'compressed': True,
         }
+        story_info.update(self._playlist_info)
 
-        if not self._send_compressed_encrypted(story_info):
+        if not self._send_compressed_encrypted(media_packet.pack_info(story_info)):
             return
-
-        print(f"[StorySession #{self.session_id}] Sending {STORY_TOTAL_FRAME_COUNT} image frames...")
-        frame_delay = SECONDS_IN_ONE_UNIT / DEFAULT_FPS
-
-        for i in range(STORY_TOTAL_FRAME_COUNT):
-            packet = {'frame': img, 'audio': None, 'frame_number': i}
-            if not self._send_compressed_encrypted(packet):
-                return
-            time.sleep(frame_delay)
-
-        print(f"[StorySession #{self.session_id}] Image story done")
+        # Already compressed by JPEG: zlib only stores it
+        if self._send_compressed_encrypted(media_packet.pack_image(jpeg, height, width),
+                                           NO_COMPRESSION):
+            print(f"[StorySession #{self.session_id}] Image story sent "
+                  f"({len(jpeg)} bytes, {IMAGE_DISPLAY_SECONDS:.1f}s)")
+
+    @staticmethod
+    def _load_jpeg(image_path: str):
+        """
+        Returns:
+            tuple: (jpeg bytes, height, width), or None if unreadable.
+                   Stored stories are JPEG already and are sent as is.
+        """
+        ext = os.path.splitext(image_path)[FILE_EXTENSION_INDEX].lower()
+        entry = get_media_catalog().lookup(image_path, MEDIA_KIND_STORY)
+        if ext in JPEG_EXTENSIONS and _is_playback_size(entry):
+            with open(image_path, 'rb') as f:
+                return f.read(), PLAYBACK_HEIGHT, PLAYBACK_WIDTH
+
+        # Not normalized yet (or normalization failed): resize here
+        img = cv2.imread(image_path)
+        if img is None:
+            return None
+        if img.shape[:IMAGE_SHAPE_SLICE_2D] != (PLAYBACK_HEIGHT, PLAYBACK_WIDTH):
+            img = cv2.resize(img, (PLAYBACK_WIDTH, PLAYBACK_HEIGHT),
+                             interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', img)
+        return (buffer.tobytes(), PLAYBACK_HEIGHT, PLAYBACK_WIDTH) if ok else None
 
     # ── Video story ───────────────────────────────────────────────────────────
 
@@ -134,21 +192,25 @@ class StoryClientSession:
             print(f"[StorySession #{self.session_id}] Cannot open video")
             return
 
-        fps = cap.get(cv2.CAP_PROP_FPS)
+        entry = get_media_catalog().lookup(video_path, MEDIA_KIND_STORY)
+        if entry is not None:
+            fps, total_frames = entry['fps'], entry['frame_count']
+        else:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Not normalized yet (or normalization failed): resize each frame
+        resize = not _is_playback_size(entry)
+        width, height = PLAYBACK_WIDTH, PLAYBACK_HEIGHT
+
         if not (MINIMUM_FPS_LIMIT < fps <= MAXIMUM_FPS_LIMIT):
             fps = DEFAULT_FPS
         else:
             fps = min(fps, MAXIMUM_FPS_LIMIT)
 
-        frame_delay = SECONDS_IN_ONE_UNIT / fps
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        audio_info = self._get_audio_info(video_path)
-        samples_per_frame = int(audio_info['sample_rate'] / fps)
-        chunk_bytes = samples_per_frame * audio_info['channels'] * BYTES_PER_SAMPLE_16_BIT
-        audio_proc = self._start_audio_process(video_path, audio_info)
+        track = get_audio_track(video_path)
+        audio = track.open_reader(fps) if track else None
+        sample_rate = track.sample_rate if track else DEFAULT_AUDIO_SAMPLE_RATE
+        channels = track.channels if track else DEFAULT_AUDIO_CHANNELS
 
         story_info = {
             'type': 'VIDEO',
@@ -156,30 +218,64 @@ class StoryClientSession:
             'height': height,
             'fps': fps,
             'total_frames': total_frames,
-            'has_audio': audio_proc is not None,
-            'audio_sample_rate': audio_info['sample_rate'],
-            'audio_channels': audio_info['channels'],
-            'samples_per_frame': samples_per_frame,
+            'has_audio': track is not None,
+            'audio_sample_rate': sample_rate,
+            'audio_channels': channels,
+            'samples_per_frame': int(sample_rate / fps),
             'compressed': True,
         }
+        story_info.update(self._playlist_info)
 
-        if not self._send_compressed_encrypted(story_info):
-            self._cleanup_video(cap, audio_proc)
+        if not self._send_compressed_encrypted(media_packet.pack_info(story_info)):
+            self._cleanup_video(cap, audio)
             return
+        self.control.start()
 
         print(f"[StorySession #{self.session_id}] Streaming video story @ {fps:.0f} fps...")
         frame_count = INITIAL_COUNT
+        rate = DEFAULT_RATE
+        pacer = FramePacer(fps)
 
+        story_index = self._playlist_info.get('index', 0)
         while True:
-            t0 = time.time()
+            if self.control.skipped(story_index):
+                break
+
+            if self.control.paused:
+                if not self.control.wait_while_paused():
+                    break
+                pacer.restart(burst=False)
+
+            seek_to = self.control.take_seek(fps, total_frames)
+            if seek_to is not None:
+                get_frame_index(video_path).seek(cap, seek_to)
+                frame_count = seek_to
+                pacer.restart(burst=True)   # client dropped its buffer
+
+            rate_changed = self.control.rate != rate
+            if rate_changed:
+                rate = self.control.rate
+                if seek_to is None:
+                    pacer.restart(burst=False)
+
+            if track is not None and (seek_to is not None or rate_changed):
+                audio.close()
+                audio = track.open_reader(fps, frame_count, rate)
+
             ret, frame = cap.read()
             if not ret:
                 break
+            if resize and frame.shape[:IMAGE_SHAPE_SLICE_2D] != (height, width):
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
 
-            frame = cv2.resize(frame, (TARGET_FRAME_WIDTH, TARGET_FRAME_HEIGHT))
-            audio_chunk = self._read_audio(audio_proc, chunk_bytes)
+            audio_chunk = audio.read() if audio else None
 
-            packet = {'frame': frame, 'audio': audio_chunk, 'frame_number': frame_count}
+            pacer.wait(rate, self.control.closed)
+            packet = media_packet.pack_frame(
+                frame, audio_chunk, frame_count, frame_count / fps,
+                seek_seq=self.control.seek_seq,
+                audio_channels=channels,
+            )
             if not self._send_compressed_encrypted(packet):
                 break
 
@@ -187,75 +283,28 @@ class StoryClientSession:
             if frame_count % TARGET_FPS == 0:
                 print(f"[StorySession #{self.session_id}] Frame {frame_count}/{total_frames}")
 
-            elapsed = time.time() - t0
-            sleep_time = max(MINIMUM_DELAY_SECONDS, frame_delay - elapsed)
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-
-        self._cleanup_video(cap, audio_proc)
+        self._cleanup_video(cap, audio)
         print(f"[StorySession #{self.session_id}] Video story done ({frame_count} frames)")
 
-    # ── Audio helpers ─────────────────────────────────────────────────────────
-
-    def _get_audio_info(self, video_path: str) -> dict:
-        try:
-            result = subprocess.run(
-                ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
-                 '-show_entries', 'stream=sample_rate,channels',
-                 '-of', 'default=noprint_wrappers=1', video_path],
-                capture_output=True, text=True, check=True
-            )
-            info = {}
-            for line in result.stdout.splitlines():
-                if '=' in line:
-                    k, v = line.split('=', MAX_SPLIT_COUNT)
-                    info[k.strip()] = v.strip()
-            return {
-                'sample_rate': int(info.get('sample_rate', DEFAULT_AUDIO_SAMPLE_RATE)),
-                'channels': int(info.get('channels', DEFAULT_AUDIO_CHANNELS)),
-            }
-        except Exception:
-            return {'sample_rate': DEFAULT_AUDIO_SAMPLE_RATE, 'channels': DEFAULT_AUDIO_CHANNELS}
-
-    def _start_audio_process(self, video_path: str, audio_info: dict):
-        try:
-            return subprocess.Popen(
-                ['ffmpeg', '-i', video_path, '-vn',
-                 '-acodec', 'pcm_s16le',
-                 '-ar', str(audio_info['sample_rate']),
-                 '-ac', str(audio_info['channels']),
-                 '-f', 's16le', 'pipe:1'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-                bufsize=LARGE_IO_BUFFER_SIZE_BYTES
-            )
-        except Exception:
-            return None
+    # ── Cleanup ───────────────────────────────────────────────────────────────
 
-    def _read_audio(self, audio_proc, chunk_bytes):
-        if audio_proc and audio_proc.stdout:
-            try:
-                data = audio_proc.stdout.read(chunk_bytes)
-                if data and len(data) == chunk_bytes:
-                    return np.frombuffer(data, dtype=np.int16)
-            except Exception:
-                pass
-        return None
-
-    def _cleanup_video(self, cap, audio_proc):
+    @staticmethod
+    def _cleanup_video(cap, audio):
         try:
             cap.release()
         except Exception:
             pass
-        if audio_proc:
-            try:
-                audio_proc.terminate()
-                audio_proc.wait()
-            except Exception:
-                pass
+        if audio is not None:
+            audio.close()
 
     def close(self):
         try:
             self.client_socket.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
+
+
+def _is_playback_size(entry) -> bool:
+    """True if the catalog entry says the story is already normalized."""
+    return (entry is not None
+            and (entry['width'], entry['height']) == (PLAYBACK_WIDTH, PLAYBACK_HEIGHT))
@@ -0,0 +1,203 @@
+"""
+Gal Haham
+Stream Control - client → server messages on a streaming connection.
+The client sends small encrypted JSON messages (Protocol.send_json) on
+the same socket the frames flow down. A reader thread keeps the latest
+state so the streaming loop can poll it without blocking.
+
+Messages:
+    {"type": "BUFFER", "buffer_s": <float>, "frame": <int>,
+     "dropped": <int>, "underruns": <int>}      (last two optional)
+    {"type": "SEEK", "frame": <int>, "seq": <int>}
+    {"type": "SEEK", "time_s": <float>, "seq": <int>}
+    {"type": "PAUSE"}
+    {"type": "RESUME"}
+    {"type": "RATE", "rate": <float>}
+    {"type": "SKIP", "index": <int>}        playlist: stop sending story <index>
+
+Every frame packet echoes the seq of the last applied seek, so the
+client can drop packets that were already in flight before it.
+"""
+import threading
+import time
+from Protocol import Protocol
+
+CONTROL_BUFFER = "BUFFER"
+CONTROL_SEEK = "SEEK"
+CONTROL_PAUSE = "PAUSE"
+CONTROL_RESUME = "RESUME"
+CONTROL_RATE = "RATE"
+CONTROL_SKIP = "SKIP"
+
+KEY_TYPE = 'type'
+KEY_BUFFER_SECONDS = 'buffer_s'
+KEY_FRAME = 'frame'
+KEY_TIME_SECONDS = 'time_s'
+KEY_SEQ = 'seq'
+KEY_RATE = 'rate'
+KEY_DROPPED = 'dropped'
+KEY_UNDERRUNS = 'underruns'
+KEY_INDEX = 'index'
+
+BUFFER_REPORT_STALE_SECONDS = 3.0
+DEFAULT_RATE = 1.0
+MINIMUM_RATE = 0.5          # ffmpeg atempo range for a single filter
+MAXIMUM_RATE = 2.0
+PAUSE_POLL_SECONDS = 0.5
+NO_SKIP = -1
+
+
+class StreamControl:
+    """
+    Background reader for one streaming client's control messages.
+    """
+
+    def __init__(self, conn: tuple, client_id: int):
+        self.conn = conn                    # (socket, encryption_key)
+        self.client_id = client_id
+        self.closed = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._lock = threading.Lock()
+        self._buffer_seconds = None
+        self._buffer_reported_at = 0.0
+        self._pending_seek = None           # (kind, value, seq)
+        self._rate = DEFAULT_RATE
+        self.seek_seq = 0
+        self.client_stats = {}              # dropped / underruns as reported
+        self._skip_index = NO_SKIP          # Playlist stories up to here are skipped
+        self._thread = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self):
+        if self._thread is not None:
+            return                          # Already reading (playlist sessions)
+        self._thread = threading.Thread(
+            target=self._reader_loop,
+            daemon=True,
+            name=f"StreamControl-{self.client_id}"
+        )
+        self._thread.start()
+
+    def _reader_loop(self):
+        try:
+            while not self.closed.is_set():
+                message = Protocol.recv_json(self.conn)
+                if isinstance(message, dict):
+                    self._dispatch(message)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        except Exception as e:
+            print(f"[StreamControl #{self.client_id}] Reader error: {e}")
+        finally:
+            self.closed.set()
+            self._resumed.set()             # never leave the streamer parked
+
+    def _dispatch(self, message: dict):
+        message_type = message.get(KEY_TYPE)
+        try:
+            if message_type == CONTROL_BUFFER:
+                buffer_seconds = float(message.get(KEY_BUFFER_SECONDS))
+                with self._lock:
+                    self._buffer_seconds = buffer_seconds
+                    self._buffer_reported_at = time.monotonic()
+                    for key in (KEY_DROPPED, KEY_UNDERRUNS):
+                        if key in message:
+                            self.client_stats[key] = int(message[key])
+
+            elif message_type == CONTROL_SEEK:
+                seq = int(message.get(KEY_SEQ, 0))
+                if message.get(KEY_FRAME) is not None:
+                    seek = ('frame', int(message[KEY_FRAME]), seq)
+                else:
+                    seek = ('time', float(message[KEY_TIME_SECONDS]), seq)
+                with self._lock:
+                    self._pending_seek = seek
+                    self._buffer_seconds = None
+
+            elif message_type == CONTROL_PAUSE:
+                self._resumed.clear()
+
+            elif message_type == CONTROL_RESUME:
+                with self._lock:
+                    self._buffer_seconds = None
+                self._resumed.set()
+
+            elif message_type == CONTROL_RATE:
+                rate = float(message.get(KEY_RATE, DEFAULT_RATE))
+                with self._lock:
+                    self._rate = min(max(rate, MINIMUM_RATE), MAXIMUM_RATE)
+                    self._buffer_seconds = None
+
+            elif message_type == CONTROL_SKIP:
+                index = int(message[KEY_INDEX])
+                with self._lock:
+                    self._skip_index = max(self._skip_index, index)
+
+        except (KeyError, TypeError, ValueError):
+            print(f"[StreamControl #{self.client_id}] Bad message: {message}")
+
+    # ── Queries (called from the streaming thread) ───────────────────────────
+
+    def buffer_level(self):
+        """
+        Latest client buffer report in seconds, or None if the client
+        never reported or the last report is too old to trust.
+        """
+        with self._lock:
+            if self._buffer_seconds is None:
+                return None
+            age = time.monotonic() - self._buffer_reported_at
+            if age > BUFFER_REPORT_STALE_SECONDS:
+                return None
+            return self._buffer_seconds
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    @property
+    def rate(self) -> float:
+        with self._lock:
+            return self._rate
+
+    def skipped(self, index: int) -> bool:
+        """True if the client skipped playlist story <index> (or a later one)."""
+        with self._lock:
+            return index <= self._skip_index
+
+    def wait_while_paused(self) -> bool:
+        """
+        Block while the client has the stream paused.
+
+        Returns:
+            bool: True if the stream should continue, False if closed
+        """
+        while not self._resumed.wait(PAUSE_POLL_SECONDS):
+            if self.closed.is_set():
+                return False
+        return not self.closed.is_set()
+
+    def take_seek(self, fps: float, total_frames: int):
+        """
+        Pop the pending seek, if any, as a frame index.
+
+        Args:
+            fps: Stream frame rate, used for time-based seeks
+            total_frames: Upper bound for the target frame
+
+        Returns:
+            int: Target frame index, or None if no seek is pending
+        """
+        with self._lock:
+            seek = self._pending_seek
+            self._pending_seek = None
+        if seek is None:
+            return None
+
+        kind, value, seq = seek
+        frame = int(round(value * fps)) if kind == 'time' else value
+        self.seek_seq = seq
+        last_frame = max(total_frames - 1, 0)
+        return min(max(frame, 0), last_frame)
@@ -42,6 +42,7 @@ class VideoAudioServer:
         self.active_clients = []
         self._client_lock = threading.Lock()
         self._client_counter = 0
+        self._handlers = {}                 # client_id → ClientHandler
 
         # ticket_id → {"video_path": str, "expires": float}
         self._tickets: dict = {}
@@ -110,6 +111,12 @@ class VideoAudioServer:
                 pass
         print("[VideoServer] Stopped")
 
+    def get_stats(self) -> dict:
+        """Pipeline stats of every active stream, keyed by client id."""
+        with self._client_lock:
+            handlers = dict(self._handlers)
+        return {client_id: h.get_stats() for client_id, h in handlers.items()}
+
     # ── Private ────────────────────────────────────────────────────────────────
 
     def _create_server_socket(self):
@@ -198,6 +205,8 @@ class VideoAudioServer:
 
             # Step 3 – stream
             handler = ClientHandler(video_path, encrypted_conn, address, client_id)
+            with self._client_lock:
+                self._handlers[client_id] = handler
             handler.handle_streaming()
 
         except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError, OSError):
@@ -208,6 +217,7 @@ class VideoAudioServer:
             with self._client_lock:
                 if address in self.active_clients:
                     self.active_clients.remove(address)
+                self._handlers.pop(client_id, None)
                 remaining = len(self.active_clients)
 
             print(f"[VideoServer] Client #{client_id} disconnected. Active: {remaining}/{MAX_CONCURRENT_STREAMS}")
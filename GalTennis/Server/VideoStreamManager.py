@@ -2,9 +2,15 @@
 Gal Haham
 Video Stream Manager
 Handles video file operations and frame streaming
+CHANGED: Frame rate control uses FramePacer (monotonic deadlines and a
+         fast-start burst) instead of sleeping frame_delay - elapsed
+CHANGED: Video properties read from the media catalog
 """
 import cv2
 import time
+from FramePacer import FramePacer
+from MediaCatalog import get_media_catalog
+from Db_manager import MEDIA_KIND_VIDEO
 
 DEFAULT_FPS_FALLBACK = 30.0
 INVALID_FPS_THRESHOLD = 0
@@ -13,7 +19,6 @@ INITIAL_FRAME_COUNT = 0
 FRAME_INCREMENT_STEP = 1
 FRAME_COUNT_RESET_VALUE = 0
 PROGRESS_LOG_EVERY_N_FRAMES = 30
-MINIMUM_SLEEP_TIME_SECONDS = 0.0
 
 
 class VideoStreamManager:
@@ -28,6 +33,7 @@ class VideoStreamManager:
         self.video_path = video_path
         self.cap = None
         self.video_info = None
+        self.pacer = None
 
     def open_video(self):
         """Opens video file and extracts core video stream information."""
@@ -37,15 +43,20 @@ class VideoStreamManager:
             print(f"Cannot open video: {self.video_path}")
             return False
 
-        # Get video properties
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        # Get video properties (catalog first, probed once at ingest)
+        entry = get_media_catalog().lookup(self.video_path, MEDIA_KIND_VIDEO)
+        if entry is not None:
+            fps, width, height = entry['fps'], entry['width'], entry['height']
+            total_frames = entry['frame_count']
+        else:
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         if fps <= INVALID_FPS_THRESHOLD:
             fps = DEFAULT_FPS_FALLBACK
 
         frame_delay = SECONDS_PER_FRAME_CALCULATION_UNIT / fps
-        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
         self.video_info = {
             'fps': fps,
@@ -54,6 +65,7 @@ class VideoStreamManager:
             'total_frames': total_frames,
             'frame_delay': frame_delay
         }
+        self.pacer = FramePacer(fps)
 
         return True
 
@@ -75,16 +87,10 @@ class VideoStreamManager:
             self.cap.release()
             self.cap = None
 
-    @staticmethod
-    def control_frame_rate(frame_start, frame_delay):
-        """Pauses execution to maintain the target frame rate."""
-        elapsed = time.time() - frame_start
-        sleep_time = max(
-            MINIMUM_SLEEP_TIME_SECONDS,
-            frame_delay - elapsed
-        )
-        if sleep_time > MINIMUM_SLEEP_TIME_SECONDS:
-            time.sleep(sleep_time)
+    def control_frame_rate(self):
+        """Blocks until the next frame is due (see FramePacer)."""
+        if self.pacer:
+            self.pacer.wait()
 
     @staticmethod
     def log_progress(frame_count, total_frames, start_time, address):
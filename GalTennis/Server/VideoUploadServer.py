@@ -0,0 +1,418 @@
+"""
+Gal Haham
+Video Upload Server - encrypted, chunked, resumable video uploads.
+Replaces sending the whole file base64-encoded inside one UPLOAD_VIDEO
+request, which held the video in memory (three times over) on both
+sides and had to start again from zero after any disconnect.
+
+Every connection does its own key exchange, then sends JSON messages:
+    INIT      metadata + size + SHA-256 → upload_id, chunk_size and the
+              chunks the server still needs (resume); none at all if the
+              BlobStore already holds this content for a video
+              (deduplicated)
+    CHUNKS    upload_id, then binary chunks until the client closes;
+              each chunk is acknowledged after it is written
+    COMPLETE  upload_id → hash check, then the file is stored as a blob,
+              linked into videos/ and registered (ADD_VIDEO) as one step
+
+A client opens several CHUNKS connections in parallel. Chunks go into
+uploads/<upload_id>.part at their own offset; a JSON sidecar records
+which ones arrived, so an upload survives client and server restarts.
+"""
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import aes_cipher
+import key_exchange
+from Protocol import Protocol
+from Videos_Handler import VideosHandler
+from BlobStore import get_blob_store
+from Db_manager import MEDIA_KIND_VIDEO
+from my_sha256 import Hasha256
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOADS_FOLDER = os.path.join(_SERVER_DIR, "uploads")
+PART_EXTENSION = ".part"
+STATE_EXTENSION = ".json"
+TEMP_SUFFIX = ".tmp"
+
+HOST = '0.0.0.0'
+PORT = 3334
+SOCKET_OPTION_ENABLED = 1
+MAX_PENDING_CONNECTIONS = 16
+
+CHUNK_SIZE = 1024 * 1024
+CHUNK_HEADER_FORMAT = "!I"      # chunk index
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FORMAT)
+MAX_VIDEO_BYTES = 4 * 1024 * 1024 * 1024
+UPLOAD_ID_LENGTH = 16
+STALE_UPLOAD_SECONDS = 24 * 60 * 60
+
+MSG_INIT = 'INIT'
+MSG_CHUNKS = 'CHUNKS'
+MSG_COMPLETE = 'COMPLETE'
+
+KEY_TYPE = 'type'
+KEY_STATUS = 'status'
+KEY_MESSAGE = 'message'
+KEY_UPLOAD_ID = 'upload_id'
+KEY_INDEX = 'index'
+
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+
+SOCK_INDEX = 0
+KEY_INDEX_IN_CONN = 1
+
+
+class UploadError(Exception):
+    """A request that cannot be served; the message goes to the client."""
+
+
+class UploadSession:
+    """One video being uploaded: metadata, .part file and received chunks."""
+
+    def __init__(self, upload_id: str, meta: dict, received=()):
+        self.upload_id = upload_id
+        self.meta = meta
+        self.size = meta['size']
+        self.chunk_size = meta['chunk_size']
+        self.chunk_count = max(1, -(-self.size // self.chunk_size))
+        self.received = set(range(self.chunk_count)) if self.deduplicated else set(received)
+        self.lock = threading.Lock()
+        self.completed = False
+
+        base = os.path.join(UPLOADS_FOLDER, upload_id)
+        self.part_path = base + PART_EXTENSION
+        self.state_path = base + STATE_EXTENSION
+
+    @property
+    def deduplicated(self) -> bool:
+        """The content is already stored: no bytes need to be sent."""
+        return self.meta.get('deduplicated', False)
+
+    def chunk_length(self, index: int) -> int:
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    @property
+    def missing(self) -> list:
+        return [i for i in range(self.chunk_count) if i not in self.received]
+
+    def create_files(self):
+        """Pre-size the .part file so chunks can land in any order."""
+        if not self.deduplicated and not os.path.exists(self.part_path):
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.size)
+        self.save_state()
+
+    def mark_received(self, index: int):
+        with self.lock:
+            self.received.add(index)
+            self.save_state()
+
+    def save_state(self):
+        state = dict(self.meta, received=sorted(self.received))
+        with open(self.state_path + TEMP_SUFFIX, 'w') as f:
+            json.dump(state, f)
+        os.replace(self.state_path + TEMP_SUFFIX, self.state_path)
+
+    def discard(self):
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @classmethod
+    def load(cls, upload_id: str):
+        """Session saved by an earlier server run, or None."""
+        state_path = os.path.join(UPLOADS_FOLDER, upload_id + STATE_EXTENSION)
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        received = state.pop('received', [])
+        session = cls(upload_id, state, received)
+        if not session.deduplicated and not os.path.exists(session.part_path):
+            return None
+        return session
+
+
+class VideoUploadServer:
+    """
+    Multi-client upload server. Each connection runs in its own thread;
+    sessions are shared between the connections of one upload.
+    """
+
+    def __init__(self, host: str = HOST, port: int = PORT):
+        self.host = host
+        self.port = port
+        self.is_running = False
+        self.videos_handler = VideosHandler()
+        self.blob_store = get_blob_store()
+
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._complete_lock = threading.Lock()
+
+        os.makedirs(UPLOADS_FOLDER, exist_ok=True)
+        self._purge_stale_uploads()
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, SOCKET_OPTION_ENABLED
+        )
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(MAX_PENDING_CONNECTIONS)
+
+    def start(self):
+        self.is_running = True
+        print(f"[VideoUpload] Listening on {self.host}:{self.port}")
+
+        while self.is_running:
+            try:
+                client_socket, addr = self.server_socket.accept()
+                threading.Thread(
+                    target=self._handle_client,
+                    args=(client_socket, addr),
+                    daemon=True,
+                    name=f"VideoUpload-{addr[1]}"
+                ).start()
+            except OSError:
+                if self.is_running:
+                    print("[VideoUpload] Socket error")
+                break
+            except Exception as e:
+                print(f"[VideoUpload] Accept error: {e}")
+
+        self.server_socket.close()
+        print("[VideoUpload] Server stopped")
+
+    def stop(self):
+        self.is_running = False
+        try:
+            self.server_socket.close()
+        except Exception:
+            pass
+
+    # ── Connection ────────────────────────────────────────────────────────────
+
+    def _handle_client(self, client_socket: socket.socket, addr: tuple):
+        """Key exchange → one request (INIT / CHUNKS / COMPLETE)."""
+        conn = None
+        try:
+            key = key_exchange.KeyExchange.recv_send_key((client_socket, None))
+            conn = (client_socket, key)
+
+            request = Protocol.recv_json(conn)
+            request_type = request.get(KEY_TYPE)
+            if request_type == MSG_INIT:
+                Protocol.send_json(self._init_upload(request), conn)
+            elif request_type == MSG_CHUNKS:
+                self._receive_chunks(request, conn)
+            elif request_type == MSG_COMPLETE:
+                Protocol.send_json(self._complete_upload(request), conn)
+            else:
+                raise UploadError(f"Unknown request: {request_type}")
+
+        except UploadError as e:
+            print(f"[VideoUpload {addr}] {e}")
+            if conn:
+                self._send_error(conn, str(e))
+        except (ConnectionError, OSError, ValueError):
+            pass  # Client went away; chunks written so far are kept
+        except Exception as e:
+            print(f"[VideoUpload {addr}] Error: {e}")
+            if conn:
+                self._send_error(conn, str(e))
+        finally:
+            try:
+                client_socket.close()
+            except Exception:
+                pass
+
+    # ── INIT ──────────────────────────────────────────────────────────────────
+
+    def _init_upload(self, request: dict) -> dict:
+        title = os.path.basename(str(request.get('title', '')))
+        category = request.get('category')
+        level = request.get('level')
+        uploader = request.get('uploader')
+        size = request.get('size')
+        sha256 = str(request.get('sha256', '')).lower()
+
+        error = self.videos_handler.validate_video_metadata(title, category, level, uploader)
+        if error:
+            raise UploadError(error)
+        if not isinstance(size, int) or not 0 < size <= MAX_VIDEO_BYTES:
+            raise UploadError("Invalid file size.")
+        if len(sha256) != hashlib.sha256().digest_size * 2:
+            raise UploadError("Missing file hash.")
+        if self.videos_handler.video_exists(title):
+            raise UploadError(f"A video named '{title}' already exists.")
+
+        upload_id = hashlib.sha256(
+            f"{uploader}\n{title}\n{size}\n{sha256}".encode()
+        ).hexdigest()[:UPLOAD_ID_LENGTH]
+
+        with self._sessions_lock:
+            session = self._sessions.get(upload_id) or UploadSession.load(upload_id)
+            if session is None:
+                session = UploadSession(upload_id, {
+                    'title': title,
+                    'category': category,
+                    'level': level,
+                    'uploader': uploader,
+                    'size': size,
+                    'sha256': sha256,
+                    'chunk_size': CHUNK_SIZE,
+                    'started': time.time(),
+                    'deduplicated': self.blob_store.has(sha256, MEDIA_KIND_VIDEO),
+                })
+                session.create_files()
+                if session.deduplicated:
+                    print(f"[VideoUpload] {upload_id}: {title} already stored, no transfer")
+                else:
+                    print(f"[VideoUpload] New upload {upload_id}: {title} ({size} bytes)")
+            else:
+                print(f"[VideoUpload] Resuming {upload_id}: "
+                      f"{len(session.received)}/{session.chunk_count} chunks")
+            self._sessions[upload_id] = session
+
+        return {
+            KEY_STATUS: STATUS_SUCCESS,
+            KEY_UPLOAD_ID: upload_id,
+            'chunk_size': session.chunk_size,
+            'chunk_count': session.chunk_count,
+            'missing': session.missing,
+            'deduplicated': session.deduplicated,
+        }
+
+    # ── CHUNKS ────────────────────────────────────────────────────────────────
+
+    def _receive_chunks(self, request: dict, conn):
+        """Write chunks until the client closes, acknowledging each one."""
+        session = self._get_session(request.get(KEY_UPLOAD_ID))
+        Protocol.send_json({KEY_STATUS: STATUS_SUCCESS}, conn)
+
+        with open(session.part_path, 'r+b') as part_file:
+            while True:
+                try:
+                    encrypted = Protocol.recv_bin(conn)
+                except ConnectionError:
+                    return
+                data = aes_cipher.AESCipher.decrypt(conn[KEY_INDEX_IN_CONN], encrypted)
+                (index,) = struct.unpack_from(CHUNK_HEADER_FORMAT, data)
+                payload = memoryview(data)[CHUNK_HEADER_SIZE:]
+
+                if index >= session.chunk_count or len(payload) != session.chunk_length(index):
+                    raise UploadError(f"Bad chunk {index}")
+
+                part_file.seek(index * session.chunk_size)
+                part_file.write(payload)
+                part_file.flush()
+                session.mark_received(index)
+                Protocol.send_json({KEY_STATUS: STATUS_SUCCESS, KEY_INDEX: index}, conn)
+
+    # ── COMPLETE ──────────────────────────────────────────────────────────────
+
+    def _complete_upload(self, request: dict) -> dict:
+        """
+        Verify the hash and store the blob, then link it into videos/ and
+        add its DB row together: either both happen or neither does.
+        """
+        session = self._get_session(request.get(KEY_UPLOAD_ID))
+        with session.lock:
+            if session.completed:
+                raise UploadError("Upload already completed.")
+            if session.missing:
+                raise UploadError(f"{len(session.missing)} chunks still missing.")
+
+            meta = session.meta
+            if not session.deduplicated:
+                if Hasha256.get_file_hash(session.part_path) != meta['sha256']:
+                    # No way to tell which chunk is wrong: start over
+                    self._drop_session(session)
+                    raise UploadError("File hash mismatch - upload it again.")
+                self.blob_store.store(session.part_path, meta['sha256'])
+
+            with self._complete_lock:
+                response = self.videos_handler.register_uploaded_video(
+                    meta['sha256'],
+                    meta['title'],
+                    meta['category'],
+                    meta['level'],
+                    meta['uploader'],
+                )
+            # The bytes now live in the blob store either way
+            session.completed = True
+            self._drop_session(session)
+            return response
+
+    # ── Sessions ──────────────────────────────────────────────────────────────
+
+    def _get_session(self, upload_id) -> UploadSession:
+        with self._sessions_lock:
+            session = self._sessions.get(upload_id)
+            if session is None and isinstance(upload_id, str) and upload_id.isalnum():
+                session = UploadSession.load(upload_id)
+                if session is not None:
+                    self._sessions[upload_id] = session
+        if session is None:
+            raise UploadError("Unknown upload - send INIT first.")
+        return session
+
+    def _drop_session(self, session: UploadSession):
+        with self._sessions_lock:
+            self._sessions.pop(session.upload_id, None)
+        session.discard()
+
+    def _purge_stale_uploads(self):
+        """Delete uploads nobody has touched for STALE_UPLOAD_SECONDS."""
+        cutoff = time.time() - STALE_UPLOAD_SECONDS
+        for name in os.listdir(UPLOADS_FOLDER):
+            path = os.path.join(UPLOADS_FOLDER, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    print(f"[VideoUpload] Removed stale upload file {name}")
+            except OSError:
+                pass
+
+    def _send_error(self, conn, message: str):
+        try:
+            Protocol.send_json({KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: message}, conn)
+        except Exception:
+            pass
+
+
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_server_instance = None
+_server_lock = threading.Lock()
+
+
+def ensure_video_upload_server_running() -> dict:
+    """
+    Start the upload server on first use.
+
+    Returns:
+        dict: {"server": <VideoUploadServer>, "port": PORT}
+    """
+    global _server_instance
+    with _server_lock:
+        if _server_instance is None:
+            _server_instance = VideoUploadServer()
+            threading.Thread(
+                target=_server_instance.start,
+                daemon=True,
+                name="VideoUploadServer"
+            ).start()
+    return {"server": _server_instance, "port": _server_instance.port}
@@ -4,22 +4,34 @@ Video metadata management system.
 Handles video upload registration and retrieval
 with category/difficulty validation.
 NOW USES DBManager for all database operations.
+ADDED: register_uploaded_video() - the file rename and the ADD_VIDEO row
+       happen together, shared by the chunked upload server and the
+       legacy single-request upload.
+CHANGED: Video files are hard links to content-addressed blobs
+         (BlobStore), so identical uploads share one copy on disk.
+CHANGED: Ingest is queued as a job (MediaJobs); the upload response
+         carries its job_id for GET_JOB_STATUS.
 """
 import time
 import os
 import base64
-from Db_manager import get_db_manager
+from Db_manager import get_db_manager, MEDIA_KIND_VIDEO
+from MediaJobs import enqueue_video_ingest
+from BlobStore import get_blob_store
+from my_sha256 import Hasha256
 
 ALLOWED_CATEGORIES = (
     'forehand', 'backhand', 'serve',
     'slice', 'volley', 'smash'
 )
 ALLOWED_DIFFICULTIES = ('easy', 'medium', 'hard')
+UPLOAD_TEMP_SUFFIX = ".part"
 
 
 class VideosHandler:
     def __init__(self):
         self.db = get_db_manager()
+        self.blob_store = get_blob_store()
         self.videos_folder = self._ensure_videos_folder()
 
     def _ensure_videos_folder(self):
@@ -40,9 +52,72 @@ class VideosHandler:
 
         return videos_folder
 
+    def validate_video_metadata(self, title, category, level, uploader):
+        """
+        Check the fields every new video needs.
+
+        Returns:
+            str: Error message, or None if the metadata is valid
+        """
+        if not all([title, category, level, uploader]):
+            return "Missing required fields (title, category, level, or uploader)."
+        if title.startswith('.') or os.path.basename(title) != title:
+            return "Invalid video title."
+        if (
+                category not in ALLOWED_CATEGORIES or
+                level not in ALLOWED_DIFFICULTIES
+        ):
+            return "Invalid category or difficulty level."
+        return None
+
+    def video_exists(self, title):
+        """True if a video with this title is on disk or in the database."""
+        return (os.path.exists(os.path.join(self.videos_folder, title)) or
+                self.db.get_video_by_title(title) is not None)
+
+    def register_uploaded_video(self, content_hash, title, category, level, uploader):
+        """
+        Link a stored blob into the videos folder and add its database
+        row as one step: if the insert fails the link is removed again,
+        so a video is never listed without its file or the other way round.
+
+        Args:
+            content_hash: Hex SHA-256 of a blob in the BlobStore
+            title: Video title (also its filename)
+            category: Video category
+            level: Difficulty level
+            uploader: Username of the uploader
+
+        Returns:
+            dict: Response with status and message
+        """
+        file_path = os.path.join(self.videos_folder, title)
+        if not self.blob_store.attach(content_hash, file_path, MEDIA_KIND_VIDEO):
+            self.blob_store.discard(content_hash)
+            return {
+                "status": "error",
+                "message": f"Failed to save video file '{title}' (name taken?)."
+            }
+
+        db_response = self.db.add_video(title, uploader, category, level, time.time())
+        if db_response.get("status") != "success":
+            self.blob_store.detach(file_path, MEDIA_KIND_VIDEO)
+            print(f"Deleted file after DB failure: {file_path}")
+            return db_response
+
+        print(f"[DEBUG] Video uploaded successfully: {title}")
+
+        # Catalog, audio cache and ABR renditions run as a background job
+        return {
+            "status": "success",
+            "message": f"Video '{title}' uploaded successfully!",
+            "job_id": enqueue_video_ingest(file_path)
+        }
+
     def upload_video(self, payload):
         """
-        Handle video upload - receive file over network and save it.
+        Legacy upload - the whole file base64-encoded in one request.
+        New clients use the chunked upload server (VideoUploadServer).
 
         Args:
             payload: Dict containing title, category,
@@ -52,83 +127,35 @@ class VideosHandler:
             dict: Response with status and message
         """
         try:
-            # Extract data
             title = payload.get("title")
             category = payload.get("category")
             level = payload.get("level")
             uploader = payload.get("uploader")
             file_content_b64 = payload.get("file_content")
 
-            # Validate required fields
-            if not all([title, category, level, uploader, file_content_b64]):
+            error = self.validate_video_metadata(title, category, level, uploader)
+            if error or not file_content_b64:
                 return {
                     "status": "error",
-                    "message": (
-                        "Missing required fields "
-                        "(title, category, level, uploader, or file_content)."
-                    )
+                    "message": error or "Missing required field (file_content)."
                 }
-            # Validate category and level
-            if (
-                    category not in ALLOWED_CATEGORIES or
-                    level not in ALLOWED_DIFFICULTIES
-            ):
-                return {
-                    "status": "error",
-                    "message": "Invalid category or difficulty level."
-                }
-
-            # Decode and save file
-            file_path = os.path.join(self.videos_folder, title)
 
-            # Check if file already exists on disk
-            if os.path.exists(file_path):
-                return {
-                    "status": "error",
-                    "message": (
-                        f"A file named '{title}' already exists "
-                        "in videos folder."
-                    )
-                }
+            temp_path = os.path.join(self.videos_folder, f".{title}{UPLOAD_TEMP_SUFFIX}")
             try:
-                # Decode base64 and write file
-                file_data = base64.b64decode(file_content_b64)
-                with open(file_path, 'wb') as f:
-                    f.write(file_data)
-                print(f"[DEBUG] Video file saved: {file_path}")
-
+                with open(temp_path, 'wb') as f:
+                    f.write(base64.b64decode(file_content_b64))
+                content_hash = Hasha256.get_file_hash(temp_path)
+                self.blob_store.store(temp_path, content_hash)
             except Exception as file_err:
                 print(f"[DEBUG] Error saving file: {file_err}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
                 return {
                     "status": "error",
                     "message": f"Failed to save video file: {str(file_err)}"
                 }
 
-            # Add to database
-            current_time = time.time()
-            db_response = self.db.add_video(
-                title,
-                uploader,
-                category,
-                level,
-                current_time
-            )
-
-            # If database insert failed, delete the file
-            if db_response.get("status") != "success":
-                try:
-                    os.remove(file_path)
-                    print(f"Deleted file after DB failure: {file_path}")
-                except Exception as del_err:
-                    print(f"Could not delete file: {del_err}")
-
-                return db_response
-
-            print(f"[DEBUG] Video uploaded successfully: {title}")
-            return {
-                "status": "success",
-                "message": f"Video '{title}' uploaded successfully!"
-            }
+            return self.register_uploaded_video(content_hash, title, category, level, uploader)
 
         except Exception as e:
             print(f"[DEBUG] Upload error: {e}")
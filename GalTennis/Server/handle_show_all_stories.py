@@ -2,36 +2,45 @@
 Gal Haham
 Media server for displaying story thumbnails.
 Handles image and video preview generation and streaming to clients.
+CHANGED: Each client runs in its own thread over a persistent encrypted
+         connection. The session key from the first key exchange is reused
+         for every request, and media items are streamed as separate frames.
+CHANGED: Thumbnails are read from the precomputed store (StoryNormalizer)
+         instead of decoding and resizing every story on each request
 """
 import socket
-import json
 import os
-import cv2
+import threading
 import base64
 from pathlib import Path
 from Protocol import Protocol
 import key_exchange
+from StoryNormalizer import get_thumbnail
 
 DEFAULT_MEDIA_FOLDER = "stories"
 DEFAULT_PORT = 2222
 DEFAULT_HOST = "0.0.0.0"
-MAX_PENDING_CONNECTIONS = 5
-RECEIVE_BUFFER_SIZE = 1024
+MAX_PENDING_CONNECTIONS = 20
+SOCKET_REUSE_ADDRESS = 1
 
 VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov')
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
 
-THUMBNAIL_MAX_SIZE = 200
-IMAGE_SHAPE_SLICE_2D = 2
-
 ENCODING_FORMAT = 'utf-8'
-JPEG_EXTENSION = '.jpg'
-ENSURE_ASCII_DISABLED = False
 
 MEDIA_TYPE_IMAGE = 'image'
 MEDIA_TYPE_VIDEO = 'video'
 
 REQUEST_GET_MEDIA = "GET_MEDIA"
+RESPONSE_MEDIA_ITEM = "MEDIA_ITEM"
+RESPONSE_MEDIA_END = "MEDIA_END"
+RESPONSE_ERROR = "error"
+MESSAGE_UNKNOWN_REQUEST = "Unknown request"
+
+KEY_TYPE = 'type'
+KEY_PAYLOAD = 'payload'
+KEY_COUNT = 'count'
+KEY_MESSAGE = 'message'
 
 COUNT_START = 1
 
@@ -62,20 +71,22 @@ class MediaServer:
         self.media_folder = media_folder
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, SOCKET_REUSE_ADDRESS
+        )
         self.sock.bind((DEFAULT_HOST, self.port))
-        # temp_conn = (self.sock, None)
-        # key = key_exchange.KeyExchange.send_recv_key(temp_conn)
-        # self.conn = (self.sock, key)
 
         # Supported file extensions
         self.video_extensions = VIDEO_EXTENSIONS
         self.image_extensions = IMAGE_EXTENSIONS
-        self.conn = (0, 0)
+        self._client_counter = 0
+        self._counter_lock = threading.Lock()
 
     def extract_thumbnail(self, file_path: str, file_type: str):
         """
-        Extract preview thumbnail from media file.
-        REFACTORED: Split into separate methods for images and videos.
+        Get the preview thumbnail of a story. Thumbnails are made once
+        when the story is saved (StoryNormalizer); stories saved before
+        that get theirs on first request.
 
         Args:
             file_path: Path to media file
@@ -84,85 +95,10 @@ class MediaServer:
         Returns:
             Base64 encoded thumbnail or None if extraction failed
         """
-        if file_type == MEDIA_TYPE_IMAGE:
-            return self._extract_image_thumbnail(file_path)
-        elif file_type == MEDIA_TYPE_VIDEO:
-            return self._extract_video_thumbnail(file_path)
-        return None
-
-    def _extract_image_thumbnail(self, file_path: str):
-        """
-        Extract thumbnail from image file.
-
-        Args:
-            file_path: Path to image file
-
-        Returns:
-            Base64 encoded thumbnail or None
-        """
-        img = cv2.imread(file_path)
-        if img is None:
-            return None
-
-        # Resize image
-        resized_img = self._resize_to_thumbnail(img)
-
-        # Encode to base64
-        return self._encode_image_to_base64(resized_img)
-
-    def _extract_video_thumbnail(self, file_path: str):
-        """
-        Extract first frame from video as thumbnail.
-
-        Args:
-            file_path: Path to video file
-
-        Returns:
-            Base64 encoded thumbnail or None
-        """
-        cap = cv2.VideoCapture(file_path)
-        ret, frame = cap.read()
-        cap.release()
-
-        if not ret:
+        data = get_thumbnail(file_path)
+        if data is None:
             return None
-
-        return self._encode_image_to_base64(frame)
-
-    def _resize_to_thumbnail(self, img):
-        """
-        Resize image to thumbnail size while maintaining aspect ratio.
-
-        Args:
-            img: OpenCV image array
-
-        Returns:
-            Resized image
-        """
-        height, width = img.shape[:IMAGE_SHAPE_SLICE_2D]
-
-        # Calculate new dimensions
-        if height > width:
-            new_height = THUMBNAIL_MAX_SIZE
-            new_width = int(width * (THUMBNAIL_MAX_SIZE / height))
-        else:
-            new_width = THUMBNAIL_MAX_SIZE
-            new_height = int(height * (THUMBNAIL_MAX_SIZE / width))
-
-        return cv2.resize(img, (new_width, new_height))
-
-    def _encode_image_to_base64(self, img) -> str:
-        """
-        Encode image to base64 string.
-
-        Args:
-            img: OpenCV image array
-
-        Returns:
-            Base64 encoded string
-        """
-        _, buffer = cv2.imencode(JPEG_EXTENSION, img)
-        return base64.b64encode(buffer).decode(ENCODING_FORMAT)
+        return base64.b64encode(data).decode(ENCODING_FORMAT)
 
     def get_media_data(self) -> list:
         """
@@ -175,11 +111,19 @@ class MediaServer:
                 - thumbnail: base64 encoded preview
                 - type: 'image' or 'video'
         """
-        media_data = []
+        return list(self.iter_media_data())
 
+    def iter_media_data(self):
+        """
+        Yield media information one file at a time, so callers can
+        start sending before the whole folder has been thumbnailed.
+
+        Yields:
+            Dictionary with media information
+        """
         # Ensure folder exists
         if not self._ensure_media_folder_exists():
-            return media_data
+            return
 
         # Scan folder for media files
         for file in os.listdir(self.media_folder):
@@ -188,13 +132,23 @@ class MediaServer:
 
             # Check if it's a video
             if file_lower.endswith(self.video_extensions):
-                self._add_video_to_list(media_data, file, file_path)
+                media_type = MEDIA_TYPE_VIDEO
 
             # Check if it's an image
             elif file_lower.endswith(self.image_extensions):
-                self._add_image_to_list(media_data, file, file_path)
+                media_type = MEDIA_TYPE_IMAGE
 
-        return media_data
+            else:
+                continue
+
+            thumbnail = self.extract_thumbnail(file_path, media_type)
+            if thumbnail:
+                yield {
+                    'name': file,
+                    'path': file_path,
+                    'thumbnail': thumbnail,
+                    'type': media_type
+                }
 
     def _ensure_media_folder_exists(self) -> bool:
         """
@@ -208,57 +162,11 @@ class MediaServer:
             return False
         return True
 
-    def _add_video_to_list(
-            self,
-            media_data: list,
-            filename: str,
-            file_path: str
-    ):
-        """
-        Add video to media list if thumbnail extraction succeeds.
-
-        Args:
-            media_data: List to append to
-            filename: Name of file
-            file_path: Full path to file
-        """
-        thumbnail = self.extract_thumbnail(file_path, MEDIA_TYPE_VIDEO)
-        if thumbnail:
-            media_data.append({
-                'name': filename,
-                'path': file_path,
-                'thumbnail': thumbnail,
-                'type': MEDIA_TYPE_VIDEO
-            })
-
-    def _add_image_to_list(
-            self,
-            media_data: list,
-            filename: str,
-            file_path: str
-    ):
-        """
-        Add image to media list if thumbnail extraction succeeds.
-
-        Args:
-            media_data: List to append to
-            filename: Name of file
-            file_path: Full path to file
-        """
-        thumbnail = self.extract_thumbnail(file_path, MEDIA_TYPE_IMAGE)
-        if thumbnail:
-            media_data.append({
-                'name': filename,
-                'path': file_path,
-                'thumbnail': thumbnail,
-                'type': MEDIA_TYPE_IMAGE
-            })
-
     def start(self):
         """
         Start listening for client requests.
         Runs continuously until stopped.
-        REFACTORED: Split client handling into separate method.
+        Every client is served on its own thread.
         """
         self.sock.listen(MAX_PENDING_CONNECTIONS)
         print(f"Server listening on port {self.port}")
@@ -266,51 +174,88 @@ class MediaServer:
 
         while True:
             client, address = self.sock.accept()
-            print(f"Client connected: {address}")
 
-            try:
-                self._handle_client_request(client)
-            except Exception as e:
-                print(f"Error: {e}")
-            finally:
-                client.close()
+            with self._counter_lock:
+                self._client_counter += 1
+                client_id = self._client_counter
 
-    def _handle_client_request(self, client: socket.socket):
+            print(f"[StoryThumbs #{client_id}] Client connected: {address}")
+            threading.Thread(
+                target=self._serve_client,
+                args=(client, client_id),
+                daemon=True,
+                name=f"StoryThumbs-{client_id}"
+            ).start()
+
+    def _serve_client(self, client: socket.socket, client_id: int):
         """
-        Handle a single client request.
+        Serve one persistent client connection.
+        Key exchange happens once; the session key is reused for
+        every request until the client disconnects.
 
         Args:
             client: Client socket connection
+            client_id: Sequential id used for logging
         """
-        # Key exchange with the CLIENT socket (not the server socket)
-        temp_conn = (client, None)
-        key = key_exchange.KeyExchange.send_recv_key(temp_conn)
-        client_conn = (client, key)
+        try:
+            # Key exchange with the CLIENT socket (server role)
+            temp_conn = (client, None)
+            key = key_exchange.KeyExchange.recv_send_key(temp_conn)
+            client_conn = (client, key)
+
+            while True:
+                request = Protocol.recv_json(client_conn)
+                self._handle_client_request(client_conn, request)
+
+        except (ConnectionError, ConnectionResetError,
+                ConnectionAbortedError, BrokenPipeError, OSError):
+            pass
+        except Exception as e:
+            print(f"[StoryThumbs #{client_id}] Error: {e}")
+        finally:
+            try:
+                client.close()
+            except Exception:
+                pass
+            print(f"[StoryThumbs #{client_id}] Disconnected")
 
-        # Receive request
-        response_data = Protocol.recv(client_conn)
+    def _handle_client_request(self, client_conn: tuple, request: dict):
+        """
+        Handle a single client request.
 
-        # Process request
-        if response_data.get('type') == "GET_MEDIA":
-            self._send_media_list(client, client_conn)
+        Args:
+            client_conn: Encrypted connection tuple (socket, key)
+            request: Parsed JSON request
+        """
+        if request.get(KEY_TYPE) == REQUEST_GET_MEDIA:
+            self._send_media_list(client_conn)
+        else:
+            Protocol.send_json({
+                KEY_TYPE: RESPONSE_ERROR,
+                KEY_MESSAGE: MESSAGE_UNKNOWN_REQUEST
+            }, client_conn)
 
-    def _send_media_list(self, client: socket.socket, client_conn: tuple):
+    def _send_media_list(self, client_conn: tuple):
         """
-        Send list of media files to client.
+        Stream the list of media files to client.
+        Each item goes out as its own frame as soon as its thumbnail
+        is ready, followed by an end frame carrying the total count.
 
         Args:
-            client: Client socket connection
             client_conn: Encrypted connection tuple (socket, key)
         """
-        # Collect media data
-        media_data = self.get_media_data()
-        print("iiii")
-        print(media_data)
-        request_data = json.dumps({
-            "type": 'RES_GET_MEDIA',
-            "payload": media_data
-        })
-        Protocol.send(request_data, client_conn)
+        media_data = []
+        for media_item in self.iter_media_data():
+            Protocol.send_json({
+                KEY_TYPE: RESPONSE_MEDIA_ITEM,
+                KEY_PAYLOAD: media_item
+            }, client_conn)
+            media_data.append(media_item)
+
+        Protocol.send_json({
+            KEY_TYPE: RESPONSE_MEDIA_END,
+            KEY_COUNT: len(media_data)
+        }, client_conn)
 
         # Log statistics
         self._log_media_stats(media_data)
@@ -3,21 +3,29 @@ Gal Haham
 Video media server for displaying video thumbnails with metadata.
 Handles video preview generation, metadata extraction,
  and streaming to clients.
+CHANGED: Each client runs in its own thread over a persistent encrypted
+         connection (one key exchange, many requests). Responses are
+         length-prefixed frames streamed one video at a time.
+ADDED: Client and video list metrics (Metrics)
 """
 import socket
-import json
 import os
+import threading
+import time
 import cv2
 import base64
 import sqlite3
 from pathlib import Path
+import key_exchange
+from Protocol import Protocol
+from Metrics import get_metrics
 
 
 DEFAULT_MEDIA_FOLDER = "videos"
 DEFAULT_PORT = 2223
 DEFAULT_HOST = "0.0.0.0"
-MAX_PENDING_CONNECTIONS = 5
-RECEIVE_BUFFER_SIZE = 1024
+MAX_PENDING_CONNECTIONS = 20
+SOCKET_REUSE_ADDRESS = 1
 
 DATABASE_NAME = 'users.db'
 DATABASE_QUERY_VIDEOS = (
@@ -36,11 +44,14 @@ IMAGE_SHAPE_SLICE_2D = 2
 
 ENCODING_FORMAT = 'utf-8'
 JPEG_EXTENSION = '.jpg'
-ENSURE_ASCII_DISABLED = False
 
 MEDIA_TYPE_VIDEO = 'video'
 
 REQUEST_GET_VIDEOS_MEDIA = "GET_VIDEOS_MEDIA"
+RESPONSE_MEDIA_ITEM = "MEDIA_ITEM"
+RESPONSE_MEDIA_END = "MEDIA_END"
+RESPONSE_ERROR = "error"
+MESSAGE_UNKNOWN_REQUEST = "Unknown request"
 
 CATEGORY_FOREHAND = 'forehand'
 CATEGORY_BACKHAND = 'backhand'
@@ -76,6 +87,9 @@ KEY_NAME = 'name'
 KEY_PATH = 'path'
 KEY_THUMBNAIL = 'thumbnail'
 KEY_TYPE = 'type'
+KEY_PAYLOAD = 'payload'
+KEY_COUNT = 'count'
+KEY_MESSAGE = 'message'
 
 DB_RESULT_CATEGORY = 0
 DB_RESULT_LEVEL = 1
@@ -86,6 +100,19 @@ MIN_FILENAME_PARTS = 2
 FILENAME_CATEGORY_INDEX = 0
 FILENAME_LEVEL_INDEX = 1
 
+_clients_active = get_metrics().gauge(
+    "video_thumbs_clients_active", "Clients connected to the video thumbnail server"
+)
+_clients_total = get_metrics().counter(
+    "video_thumbs_clients_total", "Clients accepted by the video thumbnail server"
+)
+_items_sent = get_metrics().counter(
+    "video_thumbs_items_sent_total", "Video thumbnails sent"
+)
+_list_seconds = get_metrics().histogram(
+    "video_thumbs_list_seconds", "Time to stream the whole video list to a client"
+)
+
 
 class VideoMediaServer:
     """
@@ -114,7 +141,12 @@ class VideoMediaServer:
         self.media_folder = media_folder
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, SOCKET_REUSE_ADDRESS
+        )
         self.sock.bind((DEFAULT_HOST, self.port))
+        self._client_counter = 0
+        self._counter_lock = threading.Lock()
 
         # Supported video extensions
         self.video_extensions = VIDEO_EXTENSIONS
@@ -287,20 +319,26 @@ class VideoMediaServer:
         Returns:
             List of dictionaries with video information
         """
-        media_data = []
+        return list(self.iter_videos_data())
+
+    def iter_videos_data(self):
+        """
+        Yield video information one file at a time, so callers can
+        start sending before the whole folder has been thumbnailed.
 
+        Yields:
+            Dictionary with video information
+        """
         # Ensure folder exists
         if not self._ensure_videos_folder_exists():
-            return media_data
+            return
 
         # Scan folder for video files
         for file in os.listdir(self.media_folder):
             if self._is_video_file(file):
                 video_info = self._create_video_info(file)
                 if video_info:
-                    media_data.append(video_info)
-
-        return media_data
+                    yield video_info
 
     def _ensure_videos_folder_exists(self) -> bool:
         """
@@ -358,7 +396,7 @@ class VideoMediaServer:
         """
         Start listening for client requests.
         Runs continuously until stopped.
-        REFACTORED: Split client handling into separate method.
+        Every client is served on its own thread.
         """
         self.sock.listen(MAX_PENDING_CONNECTIONS)
         print(f"Video Media Server listening on port {self.port}")
@@ -366,45 +404,95 @@ class VideoMediaServer:
 
         while True:
             client, address = self.sock.accept()
-            print(f"Client connected: {address}")
 
-            try:
-                self._handle_client_request(client)
-            except Exception as e:
-                print(f"Error: {e}")
-            finally:
-                client.close()
+            with self._counter_lock:
+                self._client_counter += 1
+                client_id = self._client_counter
+
+            print(f"[VideoThumbs #{client_id}] Client connected: {address}")
+            _clients_total.inc()
+            threading.Thread(
+                target=self._serve_client,
+                args=(client, client_id),
+                daemon=True,
+                name=f"VideoThumbs-{client_id}"
+            ).start()
 
-    def _handle_client_request(self, client: socket.socket):
+    def _serve_client(self, client: socket.socket, client_id: int):
         """
-        Handle a single client request.
+        Serve one persistent client connection.
+        Key exchange happens once; the session key is reused for
+        every request until the client disconnects.
 
         Args:
             client: Client socket connection
+            client_id: Sequential id used for logging
         """
-        # Receive request
-        request = client.recv(RECEIVE_BUFFER_SIZE).decode(ENCODING_FORMAT)
+        _clients_active.inc()
+        try:
+            temp_conn = (client, None)
+            key = key_exchange.KeyExchange.recv_send_key(temp_conn)
+            client_conn = (client, key)
+
+            while True:
+                request = Protocol.recv_json(client_conn)
+                self._handle_client_request(client_conn, request)
 
-        # Process request
-        if request == REQUEST_GET_VIDEOS_MEDIA:
-            self._send_videos_list(client)
+        except (ConnectionError, ConnectionResetError,
+                ConnectionAbortedError, BrokenPipeError, OSError):
+            pass
+        except Exception as e:
+            print(f"[VideoThumbs #{client_id}] Error: {e}")
+        finally:
+            _clients_active.dec()
+            try:
+                client.close()
+            except Exception:
+                pass
+            print(f"[VideoThumbs #{client_id}] Disconnected")
 
-    def _send_videos_list(self, client: socket.socket):
+    def _handle_client_request(self, client_conn: tuple, request: dict):
         """
-        Send list of video files to client.
+        Handle a single client request.
 
         Args:
-            client: Client socket connection
+            client_conn: Encrypted connection tuple (socket, key)
+            request: Parsed JSON request
+        """
+        if request.get(KEY_TYPE) == REQUEST_GET_VIDEOS_MEDIA:
+            self._send_videos_list(client_conn)
+        else:
+            Protocol.send_json({
+                KEY_TYPE: RESPONSE_ERROR,
+                KEY_MESSAGE: MESSAGE_UNKNOWN_REQUEST
+            }, client_conn)
+
+    def _send_videos_list(self, client_conn: tuple):
         """
-        # Collect video data
-        media_data = self.get_videos_data()
+        Stream the list of video files to client.
+        Each video goes out as its own frame as soon as its thumbnail
+        is ready, followed by an end frame carrying the total count.
 
-        # Send response
-        response = json.dumps(media_data, ensure_ascii=ENSURE_ASCII_DISABLED)
-        client.sendall(response.encode(ENCODING_FORMAT))
+        Args:
+            client_conn: Encrypted connection tuple (socket, key)
+        """
+        started = time.monotonic()
+        videos_count = 0
+        for video_info in self.iter_videos_data():
+            Protocol.send_json({
+                KEY_TYPE: RESPONSE_MEDIA_ITEM,
+                KEY_PAYLOAD: video_info
+            }, client_conn)
+            videos_count += 1
+            _items_sent.inc()
+
+        Protocol.send_json({
+            KEY_TYPE: RESPONSE_MEDIA_END,
+            KEY_COUNT: videos_count
+        }, client_conn)
+        _list_seconds.observe(time.monotonic() - started)
 
         # Log statistics
-        videos_count = len(media_data)
         print(f"Sent {videos_count} videos to client")
 
 
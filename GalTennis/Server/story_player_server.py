@@ -6,6 +6,12 @@ REFACTORED: Single port (6001) for ALL stories, multithreaded clients.
             Each PLAY_STORY request creates a short-lived ticket;
             the client sends the ticket on connect so the server
             knows which story file to stream.
+CHANGED: Started once with the server and kept running. The ticket is
+         sent encrypted, after key exchange, as a SELECT_STORY message;
+         the reply tells the viewer the stream is ready. Startup is
+         signalled by an event instead of a fixed sleep.
+ADDED: Playlist tickets - one ticket for several stories, streamed back
+       to back on the same session (the client prefetches the next one)
 """
 import socket
 import os
@@ -13,6 +19,7 @@ import time
 import threading
 import uuid
 
+from Protocol import Protocol
 from Story_client_session import StoryClientSession
 
 STORY_SERVER_HOST = '0.0.0.0'
@@ -21,8 +28,13 @@ STORY_FOLDER = "stories"
 
 TICKET_TTL_SECONDS = 30
 TICKET_LENGTH = 8
-TICKET_ACCEPT = b'\x01'
-TICKET_REJECT = b'\x00'
+STARTUP_TIMEOUT_SECONDS = 5
+
+REQUEST_SELECT_STORY = "SELECT_STORY"
+RESPONSE_STORY_READY = "STORY_READY"
+RESPONSE_ERROR = "error"
+MESSAGE_BAD_REQUEST = "Expected SELECT_STORY"
+MESSAGE_BAD_TICKET = "Invalid or expired ticket"
 
 SOCKET_OPTION_ENABLED = 1
 MAX_PENDING_CONNECTIONS = 20
@@ -48,10 +60,13 @@ class StoryPlayerServer:
         self._client_counter = 0
         self._counter_lock = threading.Lock()
 
-        # ticket_id → {"story_path": str, "expires": float}
+        # ticket_id → {"story_paths": [str], "expires": float}
         self._tickets: dict = {}
         self._ticket_lock = threading.Lock()
 
+        # Set once the socket is listening (or startup failed)
+        self._ready = threading.Event()
+
     # ── Singleton ─────────────────────────────────────────────────────────────
 
     @classmethod
@@ -71,15 +86,18 @@ class StoryPlayerServer:
             cls._instance = srv
             cls._thread = thr
             thr.start()
-            time.sleep(0.2)
-            print(f"[StoryServer] Singleton running on port {STORY_SERVER_PORT}")
+            if not srv._ready.wait(STARTUP_TIMEOUT_SECONDS) or not srv.is_running:
+                print(f"[StoryServer] Failed to start on port {STORY_SERVER_PORT}")
+            else:
+                print(f"[StoryServer] Singleton running on port {STORY_SERVER_PORT}")
             return srv
 
     @classmethod
-    def ensure_running(cls, story_path: str = "") -> dict:
+    def ensure_running(cls, story_path="") -> dict:
         """
         Ensure the single story streaming server is running.
-        If story_path is given, create a ticket for it.
+        If story_path is given (one path, or a list for a playlist),
+        create a ticket for it.
         Returns {"server": ..., "port": STORY_SERVER_PORT, "ticket": <str|None>}
         """
         srv = cls.get_or_create()
@@ -98,22 +116,24 @@ class StoryPlayerServer:
 
     # ── Ticket API ────────────────────────────────────────────────────────────
 
-    def create_ticket(self, story_path: str) -> str:
+    def create_ticket(self, story_path) -> str:
         """
-        Create a one-time ticket for streaming a specific story.
+        Create a one-time ticket for streaming a specific story, or a
+        playlist when story_path is a list of paths.
         Returns an 8-char token the client must send on connect.
         """
+        story_paths = [story_path] if isinstance(story_path, str) else list(story_path)
         ticket = str(uuid.uuid4())[:TICKET_LENGTH]
         with self._ticket_lock:
             self._tickets[ticket] = {
-                "story_path": story_path,
+                "story_paths": story_paths,
                 "expires": time.time() + TICKET_TTL_SECONDS,
             }
-        print(f"[StoryServer] Ticket created: {ticket} → {story_path}")
+        print(f"[StoryServer] Ticket created: {ticket} → {', '.join(story_paths)}")
         return ticket
 
-    def _claim_ticket(self, ticket: str) -> "str | None":
-        """Claim and remove a ticket. Returns story_path or None."""
+    def _claim_ticket(self, ticket: str) -> "list | None":
+        """Claim and remove a ticket. Returns its story paths or None."""
         with self._ticket_lock:
             entry = self._tickets.pop(ticket, None)
         if entry is None:
@@ -121,7 +141,7 @@ class StoryPlayerServer:
         if time.time() > entry["expires"]:
             print(f"[StoryServer] Ticket expired: {ticket}")
             return None
-        return entry["story_path"]
+        return entry["story_paths"]
 
     def _purge_expired_tickets(self):
         now = time.time()
@@ -139,12 +159,14 @@ class StoryPlayerServer:
         try:
             self._create_server_socket()
             self.is_running = True
+            self._ready.set()
             print(f"[StoryServer] Listening on {self.host}:{self.port} (single port, multi-client)")
             self._accept_loop()
         except Exception as e:
             print(f"[StoryServer] Fatal: {e}")
         finally:
             self._teardown()
+            self._ready.set()
 
     def stop(self):
         self.is_running = False
@@ -194,43 +216,44 @@ class StoryPlayerServer:
 
     def _handle_client(self, client_socket: socket.socket, address: tuple, session_id: int):
         """
-        1. Receive 8-byte ticket.
-        2. Look up story path.
-        3. Key exchange.
-        4. Stream story.
+        1. Key exchange.
+        2. Receive SELECT_STORY with the ticket (encrypted).
+        3. Look up the story paths and reply STORY_READY (or an error).
+        4. Stream the stories in order.
         """
         print(f"[StoryServer] Client #{session_id} connected from {address}")
         try:
-            ticket_bytes = self._recv_exact(client_socket, TICKET_LENGTH)
-            if not ticket_bytes:
-                print(f"[StoryServer] Client #{session_id} sent no ticket")
+            session = StoryClientSession(client_socket, address, session_id)
+            if not session.establish_encryption():
                 return
+            conn = session.encrypted_conn
 
-            ticket = ticket_bytes.decode("utf-8", errors="replace").rstrip('\x00')
-            story_path = self._claim_ticket(ticket)
-
-            if not story_path:
-                print(f"[StoryServer] Invalid/expired ticket '{ticket}' from {address}")
-                try:
-                    client_socket.sendall(TICKET_REJECT)
-                except Exception:
-                    pass
+            request = Protocol.recv_json(conn)
+            if request.get("type") != REQUEST_SELECT_STORY:
+                Protocol.send_json({"type": RESPONSE_ERROR, "message": MESSAGE_BAD_REQUEST}, conn)
                 return
 
-            try:
-                client_socket.sendall(TICKET_ACCEPT)
-            except Exception:
+            ticket = str(request.get("ticket", ""))
+            story_paths = self._claim_ticket(ticket)
+            if not story_paths:
+                print(f"[StoryServer] Invalid/expired ticket '{ticket}' from {address}")
+                Protocol.send_json({"type": RESPONSE_ERROR, "message": MESSAGE_BAD_TICKET}, conn)
                 return
 
-            print(f"[StoryServer] Client #{session_id} ticket OK → {story_path}")
+            Protocol.send_json({
+                "type": RESPONSE_STORY_READY,
+                "story": os.path.basename(story_paths[0]),
+                "stories": [os.path.basename(path) for path in story_paths],
+            }, conn)
+            print(f"[StoryServer] Client #{session_id} ticket OK → {len(story_paths)} stories")
 
-            session = StoryClientSession(client_socket, address, session_id)
-            if not session.establish_encryption():
-                return
-
-            session.stream_story(story_path)
+            if len(story_paths) == 1:
+                session.stream_story(story_paths[0])
+            else:
+                session.stream_playlist(story_paths)
 
-        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError, OSError):
+        except (ConnectionError, ConnectionResetError, BrokenPipeError,
+                ConnectionAbortedError, OSError, ValueError):
             pass
         except Exception as e:
             print(f"[StoryServer] Client #{session_id} error: {e}")
@@ -241,16 +264,6 @@ class StoryPlayerServer:
             except Exception:
                 pass
 
-    @staticmethod
-    def _recv_exact(sock: socket.socket, n: int) -> bytes:
-        data = b""
-        while len(data) < n:
-            chunk = sock.recv(n - len(data))
-            if not chunk:
-                return b""
-            data += chunk
-        return data
-
     def _teardown(self):
         self.is_running = False
         if self.server_socket:
@@ -4,25 +4,84 @@ Media upload server for stories - ENCRYPTED VERSION
 FIXED: conn=(0,0) bug removed - conn set only after real socket accept
 FIXED: True multi-client - each client in its own thread
 FIXED: Client socket passed properly to each handler thread
+ADDED: Saved stories are cataloged (MediaCatalog) and video stories get
+       their audio track cached - queued as a job (MediaJobs) whose id
+       is returned to the client
+ADDED: Content-hash deduplication - a client may first send only the
+       SHA-256 of the file; if the BlobStore already has that content
+       the story is linked to it and no bytes are transferred
+ADDED: Each saved file gets its story row (StoriesHandler.register_story_file),
+       which also schedules its expiry
+CHANGED: Uploads are normalized to the playback resolution before they are
+         stored (StoryNormalizer) and every saved story gets its thumbnail
+CHANGED: A post is one round trip - the file is kept only if its story
+         row is added too, and the ack carries the new story record
+         (no separate ADD_STORY request, no polling GET_STORIES)
+ADDED: ensure_story_upload_server_running() - one upload server for the
+       life of the main server
+ADDED: Streamed uploads - a client that sends the file size with the hash
+       then sends the file as encrypted binary chunks, written to disk as
+       they arrive (base64-in-JSON uploads are still accepted)
+ADDED: add_story_file() - a file made on the server (a recorded live
+       broadcast) is stored and registered like an upload
+ADDED: Upload metrics (Metrics) - stories by result, bytes received,
+       upload and store times
+FIXED: The upload is stored as received and acknowledged; normalizing and
+       the thumbnail run in its ingest_story job. Blobs are keyed by the
+       hash of their own bytes - a hash-only probe finds the normalized
+       version of the content through story_sources, and only story
+       blobs satisfy it.
 """
 import socket
 import base64
+import hashlib
 import json
 import os
+import shutil
 import time
 import threading
 from pathlib import Path
 import key_exchange
+import aes_cipher
 from Protocol import Protocol
+from Metrics import get_metrics
+from BlobStore import get_blob_store
+from Db_manager import get_db_manager, MEDIA_KIND_STORY
+from MediaJobs import enqueue_story_ingest
+from StoryNormalizer import discard_thumbnail
+from Stories_Handler import (
+    StoriesHandler, CONTENT_TYPE_IMAGE, CONTENT_TYPE_VIDEO, KEY_STORY
+)
 
 STORIES_FOLDER = "stories"
 HOST = '0.0.0.0'
 PORT = 3333
 SOCKET_OPTION_ENABLED = 1
 MAX_PENDING_CONNECTIONS = 5
+TEMP_SUFFIX = ".part"
+MAX_STORY_BYTES = 512 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+SERVER_CLIENT_ID = 0                # Logs files added by the server itself
 SOCK_INDEX = 0
 KEY_INDEX = 1
 
+RESULT_SAVED = "saved"
+RESULT_DEDUPLICATED = "deduplicated"    # Linked to a stored blob, no bytes sent
+RESULT_FAILED = "failed"
+
+_uploads_total = get_metrics().counter(
+    "story_uploads_total", "Stories posted, by result", ("result",)
+)
+_upload_bytes = get_metrics().counter(
+    "story_upload_bytes_total", "Story file bytes received from clients"
+)
+_upload_seconds = get_metrics().histogram(
+    "story_upload_seconds", "Request received to ack sent for a saved story"
+)
+_store_seconds = get_metrics().histogram(
+    "story_store_seconds", "Time to move a story file into the blob store and link it"
+)
+
 
 class MediaServer:
     """
@@ -45,6 +104,9 @@ class MediaServer:
 
         self._client_counter = 0
         self._counter_lock = threading.Lock()
+        self.blob_store = get_blob_store()
+        self.db = get_db_manager()
+        self.stories = StoriesHandler()
 
     def start(self):
         self.is_running = True
@@ -81,6 +143,7 @@ class MediaServer:
     def _handle_client(self, client_socket: socket.socket, addr: tuple, client_id: int):
         """Each client: key exchange → receive file → save → respond."""
         conn = None
+        result = None                   # Counted once a request has arrived
         try:
             # Key exchange
             temp_conn = (client_socket, None)
@@ -88,26 +151,53 @@ class MediaServer:
             conn = (client_socket, key)
             print(f"[StoryUpload #{client_id}] Encryption ready")
 
-            # Receive payload
-            payload_str = Protocol.recv(conn)
-            if not payload_str:
-                return
-
-            # Parse JSON
-            try:
-                payload = json.loads(payload_str)
-            except json.JSONDecodeError as e:
-                print(f"[StoryUpload #{client_id}] JSON error: {e}")
-                self._send_error(conn, "Invalid JSON")
+            payload = self._recv_payload(conn, client_id)
+            if payload is None:
                 return
+            started = time.monotonic()
+            result = RESULT_FAILED
+            uploaded = RESULT_SAVED
 
-            # Save file
-            saved_path = self._save_media(payload, client_id)
-            if saved_path:
-                print(f"[StoryUpload #{client_id}] Saved: {saved_path}")
-                Protocol.send(json.dumps({"type": "good", "payload": "OK"}), conn)
+            content_hash = payload.get("sha256")
+            if content_hash and not payload.get("data"):
+                # Hash-only probe: link to the stored blob or ask for the bytes
+                stored_hash = self._stored_hash(content_hash)
+                if stored_hash:
+                    saved_path = self._link_media(payload, stored_hash, client_id)
+                    uploaded = RESULT_DEDUPLICATED
+                elif "size" in payload:
+                    # Streamed upload: binary chunks follow the request
+                    if not 0 < payload["size"] <= MAX_STORY_BYTES:
+                        self._send_error(conn, "Invalid file size")
+                        return
+                    Protocol.send(json.dumps({"type": "need", "payload": "SEND_DATA"}), conn)
+                    saved_path = self._receive_media(conn, payload, client_id)
+                else:
+                    Protocol.send(json.dumps({"type": "need", "payload": "SEND_DATA"}), conn)
+                    payload = self._recv_payload(conn, client_id)
+                    if payload is None:
+                        return
+                    saved_path = self._save_media(payload, client_id)
             else:
+                saved_path = self._save_media(payload, client_id)
+
+            if not saved_path:
                 self._send_error(conn, "Failed to save file")
+                return
+
+            story = self._register_story(saved_path, payload)
+            if story is None:
+                self._discard_media(saved_path)
+                self._send_error(conn, "Failed to add story")
+                return
+
+            print(f"[StoryUpload #{client_id}] Saved: {saved_path}")
+            job_id = enqueue_story_ingest(saved_path, payload.get("media_type"))
+            Protocol.send(json.dumps({
+                "type": "good", "payload": "OK", "job_id": job_id, "story": story
+            }), conn)
+            result = uploaded
+            _upload_seconds.observe(time.monotonic() - started)
 
         except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError, OSError):
             pass  # Normal disconnect
@@ -116,33 +206,181 @@ class MediaServer:
             if conn:
                 self._send_error(conn, str(e))
         finally:
+            if result is not None:
+                _uploads_total.inc(result=result)
             try:
                 client_socket.close()
             except Exception:
                 pass
             print(f"[StoryUpload #{client_id}] Disconnected")
 
-    def _save_media(self, payload: dict, client_id: int) -> str:
+    def add_story_file(self, file_path: str, username: str, media_type: str):
+        """
+        Add a file produced on the server (e.g. a recorded live broadcast)
+        as a story, exactly as if it had been uploaded.
+
+        Args:
+            file_path: File to take over - it is moved into the store
+            username: Owner of the story
+            media_type: 'video' or 'image'
+
+        Returns:
+            dict: The story record, or None on failure
+        """
+        payload = {"username": username, "media_type": media_type}
+        full_path = self._new_story_path(payload)
+        temp_path = full_path + TEMP_SUFFIX
         try:
-            media_b64 = payload.get("data", "")
-            media_type = payload.get("media_type", "image")
-            username = payload.get("username", "user")
+            shutil.move(file_path, temp_path)
+            digest = hashlib.sha256()
+            with open(temp_path, "rb") as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                    digest.update(block)
+            saved_path = self._store_media(
+                payload, digest.hexdigest(), SERVER_CLIENT_ID, temp_path, full_path
+            )
+        except Exception as e:
+            print(f"[StoryUpload] Cannot add {file_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            _uploads_total.inc(result=RESULT_FAILED)
+            return None
+        if not saved_path:
+            _uploads_total.inc(result=RESULT_FAILED)
+            return None
+
+        story = self._register_story(saved_path, payload)
+        if story is None:
+            self._discard_media(saved_path)
+            _uploads_total.inc(result=RESULT_FAILED)
+            return None
+        print(f"[StoryUpload] Saved: {saved_path}")
+        enqueue_story_ingest(saved_path, media_type)
+        _uploads_total.inc(result=RESULT_SAVED)
+        return story
 
-            file_bytes = base64.b64decode(media_b64)
+    def _recv_payload(self, conn, client_id: int):
+        """Receive one JSON message, or None if it is missing or invalid."""
+        payload_str = Protocol.recv(conn)
+        if not payload_str:
+            return None
+        try:
+            return json.loads(payload_str)
+        except json.JSONDecodeError as e:
+            print(f"[StoryUpload #{client_id}] JSON error: {e}")
+            self._send_error(conn, "Invalid JSON")
+            return None
 
-            timestamp = int(time.time())
-            ext = ".mp4" if media_type == "video" else ".jpg"
-            filename = f"story_{username}_{timestamp}{ext}"
-            full_path = os.path.join(STORIES_FOLDER, filename)
+    def _save_media(self, payload: dict, client_id: int) -> str:
+        """Store base64 uploaded bytes as a blob and link the story to it."""
+        full_path = self._new_story_path(payload)
+        temp_path = full_path + TEMP_SUFFIX
+        try:
+            file_bytes = base64.b64decode(payload.get("data", ""))
+            _upload_bytes.inc(len(file_bytes))
+            content_hash = hashlib.sha256(file_bytes).hexdigest()
+            if payload.get("sha256") and payload["sha256"] != content_hash:
+                print(f"[StoryUpload #{client_id}] Hash mismatch")
+                return None
 
-            with open(full_path, "wb") as f:
+            with open(temp_path, "wb") as f:
                 f.write(file_bytes)
-
-            return full_path
+            return self._store_media(payload, content_hash, client_id, temp_path, full_path)
         except Exception as e:
             print(f"[StoryUpload #{client_id}] Save error: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
             return None
 
+    def _receive_media(self, conn, payload: dict, client_id: int) -> str:
+        """
+        Write streamed chunks to disk until payload['size'] bytes have
+        arrived, then store them as a blob and link the story to it.
+        """
+        full_path = self._new_story_path(payload)
+        temp_path = full_path + TEMP_SUFFIX
+        try:
+            digest = hashlib.sha256()
+            remaining = payload["size"]
+            with open(temp_path, "wb") as f:
+                while remaining > 0:
+                    chunk = aes_cipher.AESCipher.decrypt(conn[KEY_INDEX], Protocol.recv_bin(conn))
+                    if not chunk or len(chunk) > remaining:
+                        raise ValueError("Bad chunk")
+                    f.write(chunk)
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                    _upload_bytes.inc(len(chunk))
+
+            content_hash = digest.hexdigest()
+            if payload["sha256"] != content_hash:
+                print(f"[StoryUpload #{client_id}] Hash mismatch")
+                os.remove(temp_path)
+                return None
+            return self._store_media(payload, content_hash, client_id, temp_path, full_path)
+        except Exception as e:
+            print(f"[StoryUpload #{client_id}] Receive error: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+    def _stored_hash(self, source_hash: str):
+        """
+        Blob a story uploaded with this hash can use: its normalized
+        version if one was made, else the upload itself (its ingest job
+        normalizes it). None if no story blob has the content.
+        """
+        for content_hash in (self.db.get_story_source(source_hash), source_hash):
+            if content_hash and self.blob_store.has(content_hash, MEDIA_KIND_STORY):
+                return content_hash
+        return None
+
+    def _store_media(self, payload: dict, content_hash: str, client_id: int,
+                     temp_path: str, full_path: str) -> str:
+        """Store the upload as received; its ingest job normalizes it."""
+        with _store_seconds.time():
+            self.blob_store.store(temp_path, content_hash)
+            return self._link_media(payload, content_hash, client_id, full_path)
+
+    def _link_media(self, payload: dict, content_hash: str, client_id: int,
+                    full_path: str = None) -> str:
+        """Give a stored blob its story filename."""
+        full_path = full_path or self._new_story_path(payload)
+        if not self.blob_store.attach(content_hash, full_path, MEDIA_KIND_STORY):
+            self.blob_store.discard(content_hash)
+            print(f"[StoryUpload #{client_id}] Cannot link {full_path}")
+            return None
+        return full_path
+
+    def _register_story(self, saved_path: str, payload: dict):
+        """
+        Add the story row of a saved file.
+
+        Returns:
+            dict: The story record, or None if the row was not added
+        """
+        content_type = (CONTENT_TYPE_VIDEO if payload.get("media_type") == "video"
+                        else CONTENT_TYPE_IMAGE)
+        result = self.stories.register_story_file(
+            saved_path, payload.get("username", "user"), content_type
+        )
+        return result.get(KEY_STORY)
+
+    def _discard_media(self, saved_path: str):
+        """Undo a save whose story row could not be added."""
+        try:
+            self.blob_store.detach(saved_path, MEDIA_KIND_STORY)
+        except Exception as e:
+            print(f"[StoryUpload] Could not remove {saved_path}: {e}")
+        discard_thumbnail(saved_path)
+
+    @staticmethod
+    def _new_story_path(payload: dict) -> str:
+        username = payload.get("username", "user")
+        timestamp = int(time.time())
+        ext = ".mp4" if payload.get("media_type", "image") == "video" else ".jpg"
+        return os.path.join(STORIES_FOLDER, f"story_{username}_{timestamp}{ext}")
+
     def _send_error(self, conn, message: str):
         try:
             Protocol.send(json.dumps({"type": "error", "payload": f"ERROR: {message}"}), conn)
@@ -157,6 +395,32 @@ class MediaServer:
             pass
 
 
+# ── Module-level singleton ────────────────────────────────────────────────────
+
+_server_instance = None
+_server_lock = threading.Lock()
+
+
+def ensure_story_upload_server_running() -> dict:
+    """
+    Start the story upload server on first use. The socket is bound
+    before this returns, so clients can connect right away.
+
+    Returns:
+        dict: {"server": <MediaServer>, "port": PORT}
+    """
+    global _server_instance
+    with _server_lock:
+        if _server_instance is None:
+            _server_instance = MediaServer()
+            threading.Thread(
+                target=_server_instance.start,
+                daemon=True,
+                name="StoryUploadServer"
+            ).start()
+    return {"server": _server_instance, "port": _server_instance.port}
+
+
 def run():
     server = MediaServer()
     server.start()